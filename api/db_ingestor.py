@@ -1,8 +1,17 @@
 import os
+import queue
+import threading
 import pandas as pd
 import duckdb
-from pymilvus import connections, utility, Collection, CollectionSchema, FieldSchema, DataType
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Optional, Callable
+
+from libs.KnowledgeManageHandler.embedding_store import get_embedding_store
+
+try:
+    from pymilvus import connections, utility, Collection, CollectionSchema, FieldSchema, DataType
+    MILVUS_AVAILABLE = True
+except ImportError:
+    MILVUS_AVAILABLE = False
 
 class DBIngestor:
     def __init__(self):
@@ -13,6 +22,10 @@ class DBIngestor:
         self.EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
         self.EMBEDDING_DIM = 384
         self._embedding_model = None
+        # 串流匯入：每批筆數、階段間佇列深度、每幾批 flush 一次 Milvus
+        self.BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+        self.QUEUE_DEPTH = 2
+        self.FLUSH_EVERY_BATCHES = 20
         self.ALL_FIELDS = [
             'modeltype', 'version', 'modelname', 'mainboard', 'devtime', 'pm', 
             'structconfig', 'lcd', 'touchpanel', 'iointerface', 'ledind', 
@@ -36,34 +49,200 @@ class DBIngestor:
             self._embedding_model = SentenceTransformer(self.EMBEDDING_MODEL_NAME)
         return self._embedding_model
 
+    def _encode(self, texts: List[str]):
+        """Encode texts, reusing vectors already in the shared embedding store"""
+        store = get_embedding_store(self.EMBEDDING_MODEL_NAME)
+        if store is None:
+            return self.embedding_model.encode(texts, batch_size=64, show_progress_bar=False)
+        vectors = store.get_or_encode(
+            texts, lambda batch: self.embedding_model.encode(batch, batch_size=64, show_progress_bar=False)
+        )
+        store.add_references(f"db_ingestor.{self.COLLECTION_NAME}", texts)
+        return vectors
+
     def ingest(self, data: List[Dict[str, str]]):
         if not data:
             raise ValueError("Input data cannot be empty")
         
-        # Filter out empty records
-        valid_data = self._filter_valid_records(data)
-        if not valid_data:
+        duckdb_count, milvus_count, total = self.ingest_stream(self._iter_record_batches(data))
+        if duckdb_count == 0:
             raise ValueError("No valid records found after filtering empty data")
         
-        print(f"資料驗證：原始 {len(data)} 筆，有效 {len(valid_data)} 筆，過濾掉 {len(data) - len(valid_data)} 筆空記錄")
-        
-        # Create DataFrame and ensure all expected columns exist
-        df = pd.DataFrame(valid_data)
-        
-        # Add missing columns with empty strings
-        for field in self.ALL_FIELDS:
-            if field not in df.columns:
-                df[field] = ""
-        
-        # Select only the expected columns in the correct order
-        df = df[self.ALL_FIELDS]
-        df = df.astype(str)
+        print(f"資料驗證：原始 {total} 筆，有效 {duckdb_count} 筆，過濾掉 {total - duckdb_count} 筆空記錄")
+        return duckdb_count, milvus_count
 
-        duckdb_count = self._ingest_to_duckdb(df)
-        milvus_count = self._ingest_to_milvus(df)
+    def ingest_csv(self, csv_path: str, encoding: str = "utf-8-sig"):
+        """
+        串流匯入 CSV 檔：以 BATCH_SIZE 分段讀取，記憶體用量與檔案大小無關
 
+        Returns:
+            (duckdb_rows_added, milvus_entities_added)
+        """
+        reader = pd.read_csv(
+            csv_path, dtype=str, keep_default_na=False, encoding=encoding, chunksize=self.BATCH_SIZE
+        )
+        duckdb_count, milvus_count, total = self.ingest_stream(
+            batch.to_dict("records") for batch in reader
+        )
+        print(f"CSV 匯入完成：讀取 {total} 筆，有效 {duckdb_count} 筆")
         return duckdb_count, milvus_count
 
+    def _iter_record_batches(self, data: List[Dict[str, str]]) -> Iterator[List[Dict[str, str]]]:
+        for start in range(0, len(data), self.BATCH_SIZE):
+            yield data[start:start + self.BATCH_SIZE]
+
+    def _prepare_batch(self, records: List[Dict[str, str]]) -> pd.DataFrame:
+        """清理並驗證一個批次：過濾空記錄，補齊缺少的欄位並轉為字串"""
+        valid = self._filter_valid_records(records)
+        df = pd.DataFrame(valid, columns=self.ALL_FIELDS)
+        return df.fillna("").astype(str)
+
+    def ingest_stream(
+        self,
+        record_batches: Iterable[List[Dict[str, str]]],
+        progress_callback: Optional[Callable[[str, int, int], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        resume_from: Optional[Dict[str, int]] = None
+    ):
+        """
+        串流匯入管線：解析/寫入 DuckDB → 編碼 → 寫入 Milvus 三個階段以有界佇列串接，
+        各階段同時進行；佇列滿時上游等待，記憶體只保留 QUEUE_DEPTH 個批次
+
+        Args:
+            record_batches: 記錄批次（批次順序需固定，續傳時依批次序號跳過已完成的批次）
+            progress_callback: progress_callback(stage, batch_index, rows)，stage 為
+                parsed / duckdb / embedded / inserted / flushed（flushed 的 batch_index 為已 flush 的批次數）；
+                批次依序寫入 Milvus，inserted 回報後該批次即可作為續傳檢查點
+                （Milvus 已接受的資料即使尚未 flush 也會保留，續傳不可重送，否則 auto_id 會產生重複資料）
+            cancel_event: 設定後不再讀取新批次，已排入的批次寫完並 flush 後結束
+            resume_from: {"duckdb": 已寫入 DuckDB 的批次數, "milvus": 已寫入 Milvus 的批次數}
+
+        Returns:
+            (duckdb_rows_added, milvus_entities_added, total_records)
+        """
+        resume_from = resume_from or {}
+        duckdb_done = resume_from.get("duckdb", 0)
+        milvus_done = resume_from.get("milvus", 0)
+
+        def report(stage: str, batch_index: int, rows: int):
+            if progress_callback is not None:
+                progress_callback(stage, batch_index, rows)
+
+        encode_queue: "queue.Queue" = queue.Queue(maxsize=self.QUEUE_DEPTH)
+        insert_queue: "queue.Queue" = queue.Queue(maxsize=self.QUEUE_DEPTH)
+        errors: List[BaseException] = []
+        counts = {"duckdb": 0, "milvus": 0, "total": 0}
+        stop = threading.Event()
+
+        def put(q: "queue.Queue", item) -> bool:
+            # 下游失敗時不再阻塞等待
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q: "queue.Queue"):
+            # 上游或下游失敗時回傳 None 結束該階段
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+            return None
+
+        def encode_stage():
+            try:
+                while True:
+                    item = get(encode_queue)
+                    if item is None:
+                        break
+                    batch_index, df = item
+                    vectors = self._encode(self._texts_to_embed(df))
+                    report("embedded", batch_index, len(df))
+                    if not put(insert_queue, (batch_index, df, vectors)):
+                        return
+                put(insert_queue, None)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+
+        def insert_stage():
+            try:
+                collection = self._get_collection()
+                batches = 0
+                while True:
+                    item = get(insert_queue)
+                    if item is None:
+                        break
+                    batch_index, df, vectors = item
+                    entities = [df[col].tolist() for col in self.ALL_FIELDS]
+                    entities.append(vectors.tolist())
+                    collection.insert(entities)
+                    counts["milvus"] += len(df)
+                    report("inserted", batch_index, len(df))
+                    batches += 1
+                    # 定期 flush 封存 segment（續傳檢查點以 inserted 為準）
+                    if batches % self.FLUSH_EVERY_BATCHES == 0:
+                        collection.flush()
+                        report("flushed", batch_index + 1, counts["milvus"])
+                        print(f"Milvus checkpoint: {counts['milvus']} entities flushed")
+                    last_batch = batch_index
+                collection.flush()
+                if batches:
+                    report("flushed", last_batch + 1, counts["milvus"])
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+
+        encoder = threading.Thread(target=encode_stage, name="ingest-encode", daemon=True)
+        inserter = threading.Thread(target=insert_stage, name="ingest-insert", daemon=True)
+        encoder.start()
+        inserter.start()
+
+        print("--- Streaming ingestion to DuckDB and Milvus ---")
+        try:
+            with duckdb.connect(database=self.DUCKDB_FILE, read_only=False) as con:
+                con.execute(f"CREATE TABLE IF NOT EXISTS specs ({', '.join([f'{col} VARCHAR' for col in self.ALL_FIELDS])})")
+                for batch_index, records in enumerate(record_batches):
+                    if stop.is_set() or (cancel_event is not None and cancel_event.is_set()):
+                        break
+                    if batch_index < milvus_done and batch_index < duckdb_done:
+                        continue
+                    counts["total"] += len(records)
+                    df = self._prepare_batch(records)
+                    report("parsed", batch_index, len(records))
+                    if batch_index >= duckdb_done and not df.empty:
+                        con.execute("INSERT INTO specs SELECT * FROM df")
+                        counts["duckdb"] += len(df)
+                    report("duckdb", batch_index, len(df))
+                    if batch_index < milvus_done or df.empty:
+                        continue
+                    if not put(encode_queue, (batch_index, df)):
+                        break
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            if not stop.is_set():
+                put(encode_queue, None)
+            encoder.join()
+            inserter.join()
+
+        if errors:
+            print(f"Error during streaming ingestion: {errors[0]}")
+            raise errors[0]
+        print(f"Successfully appended {counts['duckdb']} rows to DuckDB and {counts['milvus']} entities to Milvus.")
+        return counts["duckdb"], counts["milvus"], counts["total"]
+
+    def _texts_to_embed(self, df: pd.DataFrame) -> List[str]:
+        return [
+            ' '.join(f"{col}: {val}" for col, val in zip(self.VECTOR_FIELDS, row) if val)
+            for row in df[self.VECTOR_FIELDS].itertuples(index=False, name=None)
+        ]
+
     def _filter_valid_records(self, data: List[Dict[str, str]]) -> List[Dict[str, str]]:
         """
         過濾掉空記錄，只保留有有效資料的記錄
@@ -102,75 +281,26 @@ class DBIngestor:
         
         return False
 
-    def _ingest_to_duckdb(self, df: pd.DataFrame) -> int:
-        print("--- Ingesting to DuckDB ---")
-        try:
-            # Check if DuckDB file exists
-            db_exists = os.path.exists(self.DUCKDB_FILE)
-            if db_exists:
-                print(f"Found existing DuckDB file '{self.DUCKDB_FILE}'. Appending data...")
-            else:
-                print(f"DuckDB file '{self.DUCKDB_FILE}' not found. Creating new database...")
-            
-            with duckdb.connect(database=self.DUCKDB_FILE, read_only=False) as con:
-                # Check if table exists using DuckDB syntax
-                table_check = con.execute("SELECT table_name FROM information_schema.tables WHERE table_name = 'specs'").fetchone()
-                if table_check:
-                    print("Found existing 'specs' table. Appending data...")
-                else:
-                    print("Creating new 'specs' table...")
-                
-                con.execute(f"CREATE TABLE IF NOT EXISTS specs ({', '.join([f'{col} VARCHAR' for col in self.ALL_FIELDS])})")
-                con.execute("INSERT INTO specs SELECT * FROM df")
-            
-            print(f"Successfully appended {len(df)} rows to DuckDB 'specs' table.")
-            return len(df)
-        except Exception as e:
-            print(f"Error ingesting to DuckDB: {e}")
-            raise
-
-    def _ingest_to_milvus(self, df: pd.DataFrame) -> int:
-        print("--- Ingesting to Milvus ---")
-        try:
-            print(f"Connecting to Milvus at {self.MILVUS_HOST}:{self.MILVUS_PORT}...")
-            connections.connect("default", host=self.MILVUS_HOST, port=self.MILVUS_PORT)
-
-            if not utility.has_collection(self.COLLECTION_NAME):
-                print(f"Collection '{self.COLLECTION_NAME}' not found. Creating new collection...")
-                fields = [FieldSchema(name="pk", dtype=DataType.INT64, is_primary=True, auto_id=True)]
-                for col_name in self.ALL_FIELDS:
-                    fields.append(FieldSchema(name=col_name, dtype=DataType.VARCHAR, max_length=2048))
-                fields.append(FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.EMBEDDING_DIM))
-                schema = CollectionSchema(fields, "Notebook Specifications Knowledge Base")
-                collection = Collection(self.COLLECTION_NAME, schema)
-                
-                print("Creating vector index for embedding field...")
-                index_params = {"metric_type": "L2", "index_type": "IVF_FLAT", "params": {"nlist": 128}}
-                collection.create_index("embedding", index_params)
-                print("New collection created successfully.")
-            else:
-                print(f"Found existing collection '{self.COLLECTION_NAME}'. Appending data...")
-                collection = Collection(self.COLLECTION_NAME)
-
-            # Filter VECTOR_FIELDS to only include columns that exist in the DataFrame
-            available_vector_fields = [field for field in self.VECTOR_FIELDS if field in df.columns]
-            print(f"Generating embeddings for {len(available_vector_fields)} vector fields...")
-            
-            texts_to_embed = df[available_vector_fields].apply(
-                lambda row: ' '.join([f"{col}: {val}" for col, val in row.items() if val]), 
-                axis=1
-            ).tolist()
-            
-            vectors = self.embedding_model.encode(texts_to_embed, show_progress_bar=True)
-            
-            print("Preparing data for insertion...")
-            entities = [df[col].tolist() for col in self.ALL_FIELDS]
-            entities.append(vectors.tolist())
-            
-            collection.insert(entities)
-            collection.flush()
-            print(f"Successfully appended {len(df)} entities to Milvus collection '{self.COLLECTION_NAME}'.")
-            return len(df)
-        except Exception as e:
-            print(f"Error ingesting to Milvus: {e}")
-            raise
\ No newline at end of file
+    def _get_collection(self) -> "Collection":
+        if not MILVUS_AVAILABLE:
+            raise RuntimeError("pymilvus 未安裝，無法寫入 Milvus")
+        print(f"Connecting to Milvus at {self.MILVUS_HOST}:{self.MILVUS_PORT}...")
+        connections.connect("default", host=self.MILVUS_HOST, port=self.MILVUS_PORT)
+
+        if utility.has_collection(self.COLLECTION_NAME):
+            print(f"Found existing collection '{self.COLLECTION_NAME}'. Appending data...")
+            return Collection(self.COLLECTION_NAME)
+
+        print(f"Collection '{self.COLLECTION_NAME}' not found. Creating new collection...")
+        fields = [FieldSchema(name="pk", dtype=DataType.INT64, is_primary=True, auto_id=True)]
+        for col_name in self.ALL_FIELDS:
+            fields.append(FieldSchema(name=col_name, dtype=DataType.VARCHAR, max_length=2048))
+        fields.append(FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.EMBEDDING_DIM))
+        schema = CollectionSchema(fields, "Notebook Specifications Knowledge Base")
+        collection = Collection(self.COLLECTION_NAME, schema)
+
+        print("Creating vector index for embedding field...")
+        index_params = {"metric_type": "L2", "index_type": "IVF_FLAT", "params": {"nlist": 128}}
+        collection.create_index("embedding", index_params)
+        print("New collection created successfully.")
+        return collection
@@ -47,6 +47,23 @@ def init_history_database():
     except Exception as e:
         logger.error(f"Failed to initialize history database: {e}")
 
+def insert_history_record(filename: str, data_type: str, record_count: int, error_count: int,
+                          status: str, metadata: Dict[str, Any] = None) -> int:
+    """同步寫入一筆歷史記錄（背景匯入工作使用，不限於成功的記錄）"""
+    init_history_database()
+    conn = sqlite3.connect(str(DB_PATH))
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO data_history 
+            (filename, data_type, record_count, error_count, status, metadata)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (filename, data_type, record_count, error_count, status, json.dumps(metadata or {}, ensure_ascii=False)))
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
 @router.on_event("startup")
 async def startup_event():
     """應用啟動時初始化資料庫"""
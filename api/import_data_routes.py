@@ -1,12 +1,14 @@
 # api/import_data_routes.py
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional
+import asyncio
 import logging
 import re
 
 from .csv_processor2 import CSVProcessor2
-from .db_ingestor import DBIngestor
+from .ingest_jobs import get_job_manager, job_event_stream
 
 logger = logging.getLogger(__name__)
 
@@ -30,12 +32,18 @@ class ProcessResponse(BaseModel):
 
 class IngestRequest(BaseModel):
     data: List[Dict[str, str]]
+    file_name: Optional[str] = None
+    background: bool = False  # True 時立即回傳 job_id，進度由 /jobs/{job_id}/events 取得
 
 class IngestResponse(BaseModel):
     success: bool
     message: str
     duckdb_rows_added: int
     milvus_entities_added: int
+    job_id: Optional[str] = None
+
+# SSE 進度輪詢間隔（秒）
+JOB_EVENT_POLL_SECONDS = 0.5
 
 def validate_regex_patterns(patterns):
     """Validate regex patterns for safety"""
@@ -52,10 +60,11 @@ def validate_regex_patterns(patterns):
     return True
 
 @router.post("/process", response_model=ProcessResponse, tags=["Import"])
-def process_csv_content(request: ProcessRequest):
+async def process_csv_content(request: ProcessRequest):
     """
     處理 CSV 內容並返回解析結果 (使用 CSVProcessor2 strategy pattern)
     支援三階段 modeltype 判斷：檔名→內容→用戶輸入
+    解析在背景執行緒中執行，不阻塞事件迴圈
     """
     try:
         # 驗證輸入
@@ -65,7 +74,9 @@ def process_csv_content(request: ProcessRequest):
             raise HTTPException(status_code=400, detail="Invalid regex patterns provided.")
         
         processor = CSVProcessor2()
-        result = processor.process_csv_content(
+        # 互動式解析不排在匯入工作池（預設只有 1 個工作執行緒）後面
+        result = await asyncio.to_thread(
+            processor.process_csv_content,
             csv_content=request.text_content,
             custom_rules=request.custom_rules
         )
@@ -137,27 +148,105 @@ def process_csv_content(request: ProcessRequest):
         raise HTTPException(status_code=500, detail=f"CSV processing failed: {str(e)}")
 
 @router.post("/ingest-to-db", response_model=IngestResponse, tags=["Import"])
-def ingest_data_to_db(request: IngestRequest):
+async def ingest_data_to_db(request: IngestRequest):
     """
     將解析後的資料匯入到 DuckDB 和 Milvus 資料庫
+    以背景工作執行；background=True 時立即回傳 job_id，否則等待工作完成後回傳結果
     """
     if not request.data:
         raise HTTPException(status_code=400, detail="data cannot be empty.")
     
     try:
-        ingestor = DBIngestor()
-        duckdb_count, milvus_count = ingestor.ingest(request.data)
+        manager = get_job_manager()
+        job = manager.submit(request.data, filename=request.file_name or "", kind="ingest")
+        if request.background:
+            return IngestResponse(
+                success=True,
+                message="Data ingestion job submitted.",
+                duckdb_rows_added=0,
+                milvus_entities_added=0,
+                job_id=job["job_id"]
+            )
+        
+        job = await asyncio.wrap_future(manager.wait(job["job_id"]))
+        if job["status"] != "completed":
+            raise ValueError(job.get("error") or f"Data ingestion job {job['status']}")
+        result = job["result"] or {}
+        if not result.get("duckdb_rows_added"):
+            raise ValueError("No valid records found after filtering empty data")
         
         return IngestResponse(
             success=True,
             message="Data ingestion successful.",
-            duckdb_rows_added=duckdb_count,
-            milvus_entities_added=milvus_count
+            duckdb_rows_added=result["duckdb_rows_added"],
+            milvus_entities_added=result["milvus_entities_added"],
+            job_id=job["job_id"]
         )
     except Exception as e:
         logger.error(f"Data ingestion failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/jobs", tags=["Import"])
+def list_ingest_jobs(limit: int = 50):
+    """
+    列出匯入工作（新到舊）
+    """
+    return {"jobs": get_job_manager().list_jobs(limit)}
+
+@router.get("/jobs/{job_id}", tags=["Import"])
+def get_ingest_job(job_id: str):
+    """
+    取得匯入工作狀態與進度
+    """
+    try:
+        return get_job_manager().get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+@router.get("/jobs/{job_id}/events", tags=["Import"])
+async def stream_ingest_job(job_id: str):
+    """
+    以 SSE 串流匯入工作的進度（已解析、已嵌入、已寫入、錯誤數），工作結束時關閉
+    """
+    manager = get_job_manager()
+    try:
+        manager.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+    return StreamingResponse(
+        job_event_stream(manager, job_id, JOB_EVENT_POLL_SECONDS),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': 'Cache-Control'
+        }
+    )
+
+@router.post("/jobs/{job_id}/cancel", tags=["Import"])
+def cancel_ingest_job(job_id: str):
+    """
+    取消匯入工作（已送出的批次寫完並 flush 後停止）
+    """
+    try:
+        return get_job_manager().cancel(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+@router.post("/jobs/{job_id}/resume", tags=["Import"])
+def resume_ingest_job(job_id: str):
+    """
+    從最後的檢查點續傳已取消、失敗或中斷的匯入工作
+    """
+    try:
+        return get_job_manager().resume(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/parser-info", tags=["Import"])
 def get_parser_info():
     """
@@ -178,5 +267,5 @@ def health_check():
     return {
         "status": "healthy",
         "service": "MLINFO Data Import Integration",
-        "endpoints": ["/process", "/ingest-to-db", "/parser-info"]
+        "endpoints": ["/process", "/ingest-to-db", "/jobs", "/parser-info"]
     }
\ No newline at end of file
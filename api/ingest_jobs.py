@@ -0,0 +1,342 @@
+# api/ingest_jobs.py
+"""
+背景匯入工作
+匯入請求送出後立即回傳 job id，實際工作在專用的工作執行緒池中執行，不佔用 API 的工作執行緒；
+進度（已解析、已嵌入、已寫入、錯誤數）可由 SSE 串流取得，工作可取消並從檢查點續傳，
+結束時寫入歷史資料庫。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from .db_ingestor import DBIngestor
+
+logger = logging.getLogger(__name__)
+
+JOB_DIR = Path(__file__).parent.parent / "db" / "ingest_jobs"
+MAX_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "1"))
+# 規格驗證工作每處理幾筆寫一次檢查點
+SPECS_CHECKPOINT_EVERY = 100
+
+QUEUED = "queued"
+RUNNING = "running"
+CANCELLING = "cancelling"
+CANCELLED = "cancelled"
+COMPLETED = "completed"
+FAILED = "failed"
+INTERRUPTED = "interrupted"
+TERMINAL_STATES = {CANCELLED, COMPLETED, FAILED, INTERRUPTED}
+RESUMABLE_STATES = {CANCELLED, FAILED, INTERRUPTED}
+
+
+class IngestJobManager:
+    """管理背景匯入工作：提交、進度、取消、續傳與持久化"""
+
+    def __init__(self, job_dir: Path = JOB_DIR, max_workers: int = MAX_WORKERS,
+                 ingestor_factory: Callable[[], DBIngestor] = DBIngestor,
+                 history_recorder: Optional[Callable[..., None]] = None):
+        """
+        Args:
+            job_dir: 工作狀態與待匯入資料的保存目錄
+            max_workers: 同時執行的匯入工作數
+            ingestor_factory: 建立 DBIngestor 的函式
+            history_recorder: 寫入歷史記錄的函式，預設為 history_routes.insert_history_record
+        """
+        self.job_dir = Path(job_dir)
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest-job")
+        self.ingestor_factory = ingestor_factory
+        if history_recorder is None:
+            from .history_routes import insert_history_record as history_recorder
+        self.history_recorder = history_recorder
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._payloads: Dict[str, List[Dict[str, str]]] = {}
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._futures: Dict[str, Future] = {}
+        self._parsed_rows: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load_jobs()
+
+    # ---- 持久化 ----
+
+    def _job_path(self, job_id: str) -> Path:
+        return self.job_dir / f"{job_id}.json"
+
+    def _payload_path(self, job_id: str) -> Path:
+        return self.job_dir / f"{job_id}.payload.json"
+
+    def _save(self, job: Dict[str, Any]):
+        job["updated_at"] = time.time()
+        tmp_path = self._job_path(job["job_id"]).with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, self._job_path(job["job_id"]))
+
+    def _load_jobs(self):
+        """載入先前的工作；服務重啟時仍在執行的工作標記為 interrupted（可續傳）"""
+        for path in self.job_dir.glob("*.json"):
+            if path.name.endswith(".payload.json"):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"讀取匯入工作 {path.name} 失敗: {e}")
+                continue
+            if job.get("status") not in TERMINAL_STATES:
+                job["status"] = INTERRUPTED
+                self._save(job)
+            self._jobs[job["job_id"]] = job
+
+    def _load_payload(self, job_id: str) -> List[Dict[str, str]]:
+        if job_id not in self._payloads:
+            with open(self._payload_path(job_id), "r", encoding="utf-8") as f:
+                self._payloads[job_id] = json.load(f)
+        return self._payloads[job_id]
+
+    # ---- 提交與控制 ----
+
+    def submit(self, data: List[Dict[str, str]], filename: str = "", kind: str = "ingest") -> Dict[str, Any]:
+        """
+        提交匯入工作並立即回傳
+
+        Args:
+            data: 要匯入的記錄
+            filename: 來源檔名（寫入歷史記錄）
+            kind: ingest（DuckDB + Milvus）或 specs（規格驗證）
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "filename": filename or "",
+            "status": QUEUED,
+            "created_at": time.time(),
+            "progress": {
+                "rows_total": len(data), "rows_parsed": 0, "rows_embedded": 0,
+                "rows_inserted": 0, "errors": 0,
+            },
+            "checkpoint": {"duckdb": 0, "milvus": 0},
+            "result": None,
+            "error": None,
+        }
+        with open(self._payload_path(job_id), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        with self._lock:
+            self._jobs[job_id] = job
+            self._payloads[job_id] = data
+            self._save(job)
+        self._start(job_id)
+        logger.info(f"已提交匯入工作 {job_id}（{kind}，{len(data)} 筆）")
+        return self.get(job_id)
+
+    def _start(self, job_id: str):
+        self._cancel_events[job_id] = threading.Event()
+        self._futures[job_id] = self.executor.submit(self._run, job_id)
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        """要求取消：目前批次寫完並 flush 後停止，可稍後續傳"""
+        cancelled_queued = False
+        with self._lock:
+            job = self._require(job_id)
+            if job["status"] == QUEUED:
+                job["status"] = CANCELLED
+                job["finished_at"] = time.time()
+                self._save(job)
+                cancelled_queued = True
+            elif job["status"] == RUNNING:
+                job["status"] = CANCELLING
+                self._save(job)
+            event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+        # 尚未開始的工作不會經過 _run，在此寫入歷史記錄
+        if cancelled_queued:
+            self._record_history(self.get(job_id))
+        return self.get(job_id)
+
+    def resume(self, job_id: str) -> Dict[str, Any]:
+        """從檢查點續傳已取消、失敗或中斷的工作"""
+        with self._lock:
+            job = self._require(job_id)
+            if job["status"] not in RESUMABLE_STATES:
+                raise ValueError(f"工作狀態為 {job['status']}，無法續傳")
+            job["status"] = QUEUED
+            job["error"] = None
+            self._save(job)
+        self._start(job_id)
+        return self.get(job_id)
+
+    def wait(self, job_id: str) -> Future:
+        """取得工作的 Future（供需要同步結果的端點 await）"""
+        return self._futures[job_id]
+
+    def get(self, job_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return json.loads(json.dumps(self._require(job_id)))
+
+    def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda job: job["created_at"], reverse=True)
+            return json.loads(json.dumps(jobs[:limit]))
+
+    def _require(self, job_id: str) -> Dict[str, Any]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+    # ---- 執行 ----
+
+    def _update(self, job_id: str, **changes):
+        with self._lock:
+            job = self._jobs[job_id]
+            for key, value in changes.items():
+                job[key] = value
+            self._save(job)
+
+    def _on_progress(self, job_id: str, stage: str, batch_index: int, rows: int):
+        with self._lock:
+            job = self._jobs[job_id]
+            progress, checkpoint = job["progress"], job["checkpoint"]
+            if stage == "parsed":
+                progress["rows_parsed"] += rows
+                self._parsed_rows[job_id] = rows
+            elif stage == "duckdb":
+                # 批次中被過濾掉的空記錄計為錯誤
+                progress["errors"] += self._parsed_rows.pop(job_id, rows) - rows
+                checkpoint["duckdb"] = max(checkpoint["duckdb"], batch_index + 1)
+            elif stage == "embedded":
+                progress["rows_embedded"] += rows
+            elif stage == "inserted":
+                # Milvus 已接受的批次即為檢查點（主鍵為 auto_id，續傳重送會產生重複資料）
+                progress["rows_inserted"] += rows
+                checkpoint["milvus"] = max(checkpoint["milvus"], batch_index + 1)
+            self._save(job)
+
+    def _run(self, job_id: str):
+        job = self.get(job_id)
+        if job["status"] == CANCELLED:
+            return job
+        self._update(job_id, status=RUNNING, started_at=time.time())
+        cancel_event = self._cancel_events[job_id]
+        try:
+            data = self._load_payload(job_id)
+            if job["kind"] == "specs":
+                result = self._run_specs(job_id, data, cancel_event)
+            else:
+                result = self._run_ingest(job_id, data, cancel_event)
+            status = CANCELLED if cancel_event.is_set() else COMPLETED
+            self._update(job_id, status=status, result=result, finished_at=time.time())
+        except Exception as e:
+            logger.error(f"匯入工作 {job_id} 失敗: {e}")
+            with self._lock:
+                self._jobs[job_id]["progress"]["errors"] += 1
+            self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+        job = self.get(job_id)
+        self._record_history(job)
+        if job["status"] == COMPLETED:
+            self._payload_path(job_id).unlink(missing_ok=True)
+            self._payloads.pop(job_id, None)
+        return job
+
+    def _run_ingest(self, job_id: str, data: List[Dict[str, str]], cancel_event: threading.Event) -> Dict[str, Any]:
+        ingestor = self.ingestor_factory()
+        checkpoint = self.get(job_id)["checkpoint"]
+        duckdb_count, milvus_count, total = ingestor.ingest_stream(
+            ingestor._iter_record_batches(data),
+            progress_callback=lambda stage, index, rows: self._on_progress(job_id, stage, index, rows),
+            cancel_event=cancel_event,
+            resume_from=checkpoint,
+        )
+        return {"duckdb_rows_added": duckdb_count, "milvus_entities_added": milvus_count, "records": total}
+
+    def _run_specs(self, job_id: str, data: List[Dict[str, Any]], cancel_event: threading.Event) -> Dict[str, Any]:
+        from .specs_routes import validate_spec_item, save_spec_to_database
+
+        start = self.get(job_id)["checkpoint"]["duckdb"]
+        success = error = 0
+        for index in range(start, len(data)):
+            if cancel_event.is_set():
+                break
+            try:
+                ok = validate_spec_item(data[index])
+                if ok:
+                    save_spec_to_database(data[index])
+            except Exception as e:
+                logger.error(f"Error processing item: {e}")
+                ok = False
+            success += int(ok)
+            error += int(not ok)
+            with self._lock:
+                job = self._jobs[job_id]
+                job["progress"]["rows_parsed"] += 1
+                job["progress"]["rows_inserted" if ok else "errors"] += 1
+                job["checkpoint"]["duckdb"] = index + 1
+                if (index + 1) % SPECS_CHECKPOINT_EVERY == 0:
+                    self._save(job)
+        with self._lock:
+            self._save(self._jobs[job_id])
+        return {"processed": success + error, "success": success, "errors": error}
+
+    def _record_history(self, job: Dict[str, Any]):
+        progress = job["progress"]
+        if job["status"] == COMPLETED:
+            status = "success" if progress["errors"] == 0 else "partial"
+        else:
+            status = job["status"]
+        try:
+            self.history_recorder(
+                filename=job["filename"] or job["job_id"],
+                data_type="specifications" if job["kind"] == "specs" else "ingestion",
+                record_count=progress["rows_inserted"],
+                error_count=progress["errors"],
+                status=status,
+                metadata={"job_id": job["job_id"], "progress": progress, "result": job.get("result"), "error": job.get("error")},
+            )
+        except Exception as e:
+            logger.error(f"寫入匯入工作歷史記錄失敗: {e}")
+
+
+def _event_payload(job: Dict[str, Any]) -> str:
+    return json.dumps(
+        {"job_id": job["job_id"], "status": job["status"], "progress": job["progress"],
+         "result": job.get("result"), "error": job.get("error")},
+        ensure_ascii=False
+    )
+
+
+async def job_event_stream(manager: IngestJobManager, job_id: str, poll_seconds: float = 0.5) -> AsyncIterator[str]:
+    """
+    工作進度的 SSE 事件：進度有變動時送出一筆 data 事件，工作結束後停止
+    """
+    last_payload = None
+    while True:
+        job = manager.get(job_id)
+        payload = _event_payload(job)
+        if payload != last_payload:
+            last_payload = payload
+            yield f"data: {payload}\n\n"
+        if job["status"] in TERMINAL_STATES:
+            break
+        await asyncio.sleep(poll_seconds)
+
+
+_manager: Optional[IngestJobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> IngestJobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = IngestJobManager()
+        return _manager
@@ -5,6 +5,7 @@ MGFD API路由 - FastAPI版本
 
 import logging
 import json
+import asyncio
 import redis
 import uuid
 from typing import Dict, Any, Optional
@@ -18,7 +19,8 @@ from libs.MGFDKernel import MGFDKernel
 from .models import (
     ChatRequest, ChatResponse, SessionState, ChatHistoryResponse,
     SystemStatus, HealthResponse, ErrorResponse, StreamResponse,
-    ResetSessionRequest, ResetSessionResponse, APIVersion
+    ResetSessionRequest, ResetSessionResponse, APIVersion,
+    BatchSearchRequest, BatchSearchResponse
 )
 
 # 創建Router
@@ -288,6 +290,51 @@ async def health_check():
 # 注意：異常處理器和中間件應該在應用程式級別處理，而不是在Router級別
 
 
+@router.post("/search/batch", response_model=BatchSearchResponse, tags=["search"])
+async def batch_search(
+    request: BatchSearchRequest,
+    mgfd: MGFDKernel = Depends(get_mgfd_system)
+):
+    """
+    批次語義搜尋（一次編碼、一次多向量 Milvus 搜尋）
+    
+    - **queries**: 查詢文本列表
+    - **top_k**: 每個查詢的返回結果數量
+    - **filters**: 槽位過濾條件（可選）
+    - **include_content**: 是否回傳 chunk 內容
+    """
+    try:
+        logger.info(f"批次語義搜尋 - 查詢數: {len(request.queries)}, top_k: {request.top_k}")
+        
+        batch_results = await asyncio.to_thread(
+            mgfd.knowledge_manager.batch_semantic_search,
+            request.queries,
+            request.top_k,
+            request.filters,
+            None,
+            request.include_content
+        )
+        
+        if batch_results is None:
+            raise HTTPException(status_code=503, detail="語義搜尋服務不可用")
+        
+        return BatchSearchResponse(
+            success=True,
+            results=[
+                {"query": query, "results": results}
+                for query, results in zip(request.queries, batch_results)
+            ],
+            count=len(batch_results),
+            timestamp=datetime.now().isoformat()
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"批次語義搜尋時發生錯誤: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"系統內部錯誤: {str(e)}")
+
+
 # 新增 mgfd_cursor 前端所需的端點
 @router.post("/session/create", response_model=dict, tags=["mgfd_cursor"])
 async def create_session(
@@ -211,6 +211,33 @@ class ResetSessionResponse(BaseModel):
         }
 
 
+
+class BatchSearchRequest(BaseModel):
+    """批次語義搜尋請求模型"""
+    queries: List[str] = Field(..., description="查詢文本列表", min_items=1, max_items=50)
+    top_k: int = Field(5, description="每個查詢的返回結果數量", ge=1, le=50)
+    filters: Optional[Dict[str, Any]] = Field(None, description="槽位過濾條件（如 weight、screen_size、gpu_tier）")
+    include_content: bool = Field(False, description="是否回傳 chunk 內容")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "queries": ["輕薄好攜帶的筆電", "適合遊戲的筆電"],
+                "top_k": 5,
+                "filters": {"screen_size": "14"},
+                "include_content": False
+            }
+        }
+
+
+class BatchSearchResponse(BaseModel):
+    """批次語義搜尋回應模型"""
+    success: bool = Field(..., description="請求是否成功")
+    results: List[Dict[str, Any]] = Field(default_factory=list, description="每個查詢的搜尋結果")
+    count: int = Field(..., description="查詢數量")
+    timestamp: str = Field(..., description="時間戳")
+
+
 # 用於API文檔的標籤
 tags_metadata = [
     {
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, File, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
 import pandas as pd
+import asyncio
 import io
 import logging
 from typing import Dict, Any
@@ -59,7 +60,7 @@ async def upload_specs_file(file: UploadFile = File(...)):
 
 @router.post("/process")
 async def process_specs_data(data: Dict[Any, Any]):
-    """處理規格資料並存入資料庫"""
+    """處理規格資料並存入資料庫（以背景匯入工作執行，background 為 True 時立即回傳 job_id）"""
     try:
         filename = data.get("filename")
         specs_data = data.get("data")
@@ -67,39 +68,27 @@ async def process_specs_data(data: Dict[Any, Any]):
         if not filename or not specs_data:
             raise HTTPException(status_code=400, detail="缺少必要的資料")
         
-        # 模擬資料處理流程
-        processed_count = 0
-        success_count = 0
-        error_count = 0
+        from .ingest_jobs import get_job_manager
+        manager = get_job_manager()
+        job = manager.submit(specs_data, filename=filename, kind="specs")
+        if data.get("background"):
+            return {"status": job["status"], "job_id": job["job_id"]}
         
-        # 這裡應該包含實際的資料處理邏輯
-        # 例如：驗證資料格式、轉換資料、存入資料庫等
-        
-        for item in specs_data:
-            try:
-                processed_count += 1
-                # 模擬資料驗證和處理
-                if validate_spec_item(item):
-                    # 存入資料庫
-                    save_spec_to_database(item)
-                    success_count += 1
-                else:
-                    error_count += 1
-            except Exception as e:
-                logger.error(f"Error processing item: {e}")
-                error_count += 1
-        
-        # 如果成功處理了資料，記錄到歷史
-        if success_count > 0:
-            await record_to_history(filename, success_count, error_count)
+        job = await asyncio.wrap_future(manager.wait(job["job_id"]))
+        if job["status"] == "failed":
+            raise RuntimeError(job.get("error"))
+        result = job["result"] or {}
         
         return {
             "status": "completed",
-            "processed": processed_count,
-            "success": success_count,
-            "errors": error_count
+            "processed": result.get("processed", 0),
+            "success": result.get("success", 0),
+            "errors": result.get("errors", 0),
+            "job_id": job["job_id"]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing specs data: {str(e)}")
         raise HTTPException(status_code=500, detail=f"資料處理失敗: {str(e)}")
@@ -121,21 +110,6 @@ def save_spec_to_database(item: Dict[Any, Any]):
     # 暫時跳過實際的資料庫操作
     pass
 
-async def record_to_history(filename: str, success_count: int, error_count: int):
-    """記錄到歷史資料庫"""
-    try:
-        # 這裡應該調用歷史 API 或直接操作資料庫
-        from .history_routes import add_history_record
-        await add_history_record({
-            "filename": filename,
-            "data_type": "specifications",
-            "record_count": success_count,
-            "error_count": error_count,
-            "status": "success" if error_count == 0 else "partial"
-        })
-    except Exception as e:
-        logger.error(f"Failed to record to history: {e}")
-
 @router.get("/template")
 async def get_template():
     """獲取規格資料模板"""
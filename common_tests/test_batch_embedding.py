@@ -0,0 +1,87 @@
+import numpy as np
+
+from libs.chunk_utils.chunking import ProductChunkingEngine, SemanticChunkingEngine
+
+
+class FakeEncoder:
+    """記錄 encode 呼叫次數的假模型"""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        if isinstance(texts, str):
+            self.calls.append(1)
+            return np.full(4, float(len(texts)), dtype=np.float32)
+        self.calls.append(len(texts))
+        return np.array([[float(len(text))] * 4 for text in texts], dtype=np.float32)
+
+
+PRODUCTS = [
+    {"modeltype": str(819 + i), "modelname": f"AB{819 + i}", "cpu": "AMD Ryzen 7", "gpu": "Radeon",
+     "memory": "16GB DDR5", "storage": "512GB SSD", "lcd": "14 inch FHD", "battery": "3 cell 50Wh"}
+    for i in range(5)
+]
+
+
+def test_batch_create_chunks_encodes_in_batches():
+    for engine_cls in (ProductChunkingEngine, SemanticChunkingEngine):
+        engine = engine_cls(embedding_batch_size=8)
+        encoder = FakeEncoder()
+        engine.sentence_transformer = encoder
+
+        parents, children = engine.batch_create_chunks(PRODUCTS)
+
+        assert len(parents) == len(PRODUCTS)
+        # 整批文字只呼叫一次 encode，而非每個分塊一次
+        assert encoder.calls == [len(parents) + len(children)]
+        for chunk in parents + children:
+            assert chunk["embedding"] == [float(len(chunk["content"]))] * 4
+        assert all(child["parent_id"] in {p["chunk_id"] for p in parents} for child in children)
+
+        report = engine.last_batch_report
+        assert report["chunks"] == len(parents) + len(children)
+        assert report["embedding_batch_size"] == 8
+        assert {"text_seconds", "embedding_seconds", "attach_seconds", "chunks_per_second"} <= set(report)
+
+
+def test_create_chunks_matches_batch_output_and_falls_back_without_model():
+    engine = ProductChunkingEngine()
+    engine.sentence_transformer = None
+    parent, children = engine.create_chunks(PRODUCTS[0])
+    batch_parents, batch_children = engine.batch_create_chunks(PRODUCTS[:1])
+
+    assert parent["embedding"] == batch_parents[0]["embedding"]
+    assert [c["embedding"] for c in children] == [c["embedding"] for c in batch_children]
+    assert len(parent["embedding"]) == 384
+
+
+def test_embedding_store_skips_already_encoded_chunks(tmp_path):
+    from libs.KnowledgeManageHandler.embedding_store import EmbeddingStore
+
+    engine = SemanticChunkingEngine(embedding_store=EmbeddingStore(tmp_path, "fake"))
+    encoder = FakeEncoder()
+    engine.sentence_transformer = encoder
+
+    first_parents, _ = engine.batch_create_chunks(PRODUCTS[:2])
+    parents, _ = engine.batch_create_chunks(PRODUCTS)
+    # 第二次只編碼新產品的分塊
+    assert encoder.calls == [8, 12]
+    assert parents[0]["embedding"] == first_parents[0]["embedding"]
+
+
+def test_parallel_chunk_build_matches_serial_output():
+    serial = SemanticChunkingEngine(load_model=False)
+    parallel = SemanticChunkingEngine(load_model=False, chunk_build_processes=2)
+    parallel.CHUNK_BUILD_SHARD_SIZE = 2
+
+    serial_parents, serial_children = serial.batch_create_chunks(PRODUCTS)
+    parallel_parents, parallel_children = parallel.batch_create_chunks(PRODUCTS)
+
+    for expected, actual in ((serial_parents, parallel_parents), (serial_children, parallel_children)):
+        assert [c["chunk_id"] for c in actual] == [c["chunk_id"] for c in expected]
+        assert [c["content"] for c in actual] == [c["content"] for c in expected]
+    # raw_product 指回主程序的產品物件，統計與單程序相同
+    assert parallel_parents[0]["raw_product"] is PRODUCTS[0]
+    assert parallel.stats["total_products_processed"] == serial.stats["total_products_processed"]
+    assert parallel.last_batch_report["chunk_build_processes"] == 2
@@ -0,0 +1,87 @@
+import logging
+from types import SimpleNamespace
+
+import numpy as np
+
+from libs.KnowledgeManageHandler.knowledge_manager import KnowledgeManager
+from libs.KnowledgeManageHandler.scalar_filters import ScalarFilterCompiler
+
+FIELDS = ["chunk_id", "product_id", "chunk_type", "semantic_group", "content", "embedding", "screen_size"]
+
+
+class FakeEncoder:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32):
+        self.calls.append(list(texts))
+        return np.array([[float(len(text)), 0.0] for text in texts])
+
+
+class FakeCollection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.searches = []
+        self.schema = SimpleNamespace(fields=[SimpleNamespace(name=name) for name in FIELDS])
+
+    def search(self, data, anns_field, param, limit, output_fields, expr=None):
+        self.searches.append({"data": data, "limit": limit, "output_fields": output_fields, "expr": expr})
+        if self.fail:
+            raise RuntimeError("milvus down")
+        # 每個查詢向量一組 hits，以向量值標記 chunk_id 以檢查順序
+        return [
+            [SimpleNamespace(entity={"chunk_id": f"q{int(vector[0])}_{rank}", "product_id": "819",
+                                     "chunk_type": "semantic_child", "semantic_group": "performance",
+                                     "content": "spec"}, distance=float(rank))
+             for rank in range(limit)]
+            for vector in data
+        ]
+
+
+def _manager(collection):
+    manager = KnowledgeManager.__new__(KnowledgeManager)
+    manager.logger = logging.getLogger("test_batch_semantic_search")
+    manager.milvus_query = SimpleNamespace(collection=collection)
+    manager.sentence_transformer = FakeEncoder()
+    manager.scalar_filter_compiler = ScalarFilterCompiler()
+    manager._milvus_field_names = None
+    return manager
+
+
+def test_queries_are_encoded_and_searched_once_in_order():
+    collection = FakeCollection()
+    manager = _manager(collection)
+
+    results = manager.batch_semantic_search(["a", "bbb", "cc"], top_k=2, filters={"screen_size": "14"})
+
+    assert manager.sentence_transformer.calls == [["a", "bbb", "cc"]]
+    assert len(collection.searches) == 1
+    search = collection.searches[0]
+    assert search["data"] == [[1.0, 0.0], [3.0, 0.0], [2.0, 0.0]]
+    assert search["expr"] == '(screen_size in ["14"])'
+    assert "content" not in search["output_fields"]
+    assert [[hit["chunk_id"] for hit in hits] for hits in results] == [
+        ["q1_0", "q1_1"], ["q3_0", "q3_1"], ["q2_0", "q2_1"]
+    ]
+    assert all("content" not in hit for hits in results for hit in hits)
+    assert results[0][1]["similarity_score"] == 0.5
+
+
+def test_include_content_requests_and_returns_content():
+    manager = _manager(FakeCollection())
+    results = manager.batch_semantic_search(["a"], top_k=1, include_content=True)
+    assert results[0][0]["content"] == "spec"
+
+
+def test_empty_input_and_errors():
+    collection = FakeCollection(fail=True)
+    manager = _manager(collection)
+    assert manager.batch_semantic_search([]) == []
+    assert manager.sentence_transformer.calls == [] and collection.searches == []
+
+    assert manager.batch_semantic_search(["a"]) is None
+
+    manager.sentence_transformer = None
+    assert manager.batch_semantic_search(["a"]) is None
+    manager.milvus_query = None
+    assert manager.batch_semantic_search(["a"]) is None
@@ -0,0 +1,30 @@
+from libs.KnowledgeManageHandler.catalog_entity_detector import CatalogEntityDetector
+
+
+CATALOG = [
+    ("819", "AB819-S: FP6"),
+    ("819", "APX819: FP7R2"),
+    ("958", "AG958"),
+    ("958", "AG958P"),
+    ("839", "APX839"),
+]
+
+
+def test_detects_modelnames_aliases_and_modeltypes_in_one_pass():
+    detector = CatalogEntityDetector(CATALOG)
+
+    result = detector.detect("比較 APX819: FP7R2、ab819-s 和 AG958P 的CPU")
+
+    assert [e["text"] for e in result["entities"]] == ["APX819: FP7R2", "ab819-s", "AG958P"]
+    assert result["modelnames"] == ["APX819: FP7R2", "AB819-S: FP6", "AG958P"]
+    assert result["modeltypes"] == ["819", "958"]
+    assert result["has_context"] is True
+
+
+def test_modeltype_requires_boundaries_and_reports_exclusions():
+    detector = CatalogEntityDetector(CATALOG)
+
+    assert detector.detect("ABC8191 規格")["entities"] == []
+    result = detector.detect("2025年的839價格")
+    assert result["modeltypes"] == ["839"]
+    assert result["has_exclude"] is True
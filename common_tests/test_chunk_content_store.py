@@ -0,0 +1,71 @@
+import logging
+
+import duckdb
+
+import config
+from libs.KnowledgeManageHandler.chunk_content_store import (
+    write_chunk_contents, upsert_chunk_contents, delete_chunk_contents, fetch_chunk_contents
+)
+from libs.KnowledgeManageHandler.knowledge_manager import KnowledgeManager
+
+
+def _chunk(chunk_id, content, product_id="819"):
+    return {"chunk_id": chunk_id, "product_id": product_id, "chunk_type": "semantic_child",
+            "semantic_group": "performance", "content": content}
+
+
+class FakeCollection:
+    def __init__(self, contents):
+        self.contents = contents
+        self.queries = []
+
+    def query(self, expr, output_fields):
+        self.queries.append(expr)
+        return [{"chunk_id": cid, "content": text} for cid, text in self.contents.items() if f'"{cid}"' in expr]
+
+
+class FakeMilvusQuery:
+    def __init__(self, contents):
+        self.collection = FakeCollection(contents)
+
+
+def _manager(db_file, milvus_contents=None):
+    manager = KnowledgeManager.__new__(KnowledgeManager)
+    manager.logger = logging.getLogger("test_chunk_content_store")
+    manager.knowledge_bases = {config.DUCKDB_FILE: {"path": str(db_file)}}
+    manager.milvus_query = FakeMilvusQuery(milvus_contents or {})
+    return manager
+
+
+def test_write_upsert_and_delete_rows():
+    with duckdb.connect() as con:
+        assert write_chunk_contents(con, [_chunk("a", "A1"), _chunk("b", "B1")]) == 2
+        upsert_chunk_contents(con, [_chunk("b", "B2"), _chunk("c", "C1")])
+        assert fetch_chunk_contents(con, ["a", "b", "c", "missing", ""]) == {"a": "A1", "b": "B2", "c": "C1"}
+
+        assert delete_chunk_contents(con, ["a", "a"]) == 1
+        assert fetch_chunk_contents(con, ["a", "b"]) == {"b": "B2"}
+        # 重建會取代整張表
+        write_chunk_contents(con, [_chunk("d", "D1")])
+        assert fetch_chunk_contents(con, ["b", "d"]) == {"d": "D1"}
+
+
+def test_hydration_fills_only_requested_chunks(tmp_path):
+    db_file = tmp_path / "nb.db"
+    with duckdb.connect(str(db_file)) as con:
+        write_chunk_contents(con, [_chunk("a", "A1"), _chunk("b", "B1")])
+    manager = _manager(db_file, {"c": "C-milvus"})
+    results = [{"chunk_id": "a"}, {"chunk_id": "b", "content": "kept"}, {"chunk_id": "c"}, {"chunk_id": "x"}]
+
+    assert manager.hydrate_chunk_contents(results) is results
+    assert [r["content"] for r in results] == ["A1", "kept", "C-milvus", ""]
+    # 只有本地表缺少的 chunk 才查 Milvus
+    assert manager.milvus_query.collection.queries == ['chunk_id in ["c", "x"]']
+
+
+def test_hydration_falls_back_to_milvus_when_table_is_missing(tmp_path):
+    db_file = tmp_path / "nb.db"
+    duckdb.connect(str(db_file)).close()
+    manager = _manager(db_file, {"a": "A-milvus"})
+    results = manager.hydrate_chunk_contents([{"chunk_id": "a"}])
+    assert results == [{"chunk_id": "a", "content": "A-milvus"}]
@@ -0,0 +1,64 @@
+from libs.chunk_utils.chunking.chunk_dedup import (
+    ChunkDeduplicator, simhash, hamming_distance, remap_parent_ids, expand_duplicate_hits
+)
+from libs.KnowledgeManageHandler.ingest_manifest import IngestManifest
+from libs.KnowledgeManageHandler.scalar_filters import ScalarFilterCompiler, dedup_partition_key
+
+SPEC = "效能: Intel Core i7-1355U, 16GB DDR5, 512GB PCIe SSD, 14 吋 FHD IPS 螢幕, 電池 56Wh, 重量 1.4kg"
+
+
+def _chunk(chunk_id, product_id, content, embedding=None, **extra):
+    return {"chunk_id": chunk_id, "product_id": product_id, "chunk_type": "semantic_child",
+            "semantic_group": "performance", "content": content, "embedding": embedding, **extra}
+
+
+def test_simhash_is_close_for_near_duplicates():
+    assert hamming_distance(simhash(SPEC), simhash(SPEC.replace("1.4kg", "1.5kg"))) <= 6
+    assert hamming_distance(simhash(SPEC), simhash("遊戲筆電 RTX 4070 獨立顯卡 240Hz 電競螢幕")) > 6
+
+
+def test_near_duplicates_collapse_into_canonical_chunk():
+    chunks = [
+        _chunk("a", "819", SPEC, [1.0, 0.0]),
+        _chunk("b", "839", SPEC.replace("1.4kg", "1.5kg"), [0.999, 0.01]),
+        _chunk("c", "958", SPEC.replace("1.4kg", "1.6kg"), [0.0, 1.0]),  # 文字相近但向量不同
+        _chunk("d", "728", SPEC, [1.0, 0.0], semantic_group="design"),   # 不同語義組不合併
+    ]
+    canonical, duplicates = ChunkDeduplicator().deduplicate(chunks)
+
+    assert [chunk["chunk_id"] for chunk in canonical] == ["a", "c", "d"]
+    assert duplicates == {"b": "a"}
+    assert canonical[0]["product_ids"] == ["819", "839"]
+    assert canonical[0]["duplicate_chunk_ids"] == ["b"]
+    assert "product_ids" not in chunks[0]
+
+    children = remap_parent_ids([{"chunk_id": "x", "parent_id": "b"}], duplicates)
+    assert children[0]["parent_id"] == "a"
+
+
+def test_expand_hits_and_dissolve_groups(tmp_path):
+    hits = [{"chunk_id": "a", "product_id": "819", "product_ids": ["819", "839"], "similarity_score": 0.9},
+            {"chunk_id": "c", "product_id": "958", "similarity_score": 0.8}]
+    assert [hit["product_id"] for hit in expand_duplicate_hits(hits)] == ["819", "839", "958"]
+
+    manifest = IngestManifest(tmp_path / "m.json", "chunks")
+    manifest.record_duplicates({"b": "a", "e": "a", "g": "f"})
+    assert manifest.dissolve_duplicate_groups(["b"]) == {"a", "b", "e"}
+    assert manifest.duplicates == {"g": "f"}
+
+
+def test_modeltype_filter_stays_exact_after_collapsing_skus():
+    def sku(chunk_id, modeltype, modelname):
+        product = {"modeltype": modeltype, "modelname": modelname, "structconfig": "Weight: 1.4kg",
+                   "lcd": "14\" FHD", "gpu": "Intel Iris Xe"}
+        return _chunk(chunk_id, modeltype, SPEC, [1.0, 0.0], raw_product=product)
+
+    # 960 與 728 都使用預設價格等級，facet 相同；只有同一 modeltype 的 SKU 可以合併
+    chunks = [sku("a", "960", "AB1"), sku("b", "960", "AB2"), sku("c", "728", "CD1")]
+    canonical, duplicates = ChunkDeduplicator(key_fn=dedup_partition_key).deduplicate(chunks)
+
+    assert duplicates == {"b": "a"}
+    assert all(set(chunk.get("product_ids", [chunk["product_id"]])) == {chunk["product_id"]} for chunk in canonical)
+    expr = ScalarFilterCompiler().to_milvus_expr({"modeltype": ["728"]})
+    assert expr == 'product_id in ["728"]'
+    assert [chunk["chunk_id"] for chunk in canonical if chunk["product_id"] == "728"] == ["c"]
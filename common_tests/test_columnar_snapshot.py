@@ -0,0 +1,46 @@
+import duckdb
+
+from libs.KnowledgeManageHandler.columnar_snapshot import (
+    export_snapshot, connect_catalog, resolve_snapshot, snapshot_file, activate_snapshot
+)
+from libs.KnowledgeManageHandler.scalar_filters import build_facet_table
+
+
+def _make_db(path, rows):
+    with duckdb.connect(str(path)) as con:
+        con.execute(
+            "CREATE TABLE nbtypes AS SELECT CAST(819 + i % 3 AS VARCHAR) AS modeltype, 'AB' || i AS modelname, "
+            "'Weight: 1.4kg' AS structconfig, '14\" FHD' AS lcd, 'RTX 4060' AS gpu "
+            f"FROM range({rows}) t(i)"
+        )
+        build_facet_table(con)
+
+
+def test_snapshot_is_queried_through_parquet_views(tmp_path):
+    db_file, snapshot_dir = tmp_path / "nb.db", tmp_path / "snapshots"
+    _make_db(db_file, 30)
+    manifest = export_snapshot(db_file, snapshot_dir, version="v1")
+
+    assert set(manifest["tables"]) == {"nbtypes", "nbtypes_facets"}
+    assert snapshot_file(snapshot_dir, "nbtypes", db_file=db_file).name == "nbtypes.parquet"
+    with connect_catalog(db_file, snapshot_dir) as con:
+        plan = con.execute("EXPLAIN SELECT modelname FROM nbtypes WHERE modeltype = '819'").fetchall()[0][1]
+        assert "READ_PARQUET" in plan
+        assert con.execute("SELECT COUNT(*) FROM nbtypes WHERE modeltype = '819'").fetchone()[0] == 10
+
+
+def test_stale_snapshot_falls_back_to_database_and_old_versions_are_pruned(tmp_path):
+    db_file, snapshot_dir = tmp_path / "nb.db", tmp_path / "snapshots"
+    _make_db(db_file, 30)
+    for version in ("v1", "v2", "v3"):
+        export_snapshot(db_file, snapshot_dir, version=version, keep_versions=1)
+    assert sorted(p.name for p in snapshot_dir.iterdir() if p.is_dir()) == ["v2", "v3"]
+    assert activate_snapshot(snapshot_dir, "v2")
+    assert not activate_snapshot(snapshot_dir, "v1")
+
+    # 資料庫在快照後被修改：快照不再使用，改查資料庫
+    with duckdb.connect(str(db_file)) as con:
+        con.execute("INSERT INTO nbtypes VALUES ('960', 'NEW', '', '', '')")
+    assert resolve_snapshot(snapshot_dir, db_file) == {}
+    with connect_catalog(db_file, snapshot_dir) as con:
+        assert con.execute("SELECT COUNT(*) FROM nbtypes").fetchone()[0] == 31
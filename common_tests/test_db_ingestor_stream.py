@@ -0,0 +1,114 @@
+import threading
+
+import numpy as np
+import pytest
+
+from api.db_ingestor import DBIngestor
+
+
+class FakeCollection:
+    def __init__(self, fail=False):
+        self.rows = 0
+        self.flushes = 0
+        self.fail = fail
+
+    def insert(self, entities):
+        if self.fail:
+            raise RuntimeError("insert failed")
+        self.rows += len(entities[0])
+
+    def flush(self):
+        self.flushes += 1
+
+
+def _ingestor(tmp_path, collection, encode=None):
+    ingestor = DBIngestor()
+    ingestor.DUCKDB_FILE = str(tmp_path / "specs.db")
+    ingestor.BATCH_SIZE = 4
+    ingestor.FLUSH_EVERY_BATCHES = 2
+    ingestor._get_collection = lambda: collection
+    ingestor._encode = encode or (lambda texts: np.zeros((len(texts), 4), dtype=np.float32))
+    return ingestor
+
+
+def _records(n, empty=0):
+    return [{"modeltype": str(i), "cpu": "x"} for i in range(n)] + [{"modeltype": ""}] * empty
+
+
+def _stage_threads():
+    return [t for t in threading.enumerate() if t.name in ("ingest-encode", "ingest-insert")]
+
+
+def test_stream_reports_row_counts_and_progress(tmp_path):
+    collection = FakeCollection()
+    events = []
+    ingestor = _ingestor(tmp_path, collection)
+    data = _records(10, empty=2)
+
+    duckdb_rows, milvus_rows, total = ingestor.ingest_stream(
+        ingestor._iter_record_batches(data), progress_callback=lambda *event: events.append(event)
+    )
+    assert (duckdb_rows, milvus_rows, total) == (10, 10, 12)
+    assert collection.rows == 10
+    assert sum(rows for stage, _, rows in events if stage == "inserted") == 10
+    assert [index for stage, index, _ in events if stage == "flushed"] == [2, 3]
+    assert not _stage_threads()
+
+
+def test_encoder_error_propagates_and_stops_producer(tmp_path):
+    read_batches = []
+
+    def batches():
+        for index in range(100):
+            read_batches.append(index)
+            yield _records(4)
+
+    def failing_encode(texts):
+        raise ValueError("encoder crashed")
+
+    ingestor = _ingestor(tmp_path, FakeCollection(), encode=failing_encode)
+    with pytest.raises(ValueError, match="encoder crashed"):
+        ingestor.ingest_stream(batches())
+    # 有界佇列：下游失敗後上游不會讀完整個來源
+    assert len(read_batches) < 100
+    assert not _stage_threads()
+
+
+def test_insert_and_producer_errors_propagate(tmp_path):
+    with pytest.raises(RuntimeError, match="insert failed"):
+        _ingestor(tmp_path, FakeCollection(fail=True)).ingest_stream(iter([_records(4)] * 5))
+    assert not _stage_threads()
+
+    def broken_source():
+        yield _records(4)
+        raise OSError("source read failed")
+
+    collection = FakeCollection()
+    with pytest.raises(OSError, match="source read failed"):
+        _ingestor(tmp_path, collection).ingest_stream(broken_source())
+    assert not _stage_threads()
+
+
+def test_bounded_queues_limit_batches_read_ahead(tmp_path):
+    gate = threading.Event()
+    read_batches = []
+
+    def batches():
+        for index in range(20):
+            read_batches.append(index)
+            yield _records(4)
+
+    def blocked_encode(texts):
+        gate.wait()
+        return np.zeros((len(texts), 4), dtype=np.float32)
+
+    ingestor = _ingestor(tmp_path, FakeCollection(), encode=blocked_encode)
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(counts=ingestor.ingest_stream(batches())))
+    worker.start()
+    worker.join(timeout=1.0)
+    # 編碼階段卡住時，上游最多多讀「編碼中 1 批 + 佇列 QUEUE_DEPTH 批 + 等待放入的 1 批」
+    assert len(read_batches) <= ingestor.QUEUE_DEPTH + 2
+    gate.set()
+    worker.join(timeout=10)
+    assert result["counts"] == (80, 80, 80)
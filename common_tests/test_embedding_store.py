@@ -0,0 +1,70 @@
+import numpy as np
+
+from libs.KnowledgeManageHandler.embedding_store import EmbeddingStore
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.encoded = []
+
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        return np.array([[float(len(t)), float(t.count("a")), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_only_new_texts_are_encoded_and_vectors_persist(tmp_path):
+    encoder = CountingEncoder()
+    store = EmbeddingStore(tmp_path, "sentence-transformers/test-model")
+    first = store.get_or_encode(["alpha", "beta", "alpha"], encoder)
+    assert encoder.encoded == ["alpha", "beta"]
+    assert first.shape == (3, 3) and np.array_equal(first[0], first[2])
+
+    # 新的程序（重新開啟）直接讀取既有向量，只編碼新文字
+    reopened = EmbeddingStore(tmp_path, "sentence-transformers/test-model")
+    second = reopened.get_or_encode(["beta", "gamma"], encoder)
+    assert encoder.encoded == ["alpha", "beta", "gamma"]
+    assert np.array_equal(second[0], first[1])
+    assert reopened.get_stats()["entries"] == 3
+
+
+def test_garbage_collection_keeps_referenced_texts(tmp_path):
+    encoder = CountingEncoder()
+    store = EmbeddingStore(tmp_path, "model")
+    store.get_or_encode(["alpha", "beta", "gamma"], encoder)
+    store.set_references("rebuild", ["gamma"])
+    store.add_references("other", ["alpha"])
+
+    assert store.collect_garbage() == {"kept": 2, "removed": 1}
+    assert "beta" not in store and "alpha" in store
+    vectors = EmbeddingStore(tmp_path, "model").get_or_encode(["gamma", "alpha"], encoder)
+    assert vectors[0][0] == len("gamma") and vectors[1][1] == 2
+    assert encoder.encoded == ["alpha", "beta", "gamma"]
+
+
+def test_truncated_write_is_repaired_on_open(tmp_path):
+    store = EmbeddingStore(tmp_path, "model")
+    store.get_or_encode(["alpha", "beta"], CountingEncoder())
+    with open(store.vectors_path, "ab") as f:
+        f.write(np.zeros(3, dtype=np.float32).tobytes())
+    assert len(EmbeddingStore(tmp_path, "model")) == 2
+
+
+def test_open_store_rebuilds_index_after_other_process_collects_garbage(tmp_path):
+    encoder = CountingEncoder()
+    early = EmbeddingStore(tmp_path, "model")  # 開啟時尚未有任何寫入（維度未知）
+    writer = EmbeddingStore(tmp_path, "model")
+    writer.get_or_encode([f"n{i}" for i in range(5)], encoder)
+    early.get_or_encode(["n0"], encoder)
+    assert encoder.encoded == [f"n{i}" for i in range(5)]
+
+    reader = EmbeddingStore(tmp_path, "model")
+    reader.get_or_encode(["n0"], encoder)
+    writer.set_references("rebuild", [])
+    writer.collect_garbage()
+    new_texts = [f"t{i}" + "a" * i for i in range(10)]
+    writer.get_or_encode(new_texts, encoder)
+
+    encoded_before = len(encoder.encoded)
+    vectors = reader.get_or_encode(new_texts, encoder)
+    assert len(encoder.encoded) == encoded_before
+    assert [int(v[1]) for v in vectors] == list(range(10))
@@ -0,0 +1,100 @@
+import os
+
+import duckdb
+
+from libs.KnowledgeManageHandler import index_release
+from libs.KnowledgeManageHandler.index_release import (
+    copy_duckdb_database, verify_duckdb_version, versioned_db_path, release_index_version,
+    rollback_index_version, read_active_index
+)
+
+
+class FakeUtility:
+    """只記錄 alias 與 collection 操作的 pymilvus.utility"""
+
+    def __init__(self, collections):
+        self.collections = set(collections)
+        self.aliases = {}
+
+    def has_collection(self, name):
+        return name in self.collections or name in self.aliases
+
+    def alter_alias(self, collection_name, alias):
+        if alias not in self.aliases:
+            raise RuntimeError(f"alias {alias} does not exist")
+        self.aliases[alias] = collection_name
+
+    def create_alias(self, collection_name, alias):
+        self.aliases[alias] = collection_name
+
+    def rename_collection(self, old_name, new_name):
+        self.collections.remove(old_name)
+        self.collections.add(new_name)
+
+    def drop_collection(self, name):
+        self.collections.discard(name)
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+
+    def load(self):
+        pass
+
+
+def _make_db(path, rows):
+    with duckdb.connect(str(path)) as con:
+        con.execute(f"CREATE TABLE nbtypes AS SELECT '819' AS modeltype, 'AB' || i AS modelname FROM range({rows}) t(i)")
+
+
+def _count(path):
+    with duckdb.connect(str(path), read_only=True) as con:
+        return con.execute("SELECT COUNT(*) FROM nbtypes").fetchone()[0]
+
+
+def test_verify_rejects_shrunken_catalog(tmp_path):
+    live = tmp_path / "nb.db"
+    _make_db(live, 10)
+    candidate = versioned_db_path(live, "v1", tmp_path / "versions")
+    copy_duckdb_database(live, candidate)
+    assert verify_duckdb_version(candidate, live)["passed"]
+
+    with duckdb.connect(str(candidate)) as con:
+        con.execute("DELETE FROM nbtypes WHERE modelname > 'AB5'")
+    report = verify_duckdb_version(candidate, live)
+    assert not report["passed"]
+    assert report["checks"]["live_rows"] == 10
+
+
+def test_release_swaps_alias_and_pointer_then_rolls_back(tmp_path, monkeypatch):
+    utility = FakeUtility({"chunks", "chunks__v1", "chunks__v2"})
+    monkeypatch.setattr(index_release, "utility", utility)
+    monkeypatch.setattr(index_release, "Collection", FakeCollection)
+    monkeypatch.setattr(index_release, "MILVUS_AVAILABLE", True)
+    live = tmp_path / "nb.db"
+    active_path = tmp_path / "active_index.json"
+    _make_db(live, 3)
+
+    v1 = versioned_db_path(live, "v1", tmp_path / "versions")
+    copy_duckdb_database(live, v1)
+    release_index_version("v1", v1, "chunks__v1", "chunks", live, active_path, keep_versions=1)
+    # 原本的實體 collection 與資料庫檔案保留為 legacy 版本
+    assert utility.aliases == {"chunks": "chunks__v1"}
+    assert "chunks__legacy" in utility.collections
+    assert os.path.islink(live) and _count(live) == 3
+
+    v2 = versioned_db_path(live, "v2", tmp_path / "versions")
+    _make_db(v2, 5)
+    record = release_index_version("v2", v2, "chunks__v2", "chunks", live, active_path, keep_versions=1)
+    assert utility.aliases == {"chunks": "chunks__v2"}
+    assert _count(live) == 5
+    assert [entry["version"] for entry in record["history"]] == ["v1"]
+    # 超出保留數的 legacy 版本被刪除
+    assert "chunks__legacy" not in utility.collections
+    assert not versioned_db_path(live, "legacy", tmp_path / "versions").exists()
+
+    rollback_index_version("chunks", live, active_path)
+    assert utility.aliases == {"chunks": "chunks__v1"}
+    assert _count(live) == 3
+    assert read_active_index(active_path)["rolled_back_from"] == "v2"
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import threading
+
+import duckdb
+import numpy as np
+
+from api.db_ingestor import DBIngestor
+from api.ingest_jobs import IngestJobManager, job_event_stream
+
+RECORDS = [{"modeltype": str(i), "modelname": f"AB{i}", "cpu": "x"} for i in range(30)]
+
+
+class FakeCollection:
+    """記錄寫入的 modeltype；fail_at 指定第幾次 insert 失敗一次"""
+
+    def __init__(self, fail_at=None):
+        self.modeltypes = []
+        self.fail_at = fail_at
+        self.inserts = 0
+
+    def insert(self, entities):
+        self.inserts += 1
+        if self.inserts == self.fail_at:
+            raise RuntimeError("milvus unavailable")
+        self.modeltypes.extend(entities[0])
+
+    def flush(self):
+        pass
+
+
+def _manager(tmp_path, collection, gate=None, history=None):
+    def factory():
+        ingestor = DBIngestor()
+        ingestor.DUCKDB_FILE = str(tmp_path / "specs.db")
+        ingestor.BATCH_SIZE = 3
+        ingestor._get_collection = lambda: collection
+
+        def encode(texts):
+            if gate is not None:
+                gate.wait()
+            return np.zeros((len(texts), 4), dtype=np.float32)
+        ingestor._encode = encode
+        return ingestor
+
+    recorder = (lambda **record: history.append(record)) if history is not None else (lambda **record: None)
+    return IngestJobManager(tmp_path / "jobs", 1, factory, history_recorder=recorder)
+
+
+def _duckdb_rows(tmp_path):
+    with duckdb.connect(str(tmp_path / "specs.db"), read_only=True) as con:
+        return con.execute("SELECT COUNT(*) FROM specs").fetchone()[0]
+
+
+def test_resume_after_failure_does_not_duplicate_unflushed_batches(tmp_path):
+    collection = FakeCollection(fail_at=5)
+    history = []
+    manager = _manager(tmp_path, collection, history=history)
+
+    job = manager.submit(RECORDS, "a.csv")
+    failed = manager.wait(job["job_id"]).result()
+    assert failed["status"] == "failed"
+    # 未 flush 但已寫入 Milvus 的批次也算入檢查點
+    assert failed["checkpoint"]["milvus"] == 4
+
+    manager.resume(job["job_id"])
+    done = manager.wait(job["job_id"]).result()
+    assert done["status"] == "completed"
+    assert sorted(collection.modeltypes, key=int) == [r["modeltype"] for r in RECORDS]
+    assert _duckdb_rows(tmp_path) == len(RECORDS)
+    assert [h["status"] for h in history] == ["failed", "partial"]
+
+
+def test_cancel_running_then_resume_and_cancel_queued_records_history(tmp_path):
+    gate = threading.Event()
+    collection = FakeCollection()
+    history = []
+    manager = _manager(tmp_path, collection, gate=gate, history=history)
+
+    running = manager.submit(RECORDS, "a.csv")
+    queued = manager.submit(RECORDS[:3], "b.csv")
+    assert manager.cancel(queued["job_id"])["status"] == "cancelled"
+    assert history[0]["filename"] == "b.csv" and history[0]["status"] == "cancelled"
+
+    manager.cancel(running["job_id"])
+    gate.set()
+    cancelled = manager.wait(running["job_id"]).result()
+    assert cancelled["status"] == "cancelled"
+    assert cancelled["checkpoint"]["milvus"] * 3 == len(collection.modeltypes) < len(RECORDS)
+
+    manager.resume(running["job_id"])
+    assert manager.wait(running["job_id"]).result()["status"] == "completed"
+    assert sorted(collection.modeltypes, key=int) == [r["modeltype"] for r in RECORDS]
+    assert _duckdb_rows(tmp_path) == len(RECORDS)
+    # 重新開啟時載入先前的工作
+    assert len(_manager(tmp_path, collection).list_jobs()) == 2
+
+
+def test_event_stream_reports_progress_until_job_finishes(tmp_path):
+    gate = threading.Event()
+    manager = _manager(tmp_path, FakeCollection(), gate=gate)
+    job = manager.submit(RECORDS, "a.csv")
+
+    async def collect():
+        events = []
+        async for event in job_event_stream(manager, job["job_id"], poll_seconds=0.01):
+            events.append(json.loads(event[len("data: "):]))
+            gate.set()
+        return events
+
+    events = asyncio.run(collect())
+    assert events[0]["status"] in ("queued", "running")
+    assert events[-1]["status"] == "completed"
+    assert events[-1]["progress"]["rows_inserted"] == len(RECORDS)
+    assert len(events) > 2
@@ -0,0 +1,39 @@
+from libs.KnowledgeManageHandler.ingest_manifest import (
+    IngestManifest, product_content_hash, product_key, chunk_content_hash, default_manifest_path
+)
+
+PRODUCTS = [
+    {"modeltype": "819", "modelname": "AB819-S", "cpu": "Ryzen 7", "battery": "50Wh"},
+    {"modeltype": "958", "modelname": "AB958-G", "cpu": "Ryzen 9", "battery": "80Wh"},
+    {"modeltype": "839", "modelname": "AB839-K", "cpu": "Ryzen 5", "battery": "45Wh"},
+]
+
+
+def test_content_hash_ignores_import_bookkeeping_fields():
+    product = dict(PRODUCTS[0])
+    stamped = dict(product, import_timestamp="2025-09-26", source_file="a.csv", id=3)
+    assert product_content_hash(product) == product_content_hash(stamped)
+    assert product_content_hash(product) != product_content_hash(dict(product, battery="60Wh"))
+    assert chunk_content_hash({"chunk_id": "c", "content": "x", "embedding": [0.1]}) == \
+        chunk_content_hash({"chunk_id": "c", "content": "x", "embedding": [0.2]})
+
+
+def test_diff_against_saved_manifest(tmp_path):
+    path = default_manifest_path(str(tmp_path / "nb.db"), "chunks")
+    manifest = IngestManifest(path, "chunks")
+    for product in PRODUCTS:
+        manifest.record_product(product, {f"chunk_{product['modeltype']}": "h"})
+    manifest.save()
+
+    loaded = IngestManifest.load(path, "chunks")
+    updated = [dict(PRODUCTS[0], battery="60Wh"), PRODUCTS[1],
+               {"modeltype": "728", "modelname": "AB728", "cpu": "i7"}]
+    plan = loaded.diff(updated)
+
+    assert plan.changed == [product_key(PRODUCTS[0])]
+    assert plan.unchanged == [product_key(PRODUCTS[1])]
+    assert plan.new == ["728|AB728"]
+    assert plan.removed == [product_key(PRODUCTS[2])]
+    assert loaded.remove_product(plan.removed[0]) == ["chunk_839"]
+    # 不同 collection 的清單視為首次匯入
+    assert IngestManifest.load(path, "other").is_empty
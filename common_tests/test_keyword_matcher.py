@@ -0,0 +1,40 @@
+import json
+import os
+
+from libs.UserInputHandler.keyword_matcher import KeywordSlotMatcher
+
+
+KEYWORDS = {
+    "用途": {"synonyms": ["遊戲"], "metadata": {"regex": "(用途|遊戲|工作)", "importance": 4}},
+    "螢幕尺寸": {"synonyms": ["螢幕大小"], "metadata": {"regex": "(螢幕尺寸|螢幕大小)", "importance": 2}},
+    "產品型號": {"synonyms": [], "metadata": {"regex": r"(\d{3,4}.*型號|\d{3,4})", "importance": 5}},
+}
+
+
+def _write(path, data):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+
+def test_match_returns_all_slots_with_spans_in_priority_order(tmp_path):
+    path = tmp_path / "keywords.json"
+    _write(path, KEYWORDS)
+    matcher = KeywordSlotMatcher(path)
+
+    matches = matcher.match("819 玩遊戲，螢幕大小 15 吋")
+
+    assert [m["slot"] for m in matches] == ["產品型號", "用途", "螢幕尺寸"]
+    assert matches[1]["spans"] == [(5, 7)]
+    assert matches[2]["importance"] == 2
+
+
+def test_match_reloads_when_keywords_file_changes(tmp_path):
+    path = tmp_path / "keywords.json"
+    _write(path, KEYWORDS)
+    matcher = KeywordSlotMatcher(path)
+    assert matcher.match("散熱好嗎") == []
+
+    _write(path, {**KEYWORDS, "散熱": {"synonyms": ["風扇"], "metadata": {"regex": "(散熱|風扇)", "importance": 2}}})
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert [m["slot"] for m in matcher.match("散熱好嗎")] == ["散熱"]
@@ -0,0 +1,69 @@
+import pytest
+
+from libs.RAG.LLM.ModelRouter import ModelRouter, TASK_ENTITY_PARSE, TASK_ANSWER_GENERATION
+
+
+class FakeInitializer:
+    def __init__(self, model_name, temperature, request_timeout, keep_alive=None):
+        self.model_name = model_name
+        self.calls = []
+        self.attempts = 0
+
+    def safe_completion_with_usage(self, prompt, reserve_output, output_format=None):
+        self.attempts += 1
+        if self.model_name == "broken":
+            raise RuntimeError("model not found")
+        self.calls.append((reserve_output, output_format))
+        return f"{self.model_name}:{prompt}", {"prompt_tokens": 3, "completion_tokens": 5, "estimated": False}
+
+
+def make_router(small_model="small", **kwargs):
+    routes = {
+        TASK_ENTITY_PARSE: {"model": small_model, "temperature": 0.0, "max_tokens": 256, "format": "json"},
+        TASK_ANSWER_GENERATION: {"model": "large", "temperature": 0.1, "max_tokens": 2048},
+    }
+    return ModelRouter(routes=routes, default_model="large", initializer_factory=FakeInitializer, **kwargs)
+
+
+def test_tasks_are_routed_to_configured_models():
+    router = make_router()
+    assert router.complete(TASK_ENTITY_PARSE, "q") == "small:q"
+    assert router.complete(TASK_ANSWER_GENERATION, "q") == "large:q"
+    assert router.complete("unknown_task", "q") == "large:q"
+    assert router.get_initializer(TASK_ENTITY_PARSE).calls == [(256, "json")]
+
+    metrics = router.get_metrics()["tasks"]
+    assert metrics[TASK_ENTITY_PARSE]["models"] == {"small": 1}
+    assert metrics[TASK_ENTITY_PARSE]["completion_tokens"] == 5
+
+
+def test_failed_small_model_falls_back_to_default():
+    router = make_router(small_model="broken")
+    assert router.complete(TASK_ENTITY_PARSE, "q") == "large:q"
+    stats = router.get_metrics()["tasks"][TASK_ENTITY_PARSE]
+    assert stats["fallbacks"] == 1 and stats["errors"] == 0
+
+
+def test_fallback_is_sticky_until_retry_window_expires():
+    router = make_router(small_model="broken")
+    for _ in range(3):
+        assert router.complete(TASK_ENTITY_PARSE, "q") == "large:q"
+    # 未 pull 的模型只嘗試一次，之後直接使用備援模型
+    assert router.get_initializer(TASK_ENTITY_PARSE).attempts == 1
+    assert router.get_metrics()["unavailable_models"] == ["broken"]
+    assert router.get_metrics()["tasks"][TASK_ENTITY_PARSE]["fallbacks"] == 3
+
+    router.model_retry_seconds = 0
+    assert router.complete(TASK_ENTITY_PARSE, "q") == "large:q"
+    assert router.get_initializer(TASK_ENTITY_PARSE).attempts == 2
+
+
+def test_default_model_failure_is_raised_and_counted():
+    router = ModelRouter(
+        routes={TASK_ANSWER_GENERATION: {"model": "broken"}},
+        default_model="broken",
+        initializer_factory=FakeInitializer,
+    )
+    with pytest.raises(RuntimeError):
+        router.complete(TASK_ANSWER_GENERATION, "q")
+    assert router.get_metrics()["tasks"][TASK_ANSWER_GENERATION]["errors"] == 1
@@ -0,0 +1,25 @@
+from libs.chunk_utils.ngram_index import NGramIndex, ngram_similarity
+
+
+def test_group_scores_return_best_dice_score_per_group():
+    index = NGramIndex()
+    for term in ["玩遊戲", "打電動"]:
+        index.add(term, ("usage_purpose", "gaming"))
+    index.add("文書處理", ("usage_purpose", "office"))
+
+    scores = index.group_scores("我想玩遊戲")
+
+    assert set(scores) == {("usage_purpose", "gaming")}
+    assert abs(scores[("usage_purpose", "gaming")] - ngram_similarity("我想玩遊戲", "玩遊戲")) < 1e-9
+    assert index.group_scores("遊戲")[("usage_purpose", "gaming")] < 1.0
+    assert index.group_scores("打電動")[("usage_purpose", "gaming")] == 1.0
+
+
+def test_terms_added_after_first_query_are_searchable():
+    index = NGramIndex()
+    index.add("輕薄", "light")
+    assert index.group_scores("Gaming") == {}
+
+    index.add("gaming", "gaming")
+
+    assert index.group_scores("Gaming") == {"gaming": 1.0}
@@ -0,0 +1,16 @@
+from libs.KnowledgeManageHandler.knowledge_manager import KnowledgeManager
+
+
+def _hit(product_id, score):
+    return {"chunk_id": f"c_{product_id}_{score}", "product_id": product_id, "similarity_score": score}
+
+
+def test_aggregate_by_product_keeps_best_chunk_per_product():
+    results = [_hit("819", 0.4), _hit("958", 0.7), _hit("819", 0.9), _hit("839", 0.5), _hit("958", 0.2)]
+
+    grouped = KnowledgeManager._aggregate_by_product(results, num_products=2)
+
+    assert [item["product_id"] for item in grouped] == ["819", "958"]
+    assert grouped[0]["similarity_score"] == 0.9
+    assert grouped[0]["matched_chunks"] == 2
+    assert grouped[1]["matched_chunks"] == 2
@@ -0,0 +1,56 @@
+import json
+
+from libs.RAG.LLM.PromptBudget import (
+    TokenCounter, PromptBudgeter, PromptSection, trim_product_data
+)
+
+
+def test_estimate_matches_mixed_script_rule():
+    assert TokenCounter.estimate("") == 0
+    assert TokenCounter.estimate("abcd" * 10 + "中文") == int(40 / 4 + 2 / 2) + 1
+    counter = TokenCounter("unknown-model")
+    assert counter.estimate(counter.truncate("中" * 100, 10)) <= 10
+
+
+def test_low_priority_products_are_trimmed_before_required_sections():
+    counter = TokenCounter("unknown-model")
+    products = [{"modelname": f"AB{i}", "cpu": "Intel Core i7-1360P " * 10} for i in range(10)]
+    product_json = json.dumps({"products": products}, ensure_ascii=False)
+    query = "請比較這些筆電的 CPU 與續航"
+    budgeter = PromptBudgeter(counter, max_context_tokens=600, safety_margin=0)
+
+    texts, report = budgeter.fit([
+        PromptSection("user_query", query, 90, required=True),
+        PromptSection("product_data", product_json, 20, trimmer=trim_product_data),
+    ], reserve_output=300)
+
+    assert texts["user_query"] == query
+    assert not report["over_budget"] and report["sections"]["product_data"]["trimmed"]
+    kept = json.loads(texts["product_data"])["products"]
+    assert 1 <= len(kept) < 10 and kept[0]["modelname"] == "AB0"
+
+
+def test_reserve_output_follows_intent():
+    assert PromptBudgeter.reserve_output_for("compare") > PromptBudgeter.reserve_output_for("spec_check")
+
+
+def test_hf_tokenizer_loads_from_local_cache_only(monkeypatch):
+    from libs.RAG.LLM import PromptBudget
+
+    calls = []
+
+    class OfflineAutoTokenizer:
+        @staticmethod
+        def from_pretrained(repo_id, **kwargs):
+            calls.append((repo_id, kwargs))
+            raise OSError("not in local cache")
+
+    monkeypatch.setattr(PromptBudget, "AutoTokenizer", OfflineAutoTokenizer)
+    monkeypatch.setattr(PromptBudget, "TRANSFORMERS_AVAILABLE", True)
+    monkeypatch.setattr(PromptBudget, "_TOKENIZER_CACHE", {})
+
+    counter = TokenCounter("qwen2.5:3b")
+
+    assert calls == [("Qwen/Qwen2.5-3B-Instruct", {"local_files_only": True})]
+    assert not counter.exact
+    assert counter.count("中文 tokens") == TokenCounter.estimate("中文 tokens")
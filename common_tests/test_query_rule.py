@@ -0,0 +1,30 @@
+from libs.RAG.LLM.QueryRule import QueryRule, QueryRuleParser
+
+
+def test_parses_and_normalizes_structured_output():
+    parser = QueryRuleParser()
+    rule, ok = parser.parse(
+        '{"intent": "compare", "entities": "819", "attributes": ["cpu"], "NB_NUM": "ALL", "language": "zh-TW"}'
+    )
+    assert ok
+    assert rule == QueryRule(intent="compare", entities=["819"], attributes=["cpu"], NB_NUM="all", language="zh-TW")
+
+
+def test_repairs_fenced_or_python_style_output():
+    parser = QueryRuleParser()
+    rule, ok = parser.parse("輸出:\n```json\n{'intent': 'recommend', 'entities': [], 'attributes': [], 'NB_NUM': 'limit'}\n```")
+    assert ok and rule.intent == "recommend" and rule.NB_NUM == "limit"
+    assert parser.get_stats()["repaired"] == 1
+
+
+def test_failures_fall_back_to_default_and_are_counted():
+    parser = QueryRuleParser()
+    assert parser.parse("") == (QueryRule(), False)
+    assert parser.parse("not json at all") == (QueryRule(), False)
+    stats = parser.get_stats()
+    assert stats["empty"] == 1 and stats["failures"] == 1 and stats["failure_rate"] == 1.0
+
+
+def test_missing_or_invalid_nb_num_uses_dataclass_default():
+    assert QueryRule.from_dict({"NB_NUM": "some"}).NB_NUM == QueryRule().NB_NUM
+    assert QueryRule.from_dict({}).NB_NUM == QueryRule().NB_NUM
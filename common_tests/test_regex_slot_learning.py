@@ -0,0 +1,29 @@
+from libs.chunk_utils.regex_slot_matcher import RegexSlotMatcher
+
+
+def _matcher(tmp_path):
+    config = {"slot_definitions": {}, "validation_rules": {"global": {"confidence_threshold": 0.3}}}
+    return RegexSlotMatcher(config, config_file_path=str(tmp_path / "learned_slots.json"))
+
+
+def test_learned_value_matches_without_restart(tmp_path):
+    matcher = _matcher(tmp_path)
+
+    first = matcher.match_slots("想買 asus 筆電")
+    assert first["matches"]["brand_preference"]["newly_learned"] is True
+
+    # 學到的值已合併進目前的配置、正則表達式與詞彙索引
+    assert "asus" in matcher.config["slot_definitions"]["brand_preference"]["synonyms"]
+    assert "asus" in matcher.compiled_patterns["brand_preference"]
+    assert any(key[:2] == ("brand_preference", "asus") for key in matcher._term_scores("asus"))
+
+    second = matcher.match_slots("asus 的筆電", enable_learning=False)
+    assert second["matches"]["brand_preference"]["value"] == "asus"
+
+
+def test_public_add_new_slot_merges_into_running_matcher(tmp_path):
+    matcher = _matcher(tmp_path)
+
+    assert matcher.add_new_slot("usage_purpose", "gaming", "遊戲 筆電") is True
+    assert matcher.add_new_slot("usage_purpose", "gaming", "遊戲 筆電") is False
+    assert matcher.match_slots("遊戲 用的", enable_learning=False)["matches"]["usage_purpose"]["value"] == "gaming"
@@ -0,0 +1,41 @@
+from libs.KnowledgeManageHandler.scalar_filters import (
+    ScalarFilterCompiler,
+    extract_scalar_facets,
+)
+
+
+def test_extract_scalar_facets_parses_catalog_formats():
+    product = {
+        "modeltype": "958",
+        "structconfig": "Weight: ~2.3Kg (5.08bl)",
+        "lcd": 'Dimension: 15.6" 16:9',
+        "gpu": "Model: AMD Radeon™ RX7600M (P1), 8GB, GDDR6,",
+    }
+    assert extract_scalar_facets(product) == {
+        "price_tier": "premium",
+        "weight_class": "heavy",
+        "screen_size": "15",
+        "gpu_tier": "discrete",
+    }
+    assert extract_scalar_facets({"structconfig": "Weight: 1477 g (TBD)"})["weight_class"] == "light"
+    assert extract_scalar_facets({"structconfig": "Weight: TBD"})["weight_class"] == "unknown"
+
+
+def test_compiler_emits_milvus_expr_and_duckdb_where():
+    compiler = ScalarFilterCompiler()
+    facets = compiler.compile({"weight": "light", "screen_size": "14", "modeltype": ["819"], "brand": "ASUS"})
+
+    assert facets == {"weight_class": ["light", "unknown"], "screen_size": ["14"], "modeltype": ["819"]}
+    assert compiler.to_milvus_expr(facets) == (
+        'weight_class in ["light", "unknown"] and screen_size in ["14"] and product_id in ["819"]'
+    )
+    # 舊 collection 缺少的純量欄位不下推
+    assert compiler.to_milvus_expr(facets, ["product_id"]) == 'product_id in ["819"]'
+
+    where_sql, params = compiler.to_duckdb_where(facets)
+    assert where_sql == "weight_class IN (?, ?) AND screen_size IN (?) AND modeltype IN (?)"
+    assert params == ["light", "unknown", "14", "819"]
+
+
+def test_compiler_ignores_unknown_slot_values():
+    assert ScalarFilterCompiler().compile({"weight": "heavy", "price_range": "", "gpu_tier": None}) == {}
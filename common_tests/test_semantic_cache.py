@@ -0,0 +1,22 @@
+from libs.KnowledgeManageHandler.semantic_cache import SemanticRetrievalCache
+
+
+def test_near_duplicate_query_hits_only_within_same_context():
+    cache = SemanticRetrievalCache(similarity_threshold=0.95, ttl_seconds=60)
+    cache.put([1.0, 0.0, 0.0], ["819", "958"], query_text="輕薄筆電", context_key="a")
+
+    hit = cache.lookup([0.99, 0.05, 0.0], context_key="a")
+    assert hit is not None and hit[0] == ["819", "958"]
+    assert cache.lookup([0.99, 0.05, 0.0], context_key="b") is None
+    assert cache.lookup([0.0, 1.0, 0.0], context_key="a") is None
+
+    cache.invalidate("test")
+    assert cache.lookup([1.0, 0.0, 0.0], context_key="a") is None
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_false_hit_sampling_uses_overlap():
+    cache = SemanticRetrievalCache(false_hit_overlap=0.5)
+    assert cache.record_sample(["819", "958"], ["839", "100"]) is True
+    assert cache.record_sample(["819", "958"], ["819", "958"]) is False
+    assert cache.get_stats()["false_hit_rate"] == 0.5
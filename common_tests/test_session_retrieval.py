@@ -0,0 +1,43 @@
+from libs.StateManageHandler.session_retrieval import (
+    SessionRetrievalStore, detect_follow_up, resolve_product_references
+)
+
+PREVIOUS = {"product_keys": ["819", "958", "839"], "products": [], "query_rule": {}}
+
+
+def test_ordinal_references_resolve_to_previous_order():
+    assert resolve_product_references("第二台的重量?", PREVIOUS["product_keys"]) == ["958"]
+    assert resolve_product_references("前兩台比較", PREVIOUS["product_keys"]) == ["819", "958"]
+    assert resolve_product_references("最後一台呢", PREVIOUS["product_keys"]) == ["839"]
+    assert resolve_product_references("電池呢", PREVIOUS["product_keys"]) is None
+
+
+def test_follow_up_detection():
+    assert detect_follow_up("那電池呢?", PREVIOUS, [], ["battery"]) == {"product_keys": ["819", "958", "839"]}
+    assert detect_follow_up("第二台的重量?", PREVIOUS, [], ["structconfig"]) == {"product_keys": ["958"]}
+    assert detect_follow_up("958 的散熱如何", PREVIOUS, ["958"], ["thermal"]) == {"product_keys": ["958"]}
+    # 新機型、新推薦需求、新檢索條件或沒有上一輪時需重新檢索
+    assert detect_follow_up("那 728 呢", PREVIOUS, ["728"], []) is None
+    assert detect_follow_up("推薦輕一點的", PREVIOUS, [], ["structconfig"]) is None
+    assert detect_follow_up("那電池呢?", PREVIOUS, [], ["battery"], has_new_filters=True) is None
+    assert detect_follow_up("那電池呢?", None, [], ["battery"]) is None
+
+
+def test_new_needs_and_bare_short_questions_are_new_searches():
+    assert detect_follow_up("它們的重量?", PREVIOUS, [], ["structconfig"]) == {"product_keys": ["819", "958", "839"]}
+    assert detect_follow_up("這台適合跑AI嗎", PREVIOUS, [], ["ai"]) == {"product_keys": ["819", "958", "839"]}
+    # 提到產品類別或陳述新需求、沒有明確指涉的訊息不沿用上一輪的產品
+    assert detect_follow_up("適合跑AI的筆電", PREVIOUS, [], ["ai"]) is None
+    assert detect_follow_up("我要記憶體大的", PREVIOUS, [], ["memory"]) is None
+    assert detect_follow_up("那遊戲筆電呢?", PREVIOUS, [], ["gpu"]) is None
+    assert detect_follow_up("都要有獨顯", PREVIOUS, [], ["gpu"]) is None
+    assert detect_follow_up("電池續航?", PREVIOUS, [], ["battery"]) is None
+
+
+def test_store_without_redis_keeps_sessions_apart():
+    store = SessionRetrievalStore(redis_client=None)
+    store.save("a", ["819"], [{"modeltype": "819"}], ["modeltype"], {"intent": "spec_check"})
+    assert store.load("a")["product_keys"] == ["819"]
+    assert store.load("b") is None
+    store.clear("a")
+    assert store.load("a") is None
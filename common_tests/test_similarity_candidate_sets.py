@@ -0,0 +1,93 @@
+import numpy as np
+
+from libs.chunk_utils.similarity_engine import MGFDSimilarityEngine
+
+
+class CharCountModel:
+    """以字元計數作為向量的測試用編碼器，記錄編碼次數"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts, normalize_embeddings=True, convert_to_numpy=True):
+        self.calls += 1
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for ch in text:
+                vectors[row, ord(ch) % 64] += 1
+            vectors[row] /= np.linalg.norm(vectors[row]) or 1.0
+        return vectors
+
+
+def _engine():
+    engine = MGFDSimilarityEngine(cache_size=2)
+    engine.model = CharCountModel()
+    return engine
+
+
+def test_registered_set_is_encoded_once_and_queries_encode_only_the_query():
+    engine = _engine()
+    version = engine.register_candidate_set("synonyms", ["玩遊戲", "文書處理", "輕薄"])
+    assert engine.register_candidate_set("synonyms", ["玩遊戲", "文書處理", "輕薄"]) == version
+    assert engine.model.calls == 1
+
+    scores = engine.score_candidate_set("我想玩遊戲", "synonyms")
+
+    assert engine.model.calls == 2
+    assert int(np.argmax(scores)) == 0
+    assert np.allclose(scores.tolist(), engine.calculate_similarity("我想玩遊戲", ["玩遊戲", "文書處理", "輕薄"]))
+    assert engine.model.calls == 2
+
+
+def test_result_cache_is_bounded_lru():
+    engine = _engine()
+    for query in ["a", "b", "c"]:
+        engine.calculate_similarity(query, ["x"])
+    assert len(engine.cache) == 2
+
+
+def test_semantic_strategy_fills_slot_from_registered_synonyms():
+    from libs.chunk_utils.enhanced_slot_extractor_v2 import SemanticExtractionStrategy
+
+    engine = MGFDSimilarityEngine()
+    engine.model = CharCountModel()
+    synonyms = {
+        "usage_purpose": {
+            "gaming": {"semantic": ["打電動", "玩遊戲"]},
+            "business": {"semantic": ["文書處理", "辦公"]},
+        },
+        "budget_range": {"budget": {"semantic": ["便宜"]}},
+    }
+    strategy = SemanticExtractionStrategy(engine, synonyms)
+    assert engine.model.calls == 2
+
+    slots = strategy.extract_slots("想要文書處理", {"usage_purpose": {}})
+
+    assert slots == {"usage_purpose": "business"}
+    assert strategy.get_confidence() > 0.8
+    # 同義詞集合不重新編碼，只編碼查詢一次
+    assert engine.model.calls == 3
+    assert strategy.extract_slots("天氣很好", {"usage_purpose": {}}) == {}
+
+
+def test_special_cases_without_similarity_engine_fall_back():
+    import logging
+
+    from libs.chunk_utils.special_cases_knowledge import SpecialCasesKnowledgeBase
+
+    kb = SpecialCasesKnowledgeBase.__new__(SpecialCasesKnowledgeBase)
+    kb.logger = logging.getLogger("test_special_cases")
+    kb.knowledge_data = {}
+    kb.similarity_engine = None
+    kb.embedding_model = CharCountModel()
+    kb.loop_detection_history = {"s1": [{"query": "玩遊戲"}], "s2": []}
+
+    assert kb._get_or_compute_embedding("玩遊戲") is None
+    assert kb._queries_are_similar("玩遊戲", "玩遊戲")
+    assert not kb._queries_are_similar("玩遊戲", "文書處理")
+    assert kb._calculate_case_similarity("玩遊戲", {"customer_query": "玩遊戲"}) > 0
+
+    kb.clear_loop_history("s1")
+    assert list(kb.loop_detection_history) == ["s2"]
+    kb.clear_loop_history()
+    assert kb.loop_detection_history == {}
@@ -0,0 +1,18 @@
+from libs.KnowledgeManageHandler.spec_projection import (
+    IDENTITY_FIELDS, DEFAULT_SPEC_FIELDS, project_spec_fields, is_default_projection, dumps_compact
+)
+
+
+def test_projection_follows_parsed_attributes():
+    assert project_spec_fields(["modeltype", "CPU", "battery"]) == IDENTITY_FIELDS + ["cpu", "battery"]
+    assert project_spec_fields(["wifislot"]) == IDENTITY_FIELDS + ["wifislot", "wireless", "bluetooth"]
+
+
+def test_identity_only_attributes_use_default_fields():
+    fields = project_spec_fields(["modelname"])
+    assert fields == IDENTITY_FIELDS + DEFAULT_SPEC_FIELDS
+    assert is_default_projection(fields) and is_default_projection(project_spec_fields(None))
+
+
+def test_compact_serialization_has_no_whitespace_padding():
+    assert dumps_compact({"products": [{"cpu": "i7"}]}) == '{"products":[{"cpu":"i7"}]}'
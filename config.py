@@ -35,4 +35,39 @@ SERVICES_CONFIG = {
         "milvus_port": MILVUS_PORT,
         "collection_name": MILVUS_COLLECTION_NAME
     }
-}
\ No newline at end of file
+}
+
+# LLM routing: 結構化解析用小模型，最終回答用大模型
+LLM_DEFAULT_MODEL = os.getenv("MGFD_LLM_MODEL", "gpt-oss:20b")
+LLM_STRUCTURED_MODEL = os.getenv("MGFD_STRUCTURED_LLM_MODEL", "qwen2.5:3b")
+# 模型常駐時間：保留已載入的模型與提示詞前綴 KV cache，避免每次請求重新 prefill 靜態指示
+LLM_KEEP_ALIVE = os.getenv("MGFD_LLM_KEEP_ALIVE", "30m")
+LLM_ROUTES = {
+    # 結構化抽取：以 Ollama format 限制為 JSON，輸出上限較小
+    "entity_parse": {"model": LLM_STRUCTURED_MODEL, "temperature": 0.0, "max_tokens": 512, "format": "json"},
+    "answer_generation": {"model": LLM_DEFAULT_MODEL, "temperature": 0.1, "max_tokens": 2048},
+}
+
+# 分塊嵌入：批次編碼大小與多程序編碼程序數（0 表示單程序）
+EMBEDDING_BATCH_SIZE = int(os.getenv("MGFD_EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_PROCESSES = int(os.getenv("MGFD_EMBEDDING_PROCESSES", "0"))
+# 平行建立分塊文字的程序數（0 或 1 表示單程序；工作程序不載入嵌入模型）
+CHUNK_BUILD_PROCESSES = int(os.getenv("MGFD_CHUNK_BUILD_PROCESSES", "0"))
+# 持久化嵌入向量庫：以 (模型, sha256(文字)) 為鍵，重建時只編碼新文字
+EMBEDDING_STORE_DIR = Path(os.getenv("MGFD_EMBEDDING_STORE_DIR", str(BASE_DIR / "db" / "embedding_store")))
+# 藍綠重建：新版本建在 INDEX_VERSIONS_DIR 與帶版本的 collection，驗證後切換；
+# 切換後 DB_PATH 為指向目前版本的符號連結，MILVUS_COLLECTION_NAME 為指向目前版本 collection 的 alias
+INDEX_VERSIONS_DIR = BASE_DIR / "db" / "versions"
+ACTIVE_INDEX_PATH = BASE_DIR / "db" / "active_index.json"
+# 保留的舊版本數（供回滾），更早的版本在切換後刪除
+INDEX_KEEP_VERSIONS = int(os.getenv("MGFD_INDEX_KEEP_VERSIONS", "2"))
+# 規格資料的欄式快照（zstd Parquet + Arrow IPC），建庫或發布後匯出，讀取端延遲掃描
+COLUMNAR_SNAPSHOT_DIR = BASE_DIR / "db" / "snapshots"
+COLUMNAR_SNAPSHOT_KEEP_VERSIONS = int(os.getenv("MGFD_SNAPSHOT_KEEP_VERSIONS", str(INDEX_KEEP_VERSIONS)))
+# 分塊近似重複消除（全量重建時）：SimHash 漢明距離上限與嵌入餘弦相似度下限
+CHUNK_DEDUP_ENABLED = os.getenv("MGFD_CHUNK_DEDUP", "1") == "1"
+CHUNK_DEDUP_MAX_HAMMING = int(os.getenv("MGFD_CHUNK_DEDUP_MAX_HAMMING", "6"))
+CHUNK_DEDUP_MIN_COSINE = float(os.getenv("MGFD_CHUNK_DEDUP_MIN_COSINE", "0.98"))
+# 語義檢索快取：查詢嵌入餘弦相似度達門檻即重用產品鍵列表；項目存活秒數
+RETRIEVAL_CACHE_SIMILARITY = float(os.getenv("MGFD_RETRIEVAL_CACHE_SIMILARITY", "0.95"))
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.getenv("MGFD_RETRIEVAL_CACHE_TTL_SECONDS", "600"))
@@ -0,0 +1,243 @@
+# libs/KnowledgeManageHandler/catalog_entity_detector.py
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+產品目錄實體偵測器
+以 nbtypes 的 modelname、modeltype 及其正規化別名（如 APX819、819、AB819-S: FP6）
+建立 Aho-Corasick 自動機，單次掃描查詢即可同時找出產品實體與上下文關鍵字，
+耗時只與查詢長度相關，不隨目錄大小成長。
+"""
+
+import logging
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+
+from ..RAG.Tools.aho_corasick import AhoCorasickAutomaton
+
+logger = logging.getLogger(__name__)
+
+KIND_MODELNAME = "modelname"
+KIND_MODELTYPE = "modeltype"
+KIND_CONTEXT = "context"
+KIND_EXCLUDE = "exclude"
+
+# 純數字機型（如 819）必須伴隨這些上下文關鍵字才視為產品代碼
+PRODUCT_CONTEXT_KEYWORDS = [
+    '機型', '型號', '機種', '類別',
+    '系列', '產品', '筆電', '筆記型電腦',
+    'laptop', 'notebook', '規格', 'spec',
+    'cpu', 'gpu', '處理器', '差異', '比較', '對比', 'vs'
+]
+
+# 出現這些關鍵字時，純數字多半是年份或價格而非機型
+PRODUCT_EXCLUDE_KEYWORDS = ['年', '元', '價格', 'price', 'year', '2023', '2024', '2025']
+
+# 排除的測試資料
+EXCLUDED_MODELNAMES = {"Test Model"}
+
+
+def _is_word_char(ch: str) -> bool:
+    """ASCII 英數字視為單字字元；中文等其他字元可作為邊界（如「958的CPU」）"""
+    return ch.isascii() and ch.isalnum()
+
+
+def modelname_aliases(modelname: str) -> List[str]:
+    """
+    產生 modelname 的正規化別名（皆為小寫）
+
+    例如 "AB819-S: FP6" → ["ab819-s: fp6", "ab819-s:fp6", "ab819-s", "ab819"]
+    """
+    name = " ".join(modelname.strip().lower().split())
+    aliases = [name, re.sub(r"\s+", "", name)]
+    head = name.split(":")[0].strip()
+    aliases.append(head)
+    match = re.match(r"[a-z]+\d+", head)
+    if match:
+        aliases.append(match.group(0))
+    return [alias for alias in dict.fromkeys(aliases) if alias]
+
+
+class CatalogEntityDetector:
+    """以目錄建立的產品實體偵測器"""
+
+    def __init__(
+        self,
+        catalog_rows: Iterable[Tuple[Optional[str], Optional[str]]],
+        context_keywords: Optional[List[str]] = None,
+        exclude_keywords: Optional[List[str]] = None
+    ):
+        """
+        Args:
+            catalog_rows: (modeltype, modelname) 列表；任一欄可為 None
+            context_keywords: 純數字機型需要的上下文關鍵字
+            exclude_keywords: 使純數字機型失效的關鍵字
+        """
+        self.modeltypes: List[str] = []
+        self.modelnames: List[str] = []
+        modelname_types: Dict[str, List[str]] = {}
+        for modeltype, modelname in catalog_rows:
+            modeltype = str(modeltype).strip() if modeltype is not None else ""
+            modelname = str(modelname).strip() if modelname is not None else ""
+            if modeltype and modeltype not in self.modeltypes:
+                self.modeltypes.append(modeltype)
+            if modelname and modelname not in EXCLUDED_MODELNAMES:
+                types = modelname_types.setdefault(modelname, [])
+                if modeltype and modeltype not in types:
+                    types.append(modeltype)
+
+        # 未提供機型對應時，以名稱中出現的已知機型推斷（如 APX819 → 819）
+        for modelname, types in modelname_types.items():
+            if not types:
+                types.extend(t for t in re.findall(r"\d+", modelname) if t in self.modeltypes)
+        self.modelnames = list(modelname_types)
+
+        self._automaton = AhoCorasickAutomaton()
+        self._build_patterns(modelname_types, context_keywords, exclude_keywords)
+        self._automaton.build()
+
+    def _build_patterns(self, modelname_types, context_keywords, exclude_keywords):
+        """註冊 modelname（含別名）、modeltype 與上下文關鍵字"""
+        patterns: Dict[str, Dict[str, Any]] = {}
+        exact_names = set()
+
+        # 完整名稱優先：別名若恰好等於另一個完整名稱（如 AG958 與 AG958P 的別名），以完整名稱為準
+        for modelname in modelname_types:
+            exact_names.update(modelname_aliases(modelname)[:2])
+        for modelname, types in modelname_types.items():
+            for position, alias in enumerate(modelname_aliases(modelname)):
+                if position >= 2 and alias in exact_names:
+                    continue
+                entry = patterns.setdefault(alias, {"kind": KIND_MODELNAME, "modelnames": [], "modeltypes": []})
+                if modelname not in entry["modelnames"]:
+                    entry["modelnames"].append(modelname)
+                entry["modeltypes"].extend(t for t in types if t not in entry["modeltypes"])
+
+        for modeltype in self.modeltypes:
+            key = modeltype.lower()
+            if key not in patterns:
+                patterns[key] = {"kind": KIND_MODELTYPE, "modelnames": [], "modeltypes": [modeltype]}
+
+        for pattern, entry in patterns.items():
+            self._automaton.add(pattern, entry)
+
+        for keyword in (PRODUCT_CONTEXT_KEYWORDS if context_keywords is None else context_keywords):
+            self._automaton.add(keyword.lower(), {"kind": KIND_CONTEXT})
+        for keyword in (PRODUCT_EXCLUDE_KEYWORDS if exclude_keywords is None else exclude_keywords):
+            self._automaton.add(keyword.lower(), {"kind": KIND_EXCLUDE})
+
+    def detect(self, query: str) -> Dict[str, Any]:
+        """
+        單次掃描偵測查詢中的產品實體
+
+        Returns:
+            {
+                "entities": [{text, kind, modelnames, modeltypes, start, end}]（依出現順序，不重疊，取最長比對）,
+                "modelnames": 提及的 modelname,
+                "modeltypes": 提及或由 modelname 推得的 modeltype,
+                "has_context": 是否出現產品上下文關鍵字,
+                "has_exclude": 是否出現年份/價格等排除關鍵字
+            }
+        """
+        text = (query or "").lower()
+        has_context = False
+        has_exclude = False
+        candidates = []
+        for start, end, payload in self._automaton.iter_matches(text):
+            kind = payload["kind"]
+            if kind == KIND_CONTEXT:
+                has_context = True
+            elif kind == KIND_EXCLUDE:
+                has_exclude = True
+            elif (start == 0 or not _is_word_char(text[start - 1])) and (end == len(text) or not _is_word_char(text[end])):
+                candidates.append((start, end, payload))
+
+        # 最左最長：重疊時保留較長的比對（如 "APX819: FP7R2" 優先於 "APX819"）
+        candidates.sort(key=lambda item: (item[0], -(item[1] - item[0])))
+        entities = []
+        last_end = -1
+        for start, end, payload in candidates:
+            if start < last_end:
+                continue
+            entities.append({
+                "text": query[start:end],
+                "kind": payload["kind"],
+                "modelnames": list(payload["modelnames"]),
+                "modeltypes": list(payload["modeltypes"]),
+                "start": start,
+                "end": end,
+            })
+            last_end = end
+
+        modelnames = list(dict.fromkeys(n for e in entities for n in e["modelnames"]))
+        modeltypes = list(dict.fromkeys(t for e in entities for t in e["modeltypes"]))
+        return {
+            "entities": entities,
+            "modelnames": modelnames,
+            "modeltypes": modeltypes,
+            "has_context": has_context,
+            "has_exclude": has_exclude,
+        }
+
+
+def load_catalog_rows(db_path) -> List[Tuple[str, str]]:
+    """從 DuckDB nbtypes 讀取 (modeltype, modelname) 列表"""
+    import duckdb
+
+    with duckdb.connect(str(db_path), read_only=True) as conn:
+        return conn.execute("""
+            SELECT DISTINCT CAST(modeltype AS VARCHAR), modelname
+            FROM nbtypes
+            WHERE modeltype IS NOT NULL
+        """).fetchall()
+
+
+class CatalogDetectorProvider:
+    """
+    依資料庫檔案狀態提供偵測器：檔案變動（重新匯入）時自動重建
+
+    資料庫無法讀取時使用 fallback_rows；兩者皆無時回傳 None。
+    """
+
+    def __init__(self, db_path, fallback_rows: Optional[List[Tuple[Optional[str], Optional[str]]]] = None):
+        self.db_path = Path(db_path)
+        self.fallback_rows = fallback_rows
+        self._lock = threading.Lock()
+        self._detector: Optional[CatalogEntityDetector] = None
+        self._signature = None
+
+    def _file_signature(self):
+        try:
+            stat = self.db_path.stat()
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def get(self) -> Optional[CatalogEntityDetector]:
+        """取得最新的偵測器"""
+        signature = self._file_signature()
+        with self._lock:
+            if self._detector is not None and signature == self._signature:
+                return self._detector
+            rows = None
+            if signature is not None:
+                try:
+                    rows = load_catalog_rows(self.db_path)
+                except Exception as e:
+                    logger.warning(f"讀取產品目錄失敗，無法建立實體偵測器: {e}")
+            if not rows:
+                rows = self.fallback_rows
+            self._detector = CatalogEntityDetector(rows) if rows else None
+            self._signature = signature
+            if self._detector is not None:
+                logger.info(
+                    f"產品實體偵測器已建立：{len(self._detector.modelnames)} 個 modelname、"
+                    f"{len(self._detector.modeltypes)} 個 modeltype"
+                )
+            return self._detector
+
+    def refresh(self):
+        """強制於下次 get() 時重建"""
+        with self._lock:
+            self._detector = None
@@ -0,0 +1,116 @@
+# libs/KnowledgeManageHandler/chunk_content_store.py
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地 chunk 內容表
+Milvus 只需回傳 chunk_id、分數與小型純量欄位；chunk 全文存放在 DuckDB 的
+chunk_contents 表（以 chunk_id 為鍵），僅在呼叫端真正需要呈現時才延遲載入。
+"""
+
+import logging
+from typing import Dict, Any, List, Iterable
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TABLE = "chunk_contents"
+
+
+def write_chunk_contents(conn, chunks: Iterable[Dict[str, Any]]) -> int:
+    """
+    重建 chunk 內容表
+
+    Args:
+        conn: 可寫入的 DuckDB 連線
+        chunks: 含 chunk_id, product_id, chunk_type, semantic_group, content 的分塊
+
+    Returns:
+        寫入的列數
+    """
+    records = [
+        (
+            chunk["chunk_id"],
+            str(chunk.get("product_id", "")),
+            chunk.get("chunk_type", ""),
+            chunk.get("semantic_group", ""),
+            chunk.get("content", ""),
+        )
+        for chunk in chunks
+    ]
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE {CONTENT_TABLE} (
+            chunk_id VARCHAR PRIMARY KEY,
+            product_id VARCHAR,
+            chunk_type VARCHAR,
+            semantic_group VARCHAR,
+            content VARCHAR
+        )
+    """)
+    if records:
+        conn.executemany(f"INSERT INTO {CONTENT_TABLE} VALUES (?, ?, ?, ?, ?)", records)
+    logger.info(f"已寫入 {CONTENT_TABLE}，共 {len(records)} 筆")
+    return len(records)
+
+
+def fetch_chunk_contents(conn, chunk_ids: List[str]) -> Dict[str, str]:
+    """
+    依 chunk_id 批次讀取內容
+
+    Args:
+        conn: DuckDB 連線
+        chunk_ids: 要讀取的 chunk_id 列表
+
+    Returns:
+        {chunk_id: content}；不存在的 chunk_id 不會出現在結果中
+    """
+    ids = list(dict.fromkeys(cid for cid in chunk_ids if cid))
+    if not ids:
+        return {}
+    placeholders = ", ".join(["?"] * len(ids))
+    rows = conn.execute(
+        f"SELECT chunk_id, content FROM {CONTENT_TABLE} WHERE chunk_id IN ({placeholders})",
+        ids
+    ).fetchall()
+    return {chunk_id: content for chunk_id, content in rows}
+
+
+def upsert_chunk_contents(conn, chunks: Iterable[Dict[str, Any]]) -> int:
+    """
+    依 chunk_id 新增或覆寫內容（增量同步用；表不存在時建立）
+
+    Returns:
+        寫入的列數
+    """
+    records = [
+        (
+            chunk["chunk_id"],
+            str(chunk.get("product_id", "")),
+            chunk.get("chunk_type", ""),
+            chunk.get("semantic_group", ""),
+            chunk.get("content", ""),
+        )
+        for chunk in chunks
+    ]
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CONTENT_TABLE} (
+            chunk_id VARCHAR PRIMARY KEY,
+            product_id VARCHAR,
+            chunk_type VARCHAR,
+            semantic_group VARCHAR,
+            content VARCHAR
+        )
+    """)
+    if records:
+        conn.executemany(f"INSERT OR REPLACE INTO {CONTENT_TABLE} VALUES (?, ?, ?, ?, ?)", records)
+    logger.info(f"已 upsert {CONTENT_TABLE}，共 {len(records)} 筆")
+    return len(records)
+
+
+def delete_chunk_contents(conn, chunk_ids: List[str]) -> int:
+    """依 chunk_id 刪除內容"""
+    ids = list(dict.fromkeys(cid for cid in chunk_ids if cid))
+    if not ids:
+        return 0
+    placeholders = ", ".join(["?"] * len(ids))
+    conn.execute(f"DELETE FROM {CONTENT_TABLE} WHERE chunk_id IN ({placeholders})", ids)
+    logger.info(f"已自 {CONTENT_TABLE} 刪除 {len(ids)} 筆")
+    return len(ids)
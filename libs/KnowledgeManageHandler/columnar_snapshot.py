@@ -0,0 +1,259 @@
+# libs/KnowledgeManageHandler/columnar_snapshot.py
+"""
+規格資料的欄式快照
+DuckDB 建庫（或藍綠發布）後，將 nbtypes 與衍生表匯出為帶版本的快照目錄：
+- <table>.parquet：zstd 壓縮，依 modeltype, modelname 排序，讀取端可做欄位投影與 row group 條件下推
+- <table>.arrow：Arrow IPC 檔（需 pyarrow），以 memory map 開啟即可零複製讀取
+current.json 指向目前的版本；讀取端以 connect_catalog / scan_snapshot / open_arrow_snapshot
+延遲讀取，不必在啟動時把整張表載入記憶體。快照與來源資料庫不一致時（例如資料庫已重建），
+讀取端自動改回直接查詢 DuckDB。
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import duckdb
+
+from .scalar_filters import FACET_TABLE
+
+try:
+    import pyarrow as pa
+    ARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    ARROW_AVAILABLE = False
+
+try:
+    import polars as pl
+    POLARS_AVAILABLE = True
+except ImportError:
+    pl = None
+    POLARS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TABLES = ("nbtypes", FACET_TABLE)
+PARQUET_COMPRESSION = "zstd"
+PARQUET_ROW_GROUP_SIZE = 122880
+# Arrow IPC 預設不壓縮：壓縮後的 IPC 檔無法以 memory map 零複製讀取
+IPC_COMPRESSION = None
+SORT_COLUMNS = ("modeltype", "modelname")
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "current.json"
+DEFAULT_KEEP_VERSIONS = 2
+
+
+def _quote(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _write_json_atomic(path, data: Dict[str, Any]):
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _source_signature(db_file) -> Dict[str, Any]:
+    """來源資料庫的實體檔案與修改時間（符號連結解析為目前版本的檔案）"""
+    real_path = os.path.realpath(db_file)
+    stat = os.stat(real_path)
+    return {"source_db": real_path, "source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+
+def _export_table(conn, table: str, version_dir: Path, ipc_compression: Optional[str]) -> Dict[str, Any]:
+    columns = [row[0] for row in conn.execute(f"DESCRIBE {table}").fetchall()]
+    order = [column for column in SORT_COLUMNS if column in columns]
+    select_sql = f"SELECT * FROM {table}" + (f" ORDER BY {', '.join(order)}" if order else "")
+
+    parquet_path = version_dir / f"{table}.parquet"
+    conn.execute(
+        f"COPY ({select_sql}) TO {_quote(parquet_path)} "
+        f"(FORMAT parquet, COMPRESSION {PARQUET_COMPRESSION}, ROW_GROUP_SIZE {PARQUET_ROW_GROUP_SIZE})"
+    )
+    entry = {
+        "rows": conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0],
+        "columns": columns,
+        "parquet": parquet_path.name,
+        "parquet_bytes": parquet_path.stat().st_size,
+    }
+
+    if ARROW_AVAILABLE:
+        arrow_path = version_dir / f"{table}.arrow"
+        reader = conn.execute(select_sql).fetch_record_batch()
+        options = pa.ipc.IpcWriteOptions(compression=ipc_compression)
+        with pa.OSFile(str(arrow_path), "wb") as sink, pa.ipc.new_file(sink, reader.schema, options=options) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+        entry["arrow"] = arrow_path.name
+        entry["arrow_bytes"] = arrow_path.stat().st_size
+    return entry
+
+
+def export_snapshot(
+    db_file,
+    snapshot_dir,
+    version: Optional[str] = None,
+    tables: Sequence[str] = SNAPSHOT_TABLES,
+    keep_versions: int = DEFAULT_KEEP_VERSIONS,
+    ipc_compression: Optional[str] = IPC_COMPRESSION,
+) -> Dict[str, Any]:
+    """
+    將資料庫中的表匯出為帶版本的 Parquet（zstd）與 Arrow IPC 快照，並切換 current.json
+
+    Args:
+        db_file: 來源 DuckDB 檔案（可為藍綠發布的符號連結）
+        snapshot_dir: 快照根目錄，每個版本一個子目錄
+        version: 版本名稱，預設為目前時間
+        tables: 要匯出的表（資料庫中不存在的表略過）
+        keep_versions: 除目前版本外保留的舊版本數
+        ipc_compression: Arrow IPC 壓縮（None、"zstd" 或 "lz4"；壓縮後讀取需解壓）
+
+    Returns:
+        快照 manifest
+    """
+    snapshot_dir = Path(snapshot_dir)
+    version = version or datetime.now().strftime("%Y%m%d_%H%M%S")
+    version_dir = snapshot_dir / version
+    building_dir = snapshot_dir / f"{version}.building"
+    shutil.rmtree(building_dir, ignore_errors=True)
+    building_dir.mkdir(parents=True)
+
+    started = time.perf_counter()
+    try:
+        with duckdb.connect(str(db_file), read_only=True) as conn:
+            existing = {row[0] for row in conn.execute("SHOW TABLES").fetchall()}
+            exported = {
+                table: _export_table(conn, table, building_dir, ipc_compression)
+                for table in tables if table in existing
+            }
+        manifest = {
+            "version": version,
+            "created_at": time.time(),
+            **_source_signature(db_file),
+            "parquet_compression": PARQUET_COMPRESSION,
+            "ipc_compression": ipc_compression if ARROW_AVAILABLE else None,
+            "tables": exported,
+        }
+        _write_json_atomic(building_dir / MANIFEST_FILE, manifest)
+        shutil.rmtree(version_dir, ignore_errors=True)
+        os.replace(building_dir, version_dir)
+    except Exception:
+        shutil.rmtree(building_dir, ignore_errors=True)
+        raise
+
+    activate_snapshot(snapshot_dir, version)
+    prune_snapshots(snapshot_dir, keep_versions)
+    if not ARROW_AVAILABLE:
+        logger.warning("pyarrow 未安裝，快照只包含 Parquet 檔")
+    tables_summary = ", ".join(f"{table}({entry['rows']} 筆)" for table, entry in exported.items())
+    logger.info(
+        f"已發布欄式快照 {version}: {tables_summary}，"
+        f"耗時 {time.perf_counter() - started:.2f} 秒"
+    )
+    return manifest
+
+
+def read_snapshot_manifest(snapshot_dir, version: Optional[str] = None) -> Dict[str, Any]:
+    """讀取指定版本（預設為目前版本）的快照 manifest，不存在時回傳空字典"""
+    snapshot_dir = Path(snapshot_dir)
+    try:
+        if version is None:
+            with open(snapshot_dir / CURRENT_FILE, "r", encoding="utf-8") as f:
+                version = json.load(f)["version"]
+        with open(snapshot_dir / version / MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def activate_snapshot(snapshot_dir, version: str) -> bool:
+    """將 current.json 指向指定版本（回滾時使用）；版本不存在時回傳 False"""
+    if not read_snapshot_manifest(snapshot_dir, version):
+        logger.warning(f"欄式快照版本 {version} 不存在，維持目前版本")
+        return False
+    _write_json_atomic(Path(snapshot_dir) / CURRENT_FILE, {"version": version, "activated_at": time.time()})
+    return True
+
+
+def prune_snapshots(snapshot_dir, keep_versions: int = DEFAULT_KEEP_VERSIONS) -> List[str]:
+    """刪除目前版本以外、超出保留數的舊快照"""
+    snapshot_dir = Path(snapshot_dir)
+    current = read_snapshot_manifest(snapshot_dir).get("version")
+    versions = []
+    for path in snapshot_dir.iterdir():
+        manifest = read_snapshot_manifest(snapshot_dir, path.name) if path.is_dir() else {}
+        if manifest and path.name != current:
+            versions.append((manifest.get("created_at", 0), path.name))
+    removed = [name for _, name in sorted(versions, reverse=True)[max(keep_versions, 0):]]
+    for name in removed:
+        shutil.rmtree(snapshot_dir / name, ignore_errors=True)
+    return removed
+
+
+def resolve_snapshot(snapshot_dir, db_file=None) -> Dict[str, Any]:
+    """
+    取得可用的目前快照：指定 db_file 時，快照必須是由該資料庫目前的檔案匯出，否則回傳空字典
+    """
+    manifest = read_snapshot_manifest(snapshot_dir)
+    if not manifest or db_file is None:
+        return manifest
+    try:
+        signature = _source_signature(db_file)
+    except OSError:
+        return manifest
+    if any(manifest.get(key) != value for key, value in signature.items()):
+        logger.info(f"欄式快照 {manifest.get('version')} 與資料庫 {db_file} 不一致，改用 DuckDB")
+        return {}
+    return manifest
+
+
+def snapshot_file(snapshot_dir, table: str, fmt: str = "parquet", db_file=None) -> Optional[Path]:
+    """目前快照中某張表的檔案路徑（fmt 為 parquet 或 arrow），沒有可用快照時回傳 None"""
+    manifest = resolve_snapshot(snapshot_dir, db_file)
+    name = manifest.get("tables", {}).get(table, {}).get(fmt)
+    if not name:
+        return None
+    path = Path(snapshot_dir) / manifest["version"] / name
+    return path if path.exists() else None
+
+
+def connect_catalog(db_file, snapshot_dir=None, tables: Sequence[str] = SNAPSHOT_TABLES):
+    """
+    開啟規格資料的唯讀 DuckDB 連線：有可用快照時為記憶體資料庫，表以 read_parquet 視圖提供
+    （查詢自動套用欄位投影與條件下推），否則直接以唯讀模式開啟資料庫檔案
+    """
+    manifest = resolve_snapshot(snapshot_dir, db_file) if snapshot_dir else {}
+    views = {
+        table: Path(snapshot_dir) / manifest["version"] / manifest["tables"][table]["parquet"]
+        for table in tables if table in manifest.get("tables", {})
+    }
+    if not views or not all(path.exists() for path in views.values()):
+        return duckdb.connect(str(db_file), read_only=True)
+    conn = duckdb.connect()
+    for table, path in views.items():
+        conn.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet({_quote(path)})")
+    return conn
+
+
+def scan_snapshot(snapshot_dir, table: str = "nbtypes", db_file=None):
+    """以 Polars LazyFrame 延遲掃描快照（投影與條件下推到 Parquet），無法使用時回傳 None"""
+    path = snapshot_file(snapshot_dir, table, "parquet", db_file)
+    if not POLARS_AVAILABLE or path is None:
+        return None
+    return pl.scan_parquet(path)
+
+
+def open_arrow_snapshot(snapshot_dir, table: str = "nbtypes", db_file=None):
+    """以 memory map 開啟快照的 Arrow IPC 檔（未壓縮時為零複製），無法使用時回傳 None"""
+    path = snapshot_file(snapshot_dir, table, "arrow", db_file)
+    if not ARROW_AVAILABLE or path is None:
+        return None
+    return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
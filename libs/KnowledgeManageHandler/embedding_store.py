@@ -0,0 +1,298 @@
+# libs/KnowledgeManageHandler/embedding_store.py
+"""
+內容定址的持久化嵌入向量庫
+以 (模型 id, sha256(文字)) 為鍵保存向量，所有匯入腳本與程序內檢索器共用；
+重建時只需編碼新出現或變動的文字，其餘直接讀取。
+
+每個模型一個目錄：
+- vectors.f32：只追加的 float32 向量檔（以 np.memmap 讀取）
+- keys.bin：與向量逐列對應的 32 bytes sha256 摘要
+- meta.json：模型 id、維度與世代（generation；每次垃圾回收重寫檔案時遞增，其他程序據此重建索引）
+- refs/<consumer>.bin：各使用端最近一次引用的摘要，垃圾回收時保留所有使用端引用的聯集
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    fcntl = None
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SIZE = 32
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256((text or "").encode("utf-8")).digest()
+
+
+def _safe_model_dir(model_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "__", model_id).strip("_") or "default"
+
+
+class EmbeddingStore:
+    """單一模型的嵌入向量庫"""
+
+    def __init__(self, root_dir, model_id: str, dim: Optional[int] = None):
+        """
+        Args:
+            root_dir: 向量庫根目錄
+            model_id: 嵌入模型 id（不同模型的向量分開存放）
+            dim: 向量維度；None 時於第一次寫入時決定
+        """
+        self.model_id = model_id
+        self.path = Path(root_dir) / _safe_model_dir(model_id)
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / "refs").mkdir(exist_ok=True)
+        self.vectors_path = self.path / "vectors.f32"
+        self.keys_path = self.path / "keys.bin"
+        self.meta_path = self.path / "meta.json"
+        self._lock = threading.RLock()
+        self._index: Dict[bytes, int] = {}
+        self._rows = 0
+        self._vectors: Optional[np.memmap] = None
+        self._generation = 0
+        self._meta_signature = None
+        self.dim = dim
+        self.stats = {"hits": 0, "misses": 0}
+
+        meta = self._read_meta()
+        if meta and dim is not None and meta.get("dim") != dim:
+            raise ValueError(f"嵌入向量庫維度不符: {meta.get('dim')} != {dim}（{self.path}）")
+        with self._file_lock():
+            self._refresh()
+
+    @contextmanager
+    def _file_lock(self):
+        """跨程序的檔案鎖（無 fcntl 的平台只使用程序內鎖）"""
+        with self._lock:
+            if not FCNTL_AVAILABLE:
+                yield
+                return
+            with open(self.path / ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> Dict:
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, generation: int):
+        tmp_path = self.meta_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model_id": self.model_id, "dim": self.dim, "generation": generation}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _sync_meta(self):
+        """meta.json 變動時重新讀取維度與世代；世代改變（其他程序已垃圾回收）時捨棄舊索引"""
+        try:
+            stat = self.meta_path.stat()
+        except OSError:
+            return
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self._meta_signature:
+            return
+        meta = self._read_meta()
+        if not meta:
+            return
+        self._meta_signature = signature
+        if self.dim is None:
+            self.dim = meta.get("dim")
+        generation = meta.get("generation", 0)
+        if generation != self._generation:
+            self._index, self._rows, self._vectors = {}, 0, None
+            self._generation = generation
+
+    def _refresh(self):
+        """讀取其他程序追加的項目；兩檔列數不一致（寫入中斷）時以較短者為準"""
+        self._sync_meta()
+        if not self.dim or not self.keys_path.exists() or not self.vectors_path.exists():
+            return
+        key_rows = self.keys_path.stat().st_size // DIGEST_SIZE
+        vector_rows = self.vectors_path.stat().st_size // (self.dim * 4)
+        rows = min(key_rows, vector_rows)
+        if rows != key_rows or rows != vector_rows:
+            logger.warning(f"嵌入向量庫檔案列數不一致（keys={key_rows}, vectors={vector_rows}），截斷至 {rows} 列")
+            with open(self.keys_path, "r+b") as f:
+                f.truncate(rows * DIGEST_SIZE)
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(rows * self.dim * 4)
+        if rows > self._rows:
+            with open(self.keys_path, "rb") as f:
+                f.seek(self._rows * DIGEST_SIZE)
+                data = f.read((rows - self._rows) * DIGEST_SIZE)
+            for offset in range(0, len(data), DIGEST_SIZE):
+                self._index.setdefault(data[offset:offset + DIGEST_SIZE], self._rows + offset // DIGEST_SIZE)
+        elif rows < self._rows:
+            # 其他程序完成垃圾回收，重新建立索引
+            self._index, self._rows = {}, 0
+            return self._refresh()
+        if rows != self._rows or self._vectors is None:
+            self._rows = rows
+            self._vectors = (
+                np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+            )
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, text: str) -> bool:
+        return text_digest(text) in self._index
+
+    def _append(self, digests: List[bytes], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._file_lock():
+            self._sync_meta()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._write_meta(self._generation)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量維度 {vectors.shape[1]} 與向量庫維度 {self.dim} 不符")
+            self._refresh()
+            pending = [(d, v) for d, v in zip(digests, vectors) if d not in self._index]
+            if not pending:
+                return
+            # 先寫向量再寫摘要：中斷時只會留下沒有摘要的向量列，重新開啟時截斷
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.stack([v for _, v in pending]).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(d for d, _ in pending))
+            self._refresh()
+
+    def get_or_encode(self, texts: Sequence[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        取得文字的向量，只對向量庫中沒有的文字呼叫 encode_fn
+
+        Args:
+            texts: 文字列表
+            encode_fn: 批次編碼函式，輸入文字列表、回傳 (n, dim) 陣列
+
+        Returns:
+            (len(texts), dim) 的 float32 陣列（順序與 texts 相同）
+        """
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        digests = [text_digest(text) for text in texts]
+        with self._lock:
+            # 在檔案鎖內讀取，避免讀到其他程序垃圾回收途中的檔案
+            with self._file_lock():
+                self._refresh()
+            missing: Dict[bytes, str] = {}
+            for digest, text in zip(digests, texts):
+                if digest not in self._index and digest not in missing:
+                    missing[digest] = text
+            self.stats["hits"] += len(texts) - sum(1 for d in digests if d in missing)
+            self.stats["misses"] += len(missing)
+            if missing:
+                logger.info(f"嵌入向量庫命中 {len(texts) - len(missing)}/{len(texts)}，需編碼 {len(missing)} 筆")
+                encoded = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+                self._append(list(missing.keys()), encoded)
+            rows = [self._index[digest] for digest in digests]
+            return np.array(self._vectors[rows], dtype=np.float32)
+
+    def set_references(self, consumer: str, texts: Iterable[str]):
+        """記錄使用端目前引用的文字（覆寫該使用端先前的引用）"""
+        digests = list(dict.fromkeys(text_digest(text) for text in texts))
+        self._write_refs(consumer, digests)
+
+    def add_references(self, consumer: str, texts: Iterable[str]):
+        """在使用端既有引用上追加文字（增量匯入用）"""
+        digests = self._read_refs(consumer)
+        digests.extend(text_digest(text) for text in texts)
+        self._write_refs(consumer, list(dict.fromkeys(digests)))
+
+    def _refs_path(self, consumer: str) -> Path:
+        return self.path / "refs" / f"{_safe_model_dir(consumer)}.bin"
+
+    def _read_refs(self, consumer: str) -> List[bytes]:
+        path = self._refs_path(consumer)
+        if not path.exists():
+            return []
+        data = path.read_bytes()
+        return [data[i:i + DIGEST_SIZE] for i in range(0, len(data), DIGEST_SIZE)]
+
+    def _write_refs(self, consumer: str, digests: List[bytes]):
+        path = self._refs_path(consumer)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(b"".join(digests))
+        os.replace(tmp_path, path)
+
+    def collect_garbage(self) -> Dict[str, int]:
+        """
+        移除沒有任何使用端引用的向量並壓縮檔案
+
+        Returns:
+            {"kept": 保留筆數, "removed": 移除筆數}
+        """
+        with self._file_lock():
+            self._refresh()
+            referenced = set()
+            for ref_file in (self.path / "refs").glob("*.bin"):
+                data = ref_file.read_bytes()
+                referenced.update(data[i:i + DIGEST_SIZE] for i in range(0, len(data), DIGEST_SIZE))
+            keep = [(digest, row) for digest, row in self._index.items() if digest in referenced]
+            removed = len(self._index) - len(keep)
+            if removed == 0:
+                return {"kept": len(keep), "removed": 0}
+
+            keep.sort(key=lambda item: item[1])
+            tmp_vectors = self.vectors_path.with_suffix(".tmp")
+            tmp_keys = self.keys_path.with_suffix(".tmp")
+            with open(tmp_vectors, "wb") as f:
+                if keep:
+                    f.write(np.ascontiguousarray(self._vectors[[row for _, row in keep]]).tobytes())
+            with open(tmp_keys, "wb") as f:
+                f.write(b"".join(digest for digest, _ in keep))
+            self._vectors = None
+            os.replace(tmp_vectors, self.vectors_path)
+            os.replace(tmp_keys, self.keys_path)
+            # 遞增世代：已開啟的其他程序下次讀取時重建索引，不會沿用舊的列號
+            self._write_meta(self._generation + 1)
+            self._refresh()
+        logger.info(f"嵌入向量庫垃圾回收完成: 保留 {len(keep)} 筆，移除 {removed} 筆（{self.model_id}）")
+        return {"kept": len(keep), "removed": removed}
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"entries": len(self._index), "dim": self.dim or 0, **self.stats}
+
+
+_STORES: Dict[str, EmbeddingStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_embedding_store(model_id: str, root_dir=None) -> Optional[EmbeddingStore]:
+    """
+    取得（並快取）模型的共用向量庫；root_dir 未指定時使用 config.EMBEDDING_STORE_DIR，
+    開啟失敗時回傳 None（呼叫端直接編碼）
+    """
+    if root_dir is None:
+        import config
+        root_dir = config.EMBEDDING_STORE_DIR
+    key = f"{Path(root_dir).resolve()}::{model_id}"
+    with _STORES_LOCK:
+        if key not in _STORES:
+            try:
+                _STORES[key] = EmbeddingStore(root_dir, model_id)
+            except Exception as e:
+                logger.warning(f"開啟嵌入向量庫失敗，改為直接編碼: {e}")
+                return None
+        return _STORES[key]
@@ -0,0 +1,359 @@
+# libs/KnowledgeManageHandler/index_release.py
+"""
+藍綠重建的版本發布
+重建時不刪除線上的 collection 與 DuckDB 檔案，而是建出帶版本的 collection（<alias>__<version>）
+與資料庫檔案（db/versions/<stem>.<version>.db），預熱並驗證（筆數、範例查詢、自我召回率）後：
+- 將 Milvus alias（config.MILVUS_COLLECTION_NAME）切換到新 collection
+- 將 DuckDB 路徑（config.DB_PATH）的符號連結原子地指向新檔案
+- 寫入 active_index.json，服務端（KnowledgeManager）偵測到版本變動後重新載入
+舊版本保留 INDEX_KEEP_VERSIONS 個供回滾，更早的版本刪除。
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import duckdb
+
+from .chunk_content_store import CONTENT_TABLE
+
+try:
+    from pymilvus import utility, Collection
+    MILVUS_AVAILABLE = True
+except ImportError:
+    utility = None
+    Collection = None
+    MILVUS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 第一次藍綠發布前的線上資料（原本的實體 collection 與資料庫檔案）
+LEGACY_VERSION = "legacy"
+DEFAULT_MIN_ROW_RATIO = 0.9
+DEFAULT_MIN_RECALL = 0.95
+RECALL_TOP_K = 10
+SEARCH_PARAMS = {"metric_type": "L2", "params": {"nprobe": 16}}
+
+
+def new_index_version() -> str:
+    return datetime.now().strftime("%Y%m%d_%H%M%S")
+
+
+def versioned_db_path(db_path, version: str, versions_dir) -> Path:
+    db_path = Path(db_path)
+    return Path(versions_dir) / f"{db_path.stem}.{version}{db_path.suffix}"
+
+
+def versioned_collection_name(alias: str, version: str) -> str:
+    return f"{alias}__{version}"
+
+
+def read_active_index(path) -> Dict[str, Any]:
+    """讀取目前發布的版本；尚未以藍綠方式發布時回傳空 dict"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json_atomic(path, data: Dict[str, Any]):
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _quote(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def copy_duckdb_database(src_path, dst_path):
+    """將目前版本的資料庫完整複製為新版本（只重建分塊時使用）"""
+    dst_path = Path(dst_path)
+    dst_path.parent.mkdir(parents=True, exist_ok=True)
+    if dst_path.exists():
+        dst_path.unlink()
+    with duckdb.connect(str(dst_path)) as con:
+        target = con.execute("SELECT current_database()").fetchone()[0]
+        con.execute(f"ATTACH {_quote(Path(src_path).resolve())} AS live_source (READ_ONLY)")
+        con.execute(f"COPY FROM DATABASE live_source TO {target}")
+        con.execute("DETACH live_source")
+    logger.info(f"已複製資料庫 {src_path} → {dst_path}")
+
+
+def _table_counts(db_file) -> Dict[str, int]:
+    with duckdb.connect(str(db_file), read_only=True) as con:
+        tables = {row[0] for row in con.execute("SELECT table_name FROM information_schema.tables").fetchall()}
+        return {
+            table: con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("nbtypes", "nbtypes_facets", CONTENT_TABLE) if table in tables
+        }
+
+
+def verify_duckdb_version(
+    db_file,
+    live_db_file=None,
+    expected_chunks: Optional[int] = None,
+    min_row_ratio: float = DEFAULT_MIN_ROW_RATIO
+) -> Dict[str, Any]:
+    """
+    驗證新版本資料庫：nbtypes 有資料、範例查詢有結果、筆數不少於線上版本的 min_row_ratio，
+    分塊內容表筆數與寫入 Milvus 的分塊數一致
+
+    Returns:
+        {"passed": bool, "checks": {...}, "failures": [...]}
+    """
+    checks: Dict[str, Any] = {}
+    failures: List[str] = []
+    counts = _table_counts(db_file)
+    checks["tables"] = counts
+    rows = counts.get("nbtypes", 0)
+    if rows == 0:
+        failures.append("nbtypes 沒有資料")
+    else:
+        with duckdb.connect(str(db_file), read_only=True) as con:
+            sample = con.execute(
+                "SELECT modeltype, modelname FROM nbtypes WHERE modelname IS NOT NULL LIMIT 5"
+            ).fetchall()
+        checks["sample_rows"] = len(sample)
+        if not sample:
+            failures.append("範例查詢沒有結果")
+
+    if expected_chunks is not None and CONTENT_TABLE in counts and counts[CONTENT_TABLE] != expected_chunks:
+        failures.append(f"分塊內容表 {counts[CONTENT_TABLE]} 筆，與分塊數 {expected_chunks} 不符")
+
+    if live_db_file and Path(live_db_file).exists() and Path(live_db_file).resolve() != Path(db_file).resolve():
+        live_rows = _table_counts(live_db_file).get("nbtypes", 0)
+        checks["live_rows"] = live_rows
+        if live_rows and rows < live_rows * min_row_ratio:
+            failures.append(f"nbtypes 筆數 {rows} 少於線上版本 {live_rows} 的 {min_row_ratio:.0%}")
+
+    return {"passed": not failures, "checks": checks, "failures": failures}
+
+
+def verify_collection_version(
+    collection_name: str,
+    expected_entities: Optional[int] = None,
+    sample_vectors: Sequence[Tuple[str, Any]] = (),
+    query_vectors: Sequence[Any] = (),
+    live_collection: Optional[str] = None,
+    min_row_ratio: float = DEFAULT_MIN_ROW_RATIO,
+    min_recall: float = DEFAULT_MIN_RECALL
+) -> Dict[str, Any]:
+    """
+    載入（預熱）並驗證新版本 collection
+
+    Args:
+        collection_name: 新版本 collection
+        expected_entities: 應寫入的分塊數
+        sample_vectors: 抽樣的 (chunk_id, embedding)，以自身向量搜尋時應在前 RECALL_TOP_K 名命中
+        query_vectors: 範例查詢向量，每個查詢都應有結果（同時預熱快取）
+        live_collection: 線上版本（alias），用於筆數比較
+    """
+    checks: Dict[str, Any] = {}
+    failures: List[str] = []
+    collection = Collection(collection_name)
+    collection.flush()
+    collection.load()
+    entities = collection.num_entities
+    checks["entities"] = entities
+    if expected_entities is not None and entities != expected_entities:
+        failures.append(f"collection 有 {entities} 筆，應為 {expected_entities} 筆")
+
+    if live_collection and utility.has_collection(live_collection):
+        live_entities = Collection(live_collection).num_entities
+        checks["live_entities"] = live_entities
+        if live_entities and entities < live_entities * min_row_ratio:
+            failures.append(f"collection 筆數 {entities} 少於線上版本 {live_entities} 的 {min_row_ratio:.0%}")
+
+    if sample_vectors:
+        results = collection.search(
+            data=[list(map(float, vector)) for _, vector in sample_vectors],
+            anns_field="embedding", param=SEARCH_PARAMS, limit=RECALL_TOP_K, output_fields=["chunk_id"]
+        )
+        found = sum(
+            1 for (chunk_id, _), hits in zip(sample_vectors, results)
+            if chunk_id in {hit.id for hit in hits}
+        )
+        recall = found / len(sample_vectors)
+        checks["recall_at_k"] = round(recall, 4)
+        if recall < min_recall:
+            failures.append(f"自我召回率 {recall:.2%} 低於 {min_recall:.0%}")
+
+    if query_vectors:
+        started = time.perf_counter()
+        results = collection.search(
+            data=[list(map(float, vector)) for vector in query_vectors],
+            anns_field="embedding", param=SEARCH_PARAMS, limit=RECALL_TOP_K, output_fields=["chunk_id"]
+        )
+        checks["sample_query_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        empty = sum(1 for hits in results if len(hits) == 0)
+        if empty:
+            failures.append(f"{empty} 個範例查詢沒有結果")
+
+    return {"passed": not failures, "checks": checks, "failures": failures}
+
+
+def swap_milvus_alias(alias: str, collection_name: str, active: Dict[str, Any]) -> Optional[str]:
+    """
+    將 alias 指向新 collection，回傳原本的 collection
+
+    第一次發布時 alias 名稱仍是實體 collection，先改名為 <alias>__legacy 再建立 alias
+    （改名與建立 alias 之間有極短的空窗，之後的切換都是原子的 alter_alias）
+    """
+    previous = active.get("collection")
+    if previous:
+        utility.alter_alias(collection_name, alias)
+        return previous
+    try:
+        utility.alter_alias(collection_name, alias)
+        return None
+    except Exception:
+        pass
+    if utility.has_collection(alias):
+        previous = versioned_collection_name(alias, LEGACY_VERSION)
+        logger.warning(f"'{alias}' 為實體 collection，改名為 '{previous}' 後建立 alias")
+        utility.rename_collection(alias, previous)
+    utility.create_alias(collection_name, alias)
+    return previous
+
+
+def swap_duckdb_pointer(pointer_path, target_path) -> Optional[str]:
+    """
+    將 pointer_path 原子地改為指向 target_path 的符號連結，回傳原本指向的檔案
+
+    pointer_path 原本是一般檔案時，先以硬連結保留為 legacy 版本（已開啟的連線不受影響）
+    """
+    pointer_path, target_path = Path(pointer_path), Path(target_path)
+    previous = None
+    if pointer_path.is_symlink():
+        previous = str(pointer_path.resolve())
+    elif pointer_path.exists():
+        legacy_path = versioned_db_path(pointer_path, LEGACY_VERSION, target_path.parent)
+        if pointer_path.with_name(pointer_path.name + ".wal").exists():
+            # 未寫回的 WAL 位於原檔名旁，保留 legacy 前先寫回主檔
+            with duckdb.connect(str(pointer_path)) as con:
+                con.execute("CHECKPOINT")
+        if not legacy_path.exists():
+            try:
+                os.link(pointer_path, legacy_path)
+            except OSError:
+                shutil.copy2(pointer_path, legacy_path)
+        previous = str(legacy_path)
+    tmp_link = pointer_path.with_name(pointer_path.name + ".swap")
+    if tmp_link.is_symlink() or tmp_link.exists():
+        tmp_link.unlink()
+    os.symlink(os.path.relpath(target_path.resolve(), pointer_path.parent.resolve()), tmp_link)
+    os.replace(tmp_link, pointer_path)
+    return previous
+
+
+def _replace_file(src, dst):
+    dst = Path(dst)
+    tmp_path = dst.with_suffix(dst.suffix + ".tmp")
+    shutil.copy2(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def prune_versions(entries: List[Dict[str, Any]]):
+    """刪除已超出保留數的舊版本 collection、資料庫檔案與清單"""
+    for entry in entries:
+        collection_name = entry.get("collection")
+        if collection_name and MILVUS_AVAILABLE and utility.has_collection(collection_name):
+            try:
+                utility.drop_collection(collection_name)
+                logger.info(f"已刪除舊版本 collection: {collection_name}")
+            except Exception as e:
+                logger.warning(f"刪除舊版本 collection {collection_name} 失敗: {e}")
+        for key in ("db_file", "manifest"):
+            if not entry.get(key):
+                continue
+            for path in (Path(entry[key]), Path(entry[key] + ".wal")):
+                if path.exists():
+                    path.unlink()
+                    logger.info(f"已刪除舊版本檔案: {path}")
+
+
+def release_index_version(
+    version: str,
+    db_file,
+    collection_name: str,
+    alias: str,
+    pointer_path,
+    active_index_path,
+    manifest_path=None,
+    live_manifest_path=None,
+    verification: Optional[Dict[str, Any]] = None,
+    keep_versions: int = 2
+) -> Dict[str, Any]:
+    """
+    發布已驗證的新版本：切換 alias 與 DuckDB 符號連結、更新增量同步清單、寫入 active_index.json
+
+    先切換 alias 再切換資料庫；兩者之間的極短時間內分塊內容表查不到的分塊會改從 Milvus 取得內容。
+
+    Returns:
+        新的 active_index 記錄
+    """
+    active = read_active_index(active_index_path)
+    previous_collection = swap_milvus_alias(alias, collection_name, active)
+    previous_db = swap_duckdb_pointer(pointer_path, db_file)
+    if manifest_path and live_manifest_path and Path(manifest_path).exists():
+        _replace_file(manifest_path, live_manifest_path)
+
+    history = list(active.get("history", []))
+    if active.get("version"):
+        history.insert(0, {key: active.get(key) for key in ("version", "db_file", "collection", "manifest")})
+    elif previous_collection or previous_db:
+        history.insert(0, {"version": LEGACY_VERSION, "db_file": previous_db, "collection": previous_collection})
+
+    record = {
+        "version": version,
+        "db_file": str(db_file),
+        "collection": collection_name,
+        "alias": alias,
+        "manifest": str(manifest_path) if manifest_path else None,
+        "released_at": time.time(),
+        "verification": verification,
+        "history": history[:keep_versions],
+    }
+    _write_json_atomic(active_index_path, record)
+    logger.info(f"已發布索引版本 {version}: alias '{alias}' → '{collection_name}'，{pointer_path} → {db_file}")
+    prune_versions(history[keep_versions:])
+    return record
+
+
+def rollback_index_version(alias: str, pointer_path, active_index_path, live_manifest_path=None) -> Dict[str, Any]:
+    """切回前一個保留的版本（collection 先載入再切換 alias）"""
+    active = read_active_index(active_index_path)
+    history = list(active.get("history", []))
+    if not history:
+        raise ValueError("沒有可回滾的版本")
+    target = history.pop(0)
+    if not target.get("collection") or not target.get("db_file") or not Path(target["db_file"]).exists():
+        raise ValueError(f"版本 {target.get('version')} 的資料不完整，無法回滾")
+
+    Collection(target["collection"]).load()
+    utility.alter_alias(target["collection"], alias)
+    swap_duckdb_pointer(pointer_path, target["db_file"])
+    if target.get("manifest") and live_manifest_path and Path(target["manifest"]).exists():
+        _replace_file(target["manifest"], live_manifest_path)
+
+    current = {key: active.get(key) for key in ("version", "db_file", "collection", "manifest")}
+    record = {
+        **target,
+        "alias": alias,
+        "released_at": time.time(),
+        "rolled_back_from": active.get("version"),
+        "verification": None,
+        "history": [current] + history,
+    }
+    _write_json_atomic(active_index_path, record)
+    logger.info(f"已回滾至索引版本 {target.get('version')}（自 {active.get('version')}）")
+    return record
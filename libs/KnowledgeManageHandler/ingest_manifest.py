@@ -0,0 +1,185 @@
+# libs/KnowledgeManageHandler/ingest_manifest.py
+"""
+向量庫增量同步的內容雜湊清單
+記錄每個產品（modeltype + modelname）的內容雜湊，以及其各分塊寫入 Milvus 時的雜湊；
+重新匯入時與目前的 nbtypes 比對，只重新分塊/嵌入新增或變動的產品，
+移除的產品刪除其分塊，變動的分塊依 chunk_id upsert，不需刪除重建 collection。
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, List, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+# 與 scripts/import_nb_specs.py 的 calculate_content_hash 相同，匯入時附加的欄位不列入雜湊
+EXCLUDED_HASH_FIELDS = {'id', 'source_file', 'import_timestamp', 'content_hash'}
+
+
+def _normalize(value: Any) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    return str(value)
+
+
+def product_key(product: Dict[str, Any]) -> str:
+    """產品在清單中的鍵（分塊 chunk_id 同樣由 modeltype 與 modelname 組成）"""
+    return f"{_normalize(product.get('modeltype'))}|{_normalize(product.get('modelname'))}"
+
+
+def product_content_hash(product: Dict[str, Any]) -> str:
+    """計算產品資料列的內容雜湊"""
+    content_str = '|'.join(
+        f"{k}={_normalize(product.get(k))}"
+        for k in sorted(product.keys())
+        if k not in EXCLUDED_HASH_FIELDS
+    )
+    return hashlib.md5(content_str.encode('utf-8')).hexdigest()
+
+
+def chunk_content_hash(entity: Dict[str, Any]) -> str:
+    """計算寫入 Milvus 的分塊實體雜湊（不含 embedding，embedding 由內容決定）"""
+    payload = json.dumps(
+        {k: _normalize(v) for k, v in entity.items() if k != 'embedding'},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def default_manifest_path(db_path: str, collection_name: str) -> Path:
+    """清單與 DuckDB 檔案放在同一目錄，依 collection 區分"""
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}.{collection_name}.manifest.json")
+
+
+@dataclass
+class SyncPlan:
+    """增量同步計畫"""
+    new: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+    @property
+    def to_process(self) -> List[str]:
+        return self.new + self.changed
+
+    def summary(self) -> Dict[str, int]:
+        return {name: len(getattr(self, name)) for name in ("new", "changed", "unchanged", "removed")}
+
+
+class IngestManifest:
+    """產品與分塊內容雜湊清單（JSON 檔）"""
+
+    def __init__(self, path, collection_name: str = ""):
+        self.path = Path(path)
+        self.collection_name = collection_name
+        self.products: Dict[str, Dict[str, Any]] = {}
+        # 近似重複消除：被合併的 chunk_id → 代表分塊 chunk_id（被合併的分塊不在 Milvus 中）
+        self.duplicates: Dict[str, str] = {}
+        self.updated_at: Optional[float] = None
+
+    @classmethod
+    def load(cls, path, collection_name: str = "") -> "IngestManifest":
+        """讀取清單；檔案不存在、版本或 collection 不符時回傳空清單"""
+        manifest = cls(path, collection_name)
+        if not manifest.path.exists():
+            return manifest
+        try:
+            with open(manifest.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"讀取匯入清單失敗，視為首次匯入: {e}")
+            return manifest
+        if data.get("version") != MANIFEST_VERSION or (
+            collection_name and data.get("collection") != collection_name
+        ):
+            logger.warning(f"匯入清單版本或 collection 不符，視為首次匯入: {manifest.path}")
+            return manifest
+        manifest.products = data.get("products", {})
+        manifest.duplicates = data.get("duplicates", {})
+        manifest.updated_at = data.get("updated_at")
+        return manifest
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.products
+
+    def save(self):
+        """以暫存檔 + rename 原子寫入"""
+        self.updated_at = time.time()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "collection": self.collection_name,
+                "updated_at": self.updated_at,
+                "products": self.products,
+                "duplicates": self.duplicates,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        logger.info(f"已更新匯入清單: {self.path}（{len(self.products)} 個產品）")
+
+    def diff(self, products: Iterable[Dict[str, Any]]) -> SyncPlan:
+        """比對目前產品與清單，分出新增、變動、未變動、移除"""
+        plan = SyncPlan()
+        seen = set()
+        for product in products:
+            key = product_key(product)
+            seen.add(key)
+            previous = self.products.get(key)
+            if previous is None:
+                plan.new.append(key)
+            elif previous.get("hash") != product_content_hash(product):
+                plan.changed.append(key)
+            else:
+                plan.unchanged.append(key)
+        plan.removed = [key for key in self.products if key not in seen]
+        return plan
+
+    def chunk_hashes(self, key: str) -> Dict[str, str]:
+        return dict(self.products.get(key, {}).get("chunks", {}))
+
+    def record_product(self, product: Dict[str, Any], chunk_hashes: Dict[str, str]):
+        self.products[product_key(product)] = {
+            "hash": product_content_hash(product),
+            "chunks": dict(chunk_hashes),
+        }
+
+    def remove_product(self, key: str) -> List[str]:
+        """移除產品並回傳其分塊 chunk_id"""
+        return list(self.products.pop(key, {}).get("chunks", {}).keys())
+
+    def record_duplicates(self, duplicates: Dict[str, str]):
+        self.duplicates.update(duplicates)
+
+    def chunk_owners(self) -> Dict[str, str]:
+        """chunk_id → 產品鍵"""
+        return {chunk_id: key for key, entry in self.products.items() for chunk_id in entry.get("chunks", {})}
+
+    def dissolve_duplicate_groups(self, chunk_ids: Iterable[str]) -> set:
+        """
+        解散包含任一 chunk_ids 的近似重複群組（代表分塊或被合併的分塊）
+
+        群組中有產品變動或移除時，代表分塊不再能代表所有成員，成員需重新各自寫入。
+
+        Returns:
+            被解散群組的所有 chunk_id（代表分塊與成員）
+        """
+        chunk_ids = set(chunk_ids)
+        canonical_ids = {self.duplicates.get(chunk_id, chunk_id) for chunk_id in chunk_ids}
+        dissolved = set()
+        for member, canonical in list(self.duplicates.items()):
+            if canonical in canonical_ids:
+                dissolved.update((member, canonical))
+                del self.duplicates[member]
+        return dissolved
@@ -63,6 +63,14 @@ except ImportError:
     Collection = None
     MilvusQuery = None
 
+from .scalar_filters import ScalarFilterCompiler, FACET_TABLE, quote_milvus_string
+from .chunk_content_store import CONTENT_TABLE, fetch_chunk_contents
+from .index_release import read_active_index
+from ..chunk_utils.chunking.chunk_dedup import expand_duplicate_hits
+from .semantic_cache import SemanticRetrievalCache
+from .catalog_entity_detector import CatalogDetectorProvider, KIND_MODELTYPE
+from .spec_projection import project_spec_fields, IDENTITY_FIELDS, ATTRIBUTE_COLUMNS
+
 # we keep using old db : semantic_sales_spec (wrong)
 
 class KnowledgeManager:
@@ -90,6 +98,26 @@ class KnowledgeManager:
         
         # 知識庫配置
         self.knowledge_bases = {}
+
+        # 純量過濾下推：有過濾條件時候選集已被剪枝，可使用較小的 top_k
+        self.scalar_filter_compiler = ScalarFilterCompiler()
+        self.semantic_top_k = 30
+        self.filtered_semantic_top_k = 10
+        self._milvus_field_names = None
+        # Milvus grouping search 支援狀態（None 表示尚未偵測）
+        self._milvus_grouping_supported = None
+
+        # 語義檢索快取：相近查詢重用產品鍵列表；資料庫檔案變動（重新匯入）時失效
+        self.retrieval_cache = SemanticRetrievalCache(
+            similarity_threshold=config.RETRIEVAL_CACHE_SIMILARITY, ttl_seconds=config.RETRIEVAL_CACHE_TTL_SECONDS
+        )
+        self._catalog_signature = None
+        # 藍綠重建發布的索引版本（active_index.json 變動時重新載入）
+        self._index_release_signature = None
+        self._index_version = None
+
+        # 產品目錄實體偵測器（Aho-Corasick，資料庫重新匯入時自動重建）
+        self.catalog_detector = CatalogDetectorProvider(config.DB_PATH)
         
         # Polars 配置
         self.polars_config = {
@@ -809,7 +837,11 @@ class KnowledgeManager:
         query_text: str, 
         top_k: int = 5,
         chunk_type_filter: Optional[str] = None,
-        metric_auto_select: bool = False
+        metric_auto_select: bool = False,
+        scalar_filters: Optional[Dict[str, Any]] = None,
+        group_by_field: Optional[str] = None,
+        include_content: bool = True,
+        query_vector: Optional[List[float]] = None
     ) -> Optional[List[Dict[str, Any]]]:
         """
         使用 Milvus 進行語義搜索（增強版，支援動態度量選擇）
@@ -819,6 +851,12 @@ class KnowledgeManager:
             top_k: 返回結果數量
             chunk_type_filter: 可選的chunk類型過濾 ("parent" 或 "child")
             metric_auto_select: 是否啟用自動度量選擇（預設 False，保持向後相容）
+            scalar_filters: 可選的使用者槽位（預算、重量、螢幕尺寸、GPU 等級、機型），
+                編譯為 Milvus expr 於 ANN 評分前過濾
+            group_by_field: 可選的分組欄位（Milvus grouping search），每組只回傳最佳的一個chunk
+            include_content: False 時只回傳 id、分數與小型純量欄位，
+                內容需要時再以 hydrate_chunk_contents() 從本地內容表載入
+            query_vector: 已編碼的查詢向量（提供時不再重複編碼）
             
         Returns:
             搜索結果列表
@@ -839,7 +877,8 @@ class KnowledgeManager:
                 self.logger.info(f"自動選擇度量: {metric_type}")
             
             # 使用 sentence transformer 生成查詢向量
-            query_vector = self.sentence_transformer.encode(query_text).tolist()
+            if query_vector is None:
+                query_vector = self.sentence_transformer.encode(query_text).tolist()
 
             # Console 顯示目前使用的 Milvus Collection，便於追蹤設定
             if getattr(self.milvus_query, "collection", None):
@@ -855,42 +894,28 @@ class KnowledgeManager:
             # 設置搜索參數（支援多種度量）
             search_params = self._get_distance_metric(metric_type)
             
-            # 設置輸出字段
-            output_fields = [
-                "chunk_id", "product_id", "chunk_type", 
-                "semantic_group", "content"
-            ]
+            # 設置輸出字段（精簡模式不傳輸 content，大幅減少網路與反序列化成本）
+            output_fields = self._get_output_fields(include_content)
             
             # 構建過濾表達式
-            filter_expr = None
-            if chunk_type_filter:
-                filter_expr = f'chunk_type == "{chunk_type_filter}"'
+            filter_expr = self._build_filter_expr(chunk_type_filter, scalar_filters)
             
             # 執行向量搜索
+            search_kwargs = {}
+            if group_by_field:
+                search_kwargs["group_by_field"] = group_by_field
             results = self.milvus_query.collection.search(
                 data=[query_vector],
                 anns_field="embedding",
                 param=search_params,
                 limit=top_k,
                 output_fields=output_fields,
-                expr=filter_expr
+                expr=filter_expr,
+                **search_kwargs
             )
             
             # 格式化結果
-            hits = results[0] if results else []
-            formatted_results = []
-            
-            for hit in hits:
-                result = {
-                    "chunk_id": hit.entity.get("chunk_id"),
-                    "product_id": hit.entity.get("product_id"),
-                    "chunk_type": hit.entity.get("chunk_type"),
-                    "semantic_group": hit.entity.get("semantic_group"),
-                    "content": hit.entity.get("content"),
-                    "distance": hit.distance,
-                    "similarity_score": 1 / (1 + hit.distance)  # 轉換為相似度分數
-                }
-                formatted_results.append(result)
+            formatted_results = self._format_hits(results[0] if results else [], include_content)
             
             self.logger.info(f"Milvus 搜索完成，找到 {len(formatted_results)} 個結果")
             return formatted_results
@@ -899,6 +924,253 @@ class KnowledgeManager:
             self.logger.error(f"Milvus 語義搜索失敗: {e}")
             return None
     
+    def batch_semantic_search(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        chunk_type_filter: Optional[str] = None,
+        include_content: bool = False
+    ) -> Optional[List[List[Dict[str, Any]]]]:
+        """
+        批次語義搜索：一次批量編碼所有查詢，並以單次多向量 Milvus 搜索取回結果
+
+        Args:
+            queries: 查詢文本列表
+            top_k: 每個查詢的返回結果數量
+            filters: 可選的使用者槽位過濾（所有查詢共用，見 milvus_semantic_search）
+            chunk_type_filter: 可選的chunk類型過濾
+            include_content: 是否從 Milvus 傳回 content
+
+        Returns:
+            與 queries 順序一致的結果列表（每個查詢一個列表）
+        """
+        if not queries:
+            return []
+        try:
+            if not self.milvus_query:
+                self.logger.error("Milvus 未初始化")
+                return None
+
+            if not self.sentence_transformer:
+                self.logger.error("Embedding 模型未初始化")
+                return None
+
+            query_vectors = self.sentence_transformer.encode(list(queries), batch_size=32).tolist()
+
+            results = self.milvus_query.collection.search(
+                data=query_vectors,
+                anns_field="embedding",
+                param=self._get_distance_metric("L2"),
+                limit=top_k,
+                output_fields=self._get_output_fields(include_content),
+                expr=self._build_filter_expr(chunk_type_filter, filters)
+            )
+
+            batch_results = [self._format_hits(hits, include_content) for hits in results]
+            self.logger.info(f"Milvus 批次搜索完成：{len(queries)} 個查詢，共 {sum(len(r) for r in batch_results)} 個結果")
+            return batch_results
+
+        except Exception as e:
+            self.logger.error(f"Milvus 批次語義搜索失敗: {e}")
+            return None
+
+    def _get_output_fields(self, include_content: bool) -> List[str]:
+        """Milvus 輸出欄位；精簡模式不含 content，近似重複合併過的 collection 另取 product_ids"""
+        output_fields = ["chunk_id", "product_id", "chunk_type", "semantic_group"]
+        if "product_ids" in self._get_milvus_field_names():
+            output_fields.append("product_ids")
+        if include_content:
+            output_fields.append("content")
+        return output_fields
+
+    def _build_filter_expr(
+        self,
+        chunk_type_filter: Optional[str] = None,
+        scalar_filters: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """組合 chunk 類型與槽位純量過濾為 Milvus expr"""
+        filter_clauses = []
+        if chunk_type_filter:
+            filter_clauses.append(f'chunk_type == "{chunk_type_filter}"')
+        if scalar_filters:
+            facets = self.scalar_filter_compiler.compile(scalar_filters)
+            scalar_expr = self.scalar_filter_compiler.to_milvus_expr(
+                facets, self._get_milvus_field_names()
+            )
+            if scalar_expr:
+                filter_clauses.append(f"({scalar_expr})")
+        filter_expr = " and ".join(filter_clauses) if filter_clauses else None
+        if filter_expr:
+            self.logger.info(f"Milvus 過濾條件: {filter_expr}")
+        return filter_expr
+
+    @staticmethod
+    def _format_hits(hits, include_content: bool) -> List[Dict[str, Any]]:
+        """將 Milvus hits 轉為結果字典列表；代表分塊（近似重複合併）展開為其涵蓋的每個產品"""
+        formatted_results = []
+        for hit in hits:
+            result = {
+                "chunk_id": hit.entity.get("chunk_id"),
+                "product_id": hit.entity.get("product_id"),
+                "chunk_type": hit.entity.get("chunk_type"),
+                "semantic_group": hit.entity.get("semantic_group"),
+                "distance": hit.distance,
+                "similarity_score": 1 / (1 + hit.distance)  # 轉換為相似度分數
+            }
+            product_ids = hit.entity.get("product_ids")
+            if product_ids:
+                result["product_ids"] = [pid for pid in str(product_ids).split(",") if pid]
+            if include_content:
+                result["content"] = hit.entity.get("content")
+            formatted_results.append(result)
+        return expand_duplicate_hits(formatted_results)
+
+    def milvus_product_search(
+        self,
+        query_text: str,
+        num_products: int,
+        scalar_filters: Optional[Dict[str, Any]] = None,
+        candidate_multiplier: int = 3,
+        query_vector: Optional[List[float]] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        以產品為單位的語義搜索：直接回傳最相關的 N 個不同產品
+
+        優先使用 Milvus grouping search（group_by_field="product_id"）；
+        不支援時改為取 N * candidate_multiplier 個chunks，在本地以每個產品的最佳分數聚合。
+
+        Args:
+            query_text: 搜索查詢文本
+            num_products: 需要的不同產品數量
+            scalar_filters: 可選的使用者槽位過濾（見 milvus_semantic_search）
+            candidate_multiplier: 本地聚合時的候選放大倍數
+            query_vector: 已編碼的查詢向量（可選）
+
+        Returns:
+            每個產品一筆（最佳chunk），依相似度由高到低排序，並附 matched_chunks 計數
+        """
+        if num_products <= 0:
+            return []
+
+        if self._supports_grouping_search():
+            grouped = self.milvus_semantic_search(
+                query_text,
+                top_k=num_products,
+                scalar_filters=scalar_filters,
+                group_by_field="product_id",
+                include_content=False,
+                query_vector=query_vector
+            )
+            if grouped is not None:
+                # 代表分塊展開後同一產品可能出現多次，依產品重新聚合
+                grouped = self._aggregate_by_product(grouped, num_products)
+                for item in grouped:
+                    item.setdefault("matched_chunks", 1)
+                self.logger.info(f"Milvus grouping search 回傳 {len(grouped)} 個產品")
+                return grouped
+            self.logger.warning("Milvus grouping search 失敗，改用本地產品聚合")
+
+        candidates = self.milvus_semantic_search(
+            query_text,
+            top_k=num_products * max(candidate_multiplier, 1),
+            scalar_filters=scalar_filters,
+            include_content=False,
+            query_vector=query_vector
+        )
+        if candidates is None:
+            return None
+        return self._aggregate_by_product(candidates, num_products)
+
+    def hydrate_chunk_contents(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        為精簡檢索結果延遲載入 chunk 內容（就地填入 content）
+
+        先查本地 DuckDB 內容表；表不存在或缺漏的 chunk 再以 Milvus query 補齊。
+
+        Args:
+            results: milvus_semantic_search(include_content=False) 的結果（或其子集）
+
+        Returns:
+            同一個 results 列表
+        """
+        missing_ids = [r.get("chunk_id") for r in results if r.get("chunk_id") and "content" not in r]
+        if not missing_ids:
+            return results
+
+        contents: Dict[str, str] = {}
+        kb_info = self.knowledge_bases.get(config.DUCKDB_FILE)
+        if kb_info:
+            try:
+                import duckdb  # type: ignore
+                con = duckdb.connect(kb_info["path"])
+                try:
+                    if self._duckdb_has_table(con, CONTENT_TABLE):
+                        contents = fetch_chunk_contents(con, missing_ids)
+                finally:
+                    con.close()
+            except Exception as e:
+                self.logger.warning(f"讀取本地 chunk 內容失敗: {e}")
+
+        remaining = [cid for cid in missing_ids if cid not in contents]
+        if remaining and self.milvus_query and getattr(self.milvus_query, "collection", None):
+            try:
+                quoted = ", ".join(quote_milvus_string(cid) for cid in remaining)
+                rows = self.milvus_query.collection.query(
+                    expr=f"chunk_id in [{quoted}]",
+                    output_fields=["chunk_id", "content"]
+                )
+                contents.update({row["chunk_id"]: row.get("content") for row in rows})
+                self.logger.debug(f"以 Milvus 補齊 {len(rows)} 個 chunk 內容")
+            except Exception as e:
+                self.logger.warning(f"Milvus 補齊 chunk 內容失敗: {e}")
+
+        for result in results:
+            if "content" not in result:
+                result["content"] = contents.get(result.get("chunk_id"), "")
+        return results
+
+    def _supports_grouping_search(self) -> bool:
+        """pymilvus 2.4 起支援 group_by_field（結果快取）"""
+        if self._milvus_grouping_supported is None:
+            try:
+                import pymilvus
+                major, minor = (int(part) for part in pymilvus.__version__.split(".")[:2])
+                self._milvus_grouping_supported = (major, minor) >= (2, 4)
+            except Exception:
+                self._milvus_grouping_supported = False
+            self.logger.info(f"Milvus grouping search 支援: {self._milvus_grouping_supported}")
+        return self._milvus_grouping_supported
+
+    @staticmethod
+    def _aggregate_by_product(results: List[Dict[str, Any]], num_products: int) -> List[Dict[str, Any]]:
+        """依 product_id 聚合，每個產品保留相似度最高的chunk"""
+        best: Dict[str, Dict[str, Any]] = {}
+        for item in results:
+            product_id = str(item.get("product_id", "")).strip()
+            if not product_id:
+                continue
+            current = best.get(product_id)
+            if current is None:
+                best[product_id] = {**item, "matched_chunks": 1}
+            else:
+                current["matched_chunks"] += 1
+                if item["similarity_score"] > current["similarity_score"]:
+                    best[product_id] = {**item, "matched_chunks": current["matched_chunks"]}
+        ranked = sorted(best.values(), key=lambda x: x["similarity_score"], reverse=True)
+        return ranked[:num_products]
+
+    def _get_milvus_field_names(self) -> set:
+        """取得目前 collection 的欄位名稱（快取），用於略過舊 collection 不存在的純量欄位"""
+        if self._milvus_field_names is None:
+            try:
+                collection = self.milvus_query.collection
+                self._milvus_field_names = {field.name for field in collection.schema.fields}
+            except Exception as e:
+                self.logger.warning(f"無法取得 Milvus collection 欄位: {e}")
+                return set()
+        return self._milvus_field_names
+
     def _detect_collection_metric_preference(self) -> str:
         """
         檢測 Collection 的向量特徵，決定最佳度量
@@ -997,7 +1269,8 @@ class KnowledgeManager:
         self, 
         query_text: str, 
         child_top_k: int = 10,
-        parent_top_k: int = 3
+        parent_top_k: int = 3,
+        include_content: bool = True
     ) -> Optional[Dict[str, Any]]:
         """
         Parent-Child Chunking 檢索策略
@@ -1006,6 +1279,7 @@ class KnowledgeManager:
             query_text: 搜索查詢文本
             child_top_k: 子chunk搜索結果數量
             parent_top_k: 父document結果數量
+            include_content: False 時不從 Milvus 傳輸 content（見 hydrate_chunk_contents）
             
         Returns:
             包含子chunks和對應父documents的結果
@@ -1015,7 +1289,8 @@ class KnowledgeManager:
             child_results = self.milvus_semantic_search(
                 query_text, 
                 top_k=child_top_k,
-                chunk_type_filter="child"
+                chunk_type_filter="child",
+                include_content=include_content
             )
             
             if not child_results:
@@ -1025,16 +1300,16 @@ class KnowledgeManager:
             # 2. 根據子chunks的product_id獲取對應的parent documents
             product_ids = list(set([result["product_id"] for result in child_results]))
             
+            # 以單次批次搜索取得各產品對應的parent document
             parent_results = []
-            for product_id in product_ids[:parent_top_k]:
-                # 搜索對應的parent document
-                parent_search = self.milvus_semantic_search(
-                    f"product_id:{product_id}",
-                    top_k=1,
-                    chunk_type_filter="parent"
-                )
-                if parent_search:
-                    parent_results.extend(parent_search)
+            parent_searches = self.batch_semantic_search(
+                [f"product_id:{product_id}" for product_id in product_ids[:parent_top_k]],
+                top_k=1,
+                chunk_type_filter="parent",
+                include_content=include_content
+            ) or []
+            for parent_search in parent_searches:
+                parent_results.extend(parent_search)
             
             # 3. 整理結果
             retrieval_result = {
@@ -1073,15 +1348,21 @@ class KnowledgeManager:
         try:
             # 1. 執行向量搜索
             if use_parent_child:
-                search_results = self.parent_child_retrieval(query_text, child_top_k=top_k*2, parent_top_k=top_k)
+                search_results = self.parent_child_retrieval(
+                    query_text, child_top_k=top_k*2, parent_top_k=top_k, include_content=False
+                )
                 if not search_results:
                     return None
+
+                # 只為實際呈現的 chunks 載入內容
+                rendered_children = search_results["child_chunks"][:top_k]
+                self.hydrate_chunk_contents(rendered_children + search_results["parent_documents"])
                     
                 # 合併 child chunks 和 parent documents 的內容
                 context_parts = []
                 
                 # 添加最相關的子chunks
-                for i, child in enumerate(search_results["child_chunks"][:top_k], 1):
+                for i, child in enumerate(rendered_children, 1):
                     context_parts.append(f"相關資訊 {i}:")
                     context_parts.append(f"  內容: {child['content']}")
                     context_parts.append(f"  產品ID: {child['product_id']}")
@@ -1099,9 +1380,10 @@ class KnowledgeManager:
                 
             else:
                 # 使用簡單的向量搜索
-                search_results = self.milvus_semantic_search(query_text, top_k=top_k)
+                search_results = self.milvus_semantic_search(query_text, top_k=top_k, include_content=False)
                 if not search_results:
                     return None
+                self.hydrate_chunk_contents(search_results)
                     
                 context_parts = []
                 for i, result in enumerate(search_results, 1):
@@ -1622,7 +1904,50 @@ class KnowledgeManager:
 
     def _extract_product_codes(self, query: str) -> List[str]:
         """
-        [ENHANCED] 增強版產品代碼檢測函數 - 支援四重安全閘門
+        從查詢中提取產品代碼（如 APX819, 819 等）
+
+        Args:
+            query: 用戶查詢字串
+
+        Returns:
+            提取到的產品代碼列表
+        """
+        return self.detect_product_entities(query)[0]
+
+    def detect_product_entities(self, query: str) -> Tuple[List[str], List[str]]:
+        """
+        以產品目錄實體偵測器單次掃描查詢；偵測器無法建立時退回正則檢測
+
+        純數字機型沿用上下文規則：需出現產品上下文關鍵字，且不可出現年份/價格等排除關鍵字。
+
+        Args:
+            query: 用戶查詢字串
+
+        Returns:
+            (產品代碼列表, 對應的 modeltype 列表)
+        """
+        detector = self.catalog_detector.get()
+        if detector is None:
+            codes = self._extract_product_codes_regex(query)
+            modeltypes = [re.findall(r'\d+', code)[0] for code in codes if re.search(r'\d', code)]
+            return codes, list(dict.fromkeys(modeltypes))
+
+        detection = detector.detect(query)
+        pure_number_allowed = detection["has_context"] and not detection["has_exclude"]
+        codes, modeltypes = [], []
+        for entity in detection["entities"]:
+            if entity["kind"] == KIND_MODELTYPE and entity["text"].isdigit() and not pure_number_allowed:
+                continue
+            codes.append(entity["text"].upper())
+            modeltypes.extend(entity["modeltypes"])
+
+        if codes:
+            self.logger.info(f"[CATALOG] 目錄實體偵測到產品代碼: {codes} → modeltype: {modeltypes}")
+        return codes, list(dict.fromkeys(modeltypes))
+
+    def _extract_product_codes_regex(self, query: str) -> List[str]:
+        """
+        [FALLBACK] 正則版產品代碼檢測函數 - 支援四重安全閘門（目錄偵測器不可用時使用）
         從查詢中提取產品代碼（如 APX819, 8329 等）
 
         Args:
@@ -1673,13 +1998,206 @@ class KnowledgeManager:
 
         return all_matches
 
-    def search_product_data(self, message: str) -> Dict[str, Any]:
+    def _duckdb_has_table(self, con, table_name: str) -> bool:
+        """檢查 DuckDB 連線中是否存在指定資料表"""
+        try:
+            row = con.execute(
+                "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?",
+                [table_name]
+            ).fetchone()
+            return bool(row and row[0] > 0)
+        except Exception as e:
+            self.logger.warning(f"檢查資料表 {table_name} 失敗: {e}")
+            return False
+
+    def _search_candidates(
+        self,
+        query_text: str,
+        top_k: int,
+        num_products: Optional[int] = None,
+        slot_filters: Optional[Dict[str, Any]] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """語義候選檢索：指定產品數量時以產品分組，否則取 top_k 個chunks"""
+        if num_products:
+            return self.milvus_product_search(
+                query_text, num_products, scalar_filters=slot_filters, query_vector=query_vector
+            )
+        return self.milvus_semantic_search(
+            query_text=query_text, top_k=top_k, scalar_filters=slot_filters,
+            include_content=False, query_vector=query_vector
+        )
+
+    def _semantic_product_keys(
+        self,
+        query_text: str,
+        slot_filters: Optional[Dict[str, Any]] = None,
+        num_products: Optional[int] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> Tuple[List[str], Dict[str, List[str]], bool]:
+        """
+        語義檢索產品鍵（modeltype）列表，依相似度排序
+
+        Returns:
+            (產品鍵列表, 實際套用的純量過濾條件, 是否因無結果而放寬過濾)
+        """
+        # 槽位 → 純量過濾條件
+        facets = self.scalar_filter_compiler.compile(slot_filters)
+        filters_relaxed = False
+
+        # 可下推過濾時候選已被剪枝，使用較小的 top_k
+        semantic_results = None
+        if facets and self.scalar_filter_compiler.to_milvus_expr(facets, self._get_milvus_field_names()):
+            self.logger.info(f"槽位純量過濾下推: {facets}")
+            semantic_results = self._search_candidates(
+                query_text, self.filtered_semantic_top_k, num_products, slot_filters, query_vector
+            )
+            if not semantic_results:
+                # 過濾過嚴時放寬為無過濾搜尋，避免直接回覆查無產品
+                self.logger.info("純量過濾後無結果，放寬為無過濾的語義搜尋")
+                facets = {}
+                filters_relaxed = True
+
+        if not semantic_results:
+            semantic_results = self._search_candidates(
+                query_text, self.semantic_top_k, num_products, query_vector=query_vector
+            )
+
+        # 提取 product_id，並正規化為字串做為 modeltype 比對鍵；保留相似度排序
+        keys = list(dict.fromkeys(
+            str(item.get('product_id', '')).strip() for item in (semantic_results or []) if str(item.get('product_id', '')).strip()
+        ))
+        return keys, facets, filters_relaxed
+
+    def _cached_semantic_product_keys(
+        self,
+        query_text: str,
+        slot_filters: Optional[Dict[str, Any]] = None,
+        num_products: Optional[int] = None
+    ) -> Tuple[List[str], Dict[str, List[str]], bool]:
+        """帶語義快取的 _semantic_product_keys：相近查詢（同樣的過濾條件）直接重用結果"""
+        if not self.sentence_transformer:
+            return self._semantic_product_keys(query_text, slot_filters, num_products)
+
+        self._check_catalog_version()
+        query_vector = self.sentence_transformer.encode(query_text).tolist()
+        context_key = json.dumps(
+            {"filters": slot_filters or {}, "num_products": num_products}, sort_keys=True, ensure_ascii=False
+        )
+
+        cached = self.retrieval_cache.lookup(query_vector, context_key)
+        if cached is not None:
+            value, similarity, cached_query = cached
+            self.logger.info(f"語義檢索快取命中（相似度 {similarity:.3f}，原查詢：'{cached_query}'）")
+            if not self.retrieval_cache.should_sample():
+                return value
+            # 抽樣重新檢索，量測誤命中率
+            fresh = self._semantic_product_keys(query_text, slot_filters, num_products, query_vector)
+            self.retrieval_cache.record_sample(value[0], fresh[0])
+            return fresh
+
+        result = self._semantic_product_keys(query_text, slot_filters, num_products, query_vector)
+        if result[0]:
+            self.retrieval_cache.put(query_vector, result, query_text=query_text, context_key=context_key)
+        return result
+
+    def _check_catalog_version(self):
+        """資料庫檔案變動（重新匯入或重建分塊）時讓語義檢索快取失效"""
+        self._check_index_release()
+        try:
+            stat = Path(config.DB_PATH).stat()
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return
+        if self._catalog_signature is not None and signature != self._catalog_signature:
+            self.retrieval_cache.invalidate("catalog changed")
+        self._catalog_signature = signature
+
+    def _check_index_release(self):
+        """藍綠重建發布新版本（alias 與 DuckDB 符號連結已切換）時重新載入索引"""
+        try:
+            stat = Path(config.ACTIVE_INDEX_PATH).stat()
+        except OSError:
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._index_release_signature:
+            return
+        first_check = self._index_release_signature is None
+        self._index_release_signature = signature
+        version = read_active_index(config.ACTIVE_INDEX_PATH).get("version")
+        if not first_check and version != self._index_version:
+            self.reload_index(f"index version {self._index_version} -> {version}")
+        self._index_version = version
+
+    def reload_index(self, reason: str = "index released"):
+        """重新載入索引：重新解析 alias 指向的 collection，清除 schema 偵測結果與語義檢索快取"""
+        if self.milvus_query is not None:
+            try:
+                self.milvus_query.set_collection(config.MILVUS_COLLECTION_NAME)
+            except Exception as e:
+                self.logger.error(f"重新載入 Milvus collection 失敗: {e}")
+        self._milvus_field_names = None
+        self._milvus_grouping_supported = None
+        self.retrieval_cache.invalidate(reason)
+        self.logger.info(f"已重新載入索引（{reason}）")
+
+    def invalidate_retrieval_cache(self, reason: str = "manual"):
+        """手動讓語義檢索快取失效（例如程序內完成資料匯入後）"""
+        self.retrieval_cache.invalidate(reason)
+
+    def get_retrieval_cache_stats(self) -> Dict[str, Any]:
+        """語義檢索快取統計：命中率、抽樣誤命中率等"""
+        return self.retrieval_cache.get_stats()
+
+    def fetch_product_fields(self, modeltypes: List[str], fields: List[str]) -> List[Dict[str, Any]]:
+        """
+        只查詢指定機型的指定欄位（追問時補齊快取中缺少的規格欄位）
+
+        Args:
+            modeltypes: 機型列表
+            fields: 需要的 nbtypes 欄位（識別欄位會自動加入）
+
+        Returns:
+            規格列列表；資料庫不可用時回傳空列表
+        """
+        kb_info = self.knowledge_bases.get(config.DUCKDB_FILE)
+        if not kb_info or not modeltypes:
+            return []
+        columns = list(dict.fromkeys(IDENTITY_FIELDS + [f for f in fields if f in ATTRIBUTE_COLUMNS]))
+        try:
+            import duckdb  # type: ignore
+
+            with duckdb.connect(kb_info["path"], read_only=True) as con:
+                cur = con.execute(
+                    f"SELECT {', '.join(columns)} FROM nbtypes "
+                    f"WHERE CAST(modeltype AS VARCHAR) IN ({','.join(['?'] * len(modeltypes))})",
+                    [str(m) for m in modeltypes]
+                )
+                names = [d[0] for d in cur.description]
+                return [dict(zip(names, row)) for row in cur.fetchall()]
+        except Exception as e:
+            self.logger.error(f"補查產品欄位失敗: {e}")
+            return []
+
+    def search_product_data(
+        self,
+        message: str,
+        slot_filters: Optional[Dict[str, Any]] = None,
+        num_products: Optional[int] = None,
+        attributes: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
         """
         通用產品規格搜尋函式
         使用語義搜尋和 DuckDB 規格查詢，並加入智能產品代碼檢測
 
         Args:
             message: 客戶查詢字串
+            slot_filters: 可選的使用者槽位（如 {"weight": "light", "screen_size": "14"}），
+                會下推為 Milvus expr 與 DuckDB WHERE 條件；明確提及的產品代碼不受過濾
+            num_products: 需要的不同產品數量（通常由 query rule 決定）；
+                提供時以產品為單位檢索，不再取固定 top_k 個chunks後去重
+            attributes: query rule 解析出的屬性（如 ["cpu", "battery"]）；
+                只選取對應的規格欄位，未提供時選取預設欄位
 
         Returns:
             JSON格式的產品規格資料
@@ -1688,19 +2206,17 @@ class KnowledgeManager:
             self.logger.info(f"開始產品規格搜尋：'{message}'")
 
             # 🔍 智能產品代碼檢測
-            detected_product_codes = self._extract_product_codes(message)
+            detected_product_codes, detected_modeltypes = self.detect_product_entities(message)
 
             # 🎮 遊戲相關查詢增強處理
             enhanced_query = message
-           
 
-            # 第一步：語義搜尋
-            semantic_results = self.milvus_semantic_search(
-                query_text=enhanced_query,
-                top_k=30
+            # 第一步：語義搜尋（含槽位純量過濾下推；相近查詢命中快取時直接重用產品鍵列表）
+            semantic_keys, facets, filters_relaxed = self._cached_semantic_product_keys(
+                enhanced_query, slot_filters, num_products
             )
             
-            if not semantic_results:
+            if not semantic_keys:
                 self.logger.warning("語義搜尋未找到相關結果")
                 return {
                     "query": message,
@@ -1708,28 +2224,16 @@ class KnowledgeManager:
                     "products": []
                 }
             
-            # 第二步：提取 product_id，並正規化為字串做為 modeltype 比對鍵
-            matched_keys = list({str(item.get('product_id', '')).strip() for item in semantic_results if str(item.get('product_id', '')).strip()})
+            # 第二步：product_id 已正規化為字串做為 modeltype 比對鍵（依相似度排序）
+            matched_keys = list(semantic_keys)
             self.logger.info(f"Milvus 語義搜尋的 modeltype 候選共 {len(matched_keys)} 個：{matched_keys}")
 
-            # 🔍 智能產品代碼檢測 - 將檢測到的產品代碼轉換為 modeltype 並合併
-            if detected_product_codes:
-                # 從產品代碼中提取數字部分作為 modeltype（如 APX819 -> 819）
-                detected_modeltypes = []
-                for code in detected_product_codes:
-                    # 提取數字部分
-                    import re
-                    numbers = re.findall(r'\d+', code)
-                    if numbers:
-                        modeltype = numbers[0]  # 取第一個數字序列
-                        detected_modeltypes.append(modeltype)
-
-                if detected_modeltypes:
-                    self.logger.info(f"從產品代碼提取到 modeltype: {detected_modeltypes}")
-                    # 合併語義搜尋結果和檢測到的產品代碼，確保檢測到的產品代碼優先
-                    merged_keys = detected_modeltypes + [key for key in matched_keys if key not in detected_modeltypes]
-                    matched_keys = merged_keys
-                    self.logger.info(f"合併後的 modeltype 候選（detected + semantic）共 {len(matched_keys)} 個：{matched_keys}")
+            # 🔍 智能產品代碼檢測 - 將檢測到的 modeltype 合併，確保檢測到的產品代碼優先
+            if detected_modeltypes:
+                self.logger.info(f"從產品代碼提取到 modeltype: {detected_modeltypes}")
+                merged_keys = detected_modeltypes + [key for key in matched_keys if key not in detected_modeltypes]
+                matched_keys = merged_keys
+                self.logger.info(f"合併後的 modeltype 候選（detected + semantic）共 {len(matched_keys)} 個：{matched_keys}")
 
             if not matched_keys:
                 # 語義搜尋和產品代碼檢測都沒有結果
@@ -1757,31 +2261,57 @@ class KnowledgeManager:
                 import duckdb  # type: ignore
 
                 # 使用直接字串 IN 查詢，比對 modeltype（等同於 milvus product_id）
-                # 只選取必要欄位以提升效能
-                essential_fields = [
-                    'modeltype', 'modelname', 'cpu', 'gpu', 'memory', 'storage', 
-                    'lcd', 'battery', 'audio', 'wireless', 'bluetooth','softwareconfig',
-                    'thermal','ai'
-                ]
+                # 只選取與查詢屬性相關的欄位（加上識別欄位）以縮小提示詞
+                essential_fields = project_spec_fields(attributes)
                 fields_str = ', '.join(essential_fields)
-                modeltype_strs = [f"'{mt}'" for mt in matched_keys]
-                in_clause = ','.join(modeltype_strs)
-                sql = f"""
-                    SELECT {fields_str}
-                    FROM nbtypes
-                    WHERE modeltype IN ({in_clause})
-                """
+                in_clause = ','.join(['?'] * len(matched_keys))
+                base_where = f"modeltype IN ({in_clause})"
+                base_params = list(matched_keys)
 
-                self.logger.info(f"開始在 DuckDB 查詢 nbtypes（以 modeltype IN ({in_clause})）")
+                self.logger.info(f"開始在 DuckDB 查詢 nbtypes（以 modeltype IN ({matched_keys})）")
                 con = duckdb.connect(kb_info["path"])  # 直接連線到 DuckDB 檔案
                 try:
-                    cur = con.execute(sql)
-                    rows = cur.fetchall()
-                    columns = [d[0] for d in cur.description] if cur.description else []
-                    for r in rows:
-                        # rows 為 tuple，需與欄位名稱對應成 dict
-                        row_dict = {columns[i]: r[i] for i in range(len(columns))}
-                        detailed_specs.append(row_dict)
+                    queries = [(base_where, base_params)]
+
+                    # 純量過濾下推至 nbtypes_facets（舊資料庫沒有此表時略過）
+                    facet_where, facet_params = self.scalar_filter_compiler.to_duckdb_where(facets)
+                    if facet_where and self._duckdb_has_table(con, FACET_TABLE):
+                        facet_sql = f"""EXISTS (
+                            SELECT 1 FROM {FACET_TABLE}
+                            WHERE {FACET_TABLE}.modeltype = CAST(nbtypes.modeltype AS VARCHAR)
+                              AND {FACET_TABLE}.modelname = nbtypes.modelname
+                              AND {facet_where}
+                        )"""
+                        if detected_modeltypes:
+                            # 明確提及的機型不受槽位過濾
+                            exempt_clause = ','.join(['?'] * len(detected_modeltypes))
+                            filtered = (
+                                f"{base_where} AND (modeltype IN ({exempt_clause}) OR {facet_sql})",
+                                base_params + detected_modeltypes + facet_params
+                            )
+                        else:
+                            filtered = (f"{base_where} AND {facet_sql}", base_params + facet_params)
+                        # 先用過濾條件查詢，無結果時再退回只以 modeltype 查詢
+                        queries.insert(0, filtered)
+
+                    for attempt, (where_sql, params) in enumerate(queries):
+                        sql = f"""
+                            SELECT {fields_str}
+                            FROM nbtypes
+                            WHERE {where_sql}
+                        """
+                        cur = con.execute(sql, params)
+                        rows = cur.fetchall()
+                        columns = [d[0] for d in cur.description] if cur.description else []
+                        for r in rows:
+                            # rows 為 tuple，需與欄位名稱對應成 dict
+                            row_dict = {columns[i]: r[i] for i in range(len(columns))}
+                            detailed_specs.append(row_dict)
+                        if detailed_specs:
+                            break
+                        if attempt + 1 < len(queries):
+                            self.logger.info("DuckDB 純量過濾後無結果，放寬為只以 modeltype 查詢")
+                            filters_relaxed = True
                 finally:
                     try:
                         con.close()
@@ -1813,6 +2343,9 @@ class KnowledgeManager:
                 "status": "success",
                 "matched_keys": matched_keys,
                 "detected_product_codes": detected_product_codes,
+                "scalar_filters": facets,
+                "filters_relaxed": filters_relaxed,
+                "projected_fields": essential_fields,
                 "count": len(detailed_specs),
                 "products": detailed_specs
             }
@@ -86,7 +86,10 @@ class PolarsHelper:
     
     async def connect_data_source(self, source_config: Dict[str, Any]) -> bool:
         """
-        連接數據源，支援 CSV、Parquet、Arrow、SQL 等格式
+        連接數據源，支援 CSV、Parquet、Arrow、SQL 與欄式快照（snapshot）等格式
+
+        數據源以 LazyFrame 延遲掃描（Arrow 以 memory map 開啟），查詢時才讀取所需的欄位與列；
+        snapshot 類型讀取 columnar_snapshot 發布的目前版本（source_config: table、snapshot_dir、db_path）
         
         Args:
             source_config: 數據源配置
@@ -103,6 +106,13 @@ class PolarsHelper:
             source_type = source_config.get("type", "file")
             source_path = source_config.get("path", "")
             
+            if source_type == "snapshot":
+                from .columnar_snapshot import snapshot_file
+                source_path = snapshot_file(
+                    source_config.get("snapshot_dir", ""), source_config.get("table", "nbtypes"),
+                    db_file=source_config.get("db_path")
+                ) or ""
+            
             # 檢查文件是否存在
             if not Path(source_path).exists():
                 self.logger.error(f"數據源文件不存在: {source_path}")
@@ -110,41 +120,38 @@ class PolarsHelper:
             
             # 根據文件類型選擇讀取方法
             if source_type == "csv":
-                df = pl.read_csv(source_path)
-            elif source_type == "parquet":
-                df = pl.read_parquet(source_path)
+                df = pl.scan_csv(source_path)
+            elif source_type in ("parquet", "snapshot"):
+                df = pl.scan_parquet(source_path)
             elif source_type == "arrow":
-                df = pl.read_ipc(source_path)
+                df = pl.scan_ipc(source_path, memory_map=True)
             elif source_type == "sql":
                 # 對於 SQL 文件，這裡提供一個簡單的實現
                 # 實際使用中可能需要更複雜的 SQL 解析
-                df = pl.read_csv(source_path)  # 暫時當作 CSV 處理
+                df = pl.scan_csv(source_path)  # 暫時當作 CSV 處理
             else:
                 self.logger.error(f"不支援的數據源類型: {source_type}")
                 return False
             
-            # 檢查內存使用
-            if not self._check_memory_usage(df):
-                raise PolarsMemoryError("內存使用超出限制")
+            # 只讀取 schema 與筆數（Parquet 由檔案中繼資料取得），不載入整張表
+            columns = df.collect_schema().names() if hasattr(df, "collect_schema") else df.columns
+            row_count = df.select(pl.len()).collect().item()
             
             # 存儲數據源
             self.data_sources[source_name] = {
                 "type": source_type,
-                "path": source_path,
+                "path": str(source_path),
                 "dataframe": df,
-                "row_count": len(df),
-                "column_count": len(df.columns),
-                "memory_usage_mb": self._estimate_memory_usage(df),
+                "row_count": row_count,
+                "column_count": len(columns),
+                "memory_usage_mb": 0.0,
                 "connected_at": time.time()
             }
             
             self.logger.info(f"數據源連接成功: {source_name} ({source_type}), "
-                           f"行數: {len(df)}, 列數: {len(df.columns)}")
+                           f"行數: {row_count}, 列數: {len(columns)}")
             return True
             
-        except PolarsMemoryError as e:
-            self.logger.error(f"內存不足，無法連接數據源: {e}")
-            return False
         except Exception as e:
             self.logger.error(f"連接數據源失敗: {e}")
             return False
@@ -399,6 +406,9 @@ class PolarsHelper:
                         pl.col("price").count().alias("count")
                     ])
             
+            # 數據源為延遲掃描時，在此一次讀取（過濾與欄位選擇已下推到掃描）
+            if isinstance(result_df, pl.LazyFrame):
+                result_df = result_df.collect()
             return result_df
             
         except Exception as e:
@@ -0,0 +1,266 @@
+# libs/KnowledgeManageHandler/scalar_filters.py
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+純量過濾條件（Scalar Filter Pushdown）
+將使用者槽位（預算、重量、螢幕尺寸、GPU 等級、機型）編譯為
+Milvus expr 與 DuckDB WHERE 條件，讓候選產品在向量評分與規格查詢前就被剪枝。
+
+同一份欄位萃取規則同時供「寫入端」（分塊入庫、nbtypes_facets 表）
+與「查詢端」（KnowledgeManager）使用，確保兩邊語義一致。
+"""
+
+import logging
+import re
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# DuckDB 中存放純量欄位的衍生表名稱
+FACET_TABLE = "nbtypes_facets"
+
+# 寫入 Milvus / DuckDB 的純量欄位（皆為 VARCHAR）
+FACET_FIELDS = ["price_tier", "weight_class", "screen_size", "gpu_tier"]
+
+# 無法判定時的預設值
+UNKNOWN = "unknown"
+
+# 機型 → 價格等級（與 ProductChunkingEngine._categorize_price 一致）
+PRICE_TIER_BY_MODELTYPE = {
+    "958": "premium",
+    "819": "mid_range",
+    "839": "budget",
+}
+DEFAULT_PRICE_TIER = "standard"
+
+# 重量分級門檻（公斤）
+LIGHT_WEIGHT_KG = 1.5
+HEAVY_WEIGHT_KG = 2.0
+
+_WEIGHT_PATTERN = re.compile(r"Weight\s*:[^\n\d]*(\d+(?:[.,]\d+)?)\s*(kg|g)", re.IGNORECASE)
+_DIMENSION_PATTERN = re.compile(r"Dimension\s*:[^\n]*?(?<![\d.])(\d{1,2}(?:\.\d+)?)\s*[\"”″]")
+_DISCRETE_GPU_PATTERN = re.compile(r"\b(?:RTX|GTX|Arc\s+A\d{3})\b|\bRX\s?\d{4}", re.IGNORECASE)
+
+# 槽位值 → 允許的純量值；未知值保留在允許清單中，避免資料缺漏造成誤剪
+BUDGET_SLOT_MAPPING = {
+    "budget_low": ["budget", DEFAULT_PRICE_TIER],
+    "budget": ["budget", DEFAULT_PRICE_TIER],
+    "budget_mid": ["budget", "mid_range", DEFAULT_PRICE_TIER],
+    "mid_range": ["budget", "mid_range", DEFAULT_PRICE_TIER],
+    "budget_high": ["mid_range", "premium", DEFAULT_PRICE_TIER],
+    "premium": ["mid_range", "premium", DEFAULT_PRICE_TIER],
+    "luxury": ["premium", DEFAULT_PRICE_TIER],
+}
+WEIGHT_SLOT_MAPPING = {
+    "light": ["light", UNKNOWN],
+    "standard": ["light", "standard", UNKNOWN],
+}
+SCREEN_SLOT_MAPPING = {
+    "small": ["11", "12", "13", "14"],
+    "large": ["15", "16", "17", "18"],
+}
+GPU_SLOT_MAPPING = {
+    "discrete": ["discrete"],
+    "gaming": ["discrete"],
+    "high_performance": ["discrete"],
+    "integrated": ["integrated"],
+}
+
+# 槽位別名 → 純量欄位
+SLOT_ALIASES = {
+    "budget_range": "price_tier",
+    "price_range": "price_tier",
+    "price_tier": "price_tier",
+    "weight": "weight_class",
+    "weight_requirement": "weight_class",
+    "weight_class": "weight_class",
+    "screen_size": "screen_size",
+    "gpu_tier": "gpu_tier",
+    "gpu_performance": "gpu_tier",
+    "modeltype": "modeltype",
+}
+
+
+def quote_milvus_string(value: str) -> str:
+    """將字串轉為 Milvus expr 的雙引號字面值"""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _parse_weight_kg(structconfig: str) -> Optional[float]:
+    """從 structconfig 的 Weight 行解析重量（公斤）"""
+    match = _WEIGHT_PATTERN.search(structconfig or "")
+    if not match:
+        return None
+    value = float(match.group(1).replace(",", "."))
+    return value / 1000.0 if match.group(2).lower() == "g" else value
+
+
+def categorize_weight(structconfig: str) -> str:
+    """重量分級：light / standard / heavy / unknown"""
+    weight_kg = _parse_weight_kg(structconfig)
+    if weight_kg is None:
+        return UNKNOWN
+    if weight_kg < LIGHT_WEIGHT_KG:
+        return "light"
+    if weight_kg < HEAVY_WEIGHT_KG:
+        return "standard"
+    return "heavy"
+
+
+def categorize_screen_size(lcd: str) -> str:
+    """螢幕尺寸取整數吋（15.6 → "15"），無資料回傳 unknown"""
+    match = _DIMENSION_PATTERN.search(lcd or "")
+    if not match:
+        return UNKNOWN
+    return str(int(float(match.group(1))))
+
+
+def categorize_gpu_tier(gpu: str) -> str:
+    """GPU 等級：discrete / integrated / unknown"""
+    text = (gpu or "").strip()
+    if not text or re.fullmatch(r"(GPU|Model)\s*:\s*No Data.*", text, re.IGNORECASE | re.DOTALL):
+        return UNKNOWN
+    return "discrete" if _DISCRETE_GPU_PATTERN.search(text) else "integrated"
+
+
+def categorize_price_tier(modeltype: Any) -> str:
+    """依機型代碼決定價格等級"""
+    return PRICE_TIER_BY_MODELTYPE.get(str(modeltype).strip(), DEFAULT_PRICE_TIER)
+
+
+def extract_scalar_facets(product: Dict[str, Any]) -> Dict[str, str]:
+    """
+    從 nbtypes 的一筆產品資料萃取純量欄位
+
+    Args:
+        product: 產品數據字典（需含 modeltype, structconfig, lcd, gpu）
+
+    Returns:
+        {price_tier, weight_class, screen_size, gpu_tier}
+    """
+    return {
+        "price_tier": categorize_price_tier(product.get("modeltype", "")),
+        "weight_class": categorize_weight(str(product.get("structconfig") or "")),
+        "screen_size": categorize_screen_size(str(product.get("lcd") or "")),
+        "gpu_tier": categorize_gpu_tier(str(product.get("gpu") or "")),
+    }
+
+
+def dedup_partition_key(chunk: Dict[str, Any]) -> Tuple:
+    """
+    近似重複合併的分組鍵：只有 product_id 與純量 facet 皆相同的分塊才會合併，
+    代表分塊的 product_id 與 facet 欄位因此對所有成員成立，Milvus 過濾（modeltype → product_id）維持精確
+    """
+    facets = extract_scalar_facets(chunk.get("raw_product", {}))
+    return (str(chunk.get("product_id", "")),) + tuple(sorted(facets.items()))
+
+
+def build_facet_table(conn) -> int:
+    """
+    依 nbtypes 重建 DuckDB 純量欄位表（nbtypes_facets）
+
+    Args:
+        conn: 可寫入的 DuckDB 連線
+
+    Returns:
+        寫入的列數
+    """
+    rows = conn.execute("SELECT modeltype, modelname, structconfig, lcd, gpu FROM nbtypes").fetchall()
+    records = []
+    for modeltype, modelname, structconfig, lcd, gpu in rows:
+        facets = extract_scalar_facets({
+            "modeltype": modeltype, "structconfig": structconfig, "lcd": lcd, "gpu": gpu
+        })
+        records.append((str(modeltype), modelname, *[facets[f] for f in FACET_FIELDS]))
+
+    columns = ", ".join(f"{f} VARCHAR" for f in FACET_FIELDS)
+    conn.execute(f"CREATE OR REPLACE TABLE {FACET_TABLE} (modeltype VARCHAR, modelname VARCHAR, {columns})")
+    if records:
+        placeholders = ", ".join(["?"] * (2 + len(FACET_FIELDS)))
+        conn.executemany(f"INSERT INTO {FACET_TABLE} VALUES ({placeholders})", records)
+    logger.info(f"已重建 {FACET_TABLE}，共 {len(records)} 筆")
+    return len(records)
+
+
+class ScalarFilterCompiler:
+    """將使用者槽位編譯為 Milvus expr 與 DuckDB WHERE 條件"""
+
+    def compile(self, slots: Optional[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """
+        正規化槽位為 {純量欄位: 允許值列表}
+
+        無法辨識的槽位或值會被略過（不過濾），而不是過濾掉所有產品。
+        """
+        facets: Dict[str, List[str]] = {}
+        for slot_name, value in (slots or {}).items():
+            field = SLOT_ALIASES.get(slot_name)
+            if not field or value in (None, "", []):
+                continue
+            allowed = self._allowed_values(field, value)
+            if allowed:
+                # 同一欄位出現多個別名時取交集（交集為空則保留先前條件）
+                if field in facets:
+                    allowed = [v for v in facets[field] if v in allowed] or facets[field]
+                facets[field] = allowed
+        return facets
+
+    def _allowed_values(self, field: str, value: Any) -> List[str]:
+        """單一槽位值 → 允許的純量值"""
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        allowed: List[str] = []
+        for raw in values:
+            key = str(raw).strip().lower()
+            if field == "modeltype":
+                candidates = [str(raw).strip()]
+            elif field == "price_tier":
+                candidates = BUDGET_SLOT_MAPPING.get(key, [])
+            elif field == "weight_class":
+                candidates = WEIGHT_SLOT_MAPPING.get(key, [])
+            elif field == "gpu_tier":
+                candidates = GPU_SLOT_MAPPING.get(key, [])
+            elif field == "screen_size":
+                candidates = SCREEN_SLOT_MAPPING.get(key, [])
+                if not candidates and re.fullmatch(r"\d{1,2}(\.\d+)?", key):
+                    candidates = [str(int(float(key)))]
+            else:
+                candidates = []
+            allowed.extend(c for c in candidates if c and c not in allowed)
+        return allowed
+
+    def to_milvus_expr(
+        self,
+        facets: Dict[str, List[str]],
+        available_fields: Optional[Iterable[str]] = None
+    ) -> Optional[str]:
+        """
+        產生 Milvus 布林表達式；modeltype 對應 collection 的 product_id 欄位
+
+        Args:
+            facets: compile() 的結果
+            available_fields: collection 實際存在的欄位；舊 collection 缺少的欄位會被略過
+        """
+        available = set(available_fields) if available_fields is not None else None
+        clauses = []
+        for field, values in facets.items():
+            milvus_field = "product_id" if field == "modeltype" else field
+            if available is not None and milvus_field not in available:
+                logger.debug(f"Milvus collection 缺少純量欄位 {milvus_field}，略過過濾")
+                continue
+            clauses.append(f"{milvus_field} in [{', '.join(quote_milvus_string(v) for v in values)}]")
+        return " and ".join(clauses) if clauses else None
+
+    def to_duckdb_where(self, facets: Dict[str, List[str]]) -> Tuple[Optional[str], List[str]]:
+        """
+        產生針對 nbtypes_facets 的參數化 WHERE 條件
+
+        Returns:
+            (where_sql, params)；沒有條件時 where_sql 為 None
+        """
+        clauses = []
+        params: List[str] = []
+        for field, values in facets.items():
+            clauses.append(f"{field} IN ({', '.join(['?'] * len(values))})")
+            params.extend(values)
+        if not clauses:
+            return None, []
+        return " AND ".join(clauses), params
@@ -0,0 +1,162 @@
+# libs/KnowledgeManageHandler/semantic_cache.py
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+語義檢索快取
+以查詢向量為鍵：新查詢與近期查詢的餘弦相似度超過門檻時，直接重用快取的產品鍵列表，
+省去 Milvus 搜尋。同義但措辭不同的查詢（如「輕薄好攜帶的筆電」與「輕便好帶的筆電」）可共用結果。
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticRetrievalCache:
+    """以查詢向量近似比對的檢索結果快取（記憶體內、容量有限、具 TTL）"""
+
+    def __init__(
+        self,
+        similarity_threshold: float = 0.95,
+        ttl_seconds: float = 600.0,
+        max_entries: int = 256,
+        false_hit_sample_rate: float = 0.05,
+        false_hit_overlap: float = 0.5
+    ):
+        """
+        Args:
+            similarity_threshold: 視為命中的最低餘弦相似度
+            ttl_seconds: 快取項目存活秒數
+            max_entries: 最多保留的查詢數量（超過時淘汰最舊的項目）
+            false_hit_sample_rate: 命中時抽樣重新檢索以驗證的比例
+            false_hit_overlap: 抽樣驗證時，快取與實際結果的 Jaccard 重疊低於此值視為誤命中
+        """
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.false_hit_sample_rate = false_hit_sample_rate
+        self.false_hit_overlap = false_hit_overlap
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # (n, dim) 已正規化
+        self._entries: List[Dict[str, Any]] = []     # 與 _vectors 同序
+
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "invalidations": 0,
+            "false_hit_samples": 0,
+            "false_hits": 0,
+        }
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def _evict_expired(self, now: float):
+        """移除過期項目（呼叫端需持有鎖）"""
+        keep = [i for i, entry in enumerate(self._entries) if now - entry["created_at"] <= self.ttl_seconds]
+        if len(keep) == len(self._entries):
+            return
+        self.stats["expired"] += len(self._entries) - len(keep)
+        self._entries = [self._entries[i] for i in keep]
+        self._vectors = self._vectors[keep] if keep else None
+
+    def lookup(self, vector, context_key: str = "") -> Optional[Tuple[Any, float, str]]:
+        """
+        查詢快取
+
+        Args:
+            vector: 查詢向量
+            context_key: 必須完全相同才可共用的條件（如過濾槽位、產品數量）
+
+        Returns:
+            (快取值, 相似度, 原始查詢文本)；未命中時回傳 None
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            self.stats["lookups"] += 1
+            self._evict_expired(time.time())
+            if self._vectors is not None:
+                similarities = self._vectors @ query
+                for idx in np.argsort(-similarities):
+                    score = float(similarities[idx])
+                    if score < self.similarity_threshold:
+                        break
+                    entry = self._entries[idx]
+                    if entry["context_key"] == context_key:
+                        self.stats["hits"] += 1
+                        return entry["value"], score, entry["query_text"]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, vector, value: Any, query_text: str = "", context_key: str = ""):
+        """寫入快取"""
+        query = self._normalize(vector)
+        with self._lock:
+            self._entries.append({
+                "value": value,
+                "query_text": query_text,
+                "context_key": context_key,
+                "created_at": time.time(),
+            })
+            self._vectors = query[None, :] if self._vectors is None else np.vstack([self._vectors, query])
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._entries = self._entries[overflow:]
+                self._vectors = self._vectors[overflow:]
+
+    def invalidate(self, reason: str = ""):
+        """清空快取（例如產品目錄重新匯入後）"""
+        with self._lock:
+            if self._entries:
+                logger.info(f"語義檢索快取失效（{reason or 'manual'}），清除 {len(self._entries)} 筆")
+            self._entries = []
+            self._vectors = None
+            self.stats["invalidations"] += 1
+
+    def should_sample(self) -> bool:
+        """命中時是否抽樣重新檢索以量測誤命中率"""
+        return random.random() < self.false_hit_sample_rate
+
+    def record_sample(self, cached_keys: List[str], fresh_keys: List[str]) -> bool:
+        """
+        記錄一次抽樣驗證結果
+
+        Returns:
+            是否判定為誤命中
+        """
+        cached, fresh = set(cached_keys), set(fresh_keys)
+        union = cached | fresh
+        overlap = len(cached & fresh) / len(union) if union else 1.0
+        is_false_hit = overlap < self.false_hit_overlap
+        with self._lock:
+            self.stats["false_hit_samples"] += 1
+            if is_false_hit:
+                self.stats["false_hits"] += 1
+        if is_false_hit:
+            logger.warning(f"語義檢索快取誤命中：重疊率 {overlap:.2f}")
+        return is_false_hit
+
+    def get_stats(self) -> Dict[str, Any]:
+        """快取統計（含命中率與抽樣誤命中率）"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["false_hit_rate"] = (
+            stats["false_hits"] / stats["false_hit_samples"] if stats["false_hit_samples"] else 0.0
+        )
+        stats["similarity_threshold"] = self.similarity_threshold
+        stats["ttl_seconds"] = self.ttl_seconds
+        return stats
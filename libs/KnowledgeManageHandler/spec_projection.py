@@ -0,0 +1,108 @@
+# libs/KnowledgeManageHandler/spec_projection.py
+"""
+產品規格欄位投影
+依實體解析得到的 attributes（cpu、battery、lcd…）只選取相關的 nbtypes 欄位（加上識別欄位），
+並以緊湊格式序列化，降低送入 LLM 的 token 數。
+"""
+
+import json
+import re
+from typing import Dict, Any, List, Optional, Iterable
+
+IDENTITY_FIELDS = ["modeltype", "modelname"]
+
+# 沒有專用摘要函式的投影欄位，送入提示詞時保留的最大字元數
+PROJECTED_FIELD_MAX_CHARS = 200
+
+# 未解析出可用屬性時的預設欄位（與原先固定選取的欄位相同）
+DEFAULT_SPEC_FIELDS = [
+    'cpu', 'gpu', 'memory', 'storage',
+    'lcd', 'battery', 'audio', 'wireless', 'bluetooth', 'softwareconfig',
+    'thermal', 'ai'
+]
+
+# 實體解析的屬性標籤 → nbtypes 欄位
+ATTRIBUTE_FIELDS: Dict[str, List[str]] = {
+    "structconfig": ["structconfig"],
+    "lcd": ["lcd"],
+    "touchpanel": ["touchpanel"],
+    "iointerface": ["iointerface"],
+    "webcamera": ["webcamera"],
+    "audio": ["audio"],
+    "battery": ["battery"],
+    "cpu": ["cpu"],
+    "gpu": ["gpu"],
+    "memory": ["memory"],
+    "lcdconnector": ["lcdconnector"],
+    "storage": ["storage"],
+    "wifislot": ["wifislot", "wireless", "bluetooth"],
+    "thermal": ["thermal"],
+    "softwareconfig": ["softwareconfig"],
+    "ai": ["ai"],
+    "accessory": ["accessory"],
+}
+
+# 可投影的 nbtypes 規格欄位（用於驗證欄位名稱，避免組出任意 SQL）
+ATTRIBUTE_COLUMNS = set(DEFAULT_SPEC_FIELDS) | {f for fields in ATTRIBUTE_FIELDS.values() for f in fields}
+
+
+def project_spec_fields(attributes: Optional[Iterable[str]]) -> List[str]:
+    """
+    取得應選取的欄位：識別欄位 + 屬性對應欄位
+
+    attributes 為空或只含 modeltype/modelname 等識別屬性時，回傳識別欄位 + DEFAULT_SPEC_FIELDS
+    """
+    fields: List[str] = []
+    for attribute in attributes or []:
+        for field in ATTRIBUTE_FIELDS.get(str(attribute).strip().lower(), []):
+            if field not in fields:
+                fields.append(field)
+    return IDENTITY_FIELDS + (fields or DEFAULT_SPEC_FIELDS)
+
+
+def is_default_projection(fields: Iterable[str]) -> bool:
+    return list(fields) == IDENTITY_FIELDS + DEFAULT_SPEC_FIELDS
+
+
+def dumps_compact(data: Any) -> str:
+    """無縮排、無多餘空白的 JSON"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+# 屬性標籤的常見說法，供不經 LLM 的追問判斷所需欄位
+ATTRIBUTE_KEYWORDS: Dict[str, List[str]] = {
+    "structconfig": ["重量", "多重", "重不重", "輕", "尺寸", "厚", "材質", "weight"],
+    "lcd": ["螢幕", "屏幕", "解析度", "更新率", "面板", "display", "screen"],
+    "touchpanel": ["觸控", "touch"],
+    "iointerface": ["接口", "連接埠", "插孔", "usb", "hdmi", "type-c", "thunderbolt"],
+    "webcamera": ["鏡頭", "攝影機", "視訊", "webcam", "camera"],
+    "audio": ["喇叭", "音效", "音質", "麥克風", "audio", "speaker"],
+    "battery": ["電池", "續航", "充電", "battery"],
+    "cpu": ["cpu", "處理器", "效能"],
+    "gpu": ["gpu", "顯卡", "顯示卡", "繪圖"],
+    "memory": ["記憶體", "ram", "memory"],
+    "storage": ["硬碟", "儲存", "容量", "ssd", "storage"],
+    "wifislot": ["wifi", "wi-fi", "無線", "藍牙", "bluetooth"],
+    "thermal": ["散熱", "溫度", "風扇", "thermal"],
+    "softwareconfig": ["作業系統", "軟體", "windows"],
+    "ai": ["ai", "npu"],
+    "accessory": ["配件", "變壓器", "adapter"],
+}
+
+
+def _keyword_pattern(keywords: List[str]) -> "re.Pattern":
+    # 英數關鍵字需完整比對（避免 "ai" 命中 "detail"），中文關鍵字直接比對
+    parts = [
+        rf"(?<![a-z0-9]){re.escape(k)}(?![a-z0-9])" if k.isascii() else re.escape(k)
+        for k in keywords
+    ]
+    return re.compile("|".join(parts))
+
+
+_ATTRIBUTE_PATTERNS = {attribute: _keyword_pattern(keywords) for attribute, keywords in ATTRIBUTE_KEYWORDS.items()}
+
+
+def detect_attributes(text: str) -> List[str]:
+    """以關鍵字找出文字提及的屬性標籤（依 ATTRIBUTE_KEYWORDS 順序）"""
+    lowered = (text or "").lower()
+    return [attribute for attribute, pattern in _ATTRIBUTE_PATTERNS.items() if pattern.search(lowered)]
@@ -16,6 +16,7 @@ import json
 import redis
 from typing import Dict, Any, Optional, List
 import asyncio
+import random
 from datetime import datetime
 from pathlib import Path
 from dataclasses import dataclass
@@ -33,12 +34,43 @@ from .PromptManagementHandler import prompt_manager
 from .KnowledgeManageHandler.knowledge_manager import KnowledgeManager
 from .ResponseGenHandler import ResponseGenHandler
 from dataclasses import dataclass
-from .RAG.LLM.LLMInitializer import LLMInitializer
+from .RAG.LLM.ModelRouter import ModelRouter, TASK_ENTITY_PARSE, TASK_ANSWER_GENERATION
+from .RAG.LLM.QueryRule import QueryRule, QueryRuleParser, QUERY_RULE_SCHEMA
+from .KnowledgeManageHandler.spec_projection import (
+    IDENTITY_FIELDS, PROJECTED_FIELD_MAX_CHARS, DEFAULT_SPEC_FIELDS, is_default_projection, dumps_compact,
+    project_spec_fields, detect_attributes
+)
+from .StateManageHandler.session_retrieval import SessionRetrievalStore, detect_follow_up
+from .RAG.LLM.PromptBudget import (
+    TokenCounter, PromptBudgeter, PromptSection, SECTION_PRIORITIES, DEFAULT_OUTPUT_TOKENS, trim_product_data
+)
 from langchain.prompts import PromptTemplate
 import re
-import ast
 logger = logging.getLogger(__name__)
 
+# 產品資料 token 節省量的抽樣比例（DEBUG 日誌開啟時每次都計算）：
+# 基準為投影前固定選取的 14 個欄位、縮排 JSON，需額外查詢 DuckDB 與兩次 token 計算
+PAYLOAD_SAVINGS_SAMPLE_RATE = 0.05
+
+# 回答提示詞：位元組穩定的靜態前綴 + 變動區段。
+# 產品資料在追問時常維持不變，放在查詢設定與客戶需求之前以延長可共用的前綴。
+SYS_PROMPT_PREFIX = """你是專業的筆電銷售顧問。根據以下產品資料回答客戶問題：
+
+# **輸出格式：**
+# 1.簡潔的 Markdown 格式，包含產品推薦和規格表格。
+# 2.嚴格禁止輸出單純的JSON格式。
+"""
+SYS_PROMPT_TEMPLATE = SYS_PROMPT_PREFIX + """
+#**產品資料：**
+{product_data}
+
+# **查詢設定**
+{query_rules}
+
+#**客戶需求：**
+{user_query}
+"""
+
 ###setup debug
 logging.basicConfig(
     level=logging.INFO,
@@ -81,13 +113,18 @@ class MGFDKernel:
         # 嘗試初始化 LLM（最小變更；失敗則保持回退機制）
         self.llm = None
         self.query_rule = None
+        self.query_rule_obj = QueryRule()
+        self.query_rule_parser = QueryRuleParser()
         logger.info("LLM 初始化中...")
         try:
-            self.llm_initializer = LLMInitializer(model_name="gpt-oss:20b", temperature=0.1, request_timeout=60)
+            # 依任務路由模型：實體解析用小模型，最終回答用大模型（見 config.LLM_ROUTES）
+            self.model_router = ModelRouter(request_timeout=60)
+            self.llm_initializer = self.model_router.get_initializer(TASK_ANSWER_GENERATION)
             self.llm = self.llm_initializer.get_llm()
             logger.info("LLM 初始化成功")
         except Exception as e:
             logger.warning(f"LLM 初始化失敗，將使用回退機制: {e}")
+            self.model_router = None
             self.llm_initializer = None
             self.llm = None
         # 若 Kernel 內未取得 LLM，且 KnowledgeManager 內已有 llm，可作讀取式備援
@@ -112,9 +149,19 @@ class MGFDKernel:
         self.config = self._load_config()
         # 載入可擴充的 NB 特徵對照表（用於關鍵功能偵測與比對）
         self.nb_feature_table = self._load_nb_feature_table()
-        self.ComparableNB_NUM=6
+        self.DEFAULT_COMPARABLE_NB_NUM = 6
+        self.ComparableNB_NUM = self.DEFAULT_COMPARABLE_NB_NUM
         #self.slot_schema = self._load_slot_schema()
         self.MAX_CONTEXT_TOKENS = 131072  # gpt-oss:20b context limit
+        answer_model = self.llm_initializer.model_name if self.llm_initializer else "gpt-oss:20b"
+        self.prompt_budgeter = PromptBudgeter(
+            self.llm_initializer.token_counter if self.llm_initializer else TokenCounter(answer_model),
+            self.llm_initializer.max_context_tokens if self.llm_initializer else self.MAX_CONTEXT_TOKENS,
+        )
+        self.answer_reserve_output = DEFAULT_OUTPUT_TOKENS
+        self.payload_stats = {"samples": 0, "baseline_tokens": 0, "compact_tokens": 0}
+        # 每個會話上一輪的產品與 query rule，供追問沿用
+        self.retrieval_store = SessionRetrievalStore(redis_client)
         # Initialize states and state_status before state_machine to avoid AttributeError
         self.states = States(
             OnInit="OnInit",
@@ -247,24 +294,8 @@ class MGFDKernel:
 # 1.簡潔的 Markdown 格式，包含產品推薦和規格表格。
 # 2.嚴格禁止輸出單純的JSON格式。
 # """
-        self.SysPromptTemplate = """你是專業的筆電銷售顧問。根據以下產品資料回答客戶問題：
-
-        # **查詢設定**
-        {query_rules}
-
-        #**產品資料：**
-        {product_data}
-
-        #**客戶需求：**
-        {user_query}
-
-        
-
-
-# **輸出格式：**
-# 1.簡潔的 Markdown 格式，包含產品推薦和規格表格。
-# 2.嚴格禁止輸出單純的JSON格式。
-# """
+        # 靜態前綴（角色、輸出格式）在前、每次不同的區段在後，讓 Ollama 能重用前綴的 KV cache
+        self.SysPromptTemplate = SYS_PROMPT_TEMPLATE
         # 宣告三層式prompt所需要的變數
         # self.product_data = None
         # self.prompt_using = None
@@ -438,6 +469,20 @@ class MGFDKernel:
             # 發生任何異常時，退回到原本的前 N 策略
             products = products[:max_products]
         
+        # 檢索時已依 query rule 投影欄位；預設投影沿用原本的四項摘要
+        projected_fields = product_data.get("projected_fields") or []
+        default_projection = not projected_fields or is_default_projection(projected_fields)
+        summarizers = {
+            "cpu": self._extract_cpu_summary,
+            "memory": self._extract_memory_summary,
+            "lcd": self._extract_lcd_summary,
+            "battery": self._extract_battery_summary,
+        }
+        spec_fields = list(summarizers) if default_projection else [
+            f for f in projected_fields if f not in IDENTITY_FIELDS
+        ]
+        logger.info(f"產品摘要欄位: {spec_fields}{'（預設）' if default_projection else ''}")
+
         summarized_products = []
         for product in products:
             # 計算特徵命中（供表格與比較用）
@@ -449,13 +494,16 @@ class MGFDKernel:
             summarized_product = {
                 "modeltype": product.get("modeltype", ""),
                 "modelname": product.get("modelname", ""),
-                "cpu_summary": self._extract_cpu_summary(product.get("cpu", "") or ""),
-                "memory_summary": self._extract_memory_summary(product.get("memory", "") or ""),
-                "lcd_summary": self._extract_lcd_summary(product.get("lcd", "") or ""),
-                "battery_summary": self._extract_battery_summary(product.get("battery", "") or ""),
-                "portability": self._assess_portability(product),
-                "matched_features": feature_hits
             }
+            for field in spec_fields:
+                text = product.get(field, "") or ""
+                if field in summarizers:
+                    summarized_product[f"{field}_summary"] = summarizers[field](text)
+                else:
+                    summarized_product[field] = text[:PROJECTED_FIELD_MAX_CHARS]
+            if "lcd" in spec_fields:
+                summarized_product["portability"] = self._assess_portability(product)
+            summarized_product["matched_features"] = feature_hits
             summarized_products.append(summarized_product)
         
         return {
@@ -542,6 +590,114 @@ class MGFDKernel:
         
         return " ".join(summary_parts) if summary_parts else "標準電池"
     
+    def _save_retrieval_context(
+        self, session_id: str, raw_product_data: Dict[str, Any], summarized: Dict[str, Any]
+    ) -> None:
+        """保存本輪呈現給使用者的產品（依呈現順序）、其規格列與 query rule，供後續追問沿用"""
+        product_keys = list(dict.fromkeys(
+            str(p.get("modeltype", "")) for p in summarized.get("products", []) if p.get("modeltype")
+        ))
+        if not product_keys:
+            return
+        products = [p for p in raw_product_data.get("products", []) if str(p.get("modeltype", "")) in product_keys]
+        self.retrieval_store.save(
+            session_id, product_keys, products,
+            raw_product_data.get("projected_fields") or [], self.query_rule_obj.to_dict()
+        )
+
+    def _resolve_follow_up(
+        self, session_id: str, message: str, slot_filters: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        判斷是否為上一輪產品的追問；是則回傳以快取產品組成的 product_data（格式同 search_product_data）
+
+        追問所需而快取中沒有的欄位，只針對涉及的機型補查該些欄位。
+        """
+        previous = self.retrieval_store.load(session_id)
+        if not previous:
+            return None
+        _, mentioned_modeltypes = self.knowledge_manager.detect_product_entities(message)
+        attributes = detect_attributes(message)
+        follow_up = detect_follow_up(message, previous, mentioned_modeltypes, attributes, bool(slot_filters))
+        if not follow_up:
+            return None
+
+        product_keys = follow_up["product_keys"]
+        rule = QueryRule.from_dict(previous.get("query_rule") or {})
+        if attributes:
+            rule.attributes = attributes
+        fields = project_spec_fields(rule.attributes)
+
+        all_products = previous.get("products") or []
+        products = [p for p in all_products if str(p.get("modeltype", "")) in product_keys]
+        missing = [f for f in fields if any(f not in p for p in products)]
+        if missing:
+            rows = self.knowledge_manager.fetch_product_fields(product_keys, missing)
+            fetched = {(str(r.get("modeltype")), r.get("modelname")): r for r in rows}
+            for product in products:
+                product.update(fetched.get((str(product.get("modeltype")), product.get("modelname")), {}))
+            logger.info(f"追問補查欄位 {missing}，機型 {product_keys}")
+            # 補齊的欄位寫回會話，之後的追問不必再查
+            self.retrieval_store.save(
+                session_id, previous["product_keys"], all_products,
+                list(dict.fromkeys((previous.get("projected_fields") or []) + fields)), previous.get("query_rule") or {}
+            )
+
+        order = {key: index for index, key in enumerate(product_keys)}
+        products.sort(key=lambda p: order.get(str(p.get("modeltype", "")), len(order)))
+
+        self.query_rule_obj = rule
+        self.query_rule = rule.to_json()
+        self.ComparableNB_NUM = max(len(products), 1)
+        return {
+            "query": message,
+            "status": "success" if products else "no_results",
+            "matched_keys": product_keys,
+            "projected_fields": fields,
+            "follow_up": True,
+            "count": len(products),
+            "products": products,
+        }
+
+    def _should_sample_payload_savings(self, product_data: Any) -> bool:
+        if not (isinstance(product_data, dict) and product_data.get("products")):
+            return False
+        return logger.isEnabledFor(logging.DEBUG) or random.random() < PAYLOAD_SAVINGS_SAMPLE_RATE
+
+    def _record_payload_savings(self, product_data: Dict[str, Any], payload: str) -> None:
+        """
+        記錄送入提示詞的產品資料相較投影前格式節省的 token：
+        基準為相同產品以原先固定的 14 個欄位查詢、縮排 JSON 序列化的結果
+        """
+        products = product_data.get("products") or []
+        keys = {(str(p.get("modeltype", "")), p.get("modelname", "")) for p in products}
+        rows = self.knowledge_manager.fetch_product_fields(
+            list(dict.fromkeys(modeltype for modeltype, _ in keys)), DEFAULT_SPEC_FIELDS
+        )
+        rows = [row for row in rows if (str(row.get("modeltype", "")), row.get("modelname", "")) in keys]
+        if not rows:
+            return
+        counter = self.prompt_budgeter.token_counter
+        baseline_tokens = counter.count(json.dumps(rows, ensure_ascii=False, indent=2, default=str))
+        compact_tokens = counter.count(payload)
+        stats = self.payload_stats
+        stats["samples"] += 1
+        stats["baseline_tokens"] += baseline_tokens
+        stats["compact_tokens"] += compact_tokens
+        logger.info(
+            f"產品資料 token: {compact_tokens}（投影前縮排格式 {baseline_tokens}，節省 {baseline_tokens - compact_tokens}）"
+        )
+
+    def _payload_savings_summary(self) -> Dict[str, Any]:
+        stats = self.payload_stats
+        saved = stats["baseline_tokens"] - stats["compact_tokens"]
+        return {
+            **stats,
+            "sample_rate": PAYLOAD_SAVINGS_SAMPLE_RATE,
+            "saved_tokens": saved,
+            "saved_ratio": round(saved / stats["baseline_tokens"], 3) if stats["baseline_tokens"] else 0.0,
+        }
+
     def _assess_portability(self, product: Dict[str, Any]) -> str:
         """評估便攜性"""
         lcd = product.get("lcd", "") or ""  # 確保不是 None
@@ -557,47 +713,61 @@ class MGFDKernel:
     
     # generate three-tier prompt
     # def generate_three_tier_prompt(self,product_data=None, user_query=None):
-    async def generate_main_prompt(self,product_data=None, user_query=None):
+    async def generate_main_prompt(self,product_data=None, user_query=None, query_rule_json=None):
         """生成三層式提示 - 修復版：避免模板狀態污染"""
         # 🔧 修復：每次都從乾淨的模板開始，避免狀態污染
         # 使用 str.replace 來避免 JSON 中的佔位符衝突
-        query_rule_json = await self.get_query_rule_from_user_query(user_query=user_query)
+        # 本輪已解析過 query rule（知識查詢或追問）時直接沿用，不再呼叫 LLM
+        if query_rule_json is None:
+            query_rule_json = await self.get_query_rule_from_user_query(user_query=user_query)
         logger.info(f"^^^^^^^^^^^^^^^^^^^^^^^^^user_input_json start^^^^^^^^^^^^^^^^^^^^^^^^^\n")
         logger.info(f"分析user input 中的entities: {query_rule_json}")
         logger.info(f"\n^^^^^^^^^^^^^^^^^^^^^^^^^user_input_json end^^^^^^^^^^^^^^^^^^^^^^^^^")
-        result = self.SysPromptTemplate.replace("{query_rules}", query_rule_json)
-        result = result.replace("{user_query}", user_query)
-        result = result.replace("{product_data}", str(product_data))
+
+        # 依區段優先序控制 token 預算：超出時先裁切排名較後的產品與冗長欄位，查詢本身不裁切
+        self.answer_reserve_output = self.prompt_budgeter.reserve_output_for(self.query_rule_obj.intent)
+        system_rules = self.SysPromptTemplate
+        for placeholder in ("{query_rules}", "{user_query}", "{product_data}"):
+            system_rules = system_rules.replace(placeholder, "")
+        sections, budget_report = self.prompt_budgeter.fit([
+            PromptSection("system_rules", system_rules, SECTION_PRIORITIES["system_rules"], required=True),
+            PromptSection("query_rules", query_rule_json, SECTION_PRIORITIES["query_rules"], required=True),
+            PromptSection("user_query", user_query or "", SECTION_PRIORITIES["user_query"], required=True),
+            PromptSection(
+                "product_data", str(product_data), SECTION_PRIORITIES["product_data"], trimmer=trim_product_data
+            ),
+        ], self.answer_reserve_output)
+        logger.info(f"提示詞 token 預算: {budget_report['total_tokens']}/{budget_report['budget']}，輸出保留 {self.answer_reserve_output}")
+
+        result = self.SysPromptTemplate.replace("{query_rules}", sections["query_rules"])
+        result = result.replace("{user_query}", sections["user_query"])
+        result = result.replace("{product_data}", sections["product_data"])
         # result = result.replace("{user_query}", str(user_query))
         return result
     
     async def get_query_rule_from_user_query(self, user_query: str) -> str:
         logger.info(f"^^^^^^^^^^^^^^^^^^^^^^^^^user_query start^^^^^^^^^^^^^^^^^^^^^^^^^\n")
         qry_str = await self.user_input_handler.getEntityParsingPrompt(user_query)
-        self.query_rule = await asyncio.wait_for(
-            asyncio.to_thread(self.llm_initializer.safe_completion, qry_str, 2048),
+        # 以 JSON schema 限制輸出格式，解析為型別化的 QueryRule；解析失敗會計入統計
+        raw_rule = await asyncio.wait_for(
+            asyncio.to_thread(
+                self.model_router.complete, TASK_ENTITY_PARSE, qry_str, None, QUERY_RULE_SCHEMA
+            ),
             timeout=120,
         )
-        logger.info(f"分析user input 中的entities: {self.query_rule}")
+        logger.info(f"分析user input 中的entities: {raw_rule}")
         logger.info(f"\n^^^^^^^^^^^^^^^^^^^^^^^^^user_query end^^^^^^^^^^^^^^^^^^^^^^^^^")
 
-        # Handle empty or invalid LLM responses
-        if not self.query_rule or not self.query_rule.strip():
-            logger.warning("LLM返回空響應，使用預設查詢規則")
-            self.query_rule = '{"intent": "spec_check", "entities": [], "attributes": ["modelname"], "NB_NUM": "all", "language": "zh-TW"}'
+        self.query_rule_obj, parsed = self.query_rule_parser.parse(raw_rule)
+        if not parsed:
+            logger.error(f"解析LLM響應失敗，使用預設查詢規則，響應內容: {raw_rule}")
 
-        try:
-            tmpdict = ast.literal_eval(self.query_rule)
-            if tmpdict.get("NB_NUM") == "all":
-                self.ComparableNB_NUM = 10
-        except (ValueError, SyntaxError) as e:
-            logger.error(f"解析LLM響應失敗: {e}, 響應內容: {self.query_rule}")
-            # Use fallback query rule
-            self.query_rule = '{"intent": "spec_check", "entities": [], "attributes": ["modelname"], "NB_NUM": "all", "language": "zh-TW"}'
-            tmpdict = ast.literal_eval(self.query_rule)
-            if tmpdict.get("NB_NUM") == "all":
-                self.ComparableNB_NUM = 10
+        # 每次依 query rule 重新決定比較產品數，避免沿用上一輪的設定
+        self.ComparableNB_NUM = self.DEFAULT_COMPARABLE_NB_NUM
+        if self.query_rule_obj.NB_NUM == "all":
+            self.ComparableNB_NUM = 10
 
+        self.query_rule = self.query_rule_obj.to_json()
         return self.query_rule
         
     
@@ -814,6 +984,9 @@ class MGFDKernel:
             
             if not self.state_manager:
                 return self._create_error_response("狀態管理器未初始化")
+
+            # 重置後不再把新訊息視為上一輪產品的追問
+            self.retrieval_store.clear(session_id)
             
             # 暫時返回成功，待 StateManagementHandler 實作
             return {
@@ -850,6 +1023,9 @@ class MGFDKernel:
                 "system_status": {
                     "redis": redis_status,
                     "modules": modules_status,
+                    "llm_routing": self.model_router.get_metrics() if self.model_router else None,
+                    "query_rule_parsing": self.query_rule_parser.get_stats(),
+                    "product_payload": self._payload_savings_summary(),
                     "timestamp": datetime.now().isoformat(),
                     "version": "v2.0.0"
                 }
@@ -911,12 +1087,29 @@ class MGFDKernel:
         #需要加入knowledge_manager.search(context)
         #若ifDBSearch為True，則進行知識查詢，並將結果存入context["query_result"],
         #這是product_data
+        query_rule_json = None
+        is_follow_up = False
         if slot_metadata.get("ifDBSearch", True):
-            self.query_rule = await self.get_query_rule_from_user_query(message)
-            logger.info(f"***************************slot_name START*********************************: \n關鍵詞:\n{self.query_rule}")
-            logger.info(f"***************************slot_name START*********************************\n")
-            # 直接進行與關鍵字相關的產品規格搜尋（以非阻塞方式在執行緒池執行）
-            _product_data = await asyncio.to_thread(self.knowledge_manager.search_product_data, message)
+            # 槽位（預算、重量、螢幕尺寸、GPU 等級）下推為向量搜尋與 SQL 的過濾條件
+            slot_filters = self.user_input_handler.extract_filter_slots(message) if self.user_input_handler else {}
+            # 針對上一輪產品的追問：沿用快取的產品集合，只補查新需要的欄位
+            follow_up_data = await asyncio.to_thread(self._resolve_follow_up, session_id, message, slot_filters)
+            if follow_up_data is not None:
+                is_follow_up = True
+                _product_data = follow_up_data
+                logger.info(f"追問沿用上一輪產品：{follow_up_data.get('matched_keys')}，欄位：{follow_up_data.get('projected_fields')}")
+            else:
+                self.query_rule = await self.get_query_rule_from_user_query(message)
+                logger.info(f"***************************slot_name START*********************************: \n關鍵詞:\n{self.query_rule}")
+                logger.info(f"***************************slot_name START*********************************\n")
+                # 直接進行與關鍵字相關的產品規格搜尋（以非阻塞方式在執行緒池執行）
+                # 以 query rule 決定的產品數量直接進行分組檢索，而非取固定數量的 chunks 再去重
+                # 依 query rule 的 attributes 只選取相關規格欄位
+                _product_data = await asyncio.to_thread(
+                    self.knowledge_manager.search_product_data, message, slot_filters, self.ComparableNB_NUM,
+                    self.query_rule_obj.attributes
+                )
+            query_rule_json = self.query_rule
             context['keyword'] = slot_name
             logging.info(f"產品查詢結果: {_product_data}")
             #進行
@@ -924,17 +1117,23 @@ class MGFDKernel:
         # 摘要產品數據以大幅減少 Token 消耗
         if _product_data and isinstance(_product_data, dict) and _product_data.get("products"):
             logger.info(f"原始產品數據包含 {len(_product_data.get('products', []))} 個產品")
+            raw_product_data = _product_data
             # _summarize_product_data名稱不好，因為內部做了不少處理
             _product_data = self._postprocess_product_data(_product_data, max_products=self.ComparableNB_NUM)
             logger.info(f"摘要後產品數據包含 {len(_product_data.get('products', []))} 個產品")
+            if not is_follow_up:
+                self._save_retrieval_context(session_id, raw_product_data, _product_data)
         
-        # 將 product_data 轉為 JSON 字串注入，降低模型誤判結構機率
-        product_data_json = json.dumps(_product_data, ensure_ascii=False, indent=2)
-        logger.info(f"產品資料 JSON 長度: {len(product_data_json)} (已優化)")
+        # 將 product_data 轉為緊湊 JSON 字串注入（無縮排）；抽樣記錄相較投影前格式節省的 token
+        product_data_json = dumps_compact(_product_data)
+        if self._should_sample_payload_savings(_product_data):
+            await asyncio.to_thread(self._record_payload_savings, _product_data, product_data_json)
 
         # 🔧 修復：使用局部變量避免狀態污染
         # current_prompt = self.generate_three_tier_prompt(product_data=product_data_json, user_query=self.query)
-        current_prompt = await self.generate_main_prompt(product_data=product_data_json, user_query=self.query)
+        current_prompt = await self.generate_main_prompt(
+            product_data=product_data_json, user_query=self.query, query_rule_json=query_rule_json
+        )
         logger.info(f"***************************系統提示START********************************** \n{current_prompt}")
         logger.info(f"***************************系統提示END***********************************\n")
         #_product_data
@@ -962,12 +1161,14 @@ class MGFDKernel:
             if no_products:
                 llm_output = "目前尚未搜尋到符您需求的產品，是否進行不同規格產品的搜尋呢？"
             else:
-                if hasattr(self, 'llm_initializer') and self.llm_initializer:
+                if getattr(self, 'model_router', None):
                     try:
                         # 使用 asyncio.wait_for 提供額外的超時保護（120秒，稍大於 LLM 的 request_timeout）
                         llm_output = await asyncio.wait_for(
                             # asyncio.to_thread(self.llm.invoke, current_prompt),
-                            asyncio.to_thread(self.llm_initializer.safe_completion, current_prompt,2048),
+                            asyncio.to_thread(
+                                self.model_router.complete, TASK_ANSWER_GENERATION, current_prompt, self.answer_reserve_output
+                            ),
                             timeout=120
                         )
                         ## format markdown tables
@@ -2,14 +2,20 @@ import duckdb
 from .DatabaseQuery import DatabaseQuery
 
 class DuckDBQuery(DatabaseQuery):
-    def __init__(self, db_file: str):
+    def __init__(self, db_file: str, snapshot_dir: str = None):
         self.db_file = db_file
+        # 指定時優先查詢欄式快照（Parquet 視圖，欄位投影與條件下推），快照不可用時查詢資料庫檔案
+        self.snapshot_dir = snapshot_dir
         self.connection = None
         self.connect()
 
     def connect(self):
         try:
-            self.connection = duckdb.connect(database=self.db_file, read_only=True)
+            if self.snapshot_dir:
+                from ...KnowledgeManageHandler.columnar_snapshot import connect_catalog
+                self.connection = connect_catalog(self.db_file, self.snapshot_dir)
+            else:
+                self.connection = duckdb.connect(database=self.db_file, read_only=True)
             print(f"成功連接到 DuckDB: {self.db_file}")
         except Exception as e:
             print(f"連接 DuckDB 失敗: {e}")
@@ -1,6 +1,8 @@
-from typing import Optional
+from typing import Optional, Tuple, Dict, Any, Union
 from langchain_ollama import OllamaLLM
 
+from .PromptBudget import TokenCounter
+
 class LLMInitializer:
     """
     使用 langchain_ollama.OllamaLLM 的版本：
@@ -19,7 +21,8 @@ class LLMInitializer:
         self,
         model_name: str = "gpt-oss:20b",
         temperature: float = 0.1,
-        request_timeout: int = 60
+        request_timeout: int = 60,
+        keep_alive: Optional[Union[str, int]] = None
         # context_limit_override: Optional[int] = None,
     ):
         """
@@ -28,11 +31,13 @@ class LLMInitializer:
         :param model_name: 在 Ollama 中運行的模型名稱。
         :param temperature: 控制生成文本的隨機性。
         :param request_timeout: 請求超時（秒）。
+        :param keep_alive: Ollama 模型常駐時間（如 "30m"），讓模型與提示詞前綴的 KV cache 留在記憶體。
         :param context_limit_override: 若想手動指定 context 上限，傳入數值可覆蓋預設。
         """
         self.model_name = model_name
         self.temperature = temperature
         self.request_timeout = request_timeout
+        self.keep_alive = keep_alive
         self.llm = None
 
         # 取得 context window 上限
@@ -44,45 +49,66 @@ class LLMInitializer:
         self.max_context_tokens = (
             self.DEFAULT_CONTEXT_LIMITS.get(self.model_name, 8192)  # 萬一未知，給個保守值
         )
+        # 有對應 tokenizer 時以真實 token 數計算，否則使用快速估算
+        self.token_counter = TokenCounter(self.model_name)
 
         # 預設建立一個基礎 LLM；實際推論時會依需求重建以帶入不同 num_predict
         self.llm = OllamaLLM(
             model=self.model_name,
             temperature=self.temperature,
+            **self._ollama_kwargs(),
         )
 
-    # -------------------------
-    # Token 估算與截斷工具
-    # -------------------------
-    @staticmethod
-    def _estimate_tokens(text: str) -> int:
+    def _ollama_kwargs(self) -> Dict[str, Any]:
+        """每次建立 OllamaLLM 共用的額外參數"""
+        return {"keep_alive": self.keep_alive} if self.keep_alive is not None else {}
+
+    def _fit_prompt(
+        self,
+        prompt: str,
+        reserve_output: int,
+        auto_truncate: bool,
+        min_output: int,
+    ) -> Tuple[str, int, int]:
         """
-        簡易 token 估算：
-        - ASCII（英文/符號/空白）: 約 4 字元 ≈ 1 token
-        - 非 ASCII（中日韓等）: 約 2 字元 ≈ 1 token
-        目的：避免引入額外 tokenizer 套件，也能有足夠準的安全邊界
+        計算可用輸出 token（num_predict），必要時截斷輸入
+
+        :return: (可能已截斷的 prompt, prompt token 數, num_predict)
         """
-        if not text:
-            return 0
-        ascii_count = sum(1 for ch in text if ord(ch) < 128)
-        non_ascii_count = len(text) - ascii_count
-        est = ascii_count / 4.0 + non_ascii_count / 2.0
-        return int(est) + 1  # 向上取整一點保守
-
-    @staticmethod
-    def _truncate_to_tokens(text: str, target_tokens: int) -> str:
+        # 1) 估算輸入 token
+        prompt_tokens = self.token_counter.count(prompt)
+
+        # 2) 計算在不截斷前提下，理論可用輸出空間
+        available_for_output = self.max_context_tokens - prompt_tokens
+        if available_for_output < min_output and auto_truncate:
+            # 不夠輸出，先把 prompt 截到留下 reserve_output 空間
+            # 預留 max(reserve_output, min_output)；如果還是不夠就退而求其次
+            need_output = max(reserve_output, min_output)
+            target_prompt_tokens = max(self.max_context_tokens - need_output, 0)
+            prompt = self.token_counter.truncate(prompt, target_prompt_tokens)
+            prompt_tokens = self.token_counter.count(prompt)
+            available_for_output = self.max_context_tokens - prompt_tokens
+
+        # 3) 決定最終 num_predict（= max_tokens）
+        #    不超過 available_for_output，且至少要 min_output
+        final_max_tokens = max(min(reserve_output, max(available_for_output, 0)), min_output)
+        return prompt, prompt_tokens, int(final_max_tokens)
+
+    def _llm_for_call(self, num_predict: int, output_format: Optional[Union[str, Dict[str, Any]]] = None):
         """
-        依估算 token 反推大致可承載的字元數來截斷。
-        反推：ASCII 4字/Token、非ASCII 2字/Token 的混合不好精準，
-        這裡採用保守法：以「2字/Token」抓字元上限，避免超量。
+        以對應的 num_predict 建立（一次性）LLM 實例；新版 OllamaLLM 直接支援 num_predict 參數
+
+        :param output_format: 結構化輸出，"json" 或 JSON schema（dict），傳給 Ollama 的 format 參數
         """
-        if target_tokens <= 0 or not text:
-            return ""
-        # 保守估：每 token 至少吃掉約 2 個字元（偏向 CJK 上限）
-        char_budget = target_tokens * 2
-        if len(text) <= char_budget:
-            return text
-        return text[:char_budget]
+        llm_kwargs = self._ollama_kwargs()
+        if output_format:
+            llm_kwargs["format"] = output_format
+        return OllamaLLM(
+            model=self.model_name,
+            temperature=self.temperature,
+            num_predict=num_predict,   # 控制輸出長度
+            **llm_kwargs,
+        )
 
     # -------------------------
     # 對外：安全推論介面
@@ -105,35 +131,41 @@ class LLMInitializer:
         :param auto_truncate: True 時若輸入超量會自動截斷
         :param min_output: 最小輸出 token，避免完全沒字可回
         """
-        # 1) 估算輸入 token
-        prompt_tokens = self._estimate_tokens(prompt)
+        prompt, _, num_predict = self._fit_prompt(prompt, reserve_output, auto_truncate, min_output)
+        return self._llm_for_call(num_predict).invoke(prompt)
 
-        # 2) 計算在不截斷前提下，理論可用輸出空間
-        available_for_output = self.max_context_tokens - prompt_tokens
-        if available_for_output < min_output and auto_truncate:
-            # 不夠輸出，先把 prompt 截到留下 reserve_output 空間
-            # 預留 max(reserve_output, min_output)；如果還是不夠就退而求其次
-            need_output = max(reserve_output, min_output)
-            target_prompt_tokens = max(self.max_context_tokens - need_output, 0)
-            truncated_prompt = self._truncate_to_tokens(prompt, target_prompt_tokens)
-            prompt = truncated_prompt
-            prompt_tokens = self._estimate_tokens(prompt)
-            available_for_output = self.max_context_tokens - prompt_tokens
-
-        # 3) 決定最終 num_predict（= max_tokens）
-        #    不超過 available_for_output，且至少要 min_output
-        final_max_tokens = max(min(reserve_output, max(available_for_output, 0)), min_output)
+    def safe_completion_with_usage(
+        self,
+        prompt: str,
+        reserve_output: int = 2048,
+        auto_truncate: bool = True,
+        min_output: int = 64,
+        output_format: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        與 safe_completion 相同，另回傳 token 用量：
+        優先採用 Ollama 回報的 prompt_eval_count / eval_count，缺少時以估算值代替。
 
-        # 4) 用對應的 num_predict 重新建立（一次性）LLM 實例以送出請求
-        #    新版 OllamaLLM 直接支援 num_predict 參數
-        llm_for_call = OllamaLLM(
-            model=self.model_name,
-            temperature=self.temperature,
-            num_predict=int(final_max_tokens),   # 控制輸出長度
-        )
+        :param output_format: 結構化輸出，"json" 或 JSON schema（dict），傳給 Ollama 的 format 參數
 
-        # 5) 送出請求
-        return llm_for_call.invoke(prompt)
+        :return: (輸出文字, {"prompt_tokens", "completion_tokens", "estimated"})
+        """
+        prompt, prompt_tokens, num_predict = self._fit_prompt(prompt, reserve_output, auto_truncate, min_output)
+        result = self._llm_for_call(num_predict, output_format).generate([prompt])
+        generation = result.generations[0][0]
+        text = generation.text
+        info = generation.generation_info or {}
+
+        reported_prompt = info.get("prompt_eval_count")
+        reported_completion = info.get("eval_count")
+        usage = {
+            "prompt_tokens": reported_prompt if reported_prompt is not None else prompt_tokens,
+            "completion_tokens": (
+                reported_completion if reported_completion is not None else self.token_counter.count(text)
+            ),
+            "estimated": reported_prompt is None or reported_completion is None,
+        }
+        return text, usage
 
     # 若你仍想保留一個「單純」的補全方法，可提供：
     def complete(self, prompt: str, max_tokens: Optional[int] = None) -> str:
@@ -143,12 +175,7 @@ class LLMInitializer:
         if max_tokens is None:
             return self.llm.invoke(prompt)
 
-        llm_for_call = OllamaLLM(
-            model=self.model_name,
-            temperature=self.temperature,
-            num_predict=int(max_tokens),
-        )
-        return llm_for_call.invoke(prompt)
+        return self._llm_for_call(int(max_tokens)).invoke(prompt)
 
     def get_llm(self):
         """
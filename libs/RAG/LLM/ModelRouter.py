@@ -0,0 +1,241 @@
+# libs/RAG/LLM/ModelRouter.py
+"""
+模型路由器
+依任務類型（實體解析、最終回答）選擇對應的 Ollama 模型與生成參數：
+結構化抽取交給小型本地模型，只有最終回答使用大模型。每個任務記錄延遲與 token 用量。
+路由設定來自 config.LLM_ROUTES，未設定的任務使用 answer_generation 的設定。
+路由模型呼叫失敗（例如尚未 pull）時改用備援模型，並在 MODEL_RETRY_SECONDS 內直接使用備援模型。
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional, Callable, Tuple, Union
+
+try:
+    from .LLMInitializer import LLMInitializer
+    LLM_AVAILABLE = True
+except ImportError:
+    LLMInitializer = None
+    LLM_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+TASK_ENTITY_PARSE = "entity_parse"
+TASK_ANSWER_GENERATION = "answer_generation"
+
+DEFAULT_MODEL = "gpt-oss:20b"
+# 路由模型失敗後，改用備援模型的持續時間（秒），期滿後再嘗試路由模型
+MODEL_RETRY_SECONDS = 300.0
+
+DEFAULT_ROUTES: Dict[str, Dict[str, Any]] = {
+    TASK_ENTITY_PARSE: {"model": DEFAULT_MODEL, "temperature": 0.0, "max_tokens": 512, "format": "json"},
+    TASK_ANSWER_GENERATION: {"model": DEFAULT_MODEL, "temperature": 0.1, "max_tokens": 2048},
+}
+
+
+def load_keep_alive_from_config() -> Optional[Union[str, int]]:
+    """讀取 config.LLM_KEEP_ALIVE（Ollama 模型常駐時間）"""
+    try:
+        import config
+    except ImportError:
+        return None
+    return getattr(config, "LLM_KEEP_ALIVE", None)
+
+
+def load_routes_from_config() -> Tuple[Dict[str, Dict[str, Any]], str]:
+    """讀取 config.LLM_ROUTES / LLM_DEFAULT_MODEL；未設定時使用預設路由"""
+    try:
+        import config
+    except ImportError:
+        return DEFAULT_ROUTES, DEFAULT_MODEL
+    default_model = getattr(config, "LLM_DEFAULT_MODEL", DEFAULT_MODEL)
+    routes = {task: dict(route) for task, route in DEFAULT_ROUTES.items()}
+    for task, route in getattr(config, "LLM_ROUTES", {}).items():
+        routes.setdefault(task, {}).update(route)
+    return routes, default_model
+
+
+class ModelRouter:
+    """任務類型 → 模型與生成參數的路由器，並記錄每個任務的延遲與 token 指標"""
+
+    def __init__(
+        self,
+        routes: Optional[Dict[str, Dict[str, Any]]] = None,
+        default_model: Optional[str] = None,
+        request_timeout: int = 60,
+        initializer_factory: Optional[Callable[..., Any]] = None,
+        keep_alive: Optional[Union[str, int]] = None,
+        model_retry_seconds: float = MODEL_RETRY_SECONDS
+    ):
+        """
+        Args:
+            routes: {task: {"model", "temperature", "max_tokens"}}；None 時讀取 config
+            default_model: 路由模型失敗時的備援模型
+            request_timeout: 傳給 LLMInitializer 的請求超時（秒）
+            initializer_factory: 建立模型實例的工廠，預設為 LLMInitializer
+            keep_alive: Ollama 模型常駐時間；None 時讀取 config.LLM_KEEP_ALIVE
+            model_retry_seconds: 路由模型失敗後直接使用備援模型的秒數
+        """
+        if routes is None:
+            routes, config_default = load_routes_from_config()
+            default_model = default_model or config_default
+        self.routes = routes
+        self.default_model = default_model or DEFAULT_MODEL
+        self.request_timeout = request_timeout
+        self.keep_alive = keep_alive if keep_alive is not None else load_keep_alive_from_config()
+        self.model_retry_seconds = model_retry_seconds
+        self.initializer_factory = initializer_factory or LLMInitializer
+        if self.initializer_factory is None:
+            raise ImportError("langchain_ollama 未安裝，無法建立 LLM")
+
+        self._initializers: Dict[Tuple[str, float], Any] = {}
+        self._lock = threading.Lock()
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+        # 呼叫失敗的路由模型 → 失敗時間；期間內不再先嘗試該模型
+        self._failed_models: Dict[str, float] = {}
+
+        models = sorted({route.get("model", self.default_model) for route in self.routes.values()})
+        logger.info(f"模型路由器初始化完成，使用模型: {models}")
+
+    def get_route(self, task: str) -> Dict[str, Any]:
+        """取得任務的路由設定；未知任務使用 answer_generation 的設定"""
+        route = self.routes.get(task) or self.routes.get(TASK_ANSWER_GENERATION) or {}
+        return {
+            "model": route.get("model", self.default_model),
+            "temperature": route.get("temperature", 0.1),
+            "max_tokens": route.get("max_tokens", 2048),
+            "format": route.get("format"),
+        }
+
+    def _get_initializer(self, model: str, temperature: float):
+        """同一 (模型, 溫度) 只建立一個 LLMInitializer"""
+        key = (model, temperature)
+        with self._lock:
+            initializer = self._initializers.get(key)
+            if initializer is None:
+                initializer = self.initializer_factory(
+                    model_name=model, temperature=temperature, request_timeout=self.request_timeout,
+                    keep_alive=self.keep_alive
+                )
+                self._initializers[key] = initializer
+            return initializer
+
+    def get_initializer(self, task: str = TASK_ANSWER_GENERATION):
+        """取得任務對應的 LLMInitializer（供仍需直接操作 LLM 的舊程式使用）"""
+        route = self.get_route(task)
+        return self._get_initializer(route["model"], route["temperature"])
+
+    def complete(
+        self,
+        task: str,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        output_format: Optional[Union[str, Dict[str, Any]]] = None
+    ) -> str:
+        """
+        依任務路由呼叫模型；路由模型失敗且不同於備援模型時，改用備援模型重試一次
+
+        Args:
+            task: 任務類型（TASK_* 常數）
+            prompt: 輸入字串
+            max_tokens: 覆寫路由設定的輸出上限
+            output_format: 結構化輸出（"json" 或 JSON schema），覆寫路由設定的 format
+        """
+        route = self.get_route(task)
+        reserve_output = max_tokens or route["max_tokens"]
+        output_format = output_format or route["format"]
+        model = route["model"]
+        start = time.perf_counter()
+        if model != self.default_model and self._is_unavailable(model):
+            self._record(task, model, 0.0, None, fallback=True)
+            model = self.default_model
+        try:
+            try:
+                text, usage = self._call(model, route["temperature"], prompt, reserve_output, output_format)
+            except Exception as e:
+                if model == self.default_model:
+                    raise
+                logger.warning(
+                    f"任務 {task} 的模型 {model} 呼叫失敗，{self.model_retry_seconds:.0f} 秒內改用 {self.default_model}: {e}"
+                )
+                with self._lock:
+                    self._failed_models[model] = time.monotonic()
+                self._record(task, model, 0.0, None, fallback=True)
+                model = self.default_model
+                text, usage = self._call(model, route["temperature"], prompt, reserve_output, output_format)
+        except Exception:
+            self._record(task, model, time.perf_counter() - start, None, error=True)
+            raise
+        self._record(task, model, time.perf_counter() - start, usage)
+        return text
+
+    def _is_unavailable(self, model: str) -> bool:
+        """路由模型是否在最近 model_retry_seconds 內呼叫失敗"""
+        with self._lock:
+            failed_at = self._failed_models.get(model)
+            if failed_at is None:
+                return False
+            if time.monotonic() - failed_at >= self.model_retry_seconds:
+                del self._failed_models[model]
+                return False
+            return True
+
+    def _call(self, model: str, temperature: float, prompt: str, reserve_output: int, output_format=None):
+        initializer = self._get_initializer(model, temperature)
+        return initializer.safe_completion_with_usage(prompt, reserve_output, output_format=output_format)
+
+    def _record(
+        self,
+        task: str,
+        model: str,
+        latency: float,
+        usage: Optional[Dict[str, Any]],
+        error: bool = False,
+        fallback: bool = False
+    ):
+        with self._lock:
+            stats = self.metrics.setdefault(task, {
+                "calls": 0,
+                "errors": 0,
+                "fallbacks": 0,
+                "total_latency": 0.0,
+                "max_latency": 0.0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "estimated_calls": 0,
+                "models": {},
+            })
+            if fallback:
+                stats["fallbacks"] += 1
+                return
+            stats["calls"] += 1
+            stats["models"][model] = stats["models"].get(model, 0) + 1
+            stats["total_latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+            if error:
+                stats["errors"] += 1
+            if usage:
+                stats["prompt_tokens"] += int(usage.get("prompt_tokens") or 0)
+                stats["completion_tokens"] += int(usage.get("completion_tokens") or 0)
+                if usage.get("estimated"):
+                    stats["estimated_calls"] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """各任務的呼叫次數、錯誤、平均/最大延遲（秒）與 token 用量"""
+        with self._lock:
+            tasks = {}
+            for task, stats in self.metrics.items():
+                calls = stats["calls"]
+                tasks[task] = {
+                    **{k: v for k, v in stats.items() if k != "models"},
+                    "models": dict(stats["models"]),
+                    "avg_latency": stats["total_latency"] / calls if calls else 0.0,
+                    "avg_completion_tokens": stats["completion_tokens"] / calls if calls else 0.0,
+                }
+        return {
+            "routes": {task: self.get_route(task) for task in self.routes},
+            "default_model": self.default_model,
+            "unavailable_models": sorted(model for model in list(self._failed_models) if self._is_unavailable(model)),
+            "tasks": tasks,
+        }
@@ -0,0 +1,264 @@
+# libs/RAG/LLM/PromptBudget.py
+"""
+提示詞 token 預算管理
+- TokenCounter：使用模型對應的 tokenizer 計算 token（tokenizer 與計數結果皆快取），
+  無 tokenizer 時使用以 C 層級字串運算實作的快速估算；HuggingFace tokenizer 只從本機快取載入，
+  需預先下載（如 `huggingface-cli download Qwen/Qwen2.5-3B-Instruct`）
+- PromptBudgeter：將提示詞視為具名區段（系統規則、查詢設定、產品資料、使用者查詢），
+  超出預算時依優先序先裁切低優先區段（如排名較後的產品、冗長欄位），必要區段永不裁切；
+  輸出保留量依意圖決定
+"""
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+
+try:
+    from transformers import AutoTokenizer
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    AutoTokenizer = None
+    TRANSFORMERS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 模型名稱前綴 → tokenizer（("tiktoken", encoding) 或 ("hf", HuggingFace repo id)）
+MODEL_TOKENIZERS = {
+    "gpt-oss": ("tiktoken", "o200k_base"),
+    "qwen2.5": ("hf", "Qwen/Qwen2.5-3B-Instruct"),
+}
+
+# 依意圖保留的輸出 token（比較需要表格，輸出較長）
+INTENT_OUTPUT_TOKENS = {
+    "compare": 3072,
+    "recommend": 2048,
+    "product_introduction": 2048,
+    "spec_check": 1536,
+    "feature_explanation": 1536,
+}
+DEFAULT_OUTPUT_TOKENS = 2048
+
+# 區段優先序（數字越大越晚裁切）
+SECTION_PRIORITIES = {
+    "product_data": 20,
+    "query_rules": 80,
+    "user_query": 90,
+    "system_rules": 100,
+}
+
+_TOKENIZER_CACHE: Dict[str, Any] = {}
+_TOKENIZER_LOCK = threading.Lock()
+
+
+def _load_tokenizer(model_name: str):
+    """載入並快取模型對應的 tokenizer；無對應或載入失敗時回傳 None"""
+    spec = next(
+        (spec for prefix, spec in MODEL_TOKENIZERS.items() if (model_name or "").startswith(prefix)),
+        None
+    )
+    if spec is None:
+        return None
+    key = f"{spec[0]}:{spec[1]}"
+    with _TOKENIZER_LOCK:
+        if key in _TOKENIZER_CACHE:
+            return _TOKENIZER_CACHE[key]
+        tokenizer = None
+        try:
+            if spec[0] == "tiktoken" and TIKTOKEN_AVAILABLE:
+                tokenizer = tiktoken.get_encoding(spec[1])
+            elif spec[0] == "hf" and TRANSFORMERS_AVAILABLE:
+                # 只讀本機快取，避免在請求路徑上連網下載；未預先下載時改用估算
+                tokenizer = AutoTokenizer.from_pretrained(spec[1], local_files_only=True)
+        except Exception as e:
+            logger.warning(f"載入 {model_name} 的 tokenizer 失敗，改用估算: {e}")
+        _TOKENIZER_CACHE[key] = tokenizer
+        return tokenizer
+
+
+class TokenCounter:
+    """模型 token 計數器（含計數結果 LRU 快取）"""
+
+    def __init__(self, model_name: str = "", cache_size: int = 512):
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self.tokenizer = _load_tokenizer(model_name)
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def exact(self) -> bool:
+        """是否使用真實 tokenizer"""
+        return self.tokenizer is not None
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        """
+        快速估算：ASCII 約 4 字元 ≈ 1 token，非 ASCII（中日韓等）約 2 字元 ≈ 1 token
+        以 encode 計算 ASCII 字元數，避免逐字元的 Python 迴圈
+        """
+        if not text:
+            return 0
+        ascii_count = len(text.encode("ascii", "ignore"))
+        non_ascii_count = len(text) - ascii_count
+        return int(ascii_count / 4.0 + non_ascii_count / 2.0) + 1
+
+    def _encode(self, text: str) -> List[int]:
+        if hasattr(self.tokenizer, "encode_ordinary"):
+            return self.tokenizer.encode_ordinary(text)
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return self.estimate(text)
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                return cached
+        try:
+            tokens = len(self._encode(text))
+        except Exception:
+            tokens = self.estimate(text)
+        with self._lock:
+            self._cache[text] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """截斷至 max_tokens 以內（保留開頭）"""
+        if max_tokens <= 0 or not text:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.tokenizer is not None:
+            try:
+                return self.tokenizer.decode(self._encode(text)[:max_tokens])
+            except Exception:
+                pass
+        # 估算模式：二分搜尋可容納的最長前綴
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.estimate(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+
+def trim_product_data(text: str, max_tokens: int, counter: TokenCounter, min_products: int = 1) -> str:
+    """
+    裁切產品資料 JSON：先移除排名較後的產品，再縮短冗長欄位；非 JSON 時回傳原文
+    產品已依相關度排序，因此保留前面的產品
+    """
+    try:
+        data = json.loads(text)
+    except (ValueError, TypeError):
+        return text
+    if not isinstance(data, dict) or not isinstance(data.get("products"), list):
+        return text
+
+    def dump() -> str:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    products = data["products"]
+    result = dump()
+    while counter.count(result) > max_tokens and len(products) > min_products:
+        products.pop()
+        result = dump()
+
+    for limit in (120, 60, 30):
+        if counter.count(result) <= max_tokens:
+            break
+        for product in products:
+            if isinstance(product, dict):
+                for key, value in product.items():
+                    if isinstance(value, str) and len(value) > limit:
+                        product[key] = value[:limit] + "…"
+        result = dump()
+    return result
+
+
+@dataclass
+class PromptSection:
+    """提示詞區段"""
+    name: str
+    text: str
+    priority: int = 50
+    required: bool = False
+    min_tokens: int = 0
+    trimmer: Optional[Callable[[str, int, TokenCounter], str]] = None
+
+
+class PromptBudgeter:
+    """依區段優先序將提示詞控制在模型 context 預算內"""
+
+    def __init__(self, token_counter: TokenCounter, max_context_tokens: int, safety_margin: int = 256):
+        self.token_counter = token_counter
+        self.max_context_tokens = max_context_tokens
+        self.safety_margin = safety_margin
+
+    @staticmethod
+    def reserve_output_for(intent: Optional[str]) -> int:
+        """依意圖決定保留的輸出 token"""
+        return INTENT_OUTPUT_TOKENS.get(intent or "", DEFAULT_OUTPUT_TOKENS)
+
+    def fit(self, sections: List[PromptSection], reserve_output: int) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """
+        裁切各區段使總量不超過 context - 輸出保留 - 安全邊界
+
+        Returns:
+            ({區段名稱: 文字}, 報告 {budget, total_tokens, reserve_output, over_budget, sections})
+        """
+        counter = self.token_counter
+        budget = max(self.max_context_tokens - reserve_output - self.safety_margin, 0)
+        texts = {section.name: section.text or "" for section in sections}
+        original = {name: counter.count(text) for name, text in texts.items()}
+        counts = dict(original)
+
+        total = sum(counts.values())
+        for section in sorted(sections, key=lambda s: s.priority):
+            if total <= budget:
+                break
+            if section.required:
+                continue
+            name = section.name
+            target = max(section.min_tokens, counts[name] - (total - budget))
+            text = texts[name]
+            if section.trimmer is not None:
+                text = section.trimmer(text, target, counter)
+            if counter.count(text) > target:
+                text = counter.truncate(text, target)
+            texts[name] = text
+            total += counter.count(text) - counts[name]
+            counts[name] = counter.count(text)
+
+        report = {
+            "budget": budget,
+            "total_tokens": total,
+            "reserve_output": reserve_output,
+            "over_budget": total > budget,
+            "exact_tokenizer": counter.exact,
+            "sections": {
+                name: {"tokens": counts[name], "original_tokens": original[name], "trimmed": counts[name] < original[name]}
+                for name in texts
+            },
+        }
+        if report["over_budget"]:
+            logger.warning(f"提示詞必要區段已超出預算: {total} > {budget}")
+        elif any(item["trimmed"] for item in report["sections"].values()):
+            logger.info(f"提示詞已依預算裁切: {original} → {counts}")
+        return texts, report
@@ -0,0 +1,156 @@
+# libs/RAG/LLM/QueryRule.py
+"""
+實體解析結果（QueryRule）的結構定義與解析器
+- QUERY_RULE_SCHEMA：傳給 Ollama 的 format 參數，讓模型只能輸出符合結構的 JSON
+- QueryRuleParser：以快速 JSON 解析器轉為型別化的 QueryRule，並統計解析失敗次數，
+  失敗時回退為預設規則，不再默默吞掉錯誤
+"""
+
+import ast
+import json
+import logging
+import re
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ["recommend", "spec_check", "compare", "feature_explanation", "product_introduction"]
+NB_NUM_VALUES = ["all", "limit"]
+DEFAULT_NB_NUM = "all"
+DEFAULT_INTENT = "spec_check"
+DEFAULT_LANGUAGE = "zh-TW"
+
+QUERY_RULE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "intent": {"type": "string", "enum": INTENTS},
+        "entities": {"type": "array", "items": {"type": "string"}},
+        "attributes": {"type": "array", "items": {"type": "string"}},
+        "NB_NUM": {"type": "string", "enum": NB_NUM_VALUES},
+        "language": {"type": "string"},
+    },
+    "required": ["intent", "entities", "attributes", "NB_NUM", "language"],
+}
+
+_CODE_FENCE = re.compile(r"^```(?:json|JSON)?\s*|\s*```$")
+
+
+def loads_json(text: str) -> Any:
+    """以 orjson（若可用）解析 JSON"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+@dataclass
+class QueryRule:
+    """使用者查詢的結構化解析結果"""
+    intent: str = DEFAULT_INTENT
+    entities: List[str] = field(default_factory=list)
+    attributes: List[str] = field(default_factory=lambda: ["modelname"])
+    NB_NUM: str = DEFAULT_NB_NUM
+    language: str = DEFAULT_LANGUAGE
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QueryRule":
+        """由 dict 建立並正規化欄位型別（單一字串轉為列表、未知列舉值改用預設）"""
+        def as_list(value) -> List[str]:
+            if value is None:
+                return []
+            if isinstance(value, (list, tuple)):
+                return [str(item).strip() for item in value if str(item).strip()]
+            value = str(value).strip()
+            return [value] if value else []
+
+        intent = str(data.get("intent") or DEFAULT_INTENT).strip()
+        nb_num = str(data.get("NB_NUM") or "").strip().lower()
+        return cls(
+            intent=intent if intent in INTENTS else DEFAULT_INTENT,
+            entities=as_list(data.get("entities")),
+            attributes=as_list(data.get("attributes")),
+            NB_NUM=nb_num if nb_num in NB_NUM_VALUES else DEFAULT_NB_NUM,
+            language=str(data.get("language") or DEFAULT_LANGUAGE).strip(),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+
+class QueryRuleParser:
+    """將 LLM 輸出解析為 QueryRule，並記錄成功/修復/失敗次數"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {"total": 0, "parsed": 0, "repaired": 0, "empty": 0, "failures": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats["total"] += 1
+            self.stats[key] += 1
+
+    def parse(self, text: Optional[str]) -> Tuple[QueryRule, bool]:
+        """
+        解析 LLM 輸出
+
+        Returns:
+            (QueryRule, 是否成功解析)；失敗時回傳預設規則
+        """
+        raw = (text or "").strip()
+        if not raw:
+            self._count("empty")
+            logger.warning("實體解析結果為空，使用預設查詢規則")
+            return QueryRule(), False
+
+        try:
+            data = loads_json(raw)
+            if isinstance(data, dict):
+                self._count("parsed")
+                return QueryRule.from_dict(data), True
+        except ValueError:
+            pass
+
+        # 未使用結構化輸出的模型可能帶有 ```json 區塊、前後文字或單引號
+        data = self._repair(raw)
+        if data is not None:
+            self._count("repaired")
+            return QueryRule.from_dict(data), True
+
+        self._count("failures")
+        logger.error(f"實體解析結果無法解析為 JSON，使用預設查詢規則: {raw[:200]}")
+        return QueryRule(), False
+
+    @staticmethod
+    def _repair(raw: str) -> Optional[Dict[str, Any]]:
+        candidate = _CODE_FENCE.sub("", raw).strip()
+        start, end = candidate.find("{"), candidate.rfind("}")
+        if start == -1 or end <= start:
+            return None
+        candidate = candidate[start:end + 1]
+        for loader in (loads_json, ast.literal_eval):
+            try:
+                data = loader(candidate)
+            except (ValueError, SyntaxError, TypeError):
+                continue
+            if isinstance(data, dict):
+                return data
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["failure_rate"] = (
+            (stats["failures"] + stats["empty"]) / stats["total"] if stats["total"] else 0.0
+        )
+        return stats
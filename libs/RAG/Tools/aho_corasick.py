@@ -0,0 +1,63 @@
+# libs/RAG/Tools/aho_corasick.py
+"""
+Aho-Corasick 多模式字串比對自動機（純 Python 實作）
+建立一次後，單次掃描即可找出文本中所有模式的出現位置（含重疊），耗時與模式數量無關。
+"""
+
+from collections import deque
+from typing import Dict, Any, List, Tuple
+
+
+class AhoCorasickAutomaton:
+    """多模式字串比對自動機（純 Python 實作）"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, Any]]] = [[]]
+        self._built = False
+
+    def add(self, pattern: str, payload: Any):
+        """加入模式字串；需在 build() 之前呼叫"""
+        if not pattern:
+            return
+        state = 0
+        for ch in pattern:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), payload))
+        self._built = False
+
+    def build(self):
+        """以廣度優先建立失敗連結，並合併輸出"""
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                self._output[next_state].extend(self._output[self._fail[next_state]])
+        self._built = True
+
+    def iter_matches(self, text: str):
+        """逐一產生 (start, end, payload)，end 為不含的結束位置"""
+        if not self._built:
+            self.build()
+        state = 0
+        for index, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for length, payload in self._output[state]:
+                yield index + 1 - length, index + 1, payload
@@ -0,0 +1,194 @@
+# libs/StateManageHandler/session_retrieval.py
+"""
+會話檢索上下文
+保存每個會話上一輪解析出的產品鍵、產品規格列與 query rule（Redis，無 Redis 時使用記憶體），
+並判斷新訊息是否為針對同一批產品的追問（如「那電池呢?」「第二台的重量?」），
+追問可直接使用快取的產品集合回答，不必重新解析實體與檢索。
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_KEY = "session:{session_id}:retrieval"
+DEFAULT_TTL_SECONDS = 1800
+
+# 明確指涉前文產品的說法（不含「那」「呢」「都」等單字，它們也常出現在新的需求中）
+FOLLOW_UP_CUES = [
+    "它", "他們", "這台", "那台", "這款", "那款", "這些", "那些", "這幾台", "那幾台",
+    "上面", "剛剛", "剛才", "前面", "哪一台", "哪台", "哪款", "兩台", "兩款", "分別",
+]
+# 要求新的推薦或搜尋，需重新檢索
+NEW_SEARCH_CUES = ["推薦", "有沒有", "其他", "別的", "換一", "找", "更便宜", "更輕", "更好"]
+# 提到產品類別或陳述新需求：沒有明確指涉時視為新的搜尋
+NEW_NEED_CUES = [
+    "筆電", "筆記型電腦", "電腦", "機種", "laptop", "notebook",
+    "我要", "我想", "想要", "需要", "適合", "預算", "用來", "拿來",
+]
+# 省略句追問：「那電池呢?」「那重量呢」（只問一項規格、沒有其他內容）
+_ELLIPTICAL_FOLLOW_UP = re.compile(r"^那\s*\S{1,6}?\s*呢\s*[?？]?$")
+
+_CHINESE_NUMBERS = {"一": 1, "二": 2, "兩": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+_ORDINAL = re.compile(r"第\s*([一二三四五六七八九十]|\d+)\s*(?:台|款|個|部|名)")
+_FIRST_N = re.compile(r"前\s*([一二兩三四五六七八九十]|\d+)\s*(?:台|款|個|部|名)")
+_LAST = re.compile(r"最後(?:一)?(?:台|款|個|部)")
+
+
+def _to_int(token: str) -> int:
+    return int(token) if token.isdigit() else _CHINESE_NUMBERS.get(token, 0)
+
+
+def resolve_product_references(message: str, product_keys: List[str]) -> Optional[List[str]]:
+    """
+    解析序數指涉（第二台、前兩台、最後一台）為產品鍵
+
+    Returns:
+        指涉的產品鍵；訊息中沒有序數指涉時回傳 None
+    """
+    selected: List[str] = []
+    found = False
+    for match in _ORDINAL.finditer(message):
+        found = True
+        index = _to_int(match.group(1)) - 1
+        if 0 <= index < len(product_keys):
+            selected.append(product_keys[index])
+    for match in _FIRST_N.finditer(message):
+        found = True
+        selected.extend(product_keys[:_to_int(match.group(1))])
+    if _LAST.search(message) and product_keys:
+        found = True
+        selected.append(product_keys[-1])
+    return list(dict.fromkeys(selected)) if found else None
+
+
+def detect_follow_up(
+    message: str,
+    previous: Optional[Dict[str, Any]],
+    mentioned_modeltypes: List[str],
+    attributes: List[str],
+    has_new_filters: bool = False
+) -> Optional[Dict[str, Any]]:
+    """
+    判斷訊息是否為針對上一輪產品的追問
+
+    需指涉上一輪的產品（序數或已出現的機型），或以明確的指涉詞（這台、它們…）/省略句（那電池呢?）
+    詢問某項規格；要求新推薦、帶新檢索條件、提到新機型，或沒有明確指涉而提到產品類別/新需求
+    （「適合跑AI的筆電」「我要記憶體大的」）時不算追問。
+
+    Args:
+        message: 使用者訊息
+        previous: 上一輪保存的檢索上下文（SessionRetrievalStore.load 的結果）
+        mentioned_modeltypes: 訊息中偵測到的機型
+        attributes: 訊息提及的規格屬性
+        has_new_filters: 訊息是否帶有新的檢索條件（預算、尺寸等）
+
+    Returns:
+        {"product_keys": 追問涉及的產品鍵}；不是追問時回傳 None
+    """
+    if not previous or not previous.get("product_keys") or has_new_filters:
+        return None
+    product_keys = [str(k) for k in previous["product_keys"]]
+    text = (message or "").strip()
+    if not text or any(cue in text for cue in NEW_SEARCH_CUES):
+        return None
+
+    # 提到上一輪沒有的機型時需要重新檢索
+    if any(str(m) not in product_keys for m in mentioned_modeltypes):
+        return None
+
+    referenced = resolve_product_references(text, product_keys)
+    if referenced is not None:
+        return {"product_keys": referenced} if referenced else None
+    if mentioned_modeltypes:
+        return {"product_keys": [k for k in product_keys if k in set(map(str, mentioned_modeltypes))]}
+    if not attributes:
+        return None
+    if any(cue in text for cue in FOLLOW_UP_CUES):
+        return {"product_keys": product_keys}
+    lowered = text.lower()
+    if any(cue in lowered for cue in NEW_NEED_CUES):
+        return None
+    if _ELLIPTICAL_FOLLOW_UP.match(text):
+        return {"product_keys": product_keys}
+    return None
+
+
+class SessionRetrievalStore:
+    """每個會話最近一次檢索結果的存放處"""
+
+    def __init__(self, redis_client=None, ttl_seconds: int = DEFAULT_TTL_SECONDS, max_local_sessions: int = 1000):
+        """
+        Args:
+            redis_client: 同步 Redis 客戶端（decode_responses=True）；None 時只存於記憶體
+            ttl_seconds: 上下文保留時間
+            max_local_sessions: 記憶體模式下保留的會話數
+        """
+        self.redis_client = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.max_local_sessions = max_local_sessions
+        self._local: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(
+        self,
+        session_id: str,
+        product_keys: List[str],
+        products: List[Dict[str, Any]],
+        projected_fields: List[str],
+        query_rule: Dict[str, Any]
+    ):
+        """保存本輪解析出的產品鍵、規格列（依相關度排序）與 query rule"""
+        if not session_id:
+            return
+        record = {
+            "product_keys": [str(k) for k in product_keys],
+            "products": products,
+            "projected_fields": list(projected_fields),
+            "query_rule": query_rule,
+            "saved_at": time.time(),
+        }
+        if self.redis_client is not None:
+            try:
+                key = RETRIEVAL_KEY.format(session_id=session_id)
+                self.redis_client.set(key, json.dumps(record, ensure_ascii=False, default=str), ex=self.ttl_seconds)
+                return
+            except Exception as e:
+                logger.warning(f"保存會話檢索上下文至 Redis 失敗，改存記憶體: {e}")
+        with self._lock:
+            self._local[session_id] = record
+            self._local.move_to_end(session_id)
+            while len(self._local) > self.max_local_sessions:
+                self._local.popitem(last=False)
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """讀取會話的檢索上下文；不存在或已過期時回傳 None"""
+        if not session_id:
+            return None
+        if self.redis_client is not None:
+            try:
+                raw = self.redis_client.get(RETRIEVAL_KEY.format(session_id=session_id))
+                if raw:
+                    return json.loads(raw)
+            except Exception as e:
+                logger.warning(f"讀取會話檢索上下文失敗: {e}")
+        with self._lock:
+            record = self._local.get(session_id)
+            if record and time.time() - record["saved_at"] > self.ttl_seconds:
+                del self._local[session_id]
+                return None
+            return record
+
+    def clear(self, session_id: str):
+        if self.redis_client is not None:
+            try:
+                self.redis_client.delete(RETRIEVAL_KEY.format(session_id=session_id))
+            except Exception as e:
+                logger.warning(f"清除會話檢索上下文失敗: {e}")
+        with self._lock:
+            self._local.pop(session_id, None)
@@ -11,8 +11,125 @@ from textwrap import dedent
 from typing import Dict, Any, Optional, List, Tuple
 from pathlib import Path
 
+from .keyword_matcher import KeywordSlotMatcher
+
 logger = logging.getLogger(__name__)
 
+# 實體解析提示詞的靜態前綴：模組載入時 dedent 一次，使用者訊息只附加在最後，
+# 不同請求共用位元組相同的前綴，Ollama 可重用其 KV cache
+ENTITY_PARSING_PROMPT_PREFIX = dedent("""
+            你是一位精準的產品意圖分析師。你的任務是從使用者提供的筆電產品查詢中，精準地解析並結構化出以下三個核心資訊：使用者意圖、提及的產品實體、以及相關的屬性特徵。
+
+            [任務說明]
+            intent (意圖識別)：判斷使用者查詢的意圖。常見意圖包括但不限於：
+
+            recommend (推薦)：使用者想獲得產品推薦，通常不指定具體型號。
+
+            spec_check (規格查詢)：使用者想查詢特定產品的規格細節。
+
+            compare (比較)：使用者想比較多個產品或系列之間的差異。
+
+            feature_explanation (功能解釋)：使用者想了解某個功能或技術的運作方式。
+
+            product_introduction (產品介紹)：使用者想對某個產品有全面的了解。
+
+            實體解析 (entities)：從查詢中識別出所有明確提及的筆電型號、系列名稱或產品代碼。
+
+            屬性解析 (attributes)：從查詢中提取出與意圖相關的技術屬性或特徵。請參考下方提供的特徵列表。
+
+            [特徵列表 (Attributes)]
+            請仔細參考以下筆電相關的屬性標籤，並在 attributes 欄位中填入最相關的標籤。
+
+            modeltype (機種類型，如：商用、電競)
+
+            modelname (產品名稱或代號)
+
+            structconfig (結構配置，如：重量、尺寸、材質)
+
+            lcd (螢幕規格，如：解析度、更新率)
+
+            touchpanel (觸控面板)
+
+            iointerface (I/O 接口，如：USB-C、HDMI)
+
+            webcamera (網路攝影機)
+
+            audio (音訊系統)
+
+            battery (電池與充電)
+
+            cpu (處理器)
+
+            gpu (獨立顯示卡)
+
+            memory (記憶體)
+
+            lcdconnector (螢幕連接器)
+
+            storage (儲存裝置)
+
+            wifislot (無線網卡插槽)
+
+            thermal (散熱系統)
+
+            softwareconfig (軟體配置)
+
+            ai (AI 功能)
+
+            accessory (週邊配件)
+
+            [輸出格式與範例 (Output Format & Examples)]
+            請僅以 JSON 格式回應，不包含任何額外文字或解釋。(請注意，不要直接輸出到前端Browser)
+
+            JSON 結構
+            {
+                "intent": "<解析後的使用者意圖>",
+                "entities": ["<識別出的筆電實體，可為多個>"],
+                "attributes": ["<相關的屬性標籤，可為多個>"],
+                "NB_NUM": "<'all' 或 'limit'>",
+                "language": "<使用者查詢的語言>"
+            }
+            NB_NUM 欄位生成規則
+            在生成 JSON 時，請為 "NB_NUM" 欄位加入以下判斷邏輯：
+            - 如果 entities 陣列中，有以下任何一個實體是字母與數字的合併，或者該實體完全由數字組成 (例如 "819")，
+              則會格式化成"entities":[數字],而"attributes"中的值也會包含這個"modeltype",
+              而不會是"modelname", 並將 "NB_NUM" 欄位設為 "all"。
+              1. "系列"
+              2. "機種"
+              3. "機型"
+              4. "類型"
+              5. "型號"
+              若是以上面5個字眼結尾的實體，則只保留數字即可 (例如 "819系統" 只保留 "819")。
+            - 若不滿足以上任一狀況 (例如 entities 為 ["ROG Strix", "Vivobook Pro"])，則此欄位的值為 "limit"。
+
+            範例1:
+                查詢: "我想了解819系列這台筆電的散熱跟CPU規格"
+                輸出:
+                JSON
+
+                {
+                    "intent": "spec_check",
+                    "entities": ["819"],
+                    "attributes": [modeltype, cpu, thermal],
+                    "NB_NUM": "all",
+                    "language": "zh-TW"
+                }
+
+            範例2:
+                查詢: "推薦一台 ROG Zephyrus 的電競筆電"
+                輸出:
+                JSON
+                {
+                    "intent": "recommend",
+                    "entities": ["ROG Zephyrus"],
+                    "attributes": ["modeltype"],
+                    "NB_NUM": "limit",
+                    "language": "zh-TW"
+                }
+            **客戶需求：**
+            請llm將下方的使用者查詢message，修改成更有結構化、能讓LLM更好理解的格式.
+""").strip()
+
 
 class UserInputHandler:
     """
@@ -26,6 +143,8 @@ class UserInputHandler:
         self.keywords_data = self._load_keywords()
         self.intent_classifier = self._load_intent_classifier()
         self.slot_extractor = self._build_slot_extractor()
+        # 關鍵詞比對器：由 default_keywords.json 編譯一次，檔案變動時自動重新編譯
+        self.keyword_matcher = KeywordSlotMatcher()
         
         logger.info("UserInputHandler 初始化完成")
     
@@ -115,165 +234,30 @@ class UserInputHandler:
         return extractor
     
 
+    def match_keywords(self, message: str) -> List[Dict[str, Any]]:
+        """單次掃描找出訊息中所有命中的槽位（含位置與重要性），依 parse_keyword 的優先序排序"""
+        if not message:
+            return []
+        return self.keyword_matcher.match(message.strip())
+
     async def parse_keyword(self, message: str) -> tuple[str, dict[str, Any]]:
         """從使用者訊息中解析是否包含 default_keywords.json 的鍵或其同義詞
 
-        返回第一個匹配到的「鍵」（中文槽位名稱）和元數據。若無匹配則返回空字串和空字典。
+        返回優先序最高的「鍵」（中文槽位名稱）和元數據：regex 命中（重要性高者優先）→ 鍵名 → 同義詞。
+        若無匹配則返回空字串和空字典。全部命中結果請使用 match_keywords()。
         """
         try:
-            if not message:
+            matches = self.match_keywords(message)
+            if not matches:
                 return "", {}
-            text = message.strip()
-            # 1) 先用每個條目的 regex（若提供）匹配，最準確
-            # 按重要性排序，重要性高的優先檢查
-            sorted_slots = sorted(
-                self.keywords_data.items(),
-                key=lambda x: x[1].get("metadata", {}).get("importance", 0),
-                reverse=True
-            )
-
-            for slot_name, slot_data in sorted_slots:
-                metadata = slot_data.get("metadata", {})
-                pattern = metadata.get("regex")
-                if pattern:
-                    try:
-                        if re.search(pattern, text):
-                            return slot_name, metadata
-                    except re.error:
-                        # 正則無效則跳過該條
-                        return "", {}
-            # 2) 直接包含鍵名（中文）
-            for slot_name, slot_data in self.keywords_data.items():
-                if slot_name and slot_name in text:
-                    return slot_name, slot_data.get("metadata", {})
-
-            # 3) 同義詞匹配（子字串包含）
-            for slot_name, slot_data in self.keywords_data.items():
-                synonyms: List[str] = slot_data.get("synonyms", [])
-                for syn in synonyms:
-                    syn_norm = syn.strip()
-                    if syn_norm and syn_norm in text:
-                        return slot_name, slot_data.get("metadata", {})
-            return "", {}
+            best = matches[0]
+            return best["slot"], best["metadata"]
         except Exception as e:
             logger.error(f"parse_keyword 發生錯誤: {e}", exc_info=True)
             return "", {}
 
     async def getEntityParsingPrompt(self, message: str) -> str:
-        entity_extraction_prompt = f"""
-            你是一位精準的產品意圖分析師。你的任務是從使用者提供的筆電產品查詢中，精準地解析並結構化出以下三個核心資訊：使用者意圖、提及的產品實體、以及相關的屬性特徵。
-
-            [任務說明]
-            intent (意圖識別)：判斷使用者查詢的意圖。常見意圖包括但不限於：
-
-            recommend (推薦)：使用者想獲得產品推薦，通常不指定具體型號。
-
-            spec_check (規格查詢)：使用者想查詢特定產品的規格細節。
-
-            compare (比較)：使用者想比較多個產品或系列之間的差異。
-
-            feature_explanation (功能解釋)：使用者想了解某個功能或技術的運作方式。
-
-            product_introduction (產品介紹)：使用者想對某個產品有全面的了解。
-
-            實體解析 (entities)：從查詢中識別出所有明確提及的筆電型號、系列名稱或產品代碼。
-
-            屬性解析 (attributes)：從查詢中提取出與意圖相關的技術屬性或特徵。請參考下方提供的特徵列表。
-
-            [特徵列表 (Attributes)]
-            請仔細參考以下筆電相關的屬性標籤，並在 attributes 欄位中填入最相關的標籤。
-
-            modeltype (機種類型，如：商用、電競)
-
-            modelname (產品名稱或代號)
-
-            structconfig (結構配置，如：重量、尺寸、材質)
-
-            lcd (螢幕規格，如：解析度、更新率)
-
-            touchpanel (觸控面板)
-
-            iointerface (I/O 接口，如：USB-C、HDMI)
-
-            webcamera (網路攝影機)
-
-            audio (音訊系統)
-
-            battery (電池與充電)
-
-            cpu (處理器)
-
-            gpu (獨立顯示卡)
-
-            memory (記憶體)
-
-            lcdconnector (螢幕連接器)
-
-            storage (儲存裝置)
-
-            wifislot (無線網卡插槽)
-
-            thermal (散熱系統)
-
-            softwareconfig (軟體配置)
-
-            ai (AI 功能)
-
-            accessory (週邊配件)
-
-            [輸出格式與範例 (Output Format & Examples)]
-            請僅以 JSON 格式回應，不包含任何額外文字或解釋。(請注意，不要直接輸出到前端Browser)
-
-            JSON 結構
-            {{
-                "intent": "<解析後的使用者意圖>",
-                "entities": ["<識別出的筆電實體，可為多個>"],
-                "attributes": ["<相關的屬性標籤，可為多個>"],
-                "NB_NUM": "<'all' 或 'limit'>",
-                "language": "<使用者查詢的語言>"
-            }}
-            NB_NUM 欄位生成規則
-            在生成 JSON 時，請為 "NB_NUM" 欄位加入以下判斷邏輯：
-            - 如果 entities 陣列中，有以下任何一個實體是字母與數字的合併，或者該實體完全由數字組成 (例如 "819")，
-              則會格式化成"entities":[數字],而"attributes"中的值也會包含這個"modeltype",
-              而不會是"modelname", 並將 "NB_NUM" 欄位設為 "all"。
-              1. "系列"
-              2. "機種"
-              3. "機型"
-              4. "類型"
-              5. "型號"
-              若是以上面5個字眼結尾的實體，則只保留數字即可 (例如 "819系統" 只保留 "819")。
-            - 若不滿足以上任一狀況 (例如 entities 為 ["ROG Strix", "Vivobook Pro"])，則此欄位的值為 "limit"。
-
-            範例1:
-                查詢: "我想了解819系列這台筆電的散熱跟CPU規格"
-                輸出:
-                JSON
-
-                {{
-                    "intent": "spec_check",
-                    "entities": ["819"],
-                    "attributes": [modeltype, cpu, thermal],
-                    "NB_NUM": "all",
-                    "language": "zh-TW"
-                }}
-
-            範例2:
-                查詢: "推薦一台 ROG Zephyrus 的電競筆電"
-                輸出:
-                JSON
-                {{
-                    "intent": "recommend",
-                    "entities": ["ROG Zephyrus"],
-                    "attributes": ["modeltype"],
-                    "NB_NUM": "limit",
-                    "language": "zh-TW"
-                }}
-            **客戶需求：**
-            請llm將下方的使用者查詢message，修改成更有結構化、能讓LLM更好理解的格式. 
-            {message}
-        """
-        return dedent(entity_extraction_prompt).strip()
+        return f"{ENTITY_PARSING_PROMPT_PREFIX}\n{message.strip()}"
     
 
 
@@ -397,8 +381,41 @@ class UserInputHandler:
         
         return slots_update
     
+    def extract_filter_slots(self, message: str) -> Dict[str, Any]:
+        """
+        抽取可下推為檢索過濾條件的槽位（預算、重量、螢幕尺寸、GPU 等級）
+
+        只回傳語意明確的值，避免過濾過嚴；供 KnowledgeManager.search_product_data 使用。
+
+        Args:
+            message: 用戶輸入消息
+
+        Returns:
+            例如 {"price_range": "budget_low", "weight": "light", "screen_size": "14", "gpu_tier": "discrete"}
+        """
+        filter_slots = {}
+        message_lower = message.lower()
+
+        price_range = self._extract_price_range(message_lower)
+        if price_range:
+            filter_slots["price_range"] = price_range
+
+        if re.search(r'(輕薄|輕便|輕巧|輕量|便攜|好攜帶|容易攜帶)', message):
+            filter_slots["weight"] = "light"
+
+        size_match = re.search(r'(1[0-8](?:\.\d)?)\s*(?:吋|寸|inch|")', message_lower)
+        if size_match:
+            filter_slots["screen_size"] = size_match.group(1)
+
+        if re.search(r'(遊戲|電競|gaming|獨顯|獨立顯示)', message_lower):
+            filter_slots["gpu_tier"] = "discrete"
+
+        if filter_slots:
+            logger.debug(f"可下推的過濾槽位: {filter_slots}")
+        return filter_slots
+
     def _extract_slot_value(
-        self, 
+        self,
         message: str, 
         slot_name: str, 
         slot_info: Dict[str, Any]
@@ -0,0 +1,164 @@
+# libs/UserInputHandler/keyword_matcher.py
+"""
+關鍵詞槽位比對器 - 由 default_keywords.json 編譯一次
+純文字的關鍵詞（regex 中的字面選項、槽位鍵名、同義詞）放入 Aho-Corasick 自動機，
+以槽位為 payload；含正則語法的條目預先編譯。單次掃描即回傳所有命中的槽位、位置與重要性。
+關鍵詞檔案變動時自動重新編譯。
+"""
+
+import json
+import logging
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple
+
+from ..RAG.Tools.aho_corasick import AhoCorasickAutomaton
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEYWORDS_PATH = Path(__file__).parent.parent.parent / "HumanData" / "SlotHub" / "default_keywords.json"
+
+# 命中來源（數字越小優先序越高，與舊版 parse_keyword 的三段式檢查一致）
+SOURCE_REGEX = "regex"
+SOURCE_KEY = "key"
+SOURCE_SYNONYM = "synonym"
+_SOURCE_RANK = {SOURCE_REGEX: 0, SOURCE_KEY: 1, SOURCE_SYNONYM: 2}
+
+# 形如 "(詞1|詞2|詞3)" 且不含正則特殊字元的 pattern 可視為字面選項
+_LITERAL_ALTERNATION = re.compile(r"^\(?([^\\.^$*+?{}\[\]()]+)\)?$")
+
+
+def literal_alternatives(pattern: str) -> Optional[List[str]]:
+    """若 pattern 只是字面選項的聯集，回傳各選項；否則回傳 None"""
+    match = _LITERAL_ALTERNATION.match(pattern or "")
+    if not match:
+        return None
+    options = [option for option in match.group(1).split("|") if option]
+    return options or None
+
+
+class KeywordSlotMatcher:
+    """編譯後的關鍵詞槽位比對器"""
+
+    def __init__(self, keywords_path: Optional[Path] = None):
+        self.keywords_path = Path(keywords_path) if keywords_path else DEFAULT_KEYWORDS_PATH
+        self.keywords_data: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._signature = None
+        self._automaton: Optional[AhoCorasickAutomaton] = None
+        self._regex_slots: List[Tuple[str, Any]] = []
+        self._slot_order: Dict[str, int] = {}
+        self._maybe_reload()
+
+    def _file_signature(self):
+        try:
+            stat = self.keywords_path.stat()
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _maybe_reload(self):
+        """關鍵詞檔案變動時重新編譯"""
+        signature = self._file_signature()
+        if signature == self._signature and self._automaton is not None:
+            return
+        with self._lock:
+            if signature == self._signature and self._automaton is not None:
+                return
+            keywords_data = {}
+            if signature is not None:
+                try:
+                    with open(self.keywords_path, 'r', encoding='utf-8') as f:
+                        keywords_data = json.load(f)
+                except Exception as e:
+                    logger.error(f"載入關鍵詞數據失敗: {e}")
+                    keywords_data = self.keywords_data
+            self._compile(keywords_data)
+            self._signature = signature
+
+    def _compile(self, keywords_data: Dict[str, Dict[str, Any]]):
+        """將所有槽位的關鍵詞編譯為單一自動機與少數預編譯正則"""
+        automaton = AhoCorasickAutomaton()
+        regex_slots: List[Tuple[str, Any]] = []
+        slot_order: Dict[str, int] = {}
+
+        for index, (slot_name, slot_data) in enumerate(keywords_data.items()):
+            if not isinstance(slot_data, dict):
+                continue
+            slot_order[slot_name] = index
+            metadata = slot_data.get("metadata", {})
+            pattern = metadata.get("regex")
+            if pattern:
+                options = literal_alternatives(pattern)
+                if options:
+                    for option in options:
+                        automaton.add(option, (slot_name, SOURCE_REGEX))
+                else:
+                    try:
+                        regex_slots.append((slot_name, re.compile(pattern)))
+                    except re.error as e:
+                        # 正則無效則跳過該條
+                        logger.warning(f"槽位 '{slot_name}' 的 regex 無效，已略過: {e}")
+            if slot_name:
+                automaton.add(slot_name, (slot_name, SOURCE_KEY))
+            for synonym in slot_data.get("synonyms", []):
+                synonym = synonym.strip()
+                if synonym:
+                    automaton.add(synonym, (slot_name, SOURCE_SYNONYM))
+
+        automaton.build()
+        self.keywords_data = keywords_data
+        self._automaton = automaton
+        self._regex_slots = regex_slots
+        self._slot_order = slot_order
+        logger.info(
+            f"關鍵詞比對器編譯完成：{len(slot_order)} 個槽位，{len(regex_slots)} 個需正則比對"
+        )
+
+    def match(self, text: str) -> List[Dict[str, Any]]:
+        """
+        單次掃描找出所有命中的槽位
+
+        Returns:
+            依優先序排序的列表：regex 命中（重要性高者優先）→ 鍵名命中 → 同義詞命中；
+            每項為 {slot, source, importance, spans, metadata}，spans 為 (start, end) 列表
+        """
+        self._maybe_reload()
+        if not text:
+            return []
+        automaton, regex_slots = self._automaton, self._regex_slots
+        keywords_data, slot_order = self.keywords_data, self._slot_order
+
+        hits: Dict[str, Dict[str, Any]] = {}
+
+        def record(slot_name: str, source: str, start: int, end: int):
+            hit = hits.get(slot_name)
+            if hit is None:
+                hit = hits[slot_name] = {"slot": slot_name, "source": source, "spans": []}
+            elif _SOURCE_RANK[source] < _SOURCE_RANK[hit["source"]]:
+                hit["source"] = source
+            if (start, end) not in hit["spans"]:
+                hit["spans"].append((start, end))
+
+        for start, end, (slot_name, source) in automaton.iter_matches(text):
+            record(slot_name, source, start, end)
+        for slot_name, compiled in regex_slots:
+            for found in compiled.finditer(text):
+                if found.end() > found.start():
+                    record(slot_name, SOURCE_REGEX, found.start(), found.end())
+
+        results = []
+        for slot_name, hit in hits.items():
+            metadata = keywords_data.get(slot_name, {}).get("metadata", {})
+            hit["importance"] = metadata.get("importance", 0)
+            hit["metadata"] = metadata
+            hit["spans"].sort()
+            results.append(hit)
+
+        results.sort(key=lambda hit: (
+            _SOURCE_RANK[hit["source"]],
+            -hit["importance"] if hit["source"] == SOURCE_REGEX else 0,
+            slot_order.get(hit["slot"], 0),
+        ))
+        return results
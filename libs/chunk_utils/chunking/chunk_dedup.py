@@ -0,0 +1,179 @@
+# libs/chunk_utils/chunking/chunk_dedup.py
+"""
+分塊近似重複消除
+同系列的多個 SKU 常產生只差一個欄位的分塊文字；匯入前以 SimHash（字元 n-gram）找出候選，
+再以嵌入向量的餘弦相似度確認，將近似重複的分塊合併為一個代表分塊。
+代表分塊以 product_ids 記錄涵蓋的所有產品，檢索時再展開回各產品。
+"""
+
+import hashlib
+import logging
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+DEFAULT_MAX_HAMMING = 6
+DEFAULT_MIN_COSINE = 0.98
+# 代表分塊最多涵蓋的產品數（product_ids 以逗號串接存入 Milvus VARCHAR 欄位）
+MAX_PRODUCT_IDS = 200
+
+
+def _shingles(text: str, size: int) -> List[str]:
+    text = re.sub(r"\s+", " ", (text or "").strip().lower())
+    if len(text) <= size:
+        return [text]
+    return [text[i:i + size] for i in range(len(text) - size + 1)]
+
+
+def simhash(text: str, shingle_size: int = SHINGLE_SIZE) -> int:
+    """字元 n-gram 的 64 位元 SimHash（適用中英混合文字）"""
+    counts = Counter(_shingles(text, shingle_size))
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in counts)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(counts), 8), axis=1)
+    weights = np.array(list(counts.values()), dtype=np.int64) @ (bits.astype(np.int64) * 2 - 1)
+    return int.from_bytes(np.packbits(weights > 0).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def cosine_similarity(a, b) -> float:
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    denominator = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(a @ b) / denominator if denominator else 0.0
+
+
+def chunk_product_ids(chunk: Dict[str, Any]) -> List[str]:
+    """分塊涵蓋的產品（未合併的分塊只有自己的 product_id）"""
+    return list(chunk.get("product_ids") or [str(chunk.get("product_id", ""))])
+
+
+class ChunkDeduplicator:
+    """以 SimHash + 餘弦相似度合併近似重複的分塊"""
+
+    def __init__(
+        self,
+        max_hamming: int = DEFAULT_MAX_HAMMING,
+        min_cosine: float = DEFAULT_MIN_COSINE,
+        shingle_size: int = SHINGLE_SIZE,
+        key_fn: Optional[Callable[[Dict[str, Any]], Hashable]] = None
+    ):
+        """
+        Args:
+            max_hamming: SimHash 漢明距離上限
+            min_cosine: 兩個分塊都有 embedding 時，餘弦相似度下限
+            shingle_size: 字元 n-gram 長度
+            key_fn: 額外的分組鍵（例如純量 facet），鍵不同的分塊不會合併
+        """
+        self.max_hamming = max_hamming
+        self.min_cosine = min_cosine
+        self.shingle_size = shingle_size
+        self.key_fn = key_fn
+        # 鴿籠原理：距離不超過 max_hamming 的兩個指紋，切成 max_hamming + 1 段後至少有一段完全相同
+        bands = max_hamming + 1
+        width = SIMHASH_BITS // bands
+        self._bands = [(i * width, SIMHASH_BITS if i == bands - 1 else (i + 1) * width) for i in range(bands)]
+        self.last_report: Dict[str, Any] = {}
+
+    def _group_key(self, chunk: Dict[str, Any]) -> Hashable:
+        key = (chunk.get("chunk_type", ""), chunk.get("semantic_group", ""))
+        return key + (self.key_fn(chunk),) if self.key_fn else key
+
+    def _band_keys(self, group_key: Hashable, fingerprint: int) -> List[Tuple]:
+        return [
+            (group_key, i, (fingerprint >> start) & ((1 << (end - start)) - 1))
+            for i, (start, end) in enumerate(self._bands)
+        ]
+
+    def _is_duplicate(self, chunk, fingerprint, canonical, canonical_fingerprint) -> bool:
+        if hamming_distance(fingerprint, canonical_fingerprint) > self.max_hamming:
+            return False
+        if len(canonical.get("product_ids", ())) >= MAX_PRODUCT_IDS:
+            return False
+        embedding, canonical_embedding = chunk.get("embedding"), canonical.get("embedding")
+        if embedding is not None and canonical_embedding is not None:
+            return cosine_similarity(embedding, canonical_embedding) >= self.min_cosine
+        return True
+
+    def deduplicate(self, chunks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        """
+        合併近似重複分塊（輸入分塊不會被修改）
+
+        Returns:
+            (代表分塊列表（保持原順序，合併過的分塊附 product_ids 與 duplicate_chunk_ids）,
+             {被合併的 chunk_id: 代表分塊 chunk_id})
+        """
+        canonical: List[Dict[str, Any]] = []
+        fingerprints: List[int] = []
+        band_index: Dict[Tuple, List[int]] = {}
+        duplicates: Dict[str, str] = {}
+
+        for chunk in chunks:
+            fingerprint = simhash(chunk.get("content", ""), self.shingle_size)
+            band_keys = self._band_keys(self._group_key(chunk), fingerprint)
+            match = None
+            for candidate in dict.fromkeys(i for key in band_keys for i in band_index.get(key, ())):
+                if self._is_duplicate(chunk, fingerprint, canonical[candidate], fingerprints[candidate]):
+                    match = candidate
+                    break
+
+            if match is None:
+                for key in band_keys:
+                    band_index.setdefault(key, []).append(len(canonical))
+                canonical.append(chunk)
+                fingerprints.append(fingerprint)
+                continue
+
+            target = canonical[match]
+            if "duplicate_chunk_ids" not in target:
+                target = dict(target, product_ids=chunk_product_ids(target), duplicate_chunk_ids=[])
+                canonical[match] = target
+            for product_id in chunk_product_ids(chunk):
+                if product_id not in target["product_ids"]:
+                    target["product_ids"].append(product_id)
+            target["duplicate_chunk_ids"].append(chunk["chunk_id"])
+            duplicates[chunk["chunk_id"]] = target["chunk_id"]
+
+        self.last_report = {
+            "input_chunks": len(chunks),
+            "output_chunks": len(canonical),
+            "collapsed_chunks": len(duplicates),
+            "reduction": round(len(duplicates) / len(chunks), 4) if chunks else 0.0,
+        }
+        logger.info(
+            f"近似重複消除: {len(chunks)} → {len(canonical)} 個分塊（合併 {len(duplicates)} 個）"
+        )
+        return canonical, duplicates
+
+
+def remap_parent_ids(chunks: List[Dict[str, Any]], duplicates: Dict[str, str]) -> List[Dict[str, Any]]:
+    """子分塊的 parent_id 若指向被合併的父分塊，改指向代表分塊"""
+    remapped = []
+    for chunk in chunks:
+        parent_id = chunk.get("parent_id")
+        if parent_id in duplicates:
+            chunk = dict(chunk, parent_id=duplicates[parent_id])
+        remapped.append(chunk)
+    return remapped
+
+
+def expand_duplicate_hits(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    將代表分塊的檢索結果展開為每個產品一筆（保持排名與分數），展開出的結果附 canonical_chunk_id
+    """
+    expanded: List[Dict[str, Any]] = []
+    for result in results:
+        product_ids = result.get("product_ids") or []
+        if len(product_ids) <= 1:
+            expanded.append(result)
+            continue
+        for product_id in product_ids:
+            expanded.append(dict(result, product_id=product_id, canonical_chunk_id=result.get("chunk_id")))
+    return expanded
@@ -5,8 +5,12 @@ Chunking Strategy Pattern Implementation
 實現分塊策略模式，支援多種分塊策略
 """
 
+import copy
 import logging
+import multiprocessing
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, Any, List, Tuple, Optional
 from enum import Enum
 
@@ -18,12 +22,51 @@ class ChunkingStrategyType(Enum):
     HYBRID = "hybrid"
 
 
+# 分塊文字工作程序內的引擎（不載入嵌入模型）與其初始統計
+_worker_engine = None
+_worker_initial_stats = None
+
+
+def _init_chunk_builder(engine_cls, engine_kwargs: Dict[str, Any], engine_state: Dict[str, Any]):
+    """分塊文字工作程序初始化：建立不載入嵌入模型的引擎，並套用主程序的分塊設定"""
+    global _worker_engine, _worker_initial_stats
+    _worker_engine = engine_cls(**engine_kwargs)
+    for name, value in engine_state.items():
+        setattr(_worker_engine, name, value)
+    _worker_initial_stats = copy.deepcopy(getattr(_worker_engine, 'stats', None))
+
+
+def _build_chunk_shard(shard: Tuple[int, List[Dict[str, Any]]]):
+    """在工作程序中建立一個分片的分塊文字，回傳 (分塊結果, 本分片的統計)"""
+    start, products = shard
+    if _worker_initial_stats is not None:
+        _worker_engine.stats = copy.deepcopy(_worker_initial_stats)
+    pairs = _worker_engine._build_pairs(products, start, log_progress=False)
+    return pairs, getattr(_worker_engine, 'stats', None)
+
+
 class ChunkingStrategy(ABC):
     """分塊策略抽象基類"""
     
-    def __init__(self, strategy_name: str):
+    DEFAULT_EMBEDDING_BATCH_SIZE = 64
+    # 平行建立分塊文字時每個分片的產品數
+    CHUNK_BUILD_SHARD_SIZE = 500
+    # 工作程序需沿用的分塊設定屬性
+    CHUNK_BUILD_STATE_ATTRIBUTES = ('chunk_config', 'semantic_keywords')
+
+    def __init__(self, strategy_name: str, embedding_batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+                 embedding_processes: int = 0, embedding_store=None, chunk_build_processes: int = 0):
         self.strategy_name = strategy_name
         self.logger = logging.getLogger(f"{__name__}.{strategy_name}")
+        # 批次嵌入設定：embedding_processes > 1 時使用 sentence-transformers 多程序編碼池
+        self.embedding_batch_size = max(int(embedding_batch_size), 1)
+        self.embedding_processes = max(int(embedding_processes), 0)
+        self._embedding_pool = None
+        # 分塊文字建立：chunk_build_processes > 1 時將產品分片交由程序池建立（工作程序不載入模型）
+        self.chunk_build_processes = max(int(chunk_build_processes), 0)
+        # 持久化嵌入向量庫（EmbeddingStore）：已編碼過的文字直接讀取，只編碼新文字
+        self.embedding_store = embedding_store
+        self.last_batch_report: Dict[str, Any] = {}
     
     @abstractmethod
     def create_chunks(self, product: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
@@ -64,6 +107,207 @@ class ChunkingStrategy(ABC):
         """
         pass
     
+    @abstractmethod
+    def build_chunks(self, product: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        只建立分塊文字（不含嵌入向量），供批次流程先產生所有文字再統一編碼
+
+        Returns:
+            (parent_chunk, child_chunks): 尚未附加 embedding 的分塊
+        """
+        pass
+
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        批次生成嵌入向量：以 embedding_batch_size 為批次大小一次編碼整批文字，
+        避免逐句呼叫 encode 的固定開銷；設定 embedding_store 時只編碼向量庫中沒有的文字。
+        模型不可用或失敗時逐句回退至 generate_embedding
+        """
+        if not texts:
+            return []
+        model = getattr(self, 'sentence_transformer', None)
+        if model is not None:
+            try:
+                if self.embedding_store is not None:
+                    vectors = self.embedding_store.get_or_encode(texts, lambda batch: self._encode_texts(model, batch))
+                else:
+                    vectors = self._encode_texts(model, texts)
+                return [vector.tolist() for vector in vectors]
+            except Exception as e:
+                self.logger.error(f"批次生成嵌入向量失敗，改為逐句生成: {e}")
+        return [self.generate_embedding(text) for text in texts]
+
+    def _encode_texts(self, model, texts: List[str]):
+        pool = self._get_embedding_pool(model) if len(texts) > self.embedding_batch_size else None
+        if pool is not None:
+            return model.encode_multi_process(texts, pool, batch_size=self.embedding_batch_size)
+        return model.encode(texts, batch_size=self.embedding_batch_size, show_progress_bar=False)
+
+    def _get_embedding_pool(self, model):
+        """延遲啟動多程序編碼池（embedding_processes <= 1 時不使用）"""
+        if self.embedding_processes <= 1:
+            return None
+        if self._embedding_pool is None:
+            devices = ['cpu'] * self.embedding_processes
+            self._embedding_pool = model.start_multi_process_pool(target_devices=devices)
+            self.logger.info(f"已啟動嵌入編碼程序池: {self.embedding_processes} 個程序")
+        return self._embedding_pool
+
+    def close_embedding_pool(self):
+        """停止多程序編碼池"""
+        if self._embedding_pool is not None:
+            try:
+                self.sentence_transformer.stop_multi_process_pool(self._embedding_pool)
+            except Exception as e:
+                self.logger.warning(f"停止嵌入編碼程序池失敗: {e}")
+            self._embedding_pool = None
+
+    @staticmethod
+    def _chunk_texts(chunk_pairs: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]) -> List[str]:
+        texts = []
+        for parent, children in chunk_pairs:
+            texts.append(parent['content'])
+            texts.extend(child['content'] for child in children)
+        return texts
+
+    @staticmethod
+    def _assign_embeddings(chunk_pairs: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]], vectors: List[List[float]]):
+        vector_iter = iter(vectors)
+        for parent, children in chunk_pairs:
+            parent['embedding'] = next(vector_iter)
+            for child in children:
+                child['embedding'] = next(vector_iter)
+
+    def attach_embeddings(self, chunk_pairs: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]):
+        """將分塊文字一次批次編碼後，依序寫回各分塊的 embedding"""
+        self._assign_embeddings(chunk_pairs, self.generate_embeddings(self._chunk_texts(chunk_pairs)))
+
+    def _build_pairs(self, products: List[Dict[str, Any]], offset: int = 0,
+                     log_progress: bool = True) -> List[Tuple[int, Tuple[Dict[str, Any], List[Dict[str, Any]]]]]:
+        """
+        逐一建立產品的分塊文字，失敗的產品記錄錯誤後略過
+
+        Returns:
+            [(產品在完整列表中的索引, (parent_chunk, child_chunks))]
+        """
+        stats = getattr(self, 'stats', None)
+        pairs = []
+        for i, product in enumerate(products, start=offset):
+            try:
+                pairs.append((i, self.build_chunks(product)))
+            except Exception as e:
+                self.logger.error(f"處理產品 {i} 失敗: {e}")
+                if stats is not None:
+                    stats['processing_errors'] += 1
+                continue
+            if log_progress and (i + 1) % 100 == 0:
+                self.logger.info(f"已建立 {i + 1}/{offset + len(products)} 個產品的分塊文字")
+        return pairs
+
+    def _chunk_builder_kwargs(self) -> Dict[str, Any]:
+        """工作程序建立引擎的參數：只建立分塊文字，不載入嵌入模型"""
+        return {"embedding_model": getattr(self, 'embedding_model_name', None), "load_model": False}
+
+    def _merge_worker_stats(self, worker_stats: Optional[Dict[str, Any]]):
+        """將工作程序的分片統計加總回本引擎的 stats（數值相加、計數字典逐鍵相加、其餘取最新值）"""
+        stats = getattr(self, 'stats', None)
+        if stats is None or not worker_stats:
+            return
+        for key, value in worker_stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float, dict)):
+                if value is not None:
+                    stats[key] = value
+            elif isinstance(value, dict):
+                target = stats.setdefault(key, {})
+                for sub_key, count in value.items():
+                    target[sub_key] = target.get(sub_key, 0) + count
+            else:
+                stats[key] = stats.get(key, 0) + value
+
+    def build_all_chunks(self, products: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """
+        建立所有產品的分塊文字（不含嵌入向量）
+
+        chunk_build_processes > 1 且產品數超過一個分片時，依 CHUNK_BUILD_SHARD_SIZE 分片交由程序池建立；
+        結果依產品原順序合併（chunk_id 由產品內容決定，與單程序結果相同），
+        raw_product 改回指向主程序中的產品物件，避免保留工作程序傳回的副本。
+        """
+        if self.chunk_build_processes <= 1 or len(products) <= self.CHUNK_BUILD_SHARD_SIZE:
+            return [pair for _, pair in self._build_pairs(products)]
+
+        shard_size = self.CHUNK_BUILD_SHARD_SIZE
+        shards = [(start, products[start:start + shard_size]) for start in range(0, len(products), shard_size)]
+        state = {
+            name: getattr(self, name) for name in self.CHUNK_BUILD_STATE_ATTRIBUTES if hasattr(self, name)
+        }
+        self.logger.info(
+            f"以 {self.chunk_build_processes} 個程序平行建立分塊文字: {len(products)} 個產品，{len(shards)} 個分片"
+        )
+        chunk_pairs = []
+        done = 0
+        # spawn：主程序可能已載入模型與執行緒，不以 fork 複製
+        with ProcessPoolExecutor(
+            max_workers=self.chunk_build_processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_chunk_builder,
+            initargs=(type(self), self._chunk_builder_kwargs(), state),
+        ) as executor:
+            # map 依分片順序回傳，合併結果與單程序相同
+            for (start, shard), (pairs, worker_stats) in zip(shards, executor.map(_build_chunk_shard, shards)):
+                for index, (parent, children) in pairs:
+                    product = products[index]
+                    parent['raw_product'] = product
+                    for child in children:
+                        child['raw_product'] = product
+                    chunk_pairs.append((parent, children))
+                self._merge_worker_stats(worker_stats)
+                done += len(shard)
+                self.logger.info(f"已建立 {done}/{len(products)} 個產品的分塊文字")
+        return chunk_pairs
+
+    def batch_build_and_embed(self, products: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        三階段批量分塊：建立所有分塊文字 → 批次編碼 → 附加向量
+        各階段耗時與 chunks/sec 記錄於 last_batch_report
+
+        Returns:
+            (all_parent_chunks, all_child_chunks)
+        """
+        start = time.perf_counter()
+        chunk_pairs = self.build_all_chunks(products)
+        text_seconds = time.perf_counter() - start
+
+        chunk_count = sum(1 + len(children) for _, children in chunk_pairs)
+        start = time.perf_counter()
+        vectors = self.generate_embeddings(self._chunk_texts(chunk_pairs))
+        embedding_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self._assign_embeddings(chunk_pairs, vectors)
+        all_parent_chunks = [parent for parent, _ in chunk_pairs]
+        all_child_chunks = [child for _, children in chunk_pairs for child in children]
+        attach_seconds = time.perf_counter() - start
+
+        total_seconds = text_seconds + embedding_seconds + attach_seconds
+        self.last_batch_report = {
+            "products": len(products),
+            "chunks": chunk_count,
+            "embedding_batch_size": self.embedding_batch_size,
+            "embedding_processes": self.embedding_processes,
+            "chunk_build_processes": self.chunk_build_processes,
+            "text_seconds": round(text_seconds, 3),
+            "embedding_seconds": round(embedding_seconds, 3),
+            "attach_seconds": round(attach_seconds, 3),
+            "total_seconds": round(total_seconds, 3),
+            "chunks_per_second": round(chunk_count / total_seconds, 1) if total_seconds > 0 else 0.0,
+            "embedding_chunks_per_second": round(chunk_count / embedding_seconds, 1) if embedding_seconds > 0 else 0.0,
+        }
+        self.logger.info(
+            f"分塊耗時: 文字 {text_seconds:.2f}s, 嵌入 {embedding_seconds:.2f}s, 附加 {attach_seconds:.2f}s, "
+            f"{self.last_batch_report['chunks_per_second']} chunks/sec"
+        )
+        return all_parent_chunks, all_child_chunks
+
     def get_strategy_info(self) -> Dict[str, Any]:
         """獲取策略信息"""
         return {
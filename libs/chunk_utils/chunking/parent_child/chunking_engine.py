@@ -26,19 +26,30 @@ from ..chunking_strategy import ChunkingStrategy, ChunkingStrategyType
 class ProductChunkingEngine(ChunkingStrategy):
     """產品分塊引擎 - Parent-Child架構"""
     
-    def __init__(self, embedding_model: str = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'):
+    def __init__(self, embedding_model: str = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2',
+                 embedding_batch_size: int = ChunkingStrategy.DEFAULT_EMBEDDING_BATCH_SIZE,
+                 embedding_processes: int = 0,
+                 embedding_store=None,
+                 chunk_build_processes: int = 0,
+                 load_model: bool = True):
         """
         初始化分塊引擎
         
         Args:
             embedding_model: 句子嵌入模型名稱
+            embedding_batch_size: 批次編碼的批次大小
+            embedding_processes: 多程序編碼的程序數（0 或 1 表示不使用程序池）
+            embedding_store: 持久化嵌入向量庫（EmbeddingStore），None 表示每次都重新編碼
+            chunk_build_processes: 平行建立分塊文字的程序數（0 或 1 表示單程序）
+            load_model: False 時不載入嵌入模型（僅建立分塊文字的工作程序使用）
         """
-        super().__init__("ProductChunkingEngine")
+        super().__init__("ProductChunkingEngine", embedding_batch_size, embedding_processes, embedding_store,
+                         chunk_build_processes)
         self.logger = logging.getLogger(__name__)
         self.embedding_model_name = embedding_model
         
         # 初始化嵌入模型
-        if SENTENCE_TRANSFORMERS_AVAILABLE:
+        if SENTENCE_TRANSFORMERS_AVAILABLE and load_model:
             try:
                 self.sentence_transformer = SentenceTransformer(embedding_model)
                 self.logger.info(f"成功載入嵌入模型: {embedding_model}")
@@ -75,28 +86,10 @@ class ProductChunkingEngine(ChunkingStrategy):
             (parent_chunk, child_chunks): Parent chunk和Child chunks列表
         """
         try:
-            # 創建Parent Chunk
-            parent_chunk = self._create_parent_chunk(product)
+            parent_chunk, child_chunks = self.build_chunks(product)
             
-            # 創建四種Child Chunks
-            child_chunks = [
-                self._create_performance_chunk(product),
-                self._create_design_chunk(product),
-                self._create_connectivity_chunk(product),
-                self._create_business_chunk(product)
-            ]
-            
-            # 生成嵌入向量
-            parent_chunk['embedding'] = self.generate_embedding(parent_chunk['content'])
-            
-            for child in child_chunks:
-                child['embedding'] = self.generate_embedding(child['content'])
-                child['parent_id'] = parent_chunk['chunk_id']
-            
-            # 更新統計
-            self.stats['total_products_processed'] += 1
-            self.stats['total_chunks_created'] += 1 + len(child_chunks)
-            self.stats['last_processed'] = datetime.now().isoformat()
+            # 生成嵌入向量（父分塊與子分塊一次批次編碼）
+            self.attach_embeddings([(parent_chunk, child_chunks)])
             
             self.logger.debug(f"成功為產品 {product.get('modelname', 'Unknown')} 創建分塊")
             
@@ -107,9 +100,39 @@ class ProductChunkingEngine(ChunkingStrategy):
             self.stats['processing_errors'] += 1
             raise
     
+    def build_chunks(self, product: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        建立產品的Parent chunk與四種Child chunks文字（不含嵌入向量）
+        
+        Args:
+            product: 產品數據字典
+            
+        Returns:
+            (parent_chunk, child_chunks): 尚未附加 embedding 的分塊
+        """
+        # 創建Parent Chunk
+        parent_chunk = self._create_parent_chunk(product)
+        
+        # 創建四種Child Chunks
+        child_chunks = [
+            self._create_performance_chunk(product),
+            self._create_design_chunk(product),
+            self._create_connectivity_chunk(product),
+            self._create_business_chunk(product)
+        ]
+        for child in child_chunks:
+            child['parent_id'] = parent_chunk['chunk_id']
+        
+        # 更新統計
+        self.stats['total_products_processed'] += 1
+        self.stats['total_chunks_created'] += 1 + len(child_chunks)
+        self.stats['last_processed'] = datetime.now().isoformat()
+        
+        return parent_chunk, child_chunks
+    
     def batch_create_chunks(self, products: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
-        批量創建產品分塊
+        批量創建產品分塊：先建立所有分塊文字，再以批次編碼生成嵌入向量
         
         Args:
             products: 產品列表
@@ -117,23 +140,9 @@ class ProductChunkingEngine(ChunkingStrategy):
         Returns:
             (all_parent_chunks, all_child_chunks): 所有父分塊和子分塊
         """
-        all_parent_chunks = []
-        all_child_chunks = []
-        
         self.logger.info(f"開始批量處理 {len(products)} 個產品")
         
-        for i, product in enumerate(products):
-            try:
-                parent, children = self.create_chunks(product)
-                all_parent_chunks.append(parent)
-                all_child_chunks.extend(children)
-                
-                if (i + 1) % 10 == 0:
-                    self.logger.info(f"已處理 {i + 1}/{len(products)} 個產品")
-                    
-            except Exception as e:
-                self.logger.error(f"處理產品 {i} 失敗: {e}")
-                continue
+        all_parent_chunks, all_child_chunks = self.batch_build_and_embed(products)
         
         self.logger.info(f"批量處理完成: {len(all_parent_chunks)} 個父分塊, {len(all_child_chunks)} 個子分塊")
         
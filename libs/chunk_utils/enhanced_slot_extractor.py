@@ -30,14 +30,6 @@ class EnhancedSlotExtractor:
         self.confidence_threshold = confidence_threshold
         self.logger = logging.getLogger(__name__)
         
-        # 初始化特殊案例知識庫
-        try:
-            self.knowledge_base = SpecialCasesKnowledgeBase()
-            self.logger.info("成功初始化特殊案例知識庫")
-        except Exception as e:
-            self.logger.warning(f"初始化特殊案例知識庫失敗: {e}")
-            self.knowledge_base = None
-        
         # 初始化相似度引擎
         try:
             self.similarity_engine = MGFDSimilarityEngine()
@@ -46,6 +38,14 @@ class EnhancedSlotExtractor:
             self.logger.warning(f"初始化相似度引擎失敗: {e}")
             self.similarity_engine = None
         
+        # 初始化特殊案例知識庫（共用相似度引擎與其模型、向量緩存）
+        try:
+            self.knowledge_base = SpecialCasesKnowledgeBase(similarity_engine=self.similarity_engine)
+            self.logger.info("成功初始化特殊案例知識庫")
+        except Exception as e:
+            self.logger.warning(f"初始化特殊案例知識庫失敗: {e}")
+            self.knowledge_base = None
+        
         # 槽位特徵定義
         self.slot_features = {
             "usage_purpose": {
@@ -11,8 +11,8 @@ from abc import ABC, abstractmethod
 from typing import Dict, Any, List, Optional, Tuple
 from enum import Enum
 
-from .similarity_engine import SimilarityEngine
-from .special_cases_knowledge import SpecialCasesKnowledge
+from .similarity_engine import MGFDSimilarityEngine
+from .special_cases_knowledge import SpecialCasesKnowledgeBase
 
 
 class ExtractionStrategyType(Enum):
@@ -105,47 +105,60 @@ class RegexExtractionStrategy(ExtractionStrategy):
 class SemanticExtractionStrategy(ExtractionStrategy):
     """語義提取策略"""
     
-    def __init__(self, similarity_engine: SimilarityEngine, slot_synonyms_enhanced: Dict[str, Any]):
+    def __init__(self, similarity_engine: MGFDSimilarityEngine, slot_synonyms_enhanced: Dict[str, Any]):
         super().__init__("SemanticExtractionStrategy")
         self.similarity_engine = similarity_engine
         self.slot_synonyms = slot_synonyms_enhanced
         self._confidence = 0.0
-        self.similarity_threshold = 0.75
+        # 每個槽位的語義同義詞只在初始化時註冊為一個候選集合（一次編碼）
+        self.slot_candidates = self._register_slot_candidates()
+    
+    def _register_slot_candidates(self) -> Dict[str, Dict[str, Any]]:
+        """將各槽位所有取值的 semantic 詞彙合併為候選集合，並記錄詞彙對應的取值"""
+        slot_candidates = {}
+        for slot_name, slot_config in self.slot_synonyms.items():
+            term_values = {}
+            for value_name, value_config in slot_config.items():
+                for semantic_term in value_config.get("semantic", []):
+                    term_values.setdefault(semantic_term, value_name)
+            if not term_values:
+                continue
+            
+            candidate_set = f"slot_synonyms:{slot_name}"
+            terms = list(term_values)
+            self.similarity_engine.register_candidate_set(candidate_set, terms)
+            slot_candidates[slot_name] = {
+                "candidate_set": candidate_set,
+                "terms": terms,
+                "term_values": term_values
+            }
+        return slot_candidates
     
     def extract_slots(self, user_input: str, slot_schema: Dict[str, Any]) -> Dict[str, Any]:
         """使用語義相似度提取槽位"""
         extracted_slots = {}
         best_matches = {}
         
-        for slot_name, slot_config in self.slot_synonyms.items():
+        for slot_name, candidates in self.slot_candidates.items():
             if slot_name not in slot_schema:
                 continue
             
-            slot_best_match = None
-            slot_best_score = 0.0
-            
-            for value_name, value_config in slot_config.items():
-                if "semantic" not in value_config:
+            try:
+                matched_term = self.similarity_engine.match_slot_synonyms(
+                    user_input, candidates["terms"], candidate_set=candidates["candidate_set"]
+                )
+                if not matched_term:
                     continue
-                
-                for semantic_term in value_config["semantic"]:
-                    try:
-                        similarity = self.similarity_engine.calculate_similarity(
-                            user_input, semantic_term
-                        )
-                        
-                        if similarity > slot_best_score and similarity >= self.similarity_threshold:
-                            slot_best_score = similarity
-                            slot_best_match = value_name
-                            
-                    except Exception as e:
-                        self.logger.debug(f"語義計算失敗: {e}")
-                        continue
+                # 分數已由上一步快取，不會重新編碼
+                scores = self.similarity_engine.score_candidate_set(user_input, candidates["candidate_set"])
+                score = float(scores[candidates["terms"].index(matched_term)]) if scores is not None else 0.0
+            except Exception as e:
+                self.logger.debug(f"語義計算失敗: {e}")
+                continue
             
-            if slot_best_match:
-                extracted_slots[slot_name] = slot_best_match
-                best_matches[slot_name] = slot_best_score
-                self.logger.debug(f"語義匹配成功: {slot_name}={slot_best_match} (score: {slot_best_score:.3f})")
+            extracted_slots[slot_name] = candidates["term_values"][matched_term]
+            best_matches[slot_name] = score
+            self.logger.debug(f"語義匹配成功: {slot_name}={extracted_slots[slot_name]} (score: {score:.3f})")
         
         # 計算置信度
         if best_matches:
@@ -287,8 +300,8 @@ class EnhancedSlotExtractorV2:
         self.slot_schema = slot_schema
         
         # 初始化組件
-        self.similarity_engine = SimilarityEngine()
-        self.special_cases_knowledge = SpecialCasesKnowledge()
+        self.similarity_engine = MGFDSimilarityEngine()
+        self.special_cases_knowledge = SpecialCasesKnowledgeBase(similarity_engine=self.similarity_engine)
         
         # 載入增強的槽位同義詞
         self.slot_synonyms_enhanced = self._load_enhanced_slot_synonyms()
@@ -357,14 +370,15 @@ class EnhancedSlotExtractorV2:
             self.logger.info(f"增強型槽位提取V2，輸入: {user_input[:50]}...")
             
             # 步驟1: 檢查特殊案例
-            special_case_result = self.special_cases_knowledge.match_special_case(user_input)
+            special_case_result = self.special_cases_knowledge.find_matching_case(user_input, session_id)
             if special_case_result:
                 self.logger.info(f"找到特殊案例匹配: {special_case_result['case_id']}")
+                detected_intent = special_case_result.get("detected_intent", {})
                 return {
                     "success": True,
                     "extraction_method": "special_case_knowledge",
-                    "extracted_slots": special_case_result.get("inferred_slots", {}),
-                    "confidence": special_case_result.get("confidence", 0.9),
+                    "extracted_slots": detected_intent.get("inferred_slots", {}),
+                    "confidence": special_case_result.get("similarity_score", 0.9),
                     "special_case_id": special_case_result['case_id']
                 }
             
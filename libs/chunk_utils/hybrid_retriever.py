@@ -16,6 +16,10 @@ from sklearn.metrics.pairwise import cosine_similarity
 
 from .chunking import ProductChunkingEngine, ChunkingContext, ChunkingStrategyType
 from .knowledge_base import NotebookKnowledgeBase
+from ..KnowledgeManageHandler.embedding_store import get_embedding_store
+
+# 在共用嵌入向量庫中登記引用的使用端名稱（垃圾回收時保留其分塊向量）
+EMBEDDING_STORE_CONSUMER = "hybrid_retriever"
 
 
 class HybridProductRetriever:
@@ -39,6 +43,9 @@ class HybridProductRetriever:
             self.chunking_context = ChunkingContext(default_engine)
         
         self.chunking_engine = self.chunking_context.get_strategy()
+        # 共用持久化嵌入向量庫，重新初始化分塊時只編碼新的分塊文字
+        if self.chunking_engine.embedding_store is None and getattr(self.chunking_engine, 'sentence_transformer', None) is not None:
+            self.chunking_engine.embedding_store = get_embedding_store(self.chunking_engine.embedding_model_name)
         self.knowledge_base = NotebookKnowledgeBase()
         
         # 分塊存儲
@@ -96,6 +103,7 @@ class HybridProductRetriever:
             
             # 建立索引
             self._build_chunk_index(all_parents, all_children)
+            self._register_embedding_references(all_parents + all_children)
             
             self.logger.info(f"分塊初始化完成: {len(self.parent_chunks)} 個父分塊, {len(self.child_chunks)} 個子分塊")
             
@@ -103,6 +111,19 @@ class HybridProductRetriever:
             self.logger.error(f"初始化分塊失敗: {e}")
             raise
     
+    def _register_embedding_references(self, chunks: List[Dict]):
+        """登記目前使用的分塊文字，避免匯入腳本的垃圾回收移除檢索器的向量"""
+        store = self.chunking_engine.embedding_store
+        if store is None:
+            return
+        try:
+            store.set_references(
+                f"{EMBEDDING_STORE_CONSUMER}.{self.chunking_engine.strategy_name}",
+                [chunk["content"] for chunk in chunks]
+            )
+        except Exception as e:
+            self.logger.warning(f"登記嵌入向量庫引用失敗: {e}")
+    
     def _build_chunk_index(self, parent_chunks: List[Dict], child_chunks: List[Dict]):
         """建立分塊索引"""
         # 存儲父分塊
@@ -172,11 +193,8 @@ class HybridProductRetriever:
                           top_k: int, strategy: str) -> List[Dict[str, Any]]:
         """執行檢索邏輯"""
         
-        # 步驟1: 語義檢索 (從child chunks開始)
-        semantic_matches = self._semantic_retrieval(query, self.retrieval_config["top_k_semantic"])
-        
-        # 步驟2: 槽位過濾
-        filtered_matches = self._slot_based_filtering(semantic_matches, user_slots)
+        # 步驟1+2: 槽位過濾下推至語義檢索 (先剪枝child chunks，再計算相似度)
+        filtered_matches = self._semantic_retrieval(query, self.retrieval_config["top_k_semantic"], user_slots)
         
         # 步驟3: 聚合到父分塊
         aggregated_products = self._aggregate_by_parent(filtered_matches)
@@ -189,15 +207,17 @@ class HybridProductRetriever:
         
         return formatted_results
     
-    def _semantic_retrieval(self, query: str, top_k: int) -> List[Dict[str, Any]]:
-        """語義檢索 - 從child chunks中搜索"""
+    def _semantic_retrieval(self, query: str, top_k: int,
+                            user_slots: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """語義檢索 - 從child chunks中搜索，user_slots 不為空時先以父分塊元數據剪枝"""
         try:
             # 生成查詢嵌入
             query_embedding = self.chunking_engine.generate_embedding(query)
             
             similarities = []
+            candidates = self._prefilter_child_chunks(user_slots) if user_slots else self.child_chunks
             
-            for chunk in self.child_chunks:
+            for chunk in candidates:
                 try:
                     # 計算餘弦相似度
                     chunk_embedding = chunk.get('embedding')
@@ -232,32 +252,16 @@ class HybridProductRetriever:
             self.logger.error(f"語義檢索失敗: {e}")
             return []
     
-    def _slot_based_filtering(self, semantic_matches: List[Dict], user_slots: Dict[str, Any]) -> List[Dict]:
-        """基於用戶槽位進行過濾"""
-        if not user_slots:
-            return semantic_matches
-        
-        filtered = []
-        
-        for match in semantic_matches:
-            try:
-                # 獲取對應的父分塊元數據
-                parent_id = match.get("parent_id")
-                if not parent_id or parent_id not in self.parent_chunks:
-                    continue
-                
-                parent_metadata = self.parent_chunks[parent_id]["metadata"]
-                
-                # 進行槽位匹配
-                if self._match_user_slots(parent_metadata, user_slots):
-                    filtered.append(match)
-                    
-            except Exception as e:
-                self.logger.debug(f"槽位過濾錯誤: {e}")
-                continue
-        
-        return filtered
-    
+    def _prefilter_child_chunks(self, user_slots: Dict[str, Any]) -> List[Dict]:
+        """依用戶槽位預先過濾child chunks，避免對不符條件的分塊計算相似度"""
+        allowed_parents = {
+            parent_id for parent_id, parent in self.parent_chunks.items()
+            if self._match_user_slots(parent["metadata"], user_slots)
+        }
+        candidates = [chunk for chunk in self.child_chunks if chunk.get("parent_id") in allowed_parents]
+        self.logger.debug(f"槽位預過濾: {len(candidates)}/{len(self.child_chunks)} 個子分塊")
+        return candidates
+
     def _match_user_slots(self, parent_metadata: Dict[str, Any], user_slots: Dict[str, Any]) -> bool:
         """匹配用戶槽位"""
         
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+字元 n-gram 倒排索引
+預先為所有詞彙建立字元 1-gram + 2-gram（對中文友善，不需斷詞）倒排索引；查詢時只取與輸入
+共享 n-gram 的候選詞彙，並以向量化的 Dice 係數（2·重疊 / 總數，與 SequenceMatcher.ratio
+相同的 0–1 尺度且數值相近）評分，耗時只與查詢相關的 posting 數量有關，不隨詞彙總數成長。
+"""
+
+from collections import Counter, defaultdict
+from typing import Dict, List, Hashable, Tuple
+
+import numpy as np
+
+
+def char_ngrams(text: str, n: int = 2) -> Counter:
+    """字元 1..n-gram 計數（小寫）；含單字元 gram，單字詞也能比對"""
+    text = text.lower()
+    return Counter(
+        text[i:i + size] for size in range(1, n + 1) for i in range(len(text) - size + 1)
+    )
+
+
+def ngram_similarity(a: str, b: str, n: int = 2) -> float:
+    """兩個字串的 n-gram Dice 係數（0.0-1.0），供未建索引的詞彙使用"""
+    grams_a, grams_b = char_ngrams(a, n), char_ngrams(b, n)
+    total = sum(grams_a.values()) + sum(grams_b.values())
+    if not total:
+        return 0.0
+    overlap = sum((grams_a & grams_b).values())
+    return 2.0 * overlap / total
+
+
+class NGramIndex:
+    """詞彙的字元 1..n-gram 倒排索引，每個詞彙屬於一個群組（如 槽位/值/策略）"""
+
+    def __init__(self, n: int = 2):
+        self.n = n
+        self._group_ids: Dict[Hashable, int] = {}
+        self._groups: List[Hashable] = []
+        self._term_groups: List[int] = []
+        self._term_sizes: List[int] = []
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._arrays = None  # 延遲建立的 numpy 結構，新增詞彙後失效
+
+    def __len__(self) -> int:
+        return len(self._term_groups)
+
+    def add(self, term: str, group: Hashable):
+        """加入詞彙（可於建立後持續新增，例如動態學習到的新詞）"""
+        term = (term or "").strip()
+        if not term:
+            return
+        group_id = self._group_ids.get(group)
+        if group_id is None:
+            group_id = self._group_ids[group] = len(self._groups)
+            self._groups.append(group)
+        term_id = len(self._term_groups)
+        grams = char_ngrams(term, self.n)
+        for gram, count in grams.items():
+            self._postings[gram].append((term_id, count))
+        self._term_groups.append(group_id)
+        self._term_sizes.append(sum(grams.values()))
+        self._arrays = None
+
+    def _build_arrays(self):
+        postings = {
+            gram: (
+                np.fromiter((term_id for term_id, _ in items), dtype=np.int64, count=len(items)),
+                np.fromiter((count for _, count in items), dtype=np.float64, count=len(items)),
+            )
+            for gram, items in self._postings.items()
+        }
+        self._arrays = (
+            postings,
+            np.asarray(self._term_groups, dtype=np.int64),
+            np.asarray(self._term_sizes, dtype=np.float64),
+        )
+
+    def group_scores(self, text: str) -> Dict[Hashable, float]:
+        """
+        計算輸入與各群組詞彙的最高相似度
+
+        Returns:
+            {group: 最高 Dice 係數}；沒有共享 n-gram 的群組不會出現
+        """
+        if not self._term_groups or not text:
+            return {}
+        if self._arrays is None:
+            self._build_arrays()
+        postings, term_groups, term_sizes = self._arrays
+
+        query = char_ngrams(text, self.n)
+        ids, weights = [], []
+        for gram, count in query.items():
+            posting = postings.get(gram)
+            if posting is None:
+                continue
+            term_ids, term_counts = posting
+            ids.append(term_ids)
+            weights.append(np.minimum(term_counts, count))
+        if not ids:
+            return {}
+
+        ids = np.concatenate(ids)
+        overlap = np.bincount(ids, weights=np.concatenate(weights), minlength=len(term_sizes))
+        candidates = np.nonzero(overlap)[0]
+        scores = 2.0 * overlap[candidates] / (sum(query.values()) + term_sizes[candidates])
+
+        best = np.zeros(len(self._groups), dtype=np.float64)
+        np.maximum.at(best, term_groups[candidates], scores)
+        return {self._groups[g]: float(best[g]) for g in np.nonzero(best)[0]}
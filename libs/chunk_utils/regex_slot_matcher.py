@@ -11,10 +11,11 @@ import logging
 import hashlib
 from typing import Dict, Any, List, Optional, Tuple
 from enum import Enum
-from difflib import SequenceMatcher
 from pathlib import Path
 from datetime import datetime
 
+from .ngram_index import NGramIndex, ngram_similarity
+
 
 class MatchStrategy(Enum):
     """匹配策略"""
@@ -317,6 +318,9 @@ class RegexSlotMatcher:
         self.config = config
         self.compiled_patterns = {}
         self.match_cache = {}
+        # 語義/模糊詞彙的 n-gram 倒排索引；同一段文本只掃描一次（match_slots 會逐槽位呼叫）
+        self.term_index = NGramIndex(n=2)
+        self._term_score_cache: Tuple[Optional[str], Dict[Tuple[str, str, str], float]] = (None, {})
         
         # 初始化動態學習器
         if config_file_path:
@@ -328,6 +332,8 @@ class RegexSlotMatcher:
         
         # 預編譯正則表達式
         self._compile_patterns()
+        # 建立語義/模糊詞彙索引
+        self._build_term_index()
         
         self.logger.info("正則表達式槽位匹配器初始化完成")
     
@@ -347,18 +353,7 @@ class RegexSlotMatcher:
                     if "regex" not in value_synonyms:
                         continue
                     
-                    patterns = value_synonyms["regex"]
-                    compiled_patterns = []
-                    
-                    for pattern in patterns:
-                        try:
-                            # 編譯正則表達式，支援Unicode和忽略大小寫
-                            compiled = re.compile(pattern, re.IGNORECASE | re.UNICODE)
-                            compiled_patterns.append(compiled)
-                        except re.error as e:
-                            self.logger.warning(f"正則表達式編譯失敗: {pattern}, 錯誤: {e}")
-                            continue
-                    
+                    compiled_patterns = self._compile_value_patterns(value_synonyms["regex"])
                     if compiled_patterns:
                         self.compiled_patterns[slot_name][value_name] = compiled_patterns
             
@@ -367,6 +362,44 @@ class RegexSlotMatcher:
         except Exception as e:
             self.logger.error(f"編譯正則表達式失敗: {e}")
     
+    def _compile_value_patterns(self, patterns: List[str]) -> List[Any]:
+        """編譯單一槽位值的正則表達式，略過無效模式"""
+        compiled_patterns = []
+        for pattern in patterns:
+            try:
+                # 編譯正則表達式，支援Unicode和忽略大小寫
+                compiled_patterns.append(re.compile(pattern, re.IGNORECASE | re.UNICODE))
+            except re.error as e:
+                self.logger.warning(f"正則表達式編譯失敗: {pattern}, 錯誤: {e}")
+        return compiled_patterns
+    
+    def _build_term_index(self):
+        """為所有槽位值的 semantic 與 fuzzy_match 詞彙建立 n-gram 倒排索引"""
+        try:
+            for slot_name, slot_def in self.config.get("slot_definitions", {}).items():
+                for value_name, value_synonyms in slot_def.get("synonyms", {}).items():
+                    self._index_value_terms(slot_name, value_name, value_synonyms)
+            self._term_score_cache = (None, {})
+            self.logger.info(f"成功建立語義/模糊詞彙索引，共 {len(self.term_index)} 個詞彙")
+        except Exception as e:
+            self.logger.error(f"建立詞彙索引失敗: {e}")
+
+    def _index_value_terms(self, slot_name: str, value_name: str, value_synonyms: Dict[str, Any]):
+        """將單一槽位值的詞彙加入索引"""
+        for term in value_synonyms.get("semantic", []):
+            self.term_index.add(term, (slot_name, value_name, "semantic"))
+        for term in value_synonyms.get("fuzzy_match", []):
+            self.term_index.add(term, (slot_name, value_name, "fuzzy"))
+        self._term_score_cache = (None, {})
+
+    def _term_scores(self, text: str) -> Dict[Tuple[str, str, str], float]:
+        """文本對所有已索引詞彙群組的最高相似度（同一文本重複呼叫時直接重用）"""
+        cached_text, scores = self._term_score_cache
+        if cached_text != text:
+            scores = self.term_index.group_scores(text)
+            self._term_score_cache = (text, scores)
+        return scores
+
     def match_slots(self, text: str, target_slots: Optional[List[str]] = None, 
                    enable_learning: bool = True) -> Dict[str, Any]:
         """
@@ -439,7 +472,7 @@ class RegexSlotMatcher:
                 confidence = slot_info["confidence"]
                 
                 # 嘗試添加新槽位
-                if self.dynamic_learner.add_new_slot(slot_name, slot_value, text, confidence):
+                if self.add_new_slot(slot_name, slot_value, text, confidence):
                     learning_results[slot_name] = {
                         "value": slot_value,
                         "confidence": confidence,
@@ -541,7 +574,31 @@ class RegexSlotMatcher:
             self.logger.warning("動態學習功能未啟用")
             return False
         
-        return self.dynamic_learner.add_new_slot(slot_name, slot_value, user_input, confidence)
+        if not self.dynamic_learner.add_new_slot(slot_name, slot_value, user_input, confidence):
+            return False
+        self._merge_learned_value(slot_name, slot_value)
+        return True
+    
+    def _merge_learned_value(self, slot_name: str, slot_value: str):
+        """
+        將動態學習器剛寫入配置文件的槽位值合併進目前的配置、正則表達式與詞彙索引，
+        學到的詞彙不需重啟即可匹配
+        """
+        learned_def = self.dynamic_learner.load_config().get("slot_definitions", {}).get(slot_name, {})
+        value_synonyms = learned_def.get("synonyms", {}).get(slot_value)
+        if not value_synonyms:
+            return
+        
+        slot_definitions = self.config.setdefault("slot_definitions", {})
+        slot_def = slot_definitions.setdefault(slot_name, {**learned_def, "synonyms": {}})
+        slot_def.setdefault("synonyms", {})[slot_value] = value_synonyms
+        
+        compiled_patterns = self._compile_value_patterns(value_synonyms.get("regex", []))
+        if compiled_patterns:
+            self.compiled_patterns.setdefault(slot_name, {})[slot_value] = compiled_patterns
+        self._index_value_terms(slot_name, slot_value, value_synonyms)
+        self.match_cache.clear()
+        self.logger.info(f"已載入動態學習的槽位值: {slot_name}={slot_value}")
     
     def get_learning_statistics(self) -> Dict[str, Any]:
         """獲取學習統計信息"""
@@ -596,12 +653,12 @@ class RegexSlotMatcher:
                 
                 # 語義匹配
                 if "semantic" in weights and weights["semantic"] > 0:
-                    semantic_score = self._semantic_match(text, value_synonyms)
+                    semantic_score = self._semantic_match(text, value_synonyms, slot_name, value_name)
                     strategy_scores["semantic"] = semantic_score
                     match_score += semantic_score * weights["semantic"]
                 
                 # 模糊匹配
-                fuzzy_score = self._fuzzy_match(text, value_synonyms)
+                fuzzy_score = self._fuzzy_match(text, value_synonyms, slot_name, value_name)
                 strategy_scores["fuzzy"] = fuzzy_score
                 
                 # 記錄匹配詳情
@@ -709,13 +766,16 @@ class RegexSlotMatcher:
             self.logger.error(f"關鍵詞匹配失敗: {e}")
             return 0.0
     
-    def _semantic_match(self, text: str, value_synonyms: Dict[str, Any]) -> float:
+    def _semantic_match(self, text: str, value_synonyms: Dict[str, Any],
+                        slot_name: Optional[str] = None, value_name: Optional[str] = None) -> float:
         """
         語義匹配
         
         Args:
             text: 輸入文本
             value_synonyms: 值同義詞
+            slot_name: 槽位名稱（提供時使用預建的 n-gram 索引）
+            value_name: 值名稱
             
         Returns:
             匹配分數 (0.0-1.0)
@@ -725,27 +785,26 @@ class RegexSlotMatcher:
             if not semantic_terms:
                 return 0.0
             
-            text_lower = text.lower()
-            max_similarity = 0.0
-            
-            for term in semantic_terms:
-                # 使用序列匹配器計算相似度
-                similarity = SequenceMatcher(None, text_lower, term.lower()).ratio()
-                max_similarity = max(max_similarity, similarity)
+            if slot_name is not None and value_name is not None:
+                return self._term_scores(text).get((slot_name, value_name, "semantic"), 0.0)
             
-            return max_similarity
+            # 未建索引的詞彙：直接計算 n-gram 相似度
+            return max(ngram_similarity(text, term) for term in semantic_terms)
             
         except Exception as e:
             self.logger.error(f"語義匹配失敗: {e}")
             return 0.0
     
-    def _fuzzy_match(self, text: str, value_synonyms: Dict[str, Any]) -> float:
+    def _fuzzy_match(self, text: str, value_synonyms: Dict[str, Any],
+                     slot_name: Optional[str] = None, value_name: Optional[str] = None) -> float:
         """
         模糊匹配
         
         Args:
             text: 輸入文本
             value_synonyms: 值同義詞
+            slot_name: 槽位名稱（提供時使用預建的 n-gram 索引）
+            value_name: 值名稱
             
         Returns:
             匹配分數 (0.0-1.0)
@@ -755,15 +814,11 @@ class RegexSlotMatcher:
             if not fuzzy_terms:
                 return 0.0
             
-            text_lower = text.lower()
-            max_similarity = 0.0
-            
-            for term in fuzzy_terms:
-                # 計算模糊相似度
-                similarity = SequenceMatcher(None, text_lower, term.lower()).ratio()
-                max_similarity = max(max_similarity, similarity)
+            if slot_name is not None and value_name is not None:
+                return self._term_scores(text).get((slot_name, value_name, "fuzzy"), 0.0)
             
-            return max_similarity
+            # 未建索引的詞彙：直接計算 n-gram 相似度
+            return max(ngram_similarity(text, term) for term in fuzzy_terms)
             
         except Exception as e:
             self.logger.error(f"模糊匹配失敗: {e}")
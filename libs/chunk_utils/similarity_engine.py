@@ -3,15 +3,20 @@
 """
 MGFD 相似度計算引擎
 使用 sentence-transformers 進行語義相似度計算
+
+候選集合（槽位同義詞、特殊案例、循環檢測歷史）可預先註冊：只編碼一次為正規化矩陣並標記版本，
+之後每次查詢只需編碼查詢本身，再做一次矩陣-向量乘法。文本向量與相似度結果皆使用有界 LRU 緩存。
 """
 
+import hashlib
 import json
 import logging
+import threading
 import time
+from collections import OrderedDict
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 
 try:
     from sentence_transformers import SentenceTransformer
@@ -26,18 +31,21 @@ class MGFDSimilarityEngine:
     def __init__(self, 
                  model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
                  cache_size: int = 1000,
-                 enable_cache: bool = True):
+                 enable_cache: bool = True,
+                 embedding_cache_size: int = 4096):
         """
         初始化相似度引擎
         
         Args:
             model_name: sentence-transformers 模型名稱
-            cache_size: 緩存大小
+            cache_size: 相似度結果緩存大小（LRU）
             enable_cache: 是否啟用緩存
+            embedding_cache_size: 文本向量緩存大小（LRU）
         """
         self.model_name = model_name
         self.cache_size = cache_size
         self.enable_cache = enable_cache
+        self.embedding_cache_size = embedding_cache_size
         self.logger = logging.getLogger(__name__)
         
         # 性能監控
@@ -46,11 +54,19 @@ class MGFDSimilarityEngine:
             "cache_hits": 0,
             "average_response_time": 0.0,
             "error_count": 0,
-            "model_load_time": 0.0
+            "model_load_time": 0.0,
+            "encode_calls": 0,
+            "encoded_texts": 0,
+            "embedding_cache_hits": 0
         }
         
-        # 緩存
-        self.cache = {}
+        # 緩存（皆為有界 LRU）
+        self.cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.RLock()
+        
+        # 已註冊的候選集合：name -> {texts, matrix, version, updated_at}
+        self.candidate_sets: Dict[str, Dict[str, Any]] = {}
         
         # 閾值配置
         self.thresholds = {
@@ -97,24 +113,23 @@ class MGFDSimilarityEngine:
             self.logger.warning("模型未初始化，返回默認相似度")
             return [0.0] * len(candidates)
         
+        if isinstance(candidates, str):
+            candidates = [candidates]
+        
         start_time = time.time()
         
         try:
             # 檢查緩存
             cache_key = self._generate_cache_key(query, candidates)
-            if self.enable_cache and cache_key in self.cache:
-                self.metrics["cache_hits"] += 1
-                self.logger.debug("使用緩存的相似度結果")
-                return self.cache[cache_key]
+            cached = self._get_cached_result(cache_key)
+            if cached is not None:
+                return cached
             
-            # 編碼查詢和候選項
-            texts = [query] + candidates
-            embeddings = self.model.encode(texts)
+            # 已編碼過的文本直接取用向量，只編碼未見過的文本（通常只有查詢本身）
+            embeddings = self.encode_texts([query] + list(candidates))
             
-            # 計算餘弦相似度
-            query_embedding = embeddings[0:1]
-            candidate_embeddings = embeddings[1:]
-            similarities = cosine_similarity(query_embedding, candidate_embeddings)[0]
+            # 向量已正規化，內積即為餘弦相似度
+            similarities = embeddings[1:] @ embeddings[0]
             
             # 轉換為Python列表
             result = similarities.tolist()
@@ -135,6 +150,149 @@ class MGFDSimilarityEngine:
             self.logger.error(f"相似度計算失敗: {e}")
             return [0.0] * len(candidates)
     
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        取得正規化的文本向量；緩存中沒有的文本以單次批次編碼
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            (len(texts), dim) 的正規化向量矩陣
+        """
+        with self._lock:
+            vectors: Dict[str, np.ndarray] = {}
+            for text in texts:
+                vector = self._embedding_cache.get(text)
+                if vector is not None:
+                    self._embedding_cache.move_to_end(text)
+                    vectors[text] = vector
+            missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+            self.metrics["embedding_cache_hits"] += len(texts) - len(missing)
+        
+        if missing:
+            encoded = self.model.encode(missing, normalize_embeddings=True, convert_to_numpy=True)
+            with self._lock:
+                self.metrics["encode_calls"] += 1
+                self.metrics["encoded_texts"] += len(missing)
+                for text, vector in zip(missing, encoded):
+                    vector = np.asarray(vector, dtype=np.float32)
+                    vectors[text] = vector
+                    self._embedding_cache[text] = vector
+                    self._embedding_cache.move_to_end(text)
+                while len(self._embedding_cache) > self.embedding_cache_size:
+                    self._embedding_cache.popitem(last=False)
+        
+        return np.vstack([vectors[text] for text in texts])
+    
+    @staticmethod
+    def _texts_version(texts: List[str]) -> str:
+        """候選集合內容的版本標籤"""
+        digest = hashlib.sha1("\x1f".join(texts).encode("utf-8")).hexdigest()
+        return digest[:16]
+    
+    def register_candidate_set(self, name: str, texts: List[str], version: Optional[str] = None) -> Optional[str]:
+        """
+        註冊候選集合：編碼一次為正規化矩陣並標記版本
+        
+        Args:
+            name: 集合名稱（如 "special_cases"、"slot_synonyms"）
+            texts: 候選文本
+            version: 版本標籤；未提供時依內容計算，內容未變時不會重新編碼
+            
+        Returns:
+            集合版本；模型未初始化時回傳 None
+        """
+        if not self.model:
+            return None
+        texts = list(texts)
+        version = version or self._texts_version(texts)
+        existing = self.candidate_sets.get(name)
+        if existing and existing["version"] == version:
+            return version
+        
+        matrix = self.encode_texts(texts) if texts else np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            self.candidate_sets[name] = {
+                "texts": texts,
+                "matrix": matrix,
+                "version": version,
+                "updated_at": datetime.now().isoformat()
+            }
+        self.logger.info(f"已註冊候選集合 '{name}'：{len(texts)} 筆，版本 {version}")
+        return version
+    
+    def append_to_candidate_set(self, name: str, texts: List[str], max_size: Optional[int] = None) -> Optional[str]:
+        """
+        在候選集合尾端追加文本（只編碼新文本），可限制集合大小（保留最新的 max_size 筆）
+        
+        Returns:
+            新的集合版本；模型未初始化時回傳 None
+        """
+        if not self.model:
+            return None
+        texts = list(texts)
+        existing = self.candidate_sets.get(name)
+        if not existing or not existing["texts"]:
+            self.register_candidate_set(name, texts[-max_size:] if max_size else texts)
+            return self.get_candidate_set_version(name)
+        
+        new_matrix = self.encode_texts(texts) if texts else existing["matrix"][:0]
+        with self._lock:
+            all_texts = existing["texts"] + texts
+            matrix = np.vstack([existing["matrix"], new_matrix])
+            if max_size and len(all_texts) > max_size:
+                all_texts, matrix = all_texts[-max_size:], matrix[-max_size:]
+            version = self._texts_version([existing["version"]] + texts)
+            self.candidate_sets[name] = {
+                "texts": all_texts,
+                "matrix": matrix,
+                "version": version,
+                "updated_at": datetime.now().isoformat()
+            }
+        return version
+    
+    def remove_candidate_set(self, name: str):
+        """移除候選集合"""
+        with self._lock:
+            self.candidate_sets.pop(name, None)
+    
+    def get_candidate_set_version(self, name: str) -> Optional[str]:
+        """取得候選集合版本；未註冊時回傳 None"""
+        candidate_set = self.candidate_sets.get(name)
+        return candidate_set["version"] if candidate_set else None
+    
+    def score_candidate_set(self, query: str, name: str) -> Optional[np.ndarray]:
+        """
+        計算查詢與已註冊候選集合中每一筆文本的相似度（一次編碼 + 一次矩陣-向量乘法）
+        
+        Returns:
+            與集合文本同序的相似度陣列；集合不存在或模型未初始化時回傳 None
+        """
+        candidate_set = self.candidate_sets.get(name)
+        if not self.model or candidate_set is None:
+            return None
+        if not candidate_set["texts"]:
+            return np.zeros(0, dtype=np.float32)
+        
+        start_time = time.time()
+        cache_key = f"set:{name}:{candidate_set['version']}:{query}"
+        cached = self._get_cached_result(cache_key)
+        if cached is not None:
+            return np.asarray(cached, dtype=np.float32)
+        
+        try:
+            query_vector = self.encode_texts([query])[0]
+            similarities = candidate_set["matrix"] @ query_vector
+            if self.enable_cache:
+                self._cache_result(cache_key, similarities.tolist())
+            self._update_metrics(time.time() - start_time)
+            return similarities
+        except Exception as e:
+            self.metrics["error_count"] += 1
+            self.logger.error(f"候選集合相似度計算失敗: {e}")
+            return None
+    
     def match_special_case(self, user_query: str, cases: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
         """
         匹配特殊案例
@@ -149,13 +307,15 @@ class MGFDSimilarityEngine:
         if not cases:
             return None
         
-        # 提取案例查詢文本
+        # 提取案例查詢文本（記錄每個文本所屬的案例）
         case_queries = []
-        for case in cases:
+        case_owners = []
+        for case_idx, case in enumerate(cases):
             # 包含主查詢和變體查詢
             queries = [case.get("customer_query", "")]
             queries.extend(case.get("query_variants", []))
             case_queries.extend(queries)
+            case_owners.extend([case_idx] * len(queries))
         
         # 計算相似度
         similarities = self.calculate_similarity(user_query, case_queries)
@@ -166,7 +326,7 @@ class MGFDSimilarityEngine:
         
         if best_similarity >= self.thresholds["special_case_match"]:
             # 找到對應的案例
-            case_idx = best_match_idx // len(cases)
+            case_idx = case_owners[best_match_idx]
             if case_idx < len(cases):
                 matched_case = cases[case_idx].copy()
                 matched_case["similarity_score"] = float(best_similarity)
@@ -175,13 +335,15 @@ class MGFDSimilarityEngine:
         
         return None
     
-    def match_slot_synonyms(self, user_input: str, synonyms: List[str]) -> Optional[str]:
+    def match_slot_synonyms(self, user_input: str, synonyms: List[str],
+                            candidate_set: Optional[str] = None) -> Optional[str]:
         """
         匹配槽位同義詞
         
         Args:
             user_input: 用戶輸入
             synonyms: 同義詞列表
+            candidate_set: 已註冊的同義詞集合名稱（提供時直接使用預先編碼的矩陣）
             
         Returns:
             匹配的同義詞，如果沒有匹配則返回None
@@ -189,7 +351,12 @@ class MGFDSimilarityEngine:
         if not synonyms:
             return None
         
-        similarities = self.calculate_similarity(user_input, synonyms)
+        if candidate_set:
+            self.register_candidate_set(candidate_set, synonyms)
+            scores = self.score_candidate_set(user_input, candidate_set)
+            similarities = scores.tolist() if scores is not None else [0.0] * len(synonyms)
+        else:
+            similarities = self.calculate_similarity(user_input, synonyms)
         best_match_idx = np.argmax(similarities)
         best_similarity = similarities[best_match_idx]
         
@@ -256,18 +423,30 @@ class MGFDSimilarityEngine:
         return None
     
     def _generate_cache_key(self, query: str, candidates: List[str]) -> str:
-        """生成緩存鍵"""
-        content = f"{query}:{','.join(sorted(candidates))}"
-        return str(hash(content))
+        """生成緩存鍵（保留候選順序，結果與候選一一對應）"""
+        content = "\x1f".join([query] + list(candidates))
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+    
+    def _get_cached_result(self, cache_key: str) -> Optional[List[float]]:
+        """讀取緩存結果並更新 LRU 順序"""
+        if not self.enable_cache:
+            return None
+        with self._lock:
+            result = self.cache.get(cache_key)
+            if result is None:
+                return None
+            self.cache.move_to_end(cache_key)
+            self.metrics["cache_hits"] += 1
+        self.logger.debug("使用緩存的相似度結果")
+        return result
     
     def _cache_result(self, cache_key: str, result: List[float]):
-        """緩存結果"""
-        if len(self.cache) >= self.cache_size:
-            # 簡單的LRU緩存：移除最舊的項目
-            oldest_key = next(iter(self.cache))
-            del self.cache[oldest_key]
-        
-        self.cache[cache_key] = result
+        """緩存結果（LRU：超過上限時移除最久未使用的項目）"""
+        with self._lock:
+            self.cache[cache_key] = result
+            self.cache.move_to_end(cache_key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
     
     def _update_metrics(self, response_time: float):
         """更新性能指標"""
@@ -291,12 +470,19 @@ class MGFDSimilarityEngine:
             **self.metrics,
             "cache_hit_rate": cache_hit_rate,
             "cache_size": len(self.cache),
+            "embedding_cache_size": len(self._embedding_cache),
+            "candidate_sets": {
+                name: {"size": len(info["texts"]), "version": info["version"]}
+                for name, info in self.candidate_sets.items()
+            },
             "model_loaded": self.model is not None
         }
     
     def clear_cache(self):
-        """清理緩存"""
-        self.cache.clear()
+        """清理緩存（已註冊的候選集合不受影響）"""
+        with self._lock:
+            self.cache.clear()
+            self._embedding_cache.clear()
         self.logger.info("相似度引擎緩存已清理")
     
     def update_thresholds(self, new_thresholds: Dict[str, float]):
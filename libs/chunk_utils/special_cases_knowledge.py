@@ -10,36 +10,44 @@ import logging
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 from .similarity_engine import MGFDSimilarityEngine
 
+# 已註冊的候選集合名稱
+SPECIAL_CASES_SET = "special_cases"
+LOOP_HISTORY_SET_PREFIX = "loop_history:"
+MAX_LOOP_HISTORY = 50
+
 class SpecialCasesKnowledgeBase:
     """特殊案例知識庫類別"""
     
-    def __init__(self, knowledge_file_path: str = "libs/mgfd_cursor/humandata/special_cases_knowledge.json"):
+    def __init__(self, knowledge_file_path: str = "libs/mgfd_cursor/humandata/special_cases_knowledge.json",
+                 similarity_engine: Optional[MGFDSimilarityEngine] = None):
         """
         初始化特殊案例知識庫
         
         Args:
             knowledge_file_path: 知識庫JSON檔案路径
+            similarity_engine: 共用的相似度引擎（未提供時自行建立）
         """
         self.knowledge_file_path = Path(knowledge_file_path)
         self.knowledge_data = {}
         self.embedding_model = None
-        self.cached_embeddings = {}
         self.loop_detection_history = {}
         self.logger = logging.getLogger(__name__)
+        self.similarity_engine = similarity_engine
         
-        # 初始化新的相似度引擎
-        self.similarity_engine = MGFDSimilarityEngine()
+        # 案例文本 → 案例的對應（與已註冊的 special_cases 矩陣同序）
+        self._case_refs: List[Tuple[str, int]] = []
+        self._case_text_owner = np.zeros(0, dtype=np.int64)
+        self._case_text_is_main = np.zeros(0, dtype=bool)
         
         # 載入知識庫
         self._load_knowledge_base()
         
-        # 初始化嵌入模型
+        # 初始化嵌入模型（與相似度引擎共用）並預先編碼所有案例
         self._initialize_embedding_model()
+        self._register_case_embeddings()
     
     def _load_knowledge_base(self):
         """載入知識庫數據"""
@@ -56,18 +64,71 @@ class SpecialCasesKnowledgeBase:
             self.knowledge_data = {"categories": {}, "similarity_matching": {}, "loop_prevention": {}}
     
     def _initialize_embedding_model(self):
-        """初始化文本嵌入模型"""
+        """初始化文本嵌入模型（由相似度引擎載入，避免重複載入同一模型）"""
         try:
             model_name = self.knowledge_data.get("similarity_matching", {}).get(
                 "embedding_model", 
                 "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
             )
-            self.embedding_model = SentenceTransformer(model_name)
-            self.logger.info(f"成功初始化嵌入模型: {model_name}")
+            if self.similarity_engine is None or self.similarity_engine.model_name != model_name:
+                self.similarity_engine = MGFDSimilarityEngine(model_name=model_name)
+            self.embedding_model = self.similarity_engine.model
+            if self.embedding_model:
+                self.logger.info(f"成功初始化嵌入模型: {model_name}")
         except Exception as e:
             self.logger.error(f"初始化嵌入模型失敗: {e}")
             self.embedding_model = None
     
+    def _register_case_embeddings(self):
+        """將所有案例的主查詢與變體查詢編碼為單一矩陣（內容變動時版本隨之改變）"""
+        case_refs, texts, owners, is_main = [], [], [], []
+        for category_name, category_data in self.knowledge_data.get("categories", {}).items():
+            for case_idx, case in enumerate(category_data.get("cases", [])):
+                owner = len(case_refs)
+                case_refs.append((category_name, case_idx))
+                variants = case.get("query_variants", [])
+                texts.append(case.get("customer_query", ""))
+                texts.extend(variants)
+                owners.extend([owner] * (1 + len(variants)))
+                is_main.extend([True] + [False] * len(variants))
+        
+        self._case_refs = case_refs
+        self._case_text_owner = np.asarray(owners, dtype=np.int64)
+        self._case_text_is_main = np.asarray(is_main, dtype=bool)
+        if self.similarity_engine is None:
+            return
+        if self.embedding_model and texts:
+            self.similarity_engine.register_candidate_set(SPECIAL_CASES_SET, texts)
+        else:
+            self.similarity_engine.remove_candidate_set(SPECIAL_CASES_SET)
+    
+    def _score_all_cases(self, query: str) -> Optional[np.ndarray]:
+        """
+        一次計算查詢與所有案例的加權相似度（主查詢與最佳變體加權）
+        
+        Returns:
+            與 self._case_refs 同序的分數陣列；無法使用預先編碼的矩陣時回傳 None
+        """
+        if self.similarity_engine is None:
+            return None
+        similarities = self.similarity_engine.score_candidate_set(query, SPECIAL_CASES_SET)
+        if similarities is None or len(similarities) != len(self._case_text_owner):
+            return None
+        
+        weights = self.knowledge_data.get("similarity_matching", {}).get("similarity_weights", {
+            "main_query": 0.7, "variants": 0.3
+        })
+        n_cases = len(self._case_refs)
+        is_main = self._case_text_is_main
+        
+        main_scores = np.zeros(n_cases, dtype=np.float64)
+        main_scores[self._case_text_owner[is_main]] = similarities[is_main]
+        variant_scores = np.full(n_cases, -np.inf)
+        np.maximum.at(variant_scores, self._case_text_owner[~is_main], similarities[~is_main])
+        variant_scores[np.isinf(variant_scores)] = 0.0
+        
+        return main_scores * weights.get("main_query", 0.7) + variant_scores * weights.get("variants", 0.3)
+    
     def find_matching_case(self, query: str, session_id: str = None) -> Optional[Dict[str, Any]]:
         """
         尋找匹配的特殊案例
@@ -87,22 +148,35 @@ class SpecialCasesKnowledgeBase:
             best_match = None
             best_similarity = 0.0
             primary_threshold = self.knowledge_data.get("similarity_matching", {}).get("primary_threshold", 0.75)
-            
-            # 遍歷所有類別尋找匹配
             categories = self.knowledge_data.get("categories", {})
-            for category_name, category_data in categories.items():
-                cases = category_data.get("cases", [])
-                
-                for case in cases:
-                    similarity = self._calculate_case_similarity(query, case)
+            
+            # 預先編碼的案例矩陣：一次編碼查詢 + 一次矩陣-向量乘法
+            case_scores = self._score_all_cases(query) if self._case_refs else None
+            if case_scores is not None:
+                best_idx = int(np.argmax(case_scores))
+                best_similarity = float(case_scores[best_idx])
+                if best_similarity >= primary_threshold and best_similarity > 0.0:
+                    category_name, case_idx = self._case_refs[best_idx]
+                    best_match = {
+                        **categories[category_name]["cases"][case_idx],
+                        "matched_category": category_name,
+                        "similarity_score": best_similarity
+                    }
+            else:
+                # 遍歷所有類別尋找匹配（模型不可用時的備用路徑）
+                for category_name, category_data in categories.items():
+                    cases = category_data.get("cases", [])
                     
-                    if similarity > best_similarity and similarity >= primary_threshold:
-                        best_similarity = similarity
-                        best_match = {
-                            **case,
-                            "matched_category": category_name,
-                            "similarity_score": similarity
-                        }
+                    for case in cases:
+                        similarity = self._calculate_case_similarity(query, case)
+                        
+                        if similarity > best_similarity and similarity >= primary_threshold:
+                            best_similarity = similarity
+                            best_match = {
+                                **case,
+                                "matched_category": category_name,
+                                "similarity_score": similarity
+                            }
             
             # 如果找到匹配，記錄使用統計
             if best_match:
@@ -134,6 +208,8 @@ class SpecialCasesKnowledgeBase:
             
             if not comparison_texts:
                 return 0.0
+            if self.similarity_engine is None:
+                return self._fallback_similarity_calculation(query, case)
             
             similarities = self.similarity_engine.calculate_similarity(query, comparison_texts)
             
@@ -157,14 +233,11 @@ class SpecialCasesKnowledgeBase:
             self.logger.error(f"計算相似度失敗: {e}")
             return self._fallback_similarity_calculation(query, case)
     
-    def _get_or_compute_embedding(self, text: str) -> np.ndarray:
-        """獲取或計算文本嵌入向量"""
-        if text in self.cached_embeddings:
-            return self.cached_embeddings[text]
-        
-        embedding = self.embedding_model.encode(text)
-        self.cached_embeddings[text] = embedding
-        return embedding
+    def _get_or_compute_embedding(self, text: str) -> Optional[np.ndarray]:
+        """獲取或計算文本嵌入向量（正規化，使用相似度引擎的有界緩存）；無相似度引擎時回傳 None"""
+        if self.similarity_engine is None:
+            return None
+        return self.similarity_engine.encode_texts([text])[0]
     
     def _fallback_similarity_calculation(self, query: str, case: Dict[str, Any]) -> float:
         """備用相似度計算（基於關鍵字匹配）"""
@@ -205,11 +278,23 @@ class SpecialCasesKnowledgeBase:
             # 檢查最近的查詢歷史
             recent_queries = history[-detection_window:] if len(history) >= detection_window else history
             
-            # 計算相似查詢的數量
-            similar_count = 0
-            for historical_query in recent_queries:
-                if self._queries_are_similar(query, historical_query.get("query", "")):
-                    similar_count += 1
+            # 計算相似查詢的數量：歷史查詢已預先編碼，只需編碼當前查詢
+            similarities = None
+            if self.embedding_model and query:
+                similarities = self.similarity_engine.score_candidate_set(
+                    query, f"{LOOP_HISTORY_SET_PREFIX}{session_id}"
+                )
+            if similarities is not None and len(similarities) == len(history):
+                recent_similarities = similarities[-len(recent_queries):] if recent_queries else similarities[:0]
+                similar_count = sum(
+                    1 for entry, similarity in zip(recent_queries, recent_similarities)
+                    if entry.get("query") and similarity >= 0.8
+                )
+            else:
+                similar_count = 0
+                for historical_query in recent_queries:
+                    if self._queries_are_similar(query, historical_query.get("query", "")):
+                        similar_count += 1
             
             return similar_count >= max_repeats
             
@@ -226,8 +311,8 @@ class SpecialCasesKnowledgeBase:
             try:
                 emb1 = self._get_or_compute_embedding(query1)
                 emb2 = self._get_or_compute_embedding(query2)
-                similarity = float(cosine_similarity([emb1], [emb2])[0][0])
-                return similarity >= threshold
+                if emb1 is not None and emb2 is not None:
+                    return float(np.dot(emb1, emb2)) >= threshold
             except:
                 pass
         
@@ -293,9 +378,15 @@ class SpecialCasesKnowledgeBase:
         self.loop_detection_history[session_id].append(history_entry)
         
         # 保持歷史記錄在合理範圍內
-        max_history = 50
+        max_history = MAX_LOOP_HISTORY
         if len(self.loop_detection_history[session_id]) > max_history:
             self.loop_detection_history[session_id] = self.loop_detection_history[session_id][-max_history:]
+        
+        # 歷史查詢追加到該會話的候選集合（只編碼新查詢）
+        if self.embedding_model:
+            self.similarity_engine.append_to_candidate_set(
+                f"{LOOP_HISTORY_SET_PREFIX}{session_id}", [query], max_size=max_history
+            )
     
     def _record_case_usage(self, case: Dict[str, Any]):
         """記錄案例使用統計"""
@@ -404,8 +495,9 @@ class SpecialCasesKnowledgeBase:
             categories[category]["cases"].append(case_data)
             categories[category]["total_cases"] = len(categories[category]["cases"])
             
-            # 保存知識庫
+            # 保存知識庫並重新註冊案例矩陣（版本隨內容改變）
             self._save_knowledge_base()
+            self._register_case_embeddings()
             
             self.logger.info(f"成功添加新案例: {case_data['case_id']}")
             return True
@@ -468,7 +560,12 @@ class SpecialCasesKnowledgeBase:
         """清除循環檢測歷史"""
         if session_id:
             self.loop_detection_history.pop(session_id, None)
+            if self.similarity_engine is not None:
+                self.similarity_engine.remove_candidate_set(f"{LOOP_HISTORY_SET_PREFIX}{session_id}")
         else:
+            if self.similarity_engine is not None:
+                for history_session_id in self.loop_detection_history:
+                    self.similarity_engine.remove_candidate_set(f"{LOOP_HISTORY_SET_PREFIX}{history_session_id}")
             self.loop_detection_history.clear()
         
         self.logger.info(f"清除循環歷史: {'所有會話' if not session_id else session_id}")
\ No newline at end of file
@@ -7,6 +7,7 @@ from ...RAG.DB.DuckDBQuery import DuckDBQuery
 from ...RAG.LLM.LLMInitializer import LLMInitializer
 from .multichat import MultichatManager, ChatTemplateManager
 from .multichat.funnel_manager import FunnelConversationManager, FunnelQueryType, FunnelFlowType
+from ...KnowledgeManageHandler.catalog_entity_detector import CatalogDetectorProvider
 import logging
 import re
 from typing import Dict, Any
@@ -20,10 +21,11 @@ AVAILABLE_MODELNAMES = []
 def _get_available_modelnames_from_db():
     """從數據庫動態獲取可用的modelname"""
     try:
-        from config import DB_PATH
-        import duckdb
+        from config import DB_PATH, COLUMNAR_SNAPSHOT_DIR
+        from ...KnowledgeManageHandler.columnar_snapshot import connect_catalog
         
-        conn = duckdb.connect(str(DB_PATH))
+        # 有欄式快照時只掃描 modelname 欄，不開啟資料庫檔案
+        conn = connect_catalog(DB_PATH, COLUMNAR_SNAPSHOT_DIR)
         # 排除測試資料和空值，只獲取有效的modelname
         result = conn.execute("""
             SELECT DISTINCT modelname 
@@ -56,10 +58,10 @@ AVAILABLE_MODELTYPES = []
 def _get_available_modeltypes_from_db():
     """從數據庫動態獲取可用的modeltype"""
     try:
-        from config import DB_PATH
-        import duckdb
+        from config import DB_PATH, COLUMNAR_SNAPSHOT_DIR
+        from ...KnowledgeManageHandler.columnar_snapshot import connect_catalog
         
-        conn = duckdb.connect(str(DB_PATH))
+        conn = connect_catalog(DB_PATH, COLUMNAR_SNAPSHOT_DIR)
         result = conn.execute('SELECT DISTINCT modeltype FROM nbtypes ORDER BY modeltype').fetchall()
         conn.close()
         
@@ -74,6 +76,16 @@ def _get_available_modeltypes_from_db():
 # 初始化時從數據庫獲取可用的modeltype
 AVAILABLE_MODELTYPES = _get_available_modeltypes_from_db()
 
+def _build_catalog_detector_provider():
+    """建立產品目錄實體偵測器（數據庫重新匯入時自動重建；無法讀取時以上方清單建立）"""
+    from config import DB_PATH
+
+    fallback_rows = [(None, name) for name in AVAILABLE_MODELNAMES] + [(t, None) for t in AVAILABLE_MODELTYPES]
+    return CatalogDetectorProvider(DB_PATH, fallback_rows=fallback_rows)
+
+# 全域變數：modelname / modeltype 偵測共用的 Aho-Corasick 自動機
+CATALOG_DETECTOR = _build_catalog_detector_provider()
+
 '''
 [
     'modeltype', 'version', 'modelname', 'mainboard', 'devtime',
@@ -94,8 +106,8 @@ class SalesAssistantService(BaseService):
         self.milvus_query = MilvusQuery(collection_name="sales_notebook_specs")
         
         # 使用config中的DB_PATH確保路徑正確
-        from config import DB_PATH
-        self.duckdb_query = DuckDBQuery(db_file=str(DB_PATH))
+        from config import DB_PATH, COLUMNAR_SNAPSHOT_DIR
+        self.duckdb_query = DuckDBQuery(db_file=str(DB_PATH), snapshot_dir=str(COLUMNAR_SNAPSHOT_DIR))
         
         self.prompt_template = self._load_prompt_template("sales_rag_app/libs/services/sales_assistant/prompts/sales_prompt.txt")
         
@@ -847,25 +859,11 @@ class SalesAssistantService(BaseService):
         返回: (是否包含modelname, 找到的modelname列表)
         """
         found_modelnames = []
-        query_lower = query.lower()
-        
-        # 改进：使用更严格的匹配逻辑
-        for modelname in AVAILABLE_MODELNAMES:
-            modelname_lower = modelname.lower()
-            # 使用单词边界匹配，避免部分匹配
-            if re.search(r'\b' + re.escape(modelname_lower) + r'\b', query_lower):
-                found_modelnames.append(modelname)
         
-        # 如果没有找到完全匹配，检查是否有相似的模型名称
-        if not found_modelnames:
-            # 提取查询中可能的模型名称模式
-            potential_models = re.findall(r'[A-Z]{2,3}\d{3}(?:-[A-Z]+)?(?::\s*[A-Z]+\d+)?', query)
-            logging.info(f"查询中发现的潜在模型名称: {potential_models}")
-            
-            # 检查这些潜在模型是否在可用列表中
-            for potential_model in potential_models:
-                if potential_model in AVAILABLE_MODELNAMES:
-                    found_modelnames.append(potential_model)
+        # 單次掃描目錄自動機（完整名稱與正規化別名，如 APX819、AB819-S）
+        detector = CATALOG_DETECTOR.get()
+        if detector is not None:
+            found_modelnames = detector.detect(query)["modelnames"]
         
         logging.info(f"查询验证结果 - 查询: '{query}', 找到的模型名称: {found_modelnames}")
         return len(found_modelnames) > 0, found_modelnames
@@ -876,12 +874,11 @@ class SalesAssistantService(BaseService):
         返回: (是否包含modeltype, 找到的modeltype列表)
         """
         found_modeltypes = []
-        query_lower = query.lower()
         
-        # 檢查數據庫中存在的modeltype
-        for modeltype in AVAILABLE_MODELTYPES:
-            if modeltype.lower() in query_lower:
-                found_modeltypes.append(modeltype)
+        # 檢查數據庫中存在的modeltype（直接提及，或由提及的modelname推得）
+        detector = CATALOG_DETECTOR.get()
+        if detector is not None:
+            found_modeltypes = detector.detect(query)["modeltypes"]
         
         # 如果沒有找到匹配，檢查是否查詢了不存在的數字系列
         if not found_modeltypes:
@@ -3045,8 +3042,11 @@ Focus your analysis on the specific intent and target models identified above.
                 # 目前先使用基本查詢獲取所有筆電數據
                 logging.info("開始查詢筆電規格數據")
                 
+                # 優化數據傳輸：只選擇核心規格欄位，減少數據大小（欄式快照只讀取這些欄位）
+                core_fields = ['modeltype', 'modelname', 'cpu', 'gpu', 'memory', 'storage', 'lcd', 'battery']
+                
                 # 使用正確的SQL查詢方法
-                full_specs_records = self.duckdb_query.query("SELECT * FROM nbtypes")
+                full_specs_records = self.duckdb_query.query(f"SELECT {', '.join(core_fields)} FROM nbtypes")
                 
                 if not full_specs_records:
                     logging.warning("未查詢到任何筆電數據")
@@ -3056,12 +3056,9 @@ Focus your analysis on the specific intent and target models identified above.
                     }
                 
                 # 轉換為字典格式
-                full_context_list = [dict(zip(self.spec_fields, record)) for record in full_specs_records]
+                full_context_list = [dict(zip(core_fields, record)) for record in full_specs_records]
                 logging.info(f"成功查詢到 {len(full_context_list)} 筆筆電數據")
                 
-                # 優化數據傳輸：只選擇核心規格欄位，減少數據大小
-                core_fields = ['modeltype', 'modelname', 'cpu', 'gpu', 'memory', 'storage', 'lcd', 'battery']
-                
                 # 過濾並簡化數據
                 filtered_laptops = []
                 for laptop in full_context_list:
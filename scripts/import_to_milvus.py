@@ -6,6 +6,7 @@
 """
 
 import os
+import sys
 import csv
 import logging
 import pandas as pd
@@ -17,6 +18,12 @@ from sentence_transformers import SentenceTransformer
 # 導入chunking引擎
 from parent_child_chunking import NotebookParentChildChunker
 
+# 添加專案根目錄到路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from libs.KnowledgeManageHandler.embedding_store import get_embedding_store
+
 # 設定日誌
 logging.basicConfig(
     level=logging.INFO,
@@ -43,6 +50,7 @@ class MilvusNotebookImporter:
         self.connection = None
         self.collection = None
         self.embedding_model = None
+        self.embedding_store = None
         self.chunker = NotebookParentChildChunker()
         
         # 統計資訊
@@ -115,6 +123,7 @@ class MilvusNotebookImporter:
         try:
             logger.info(f"載入embedding模型: {EMBEDDING_MODEL}")
             self.embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+            self.embedding_store = get_embedding_store(EMBEDDING_MODEL)
             logger.info("✅ Embedding模型載入完成")
             return True
         except Exception as e:
@@ -140,6 +149,23 @@ class MilvusNotebookImporter:
             logger.error(f"生成embedding失敗: {e}")
             return [0.0] * DIMENSION
     
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """批次生成embedding；已存在於嵌入向量庫的文字不重新編碼"""
+        cleaned_texts = [text.strip() for text in texts]
+        to_encode = [text for text in cleaned_texts if text]
+        if not to_encode:
+            return [[0.0] * DIMENSION for _ in cleaned_texts]
+        try:
+            if self.embedding_store is not None:
+                vectors = self.embedding_store.get_or_encode(to_encode, self.embedding_model.encode)
+            else:
+                vectors = self.embedding_model.encode(to_encode)
+        except Exception as e:
+            logger.error(f"批次生成embedding失敗: {e}")
+            return [self.generate_embedding(text) for text in cleaned_texts]
+        encoded = iter(vector.tolist() for vector in vectors)
+        return [next(encoded) if text else [0.0] * DIMENSION for text in cleaned_texts]
+    
     def process_csv_file(self, csv_file: Path) -> List[Dict[str, Any]]:
         """處理單個CSV檔案"""
         try:
@@ -169,6 +195,13 @@ class MilvusNotebookImporter:
             # 使用chunking引擎建立chunks
             parent_chunks, child_chunks = self.chunker.batch_create_chunks(products)
             
+            child_chunks = [chunk for chunk in child_chunks if chunk and chunk.get('content')]
+            
+            # 一次批次生成所有chunks的embedding
+            embeddings = iter(self.generate_embeddings(
+                [chunk['content'] for chunk in parent_chunks] + [chunk['content'] for chunk in child_chunks]
+            ))
+            
             all_chunks = []
             chunk_id_counter = 0
             
@@ -176,8 +209,7 @@ class MilvusNotebookImporter:
             for parent_chunk in parent_chunks:
                 chunk_id_counter += 1
                 
-                # 生成embedding
-                embedding = self.generate_embedding(parent_chunk['content'])
+                embedding = next(embeddings)
                 
                 # 準備Milvus插入資料
                 milvus_chunk = {
@@ -201,8 +233,7 @@ class MilvusNotebookImporter:
                 
                 chunk_id_counter += 1
                 
-                # 生成embedding
-                embedding = self.generate_embedding(child_chunk['content'])
+                embedding = next(embeddings)
                 
                 # 準備Milvus插入資料
                 milvus_chunk = {
@@ -222,6 +253,9 @@ class MilvusNotebookImporter:
             self.stats['total_chunks'] = len(all_chunks)
             logger.info(f"成功建立 {len(all_chunks)} 個chunks")
             
+            if self.embedding_store is not None:
+                self.embedding_store.set_references(f"import_to_milvus.{COLLECTION_NAME}", [c['chunk_text'].strip() for c in all_chunks])
+            
             return all_chunks
             
         except Exception as e:
@@ -0,0 +1,109 @@
+# tools/benchmark_keyword_matcher.py
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+關鍵詞比對微基準測試
+比較舊版 parse_keyword 的逐槽位迴圈與編譯後的 KeywordSlotMatcher，
+並以放大後的關鍵詞集合模擬關鍵詞數量成長的情況。
+
+用法：
+    python tools/benchmark_keyword_matcher.py --rounds 2000 --scale 10
+"""
+
+import sys
+import json
+import re
+import argparse
+import tempfile
+import timeit
+from pathlib import Path
+
+# 添加專案根目錄到路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from libs.UserInputHandler.keyword_matcher import KeywordSlotMatcher, DEFAULT_KEYWORDS_PATH
+
+SAMPLE_MESSAGES = [
+    "請推薦一台適合玩遊戲的筆電，預算三萬以內",
+    "958的CPU與819的CPU差異？",
+    "我想要輕薄好攜帶、電池續航久的機種",
+    "有沒有觸控螢幕而且散熱好的型號",
+    "今天天氣真好",
+]
+
+
+def legacy_parse_keyword(keywords_data, text):
+    """舊版 parse_keyword：每次排序、逐槽位執行未編譯的正則，再逐一檢查鍵名與同義詞"""
+    sorted_slots = sorted(
+        keywords_data.items(),
+        key=lambda x: x[1].get("metadata", {}).get("importance", 0),
+        reverse=True
+    )
+    for slot_name, slot_data in sorted_slots:
+        pattern = slot_data.get("metadata", {}).get("regex")
+        if pattern and re.search(pattern, text):
+            return slot_name
+    for slot_name in keywords_data:
+        if slot_name and slot_name in text:
+            return slot_name
+    for slot_name, slot_data in keywords_data.items():
+        for syn in slot_data.get("synonyms", []):
+            if syn.strip() and syn.strip() in text:
+                return slot_name
+    return ""
+
+
+def scale_keywords(keywords_data, scale):
+    """複製槽位以模擬更大的關鍵詞集合（複本使用不會命中的關鍵詞）"""
+    scaled = dict(keywords_data)
+    for copy_index in range(1, scale):
+        for slot_name, slot_data in keywords_data.items():
+            suffix = f"#{copy_index}"
+            synonyms = [syn + suffix for syn in slot_data.get("synonyms", [])]
+            metadata = dict(slot_data.get("metadata", {}))
+            metadata["regex"] = "(" + "|".join(synonyms) + ")" if synonyms else ""
+            scaled[slot_name + suffix] = {"synonyms": synonyms, "metadata": metadata}
+    return scaled
+
+
+def run(rounds, scale):
+    with open(DEFAULT_KEYWORDS_PATH, 'r', encoding='utf-8') as f:
+        keywords_data = scale_keywords(json.load(f), scale)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "keywords.json"
+        path.write_text(json.dumps(keywords_data, ensure_ascii=False), encoding='utf-8')
+        matcher = KeywordSlotMatcher(path)
+
+        for message in SAMPLE_MESSAGES:
+            matches = matcher.match(message)
+            compiled_first = matches[0]["slot"] if matches else ""
+            legacy_first = legacy_parse_keyword(keywords_data, message)
+            flag = "✅" if compiled_first == legacy_first else "⚠️"
+            print(f"{flag} {message} → {compiled_first or '(無)'}，共命中 {len(matches)} 個槽位")
+
+        legacy = timeit.timeit(
+            lambda: [legacy_parse_keyword(keywords_data, m) for m in SAMPLE_MESSAGES], number=rounds
+        )
+        compiled = timeit.timeit(
+            lambda: [matcher.match(m) for m in SAMPLE_MESSAGES], number=rounds
+        )
+
+    calls = rounds * len(SAMPLE_MESSAGES)
+    print(f"\n槽位數: {len(keywords_data)}（放大 {scale} 倍），呼叫次數: {calls}")
+    print(f"舊版逐槽位比對: {legacy / calls * 1e6:8.1f} µs/次")
+    print(f"編譯後單次掃描: {compiled / calls * 1e6:8.1f} µs/次")
+    print(f"加速: {legacy / compiled:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="關鍵詞比對微基準測試")
+    parser.add_argument("--rounds", type=int, default=1000, help="每則訊息重複次數")
+    parser.add_argument("--scale", type=int, default=1, help="關鍵詞集合放大倍數")
+    args = parser.parse_args()
+    run(args.rounds, max(args.scale, 1))
+
+
+if __name__ == "__main__":
+    main()
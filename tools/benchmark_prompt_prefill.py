@@ -0,0 +1,123 @@
+# tools/benchmark_prompt_prefill.py
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+提示詞 prefill 基準測試
+比較舊版回答提示詞（變動區段在前、輸出格式在後）與新版靜態前綴在前的版面，
+在 Ollama 上實際送出請求（num_predict=1），統計每次需重新計算的 prompt token 數與 prefill 時間；
+另外測量實體解析提示詞在不同查詢間的前綴重用情形。
+
+用法：
+    python tools/benchmark_prompt_prefill.py --model gpt-oss:20b --rounds 3
+需要本機 Ollama 服務（預設 http://localhost:11434，可用 OLLAMA_HOST 覆寫）。
+"""
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+
+import requests
+
+# 添加專案根目錄到路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import config
+from libs.MGFDKernel import SYS_PROMPT_TEMPLATE
+from libs.UserInputHandler.UserInputHandler import ENTITY_PARSING_PROMPT_PREFIX
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434").rstrip("/")
+
+# 舊版版面：查詢設定、產品資料、客戶需求在前，輸出格式在最後
+LEGACY_SYS_PROMPT_TEMPLATE = """你是專業的筆電銷售顧問。根據以下產品資料回答客戶問題：
+
+        # **查詢設定**
+        {query_rules}
+
+        #**產品資料：**
+        {product_data}
+
+        #**客戶需求：**
+        {user_query}
+
+
+
+
+# **輸出格式：**
+# 1.簡潔的 Markdown 格式，包含產品推薦和規格表格。
+# 2.嚴格禁止輸出單純的JSON格式。
+# """
+
+SAMPLE_REQUESTS = [
+    ("請比較 819 與 958 的 CPU", ["819", "958"], ["cpu"], "compare"),
+    ("推薦輕薄、續航久的筆電", [], ["battery", "structconfig"], "recommend"),
+    ("839 的螢幕規格是什麼？", ["839"], ["lcd"], "spec_check"),
+    ("哪一台散熱比較好？", [], ["thermal"], "compare"),
+]
+
+
+def render(template, query, entities, attributes, intent):
+    query_rules = json.dumps({
+        "intent": intent, "entities": entities, "attributes": attributes,
+        "NB_NUM": "limit", "language": "zh-TW"
+    }, ensure_ascii=False)
+    product_data = json.dumps({
+        "products": [{"modeltype": e or "000", "modelname": f"AB{e or '000'}", "cpu_summary": "AMD Ryzen"} for e in entities or [""]]
+    }, ensure_ascii=False, separators=(",", ":"))
+    result = template.replace("{query_rules}", query_rules)
+    result = result.replace("{user_query}", query)
+    return result.replace("{product_data}", product_data)
+
+
+def prefill(model, prompt, keep_alive):
+    response = requests.post(f"{OLLAMA_HOST}/api/generate", json={
+        "model": model,
+        "prompt": prompt,
+        "stream": False,
+        "keep_alive": keep_alive,
+        "options": {"num_predict": 1},
+    }, timeout=600)
+    response.raise_for_status()
+    data = response.json()
+    return data.get("prompt_eval_count", 0), data.get("prompt_eval_duration", 0) / 1e6
+
+
+def run_layout(name, model, prompts, rounds, keep_alive):
+    # 先送一次讓模型載入並建立前綴快取，之後才計時
+    prefill(model, prompts[0], keep_alive)
+    tokens, millis = [], []
+    for _ in range(rounds):
+        for prompt in prompts:
+            count, duration = prefill(model, prompt, keep_alive)
+            tokens.append(count)
+            millis.append(duration)
+    print(f"{name:<24} 平均重新計算 {sum(tokens) / len(tokens):8.1f} tokens，prefill {sum(millis) / len(millis):8.1f} ms")
+    return sum(millis) / len(millis)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提示詞 prefill 基準測試")
+    parser.add_argument("--model", default=config.LLM_DEFAULT_MODEL, help="回答用模型")
+    parser.add_argument("--parse-model", default=config.LLM_STRUCTURED_MODEL, help="實體解析用模型")
+    parser.add_argument("--rounds", type=int, default=3, help="每組請求重複次數")
+    parser.add_argument("--keep-alive", default=config.LLM_KEEP_ALIVE, help="Ollama keep_alive")
+    args = parser.parse_args()
+
+    legacy = [render(LEGACY_SYS_PROMPT_TEMPLATE, *req) for req in SAMPLE_REQUESTS]
+    current = [render(SYS_PROMPT_TEMPLATE, *req) for req in SAMPLE_REQUESTS]
+
+    print(f"回答提示詞（{args.model}）")
+    legacy_ms = run_layout("舊版（變動區段在前）", args.model, legacy, args.rounds, args.keep_alive)
+    current_ms = run_layout("新版（靜態前綴在前）", args.model, current, args.rounds, args.keep_alive)
+    if current_ms:
+        print(f"prefill 加速: {legacy_ms / current_ms:.2f}x")
+
+    print(f"\n實體解析提示詞（{args.parse_model}）")
+    parse_prompts = [f"{ENTITY_PARSING_PROMPT_PREFIX}\n{req[0]}" for req in SAMPLE_REQUESTS]
+    run_layout("靜態前綴 + 查詢", args.parse_model, parse_prompts, args.rounds, args.keep_alive)
+
+
+if __name__ == "__main__":
+    main()
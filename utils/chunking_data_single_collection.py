@@ -6,8 +6,11 @@
 Loads data from DuckDB, creates semantic chunks, and stores chunks in Milvus collection.
 """
 
+import argparse
+import json
 import logging
 import duckdb
+import random
 import sys
 import time
 
@@ -15,6 +18,21 @@ from pymilvus import connections, utility, FieldSchema, CollectionSchema, DataTy
 from pymilvus.exceptions import MilvusException
 sys.path.append("../")
 from libs.chunk_utils.chunking.semantic_chunking.semantic_chunking_engine import SemanticChunkingEngine
+from libs.chunk_utils.chunking.chunk_dedup import ChunkDeduplicator, remap_parent_ids, chunk_product_ids
+from libs.KnowledgeManageHandler.scalar_filters import extract_scalar_facets, dedup_partition_key, FACET_FIELDS
+from libs.KnowledgeManageHandler.chunk_content_store import (
+    write_chunk_contents, upsert_chunk_contents, delete_chunk_contents
+)
+from libs.KnowledgeManageHandler.embedding_store import get_embedding_store
+from libs.KnowledgeManageHandler.ingest_manifest import (
+    IngestManifest, default_manifest_path, product_key, chunk_content_hash
+)
+from libs.KnowledgeManageHandler.index_release import (
+    new_index_version, versioned_db_path, versioned_collection_name, read_active_index,
+    copy_duckdb_database, verify_duckdb_version, verify_collection_version,
+    release_index_version, rollback_index_version, DEFAULT_MIN_ROW_RATIO, DEFAULT_MIN_RECALL
+)
+from libs.KnowledgeManageHandler.columnar_snapshot import export_snapshot, activate_snapshot
 import config
 # --- Configuration ---
 DUCKDB_FILE = config.DB_PATH#"../db/all_nbinfo_v5.db"
@@ -22,6 +40,19 @@ MILVUS_COLLECTION_NAME = config.MILVUS_COLLECTION_NAME#"semantic_nb_250926_utf8_
 MILVUS_HOST = "localhost"
 MILVUS_PORT = "19530"
 EMBEDDING_DIM = 384  # Based on the paraphrase-multilingual-MiniLM-L12-v2 model
+# Content-hash manifest next to the DuckDB file, used by --incremental
+MANIFEST_PATH = default_manifest_path(DUCKDB_FILE, MILVUS_COLLECTION_NAME)
+# Consumer name for references in the shared embedding store
+EMBEDDING_STORE_CONSUMER = f"chunking_single_collection.{MILVUS_COLLECTION_NAME}"
+# Blue/green rebuild: versioned builds are verified, then the alias and DuckDB pointer are switched
+ACTIVE_INDEX_PATH = config.ACTIVE_INDEX_PATH
+INDEX_VERSIONS_DIR = config.INDEX_VERSIONS_DIR
+INDEX_KEEP_VERSIONS = config.INDEX_KEEP_VERSIONS
+# Columnar (Parquet/Arrow) snapshot of the released catalog, read lazily by the services
+SNAPSHOT_DIR = config.COLUMNAR_SNAPSHOT_DIR
+# Chunks sampled for the self-recall check and queries used to warm and smoke-test a new version
+RECALL_SAMPLE_SIZE = 50
+SAMPLE_QUERIES = ["輕薄筆電 長續航", "高效能遊戲筆電 獨立顯卡", "商務筆電 重量", "大螢幕 高解析度"]
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -87,26 +118,30 @@ def connect_to_milvus():
         logging.error(f"Failed to establish Milvus connection after retries: {e}")
         raise
 
-def setup_milvus_collection():
+def setup_milvus_collection(collection_name=MILVUS_COLLECTION_NAME):
     """Drops the collection if it exists, then creates a new one with robust error handling."""
     def _drop_collection():
-        if utility.has_collection(MILVUS_COLLECTION_NAME):
-            logging.warning(f"Collection '{MILVUS_COLLECTION_NAME}' exists. Dropping it.")
-            utility.drop_collection(MILVUS_COLLECTION_NAME)
-            wait_for_collection_drop(MILVUS_COLLECTION_NAME)
+        if utility.has_collection(collection_name):
+            logging.warning(f"Collection '{collection_name}' exists. Dropping it.")
+            utility.drop_collection(collection_name)
+            wait_for_collection_drop(collection_name)
         return True
 
     def _create_collection():
         fields = [
             FieldSchema(name="chunk_id", dtype=DataType.VARCHAR, is_primary=True, max_length=256),
             FieldSchema(name="product_id", dtype=DataType.VARCHAR, max_length=256),
+            # Comma-joined products covered by a canonical (near-duplicate collapsed) chunk
+            FieldSchema(name="product_ids", dtype=DataType.VARCHAR, max_length=4096),
             FieldSchema(name="chunk_type", dtype=DataType.VARCHAR, max_length=50),
             FieldSchema(name="semantic_group", dtype=DataType.VARCHAR, max_length=50),
             FieldSchema(name="content", dtype=DataType.VARCHAR, max_length=65535),
+            # Scalar facets for filter pushdown (price_tier, weight_class, screen_size, gpu_tier)
+            *[FieldSchema(name=field, dtype=DataType.VARCHAR, max_length=32) for field in FACET_FIELDS],
             FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIM)
         ]
         schema = CollectionSchema(fields, "Product semantic chunks for sales RAG.")
-        collection = Collection(MILVUS_COLLECTION_NAME, schema)
+        collection = Collection(collection_name, schema)
 
         # Create an index for the embedding field
         index_params = {
@@ -115,7 +150,7 @@ def setup_milvus_collection():
             "params": {"nlist": 1024}
         }
         collection.create_index("embedding", index_params)
-        logging.info(f"Collection '{MILVUS_COLLECTION_NAME}' created and indexed.")
+        logging.info(f"Collection '{collection_name}' created and indexed.")
         return collection
 
     try:
@@ -137,51 +172,135 @@ def setup_milvus_collection():
         logging.error(f"Failed to setup Milvus collection: {e}")
         raise
 
-def process_files():
-    """Main function to process all data from DuckDB and create Milvus collection."""
+def chunk_to_entity(chunk):
+    """Convert a chunk into a Milvus entity."""
+    entity = {
+        "chunk_id": chunk["chunk_id"],
+        "product_id": chunk["product_id"],
+        "product_ids": ",".join(chunk_product_ids(chunk)),
+        "chunk_type": chunk["chunk_type"],
+        "semantic_group": chunk.get("semantic_group", ""),
+        "content": chunk["content"],
+        "embedding": chunk.get("embedding")
+    }
+    entity.update(extract_scalar_facets(chunk.get("raw_product", {})))
+    return entity
+
+def load_products(db_file=DUCKDB_FILE):
+    """Load all nbtypes rows from DuckDB as product dicts."""
+    con = duckdb.connect(database=str(db_file), read_only=True)
+    df = con.execute("SELECT * FROM nbtypes").df()
+    con.close()
+
+    logging.info(f"Loaded {len(df)} rows from DuckDB table 'nbtypes'.")
+
+    # Ensure modeltype is string to prevent Milvus type errors
+    df['modeltype'] = df['modeltype'].astype(str)
+    return df.to_dict('records')
+
+def create_chunker():
+    chunker = SemanticChunkingEngine(
+        embedding_batch_size=config.EMBEDDING_BATCH_SIZE,
+        embedding_processes=config.EMBEDDING_PROCESSES,
+        chunk_build_processes=config.CHUNK_BUILD_PROCESSES
+    )
+    # Reuse vectors of unchanged chunk texts from the shared embedding store (real model only)
+    if chunker.sentence_transformer is not None:
+        chunker.embedding_store = get_embedding_store(chunker.embedding_model_name)
+    return chunker
+
+def create_deduplicator():
+    # Only chunks of the same product_id (modeltype) and scalar facets collapse,
+    # so product_id / facet filter pushdown stays exact for every collapsed SKU
+    return ChunkDeduplicator(
+        max_hamming=config.CHUNK_DEDUP_MAX_HAMMING,
+        min_cosine=config.CHUNK_DEDUP_MIN_COSINE,
+        key_fn=dedup_partition_key
+    )
+
+def deduplicate_chunks(chunks):
+    """Collapse near-duplicate chunks (e.g. SKUs of one series) into canonical chunks carrying product_ids."""
+    if not config.CHUNK_DEDUP_ENABLED:
+        return chunks, {}
+    deduplicator = create_deduplicator()
+    stored_chunks, duplicates = deduplicator.deduplicate(chunks)
+    logging.info(f"Near-duplicate elimination: {deduplicator.last_report}")
+    return remap_parent_ids(stored_chunks, duplicates), duplicates
+
+def group_chunks_by_product(parent_chunks, child_chunks):
+    """Group chunks by manifest product key (modeltype|modelname)."""
+    grouped = {}
+    for chunk in parent_chunks + child_chunks:
+        grouped.setdefault(product_key(chunk.get("raw_product", {})), []).append(chunk)
+    return grouped
+
+def process_files(db_file=DUCKDB_FILE, collection_name=MILVUS_COLLECTION_NAME, manifest_path=MANIFEST_PATH):
+    """
+    Main function to process all data from DuckDB and create Milvus collection.
+
+    Returns a build summary (chunk count, sampled chunk vectors and sample query vectors)
+    used to verify a blue/green build.
+    """
     connect_to_milvus()
-    milvus_collection = setup_milvus_collection()
+    milvus_collection = setup_milvus_collection(collection_name)
 
     # Initialize the chunking engine
-    chunker = SemanticChunkingEngine()
+    chunker = create_chunker()
+    # The manifest always records the serving name, so it stays valid after a release
+    manifest = IngestManifest(manifest_path, MILVUS_COLLECTION_NAME)
+    summary = {"collection": collection_name, "products": 0, "chunks": 0, "samples": [], "query_vectors": []}
 
     try:
         logging.info("--- Loading data from DuckDB ---")
-
-        # Connect to DuckDB and query all data
-        con = duckdb.connect(database=DUCKDB_FILE, read_only=True)
-        df = con.execute("SELECT * FROM nbtypes").df()
-        con.close()
-
-        logging.info(f"Loaded {len(df)} rows from DuckDB table 'nbtypes'.")
-
-        # Ensure modeltype is string to prevent Milvus type errors
-        df['modeltype'] = df['modeltype'].astype(str)
+        products = load_products(db_file)
+        summary["products"] = len(products)
 
         # Generate and store chunks in Milvus
-        products = df.to_dict('records')
-        parent_chunks, child_chunks = chunker.batch_create_chunks(products)
+        try:
+            parent_chunks, child_chunks = chunker.batch_create_chunks(products)
+        finally:
+            chunker.close_embedding_pool()
+        logging.info(f"Chunking report: {chunker.last_batch_report}")
 
         all_chunks = parent_chunks + child_chunks
         if not all_chunks:
             logging.warning("No chunks created from the data.")
-            return
-
-        logging.info(f"Generated {len(all_chunks)} chunks from {len(df)} products.")
-
-        entities = []
-        for chunk in all_chunks:
-            entities.append({
-                "chunk_id": chunk["chunk_id"],
-                "product_id": chunk["product_id"],
-                "chunk_type": chunk["chunk_type"],
-                "semantic_group": chunk.get("semantic_group", ""),
-                "content": chunk["content"],
-                "embedding": chunk["embedding"]
-            })
+            return summary
 
+        logging.info(f"Generated {len(all_chunks)} chunks from {len(products)} products.")
+
+        stored_chunks, duplicates = deduplicate_chunks(all_chunks)
+        entities = [chunk_to_entity(chunk) for chunk in stored_chunks]
         milvus_collection.insert(entities)
-        logging.info(f"Inserted {len(entities)} chunks into Milvus collection '{MILVUS_COLLECTION_NAME}'.")
+        logging.info(f"Inserted {len(entities)} chunks into Milvus collection '{collection_name}'.")
+        summary["chunks"] = len(entities)
+        summary["samples"] = [
+            (chunk["chunk_id"], chunk["embedding"])
+            for chunk in random.sample(stored_chunks, min(RECALL_SAMPLE_SIZE, len(stored_chunks)))
+        ]
+        summary["query_vectors"] = list(chunker.generate_embeddings(SAMPLE_QUERIES))
+
+        # Local content table keyed by chunk_id, so searches can skip fetching content from Milvus
+        con = duckdb.connect(database=str(db_file))
+        try:
+            write_chunk_contents(con, stored_chunks)
+        finally:
+            con.close()
+
+        # Record per-product and per-chunk hashes for later incremental syncs
+        grouped = group_chunks_by_product(parent_chunks, child_chunks)
+        for product in products:
+            chunks = grouped.get(product_key(product), [])
+            manifest.record_product(product, {
+                chunk["chunk_id"]: chunk_content_hash(chunk_to_entity(chunk)) for chunk in chunks
+            })
+        manifest.record_duplicates(duplicates)
+        manifest.save()
+
+        if chunker.embedding_store is not None:
+            chunker.embedding_store.set_references(EMBEDDING_STORE_CONSUMER, [chunk["content"] for chunk in stored_chunks])
+            chunker.embedding_store.collect_garbage()
+            logging.info(f"Embedding store: {chunker.embedding_store.get_stats()}")
 
     except Exception as e:
         logging.error(f"Failed to process data from DuckDB: {e}")
@@ -192,6 +311,198 @@ def process_files():
     milvus_collection.flush()
     connections.disconnect("default")
     logging.info("--- Data processing completed successfully. ---")
+    return summary
+
+def rebuild_blue_green(csv_directory=None, min_row_ratio=DEFAULT_MIN_ROW_RATIO, min_recall=DEFAULT_MIN_RECALL):
+    """
+    Blue/green rebuild: build a versioned DuckDB file and collection while the live index keeps
+    serving, warm and verify them (row counts, sample queries, self-recall), then switch the
+    collection alias and the DuckDB pointer. A build that fails verification is never released.
+
+    Args:
+        csv_directory: rebuild the nbtypes catalog from these CSV files; by default the live
+            database is copied and only the chunks are rebuilt
+    """
+    version = new_index_version()
+    db_file = versioned_db_path(DUCKDB_FILE, version, INDEX_VERSIONS_DIR)
+    collection_name = versioned_collection_name(MILVUS_COLLECTION_NAME, version)
+    manifest_path = default_manifest_path(db_file, MILVUS_COLLECTION_NAME)
+    db_file.parent.mkdir(parents=True, exist_ok=True)
+    logging.info(f"--- Blue/green rebuild of version {version} into '{collection_name}' and {db_file} ---")
+
+    if csv_directory:
+        from utils.create_duckdb_from_csv import gen_all_nbinfo_tb
+        if not gen_all_nbinfo_tb(csv_directory, db_path=str(db_file)):
+            raise RuntimeError(f"Failed to build {db_file} from {csv_directory}")
+    else:
+        copy_duckdb_database(DUCKDB_FILE, db_file)
+
+    summary = process_files(db_file, collection_name, manifest_path)
+    if not summary["chunks"]:
+        raise RuntimeError(f"Version {version} produced no chunks; live index unchanged.")
+
+    connect_to_milvus()
+    try:
+        live_collection = MILVUS_COLLECTION_NAME if utility.has_collection(MILVUS_COLLECTION_NAME) else None
+        verification = {
+            "duckdb": verify_duckdb_version(db_file, DUCKDB_FILE, summary["chunks"], min_row_ratio),
+            "milvus": verify_collection_version(
+                collection_name, summary["chunks"], summary["samples"], summary["query_vectors"],
+                live_collection, min_row_ratio, min_recall
+            ),
+        }
+        logging.info(f"Verification of version {version}: {json.dumps(verification, ensure_ascii=False)}")
+        failures = verification["duckdb"]["failures"] + verification["milvus"]["failures"]
+        if failures:
+            Collection(collection_name).release()
+            raise RuntimeError(
+                f"Version {version} failed verification, live index unchanged "
+                f"('{collection_name}' and {db_file} kept for inspection): {'; '.join(failures)}"
+            )
+
+        record = release_index_version(
+            version, db_file, collection_name, MILVUS_COLLECTION_NAME, DUCKDB_FILE, ACTIVE_INDEX_PATH,
+            manifest_path=manifest_path, live_manifest_path=MANIFEST_PATH,
+            verification=verification, keep_versions=INDEX_KEEP_VERSIONS
+        )
+    finally:
+        connections.disconnect("default")
+    publish_snapshot(version)
+    logging.info(f"--- Released version {version}; serving processes reload on their next query. ---")
+    return record
+
+def publish_snapshot(version):
+    """Export the live catalog as a versioned zstd Parquet/Arrow snapshot; readers fall back to DuckDB on failure."""
+    try:
+        export_snapshot(DUCKDB_FILE, SNAPSHOT_DIR, version=version, keep_versions=config.COLUMNAR_SNAPSHOT_KEEP_VERSIONS)
+    except Exception as e:
+        logging.error(f"Failed to publish columnar snapshot {version}: {e}")
+
+def sync_incremental():
+    """
+    Incremental sync: re-chunk and re-embed only new or changed products (by content hash),
+    upsert changed chunks by chunk_id and delete chunks of removed products, without dropping
+    the collection. Falls back to a full rebuild when there is no manifest or collection yet.
+    """
+    connect_to_milvus()
+    manifest = IngestManifest.load(MANIFEST_PATH, MILVUS_COLLECTION_NAME)
+    if manifest.is_empty or not utility.has_collection(MILVUS_COLLECTION_NAME):
+        logging.warning("No ingest manifest or collection found; running a full rebuild instead.")
+        connections.disconnect("default")
+        return rebuild_blue_green()
+
+    milvus_collection = Collection(MILVUS_COLLECTION_NAME)
+    chunker = create_chunker()
+
+    logging.info("--- Loading data from DuckDB ---")
+    products = load_products()
+    plan = manifest.diff(products)
+    logging.info(f"Incremental sync plan: {plan.summary()}")
+
+    to_process = set(plan.to_process)
+    # Near-duplicate groups that include a changed or removed product are dissolved: the canonical
+    # chunk no longer stands for every member, so each remaining member is written back on its own
+    touched = [chunk_id for key in plan.to_process + plan.removed for chunk_id in manifest.chunk_hashes(key)]
+    dissolved = manifest.dissolve_duplicate_groups(touched)
+    if dissolved:
+        owners = manifest.chunk_owners()
+        removed = set(plan.removed)
+        to_process.update(
+            owners[chunk_id] for chunk_id in dissolved if chunk_id in owners and owners[chunk_id] not in removed
+        )
+        logging.info(f"Dissolved near-duplicate groups covering {len(dissolved)} chunks.")
+    changed_products = [product for product in products if product_key(product) in to_process]
+
+    # Build chunk texts first, then embed only chunks whose content actually changed
+    upsert_chunks, stale_ids = [], []
+    chunk_hashes_by_product = {}
+    for product in changed_products:
+        key = product_key(product)
+        parent, children = chunker.build_chunks(product)
+        previous = manifest.chunk_hashes(key)
+        hashes = {}
+        for chunk in [parent] + children:
+            hashes[chunk["chunk_id"]] = chunk_content_hash(chunk_to_entity(chunk))
+            if previous.get(chunk["chunk_id"]) != hashes[chunk["chunk_id"]] or chunk["chunk_id"] in dissolved:
+                upsert_chunks.append(chunk)
+        stale_ids.extend(chunk_id for chunk_id in previous if chunk_id not in hashes)
+        chunk_hashes_by_product[key] = (product, hashes)
+
+    for key in plan.removed:
+        stale_ids.extend(manifest.chunk_hashes(key).keys())
+
+    try:
+        vectors = chunker.generate_embeddings([chunk["content"] for chunk in upsert_chunks])
+    finally:
+        chunker.close_embedding_pool()
+    for chunk, vector in zip(upsert_chunks, vectors):
+        chunk["embedding"] = vector
+
+    if upsert_chunks:
+        # Collections built before product_ids existed keep their original schema
+        field_names = {field.name for field in milvus_collection.schema.fields}
+        milvus_collection.upsert([
+            {name: value for name, value in chunk_to_entity(chunk).items() if name in field_names}
+            for chunk in upsert_chunks
+        ])
+    if stale_ids:
+        quoted = ", ".join(json.dumps(chunk_id) for chunk_id in stale_ids)
+        milvus_collection.delete(expr=f"chunk_id in [{quoted}]")
+    milvus_collection.flush()
+    logging.info(
+        f"Upserted {len(upsert_chunks)} chunks and deleted {len(stale_ids)} chunks "
+        f"in Milvus collection '{MILVUS_COLLECTION_NAME}'."
+    )
+
+    con = duckdb.connect(database=str(DUCKDB_FILE))
+    try:
+        upsert_chunk_contents(con, upsert_chunks)
+        delete_chunk_contents(con, stale_ids)
+    finally:
+        con.close()
+
+    # Update the manifest only after Milvus and the content table are in sync
+    for product, hashes in chunk_hashes_by_product.values():
+        manifest.record_product(product, hashes)
+    for key in plan.removed:
+        manifest.remove_product(key)
+    manifest.save()
+
+    if chunker.embedding_store is not None:
+        chunker.embedding_store.add_references(EMBEDDING_STORE_CONSUMER, [chunk["content"] for chunk in upsert_chunks])
+
+    connections.disconnect("default")
+    logging.info("--- Incremental sync completed successfully. ---")
 
 if __name__ == "__main__":
-    process_files()
+    parser = argparse.ArgumentParser(description="Chunk nbtypes and store chunks in Milvus.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-embed new or changed products and upsert/delete by chunk_id")
+    parser.add_argument("--csv-dir",
+                        help="also rebuild the nbtypes catalog from this CSV directory in the new version")
+    parser.add_argument("--min-row-ratio", type=float, default=DEFAULT_MIN_ROW_RATIO,
+                        help="minimum row count of the new version relative to the live one")
+    parser.add_argument("--min-recall", type=float, default=DEFAULT_MIN_RECALL,
+                        help="minimum self-recall of sampled chunks in the new collection")
+    parser.add_argument("--rollback", action="store_true",
+                        help="switch the alias and DuckDB pointer back to the previous released version")
+    parser.add_argument("--in-place", action="store_true",
+                        help="drop and recreate the collection directly (only before the first blue/green release)")
+    args = parser.parse_args()
+    if args.rollback:
+        connect_to_milvus()
+        try:
+            record = rollback_index_version(MILVUS_COLLECTION_NAME, DUCKDB_FILE, ACTIVE_INDEX_PATH, MANIFEST_PATH)
+        finally:
+            connections.disconnect("default")
+        # Reuse the kept snapshot of the restored version, or export one if it was pruned
+        if not activate_snapshot(SNAPSHOT_DIR, record["version"]):
+            publish_snapshot(record["version"])
+    elif args.incremental:
+        sync_incremental()
+    elif args.in_place:
+        if read_active_index(ACTIVE_INDEX_PATH):
+            parser.error(f"'{MILVUS_COLLECTION_NAME}' is a released alias; use a blue/green rebuild instead")
+        process_files()
+    else:
+        rebuild_blue_green(args.csv_dir, args.min_row_ratio, args.min_recall)
@@ -1,32 +1,117 @@
 # utils/create_duckdb_from_csv.py
-import pandas as pd
+import csv
+import json
 import os
+import shutil
+import time
+from datetime import datetime
 # import hashlib
-# import json
-# import time
 # from typing import List, Dict, Tuple, Optional, Any
 # import numpy as np
 # from pathlib import Path
 import logging
 # from sentence_transformers import SentenceTransformer
 import duckdb
+import sys
+sys.path.append("../")
+from libs.KnowledgeManageHandler.scalar_filters import build_facet_table
+from libs.KnowledgeManageHandler.columnar_snapshot import export_snapshot
 
 # Set up logging for better error tracking
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def gen_all_nbinfo_tb(csv_directory: str = '../data/raw/corrected_csv_20250924', db_path: str = '../db/all_nbinfo_v5.db', collection_name: str = 'nbtypes_collection') -> bool:
+# Latin-1 decodes any byte sequence, so it must stay last or it would shadow Big5/GB2312
+ENCODINGS_TO_TRY = ['utf-8-sig', 'utf-8', 'big5', 'gb2312', 'cp1252', 'iso-8859-1']
+UTF8_ENCODINGS = {'utf-8', 'utf-8-sig'}
+# Transcoded UTF-8 copies and the encoding cache live next to the database file
+TRANSCODE_CACHE_DIR = '.csv_utf8_cache'
+ENCODING_CACHE_FILE = 'encodings.json'
+
+
+def detect_csv_encoding(file_path: str, block_size: int = 1 << 20):
+    """
+    Return the first encoding that decodes the whole file, decoding block by block
+    so the file is never held in memory.
+    """
+    for encoding in ENCODINGS_TO_TRY:
+        try:
+            with open(file_path, 'r', encoding=encoding) as f:
+                while f.read(block_size):
+                    pass
+            return encoding
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return None
+
+
+def prepare_utf8_sources(csv_directory: str, csv_files, cache_dir: str):
+    """
+    One-time encoding detection, cached by (size, mtime): UTF-8 files are read in place,
+    other files are transcoded once into cache_dir and reused until the source changes.
+
+    Returns:
+        ({csv_file: path_to_read}, {csv_file: encoding}, [unreadable files])
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, ENCODING_CACHE_FILE)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    sources, encodings, unreadable = {}, {}, []
+    for csv_file in csv_files:
+        file_path = os.path.join(csv_directory, csv_file)
+        stat = os.stat(file_path)
+        entry = cache.get(csv_file)
+        transcoded_path = os.path.join(cache_dir, csv_file)
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+            encoding = entry['encoding']
+        else:
+            encoding = detect_csv_encoding(file_path)
+            if encoding is None:
+                unreadable.append(csv_file)
+                continue
+            if encoding not in UTF8_ENCODINGS:
+                with open(file_path, 'r', encoding=encoding) as src, \
+                        open(transcoded_path, 'w', encoding='utf-8', newline='') as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+            cache[csv_file] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'encoding': encoding}
+        if encoding not in UTF8_ENCODINGS and not os.path.exists(transcoded_path):
+            with open(file_path, 'r', encoding=encoding) as src, \
+                    open(transcoded_path, 'w', encoding='utf-8', newline='') as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        sources[csv_file] = file_path if encoding in UTF8_ENCODINGS else transcoded_path
+        encodings[csv_file] = encoding
+
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    return sources, encodings, unreadable
+
+
+def read_csv_header(file_path: str):
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def gen_all_nbinfo_tb(csv_directory: str = '../data/raw/corrected_csv_20250924', db_path: str = '../db/all_nbinfo_v5.db', collection_name: str = 'nbtypes_collection', snapshot_dir: str = None) -> bool:
     """
     Creates a DuckDB database and loads all CSV files into a single table, plus manages Milvus collection.
     
-    This function reads all CSV files from the specified directory, validates their
-    structure, and loads them into a DuckDB table named 'nbtypes'. It also manages 
-    Milvus collection creation (deleting existing collection if present).
+    This function bulk-loads all CSV files from the specified directory into a DuckDB
+    table named 'nbtypes' with DuckDB's parallel CSV reader. Non-UTF-8 files are
+    transcoded once (cached by size/mtime), columns are unified by name, and
+    source_file records each row's origin. A load report is printed at the end.
     
     Args:
         csv_directory (str): Directory containing CSV files. Default: 'data/raw/EM_New TTL_241104_AllModelsParsed'
         db_path (str): Path for the DuckDB database file. Default: 'all_nbinfo_v4.db'
         collection_name (str): Name for Milvus collection. Default: 'nbtypes_collection'
+        snapshot_dir (str): If set, also publish a versioned zstd Parquet/Arrow snapshot of
+            nbtypes and nbtypes_facets there. Blue/green builds leave this unset and publish
+            the snapshot at release time instead.
     
     Returns:
         bool: True if successful, False otherwise
@@ -61,88 +146,65 @@ def gen_all_nbinfo_tb(csv_directory: str = '../data/raw/corrected_csv_20250924',
         
         logger.info(f"Found {len(csv_files)} CSV files")
         
-        # Initialize variables for data consolidation
-        all_dataframes = []
-        expected_columns = None
+        # The blue/green release pointer is switched by the release step, never overwritten
+        if os.path.islink(db_path):
+            logger.error(f"{db_path} points to a released index version; build a new version with "
+                         f"'chunking_data_single_collection.py --csv-dir {csv_directory}' instead")
+            return False
         
-        # Read and validate each CSV file
-        for csv_file in csv_files:
-            file_path = os.path.join(csv_directory, csv_file)
-            logger.info(f"Processing {csv_file}")
-            
-            # Security: Check file permissions
-            if not os.access(file_path, os.R_OK):
+        # Build into a temporary file and swap it in at the end, so readers never see a
+        # missing or half-built database
+        build_path = db_path + '.building'
+        for path in (build_path, build_path + '.wal'):
+            if os.path.exists(path):
+                os.remove(path)
+        
+        started = time.perf_counter()
+        
+        # Security: Check file permissions
+        readable_files = []
+        for csv_file in sorted(csv_files):
+            if os.access(os.path.join(csv_directory, csv_file), os.R_OK):
+                readable_files.append(csv_file)
+            else:
                 logger.warning(f"Cannot read file {csv_file}, skipping")
-                continue
-            
-            try:
-                # Try multiple encodings to handle different file formats
-                df = None
-                encodings_to_try = ['utf-8-sig', 'utf-8', 'iso-8859-1', 'cp1252', 'gb2312', 'big5']
-
-                for encoding in encodings_to_try:
-                    try:
-                        df = pd.read_csv(file_path, encoding=encoding)
-                        logger.info(f"Successfully read {csv_file} with encoding: {encoding}")
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                    except Exception as e:
-                        # Other errors should break the loop
-                        logger.error(f"Non-encoding error reading {csv_file} with {encoding}: {str(e)}")
-                        break
-
-                if df is None:
-                    logger.error(f"Could not read {csv_file} with any encoding")
-                    continue
-
-                # Validate column structure
-                if expected_columns is None:
-                    expected_columns = list(df.columns)
-                    logger.info(f"Expected columns: {expected_columns}")
-                elif list(df.columns) != expected_columns:
-                    logger.warning(f"Column mismatch in {csv_file}, skipping")
-                    continue
-
-                # Add source file information for traceability
-                df['source_file'] = csv_file
-                df['load_timestamp'] = pd.Timestamp.now().isoformat()
-
-                all_dataframes.append(df)
-                logger.info(f"Successfully loaded {csv_file} with {len(df)} rows")
-
-            except Exception as e:
-                logger.error(f"Error reading {csv_file}: {str(e)}")
-                continue
         
-        if not all_dataframes:
+        cache_dir = os.path.join(db_dir, TRANSCODE_CACHE_DIR)
+        sources, encodings, unreadable = prepare_utf8_sources(csv_directory, readable_files, cache_dir)
+        for csv_file in unreadable:
+            logger.error(f"Could not read {csv_file} with any encoding")
+        if not sources:
             logger.error("No valid CSV files could be loaded")
             return False
         
-        # Concatenate all dataframes
-        combined_df = pd.concat(all_dataframes, ignore_index=True)
-        logger.info(f"Combined data shape: {combined_df.shape}")
-        
-        # Delete existing database file if it exists
-        if os.path.exists(db_path):
-            try:
-                os.remove(db_path)
-                logger.info(f"Deleted existing database file: {db_path}")
-            except Exception as e:
-                logger.error(f"Error deleting existing database file {db_path}: {str(e)}")
-                return False
+        # Columns are unified by name across files; report files whose header differs
+        headers = {csv_file: read_csv_header(path) for csv_file, path in sources.items()}
+        expected_columns = headers[next(iter(headers))]
+        logger.info(f"Expected columns: {expected_columns}")
+        mismatched = {
+            csv_file: sorted(set(columns) ^ set(expected_columns))
+            for csv_file, columns in headers.items() if set(columns) != set(expected_columns)
+        }
+        for csv_file, diff in mismatched.items():
+            logger.warning(f"Column mismatch in {csv_file} (unified by name): {diff}")
         
         # Create DuckDB connection
-        conn = duckdb.connect(db_path)
+        conn = duckdb.connect(build_path)
+        loaded = False
         
         try:
             # Drop table if exists (for idempotency)
             conn.execute("DROP TABLE IF EXISTS nbtypes")
             
-            # Create table from dataframe using DuckDB SQL
-            # DuckDB can create table directly from pandas DataFrame
-            conn.register('temp_df', combined_df)
-            conn.execute("CREATE TABLE nbtypes AS SELECT * FROM temp_df")
+            # DuckDB's parallel CSV reader loads every file in one pass; filename=true gives lineage
+            load_timestamp = datetime.now().isoformat()
+            conn.execute("""
+                CREATE TABLE nbtypes AS
+                SELECT * EXCLUDE (filename),
+                       parse_filename(filename) AS source_file,
+                       ? AS load_timestamp
+                FROM read_csv(?, header = true, union_by_name = true, filename = true)
+            """, [load_timestamp, list(sources.values())])
             
             # Create indexes for common query patterns
             # Index on modeltype for filtering by model
@@ -164,20 +226,64 @@ def gen_all_nbinfo_tb(csv_directory: str = '../data/raw/corrected_csv_20250924',
             # Get table info for verification
             table_info = conn.execute("DESCRIBE nbtypes").fetchall()
             logger.info(f"Table schema created with {len(table_info)} columns")
+            
+            file_rows = dict(conn.execute(
+                "SELECT source_file, COUNT(*) FROM nbtypes GROUP BY source_file"
+            ).fetchall())
+            print_load_report({
+                "files": {
+                    csv_file: {"rows": file_rows.get(csv_file, 0), "encoding": encodings[csv_file]}
+                    for csv_file in sources
+                },
+                "unreadable_files": unreadable,
+                "schema_mismatches": mismatched,
+                "total_rows": row_count,
+                "columns": len(table_info),
+                "seconds": round(time.perf_counter() - started, 2),
+            })
+
+            # Derived scalar facets used for SQL filter pushdown
+            facet_count = build_facet_table(conn)
+            logger.info(f"Built nbtypes_facets with {facet_count} rows")
 
             conn.commit()
-            return True
+            loaded = True
         except Exception as e:
             logger.error(f"Error creating DuckDB table: {str(e)}")
-            return False
         finally:
             
             conn.close()
+        
+        if not loaded:
+            os.remove(build_path)
+            return False
+        os.replace(build_path, db_path)
+        logger.info(f"Database written to {db_path}")
+        if snapshot_dir:
+            try:
+                export_snapshot(db_path, snapshot_dir)
+            except Exception as e:
+                # Readers fall back to the database when no matching snapshot exists
+                logger.error(f"Failed to publish columnar snapshot: {str(e)}")
+        return True
             
     except Exception as e:
         logger.error(f"Unexpected error in gen_all_nbinfo_tb: {str(e)}")
         return False
     
 
+def print_load_report(report: dict):
+    """Print a per-file load summary"""
+    print("=== nbtypes load report ===")
+    for csv_file, info in report["files"].items():
+        transcoded = "" if info["encoding"] in UTF8_ENCODINGS else " (transcoded)"
+        print(f"  {csv_file}: {info['rows']} rows, {info['encoding']}{transcoded}")
+    for csv_file in report["unreadable_files"]:
+        print(f"  {csv_file}: skipped, unknown encoding")
+    for csv_file, diff in report["schema_mismatches"].items():
+        print(f"  {csv_file}: columns unified by name, differing columns {diff}")
+    print(f"Total: {report['total_rows']} rows, {report['columns']} columns in {report['seconds']}s")
+
+
 if __name__ == "__main__":
-    gen_all_nbinfo_tb()
\ No newline at end of file
+    gen_all_nbinfo_tb(snapshot_dir='../db/snapshots')
\ No newline at end of file